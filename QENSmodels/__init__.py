@@ -5,29 +5,117 @@ Python scripts to define fitting models ( *i.e.*, mathematical functions) that
 can be used to fit Quasi Elastic Neutron Scattering (QENS) data `S(Q, omega)`.
 """
 # -*- coding: utf-8 -*-
-# flake8: noqa : F401
+import sys
+import types
 
 # Version number
 __version__ = "0.1.5"
 
-from .lorentzian import lorentzian
-from .brownian_translational_diffusion import hwhmBrownianTranslationalDiffusion
-from .brownian_translational_diffusion import sqwBrownianTranslationalDiffusion
-from .delta import delta
-from .delta_lorentz import sqwDeltaLorentz
-from .gaussian import gaussian
-from .gaussian_model_3d import hwhmGaussianModel3D
-from .gaussian_model_3d import sqwGaussianModel3D
-from .delta_two_lorentz import sqwDeltaTwoLorentz
-from .isotropic_rotational_diffusion import sqwIsotropicRotationalDiffusion
-from .isotropic_rotational_diffusion import hwhmIsotropicRotationalDiffusion
-from .jump_sites_log_norm_dist import hwhmJumpSitesLogNormDist
-from .jump_sites_log_norm_dist import sqwJumpSitesLogNormDist
-from .jump_translational_diffusion import hwhmJumpTranslationalDiffusion
-from .jump_translational_diffusion import sqwJumpTranslationalDiffusion
-from .water_teixeira import sqwWaterTeixeira
-from .background_polynomials import background_polynomials
-from .chudley_elliott_diffusion import hwhmChudleyElliottDiffusion
-from .chudley_elliott_diffusion import sqwChudleyElliottDiffusion
-from .equivalent_sites_circle import hwhmEquivalentSitesCircle
-from .equivalent_sites_circle import sqwEquivalentSitesCircle
+# Public names and the submodules defining them. Submodules are only imported
+# when one of their names is first accessed (PEP 562), so that importing the
+# package does not load numpy, scipy or h5py.
+_lazy_names = {
+    'lorentzian': 'lorentzian',
+    'hwhmBrownianTranslationalDiffusion': 'brownian_translational_diffusion',
+    'sqwBrownianTranslationalDiffusion': 'brownian_translational_diffusion',
+    'delta': 'delta',
+    'sqwDeltaLorentz': 'delta_lorentz',
+    'gaussian': 'gaussian',
+    'hwhmGaussianModel3D': 'gaussian_model_3d',
+    'sqwGaussianModel3D': 'gaussian_model_3d',
+    'sqwDeltaTwoLorentz': 'delta_two_lorentz',
+    'sqwIsotropicRotationalDiffusion': 'isotropic_rotational_diffusion',
+    'hwhmIsotropicRotationalDiffusion': 'isotropic_rotational_diffusion',
+    'hwhmJumpSitesLogNormDist': 'jump_sites_log_norm_dist',
+    'sqwJumpSitesLogNormDist': 'jump_sites_log_norm_dist',
+    'hwhmJumpTranslationalDiffusion': 'jump_translational_diffusion',
+    'sqwJumpTranslationalDiffusion': 'jump_translational_diffusion',
+    'sqwWaterTeixeira': 'water_teixeira',
+    'background_polynomials': 'background_polynomials',
+    'polynomial_backgrounds': 'background_polynomials',
+    'BoundBackground': 'background_polynomials',
+    'hwhmChudleyElliottDiffusion': 'chudley_elliott_diffusion',
+    'sqwChudleyElliottDiffusion': 'chudley_elliott_diffusion',
+    'hwhmEquivalentSitesCircle': 'equivalent_sites_circle',
+    'sqwEquivalentSitesCircle': 'equivalent_sites_circle',
+    'LineSpectrum': 'line_spectrum',
+    'QENSDataset': 'dataset',
+    'read_mantid_nexus': 'mantid_nexus',
+    'iter_mantid_nexus': 'mantid_nexus',
+    'FitResultsWriter': 'results_store',
+    'QueuedFitResultsWriter': 'results_store',
+    'read_fit_results': 'results_store',
+    'profile': 'profiling',
+    'BoundModel': 'bound_model',
+    'ResolutionOperator': 'convolution',
+    'TimeDomainConvolution': 'convolution',
+    'BoundIqt': 'iqt',
+    'iqtBrownianTranslationalDiffusion': 'iqt',
+    'iqtChudleyElliottDiffusion': 'iqt',
+    'iqtDeltaLorentz': 'iqt',
+    'iqtDeltaTwoLorentz': 'iqt',
+    'iqtEquivalentSitesCircle': 'iqt',
+    'iqtGaussianModel3D': 'iqt',
+    'iqtIsotropicRotationalDiffusion': 'iqt',
+    'iqtJumpSitesLogNormDist': 'iqt',
+    'iqtJumpTranslationalDiffusion': 'iqt',
+    'iqtWaterTeixeira': 'iqt',
+    'SeparableModel': 'fitting',
+    'FitResult': 'fitting',
+    'sequential_fit': 'fitting',
+    'SweepResult': 'fitting',
+    'multistart_fit': 'fitting',
+    'MultiStartResult': 'fitting',
+    'poisson_deviance': 'fitting',
+    'scan': 'landscape',
+    'ScanResult': 'landscape',
+    'bootstrap': 'uncertainty',
+    'BootstrapResult': 'uncertainty',
+    'apparent_lines': 'estimation',
+    'estimate_initial': 'estimation',
+    'parameter_samples': 'lookup',
+    'SpectralIndex': 'lookup',
+}
+
+__all__ = list(_lazy_names)
+
+
+def __getattr__(name):
+    import importlib
+
+    if name in _lazy_names:
+        module = importlib.import_module('.' + _lazy_names[name], __name__)
+        value = getattr(module, name)
+    elif not name.startswith('_'):
+        # other submodules, e.g. QENSmodels.registry
+        try:
+            value = importlib.import_module('.' + name, __name__)
+        except ModuleNotFoundError as error:
+            if error.name != __name__ + '.' + name:
+                raise
+            raise AttributeError('module {!r} has no attribute {!r}'.format(
+                __name__, name)) from None
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(
+            __name__, name))
+
+    # cache the value: next accesses do not go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # The import system binds each imported submodule to the package
+        # namespace. Some submodules are named after the function they
+        # define (e.g. lorentzian): keep exposing the function.
+        if name in _lazy_names and isinstance(value, types.ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,10 @@
+"""
+Adapters exposing the models to fitting frameworks
+
+Each submodule wraps the models described in :mod:`QENSmodels.registry` for
+one framework, which has to be installed to use it:
+
+- :mod:`QENSmodels.adapters.bumps`
+- :mod:`QENSmodels.adapters.lmfit`
+- :mod:`QENSmodels.adapters.mantid`
+"""
@@ -0,0 +1,233 @@
+"""
+Fitting the models with bumps
+
+The example notebooks build one `bumps.curve.Curve` per momentum transfer,
+so that each step of the optimiser calls the model and `numpy.convolve` once
+per spectrum. :class:`QENSFitness` fits all the spectra of a dataset at
+once: the model is evaluated for all momentum transfers in one vectorised
+call of a :class:`~QENSmodels.bound_model.BoundModel` and convolved with
+resolution spectra whose Fourier transforms are computed once.
+"""
+import numpy as np
+from typing import Union, Optional, Iterable
+
+import QENSmodels
+from QENSmodels import registry
+
+try:
+    from bumps.fitproblem import Fitness
+    from bumps.parameter import Parameter
+except ImportError:
+    Fitness = object
+    Parameter = None
+
+
+class QENSFitness(Fitness):
+    """
+    bumps fitness of a model for all the spectra of a dataset
+
+    The parameters of the model are available as attributes holding
+    `bumps.parameter.Parameter` objects (lists of parameters for
+    q-dependent parameters), whose hard limits are the physical bounds
+    listed in :mod:`QENSmodels.registry`. As for `bumps.curve.Curve`, the
+    parameters are fixed until a fitting range is given,
+    *e.g.* `fitness.D.range(0, 1)`.
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwBrownianTranslationalDiffusion'
+
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer, of shape (nw,)
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfer, of shape (nq,)
+
+    data: :class:`~numpy:numpy.ndarray`
+        measured spectra, of shape (nq, nw)
+
+    error: :class:`~numpy:numpy.ndarray`
+        uncertainties of `data`. Default to None (uncertainties of 1).
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra, of shape (nq, nw) or (nw,). The model is
+        convolved with the normalised resolution, as
+        `numpy.convolve(model, resolution / resolution.sum(), mode='same')`.
+        Default to None (no convolution).
+
+    name: str
+        prefix of the names of the parameters. Default to ''.
+
+    per_q: iterable of str
+        names of parameters fitted independently for each spectrum, in
+        addition to the q-dependent parameters of the model,
+        *e.g.* ('scale', 'center'). Default to ().
+
+    **values:
+        initial values of the parameters. Non-fitting parameters, such as
+        `Nsites`, are fixed to the given value. Parameters fitted for each
+        spectrum take either one value or one value per spectrum.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> w = np.linspace(-2, 2, 201)
+    >>> q = np.array([0.5, 1., 1.5])
+    >>> data = QENSmodels.sqwBrownianTranslationalDiffusion(w, q, D=0.2)
+    >>> fitness = QENSFitness('sqwBrownianTranslationalDiffusion', w, q,
+    ...                       data, per_q=['scale'], D=0.1)
+    >>> fitness.D.range(0.01, 1.)
+    Parameter(D)
+    >>> len(fitness.scale)
+    3
+    >>> fitness.numpoints()
+    603
+    >>> fitness.D.value = 0.2
+    >>> fitness.update()
+    >>> fitness.nllf() < 1e-10
+    True
+
+    """
+
+    def __init__(
+            self,
+            model: Union[str, 'registry.ModelSpec'],
+            w,
+            q,
+            data,
+            error=None,
+            resolution: Optional[np.ndarray] = None,
+            name: str = '',
+            per_q: Iterable[str] = (),
+            **values
+    ):
+        if Parameter is None:
+            raise ImportError('bumps is required to use QENSFitness')
+
+        spec = registry.get(model) if isinstance(model, str) else model
+        per_q = set(per_q)
+        unknown = (per_q | set(values)) - set(spec.parameter_names)
+        if unknown:
+            raise TypeError('{} got unexpected parameter(s) {}'.format(
+                spec.name, ', '.join(sorted(unknown))))
+
+        fixed = {item.name: values[item.name] for item in spec.parameters
+                 if not item.fitting and item.name in values}
+        self.model = QENSmodels.BoundModel(spec, w, q, resolution, **fixed)
+        self.spec = spec
+        if not per_q <= set(self.model.per_q_names):
+            raise ValueError('{} cannot be fitted for each spectrum'.format(
+                ', '.join(sorted(per_q - set(self.model.per_q_names)))))
+        self.name = name
+
+        nq, nw = self.model.shape
+        self.x = self.model.w
+        self.y = np.asarray(data, dtype=np.float64).reshape(nq, nw)
+        if error is None:
+            self.dy = np.ones_like(self.y)
+        else:
+            self.dy = np.asarray(error, dtype=np.float64).reshape(nq, nw)
+            if np.any(self.dy <= 0):
+                raise ValueError('measurement uncertainty must be positive')
+        self._y = self.y
+
+        # bumps parameters, with physical bounds as hard limits
+        self._pars = {}
+        for item in spec.parameters:
+            if not item.fitting:
+                continue
+            value = values.get(item.name, item.default)
+            if item.q_vector or item.name in per_q:
+                value = np.broadcast_to(np.asarray(value, dtype=np.float64),
+                                        (nq,))
+                self._pars[item.name] = [
+                    Parameter(float(value[i]),
+                              name='{}{}[{}]'.format(name, item.name, i),
+                              limits=item.bounds)
+                    for i in range(nq)]
+            else:
+                self._pars[item.name] = Parameter(
+                    float(value), name=name + item.name, limits=item.bounds)
+        self._cached_theory = None
+
+    def __getattr__(self, name):
+        pars = self.__dict__.get('_pars', {})
+        if name in pars:
+            return pars[name]
+        raise AttributeError('{!r} object has no attribute {!r}'.format(
+            type(self).__name__, name))
+
+    def parameters(self) -> dict:
+        """ bumps parameters of the model """
+        return dict(self._pars)
+
+    def values(self) -> dict:
+        """ Current values of the parameters, as passed to the model """
+        values = {}
+        for key, par in self._pars.items():
+            if isinstance(par, list):
+                values[key] = np.array([item.value for item in par])
+            else:
+                values[key] = par.value
+        return values
+
+    def to_dict(self) -> dict:
+        return {'type': type(self).__name__,
+                'model': self.spec.name,
+                'name': self.name,
+                'parameters': self.parameters()}
+
+    def update(self):
+        self._cached_theory = None
+
+    def numpoints(self) -> int:
+        return self.y.size
+
+    def theory(self) -> np.ndarray:
+        """ Model convolved with the resolution, of shape (nq, nw) """
+        if self._cached_theory is None:
+            self._cached_theory = self.model(**self.values())
+        return self._cached_theory
+
+    def residuals(self) -> np.ndarray:
+        return ((self.theory() - self.y) / self.dy).ravel()
+
+    def nllf(self) -> float:
+        residuals = self.residuals()
+        return 0.5 * np.dot(residuals, residuals)
+
+    def resynth_data(self):
+        """ Replaces the data with a Gaussian resampling """
+        self.y = self._y + np.random.randn(*self._y.shape) * self.dy
+
+    def restore_data(self):
+        """ Restores the data after `resynth_data` """
+        self.y = self._y
+
+    def save(self, basename: str):
+        """ Writes energy transfer, data, uncertainties and theory of each
+        spectrum to `basename.dat` """
+        columns = [self.x]
+        headers = ['x']
+        for i, (y, dy, theory) in enumerate(zip(self.y, self.dy,
+                                                self.theory())):
+            columns.extend((y, dy, theory))
+            headers.extend(('y[{}]'.format(i), 'dy[{}]'.format(i),
+                            'fy[{}]'.format(i)))
+        with open(basename + '.dat', 'w') as handle:
+            handle.write('# ' + '\t '.join(headers) + '\n')
+            np.savetxt(handle, np.vstack(columns).T)
+
+    def plot(self, view: str = 'linear'):
+        """ Plots data and theory of each spectrum """
+        import matplotlib.pyplot as plt
+
+        for i, (y, dy, theory) in enumerate(zip(self.y, self.dy,
+                                                self.theory())):
+            plt.errorbar(self.x, y, yerr=dy, fmt='.', color='C{}'.format(i),
+                         label='q={:.3g}'.format(self.model.q[i]))
+            plt.plot(self.x, theory, '-', color='C{}'.format(i))
+        if view == 'log':
+            plt.yscale('log')
+        plt.legend()
@@ -0,0 +1,215 @@
+"""
+Fitting the models with lmfit
+
+`lmfit.Model` wrapping a model function of the library fits one spectrum at
+a time and estimates derivatives numerically. :class:`QENSModel` fits all the
+spectra of a dataset at once through a flattened residual, evaluates the
+model with a :class:`~QENSmodels.bound_model.BoundModel` holding the grids
+and the resolution, and passes analytic derivatives to the
+Levenberg-Marquardt solver (`Dfun` of `scipy.optimize.leastsq`).
+"""
+import inspect
+import numpy as np
+from typing import Union, Optional, Iterable
+
+import QENSmodels
+from QENSmodels import registry
+
+try:
+    from lmfit import Model
+except ImportError:
+    Model = None
+
+
+class QENSModel(Model if Model is not None else object):
+    """
+    lmfit model of all the spectra of a dataset
+
+    Parameters shared by all spectra are named after the arguments of the
+    model function, *e.g.* `D`. Parameters taking one value per spectrum
+    (the q-dependent parameters of the model and those listed in `per_q`)
+    are named `<name>_<index of q>`, *e.g.* `scale_0`, `scale_1`... The
+    bounds of the parameters default to the physical bounds listed in
+    :mod:`QENSmodels.registry`.
+
+    The model returns the spectra as a flattened array of size
+    `q.size * w.size`: data and weights given to :meth:`fit` are flattened
+    the same way.
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwGaussianModel3D'
+
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer, of shape (nw,)
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfer, of shape (nq,)
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra, of shape (nq, nw) or (nw,). Default to None
+        (no convolution).
+
+    per_q: iterable of str
+        'scale' and/or 'center', to fit them independently for each
+        spectrum. Default to ().
+
+    prefix: str
+        prefix of the names of the parameters. Default to ''.
+
+    **fixed:
+        values of the non-fitting parameters of the model, *e.g.* `Nsites`
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> w = np.linspace(-2, 2, 201)
+    >>> q = np.array([0.5, 1., 1.5])
+    >>> data = QENSmodels.sqwGaussianModel3D(w, q, 1., 0., 0.2, 0.8)
+    >>> model = QENSModel('sqwGaussianModel3D', w, q)
+    >>> model.param_names
+    ['scale', 'center', 'D', 'variance_ux']
+    >>> params = model.make_params(D=0.1, variance_ux=0.5)
+    >>> params['center'].vary = False
+    >>> result = model.fit(data, params)
+    >>> round(result.params['D'].value, 4)
+    0.2
+    >>> result.best_fit.shape
+    (603,)
+
+    """
+
+    def __init__(
+            self,
+            model: Union[str, 'registry.ModelSpec'],
+            w,
+            q,
+            resolution: Optional[np.ndarray] = None,
+            per_q: Iterable[str] = (),
+            prefix: str = '',
+            **fixed
+    ):
+        if Model is None:
+            raise ImportError('lmfit is required to use QENSModel')
+
+        spec = registry.get(model) if isinstance(model, str) else model
+        self.bound = QENSmodels.BoundModel(spec, w, q, resolution, **fixed)
+        self.spec = spec
+
+        per_q = set(per_q)
+        if not per_q <= {'scale', 'center'}:
+            raise ValueError('only scale and center can be fitted for each '
+                             'spectrum, not {}'.format(
+                                 ', '.join(sorted(per_q - {'scale',
+                                                           'center'}))))
+        nq = self.bound.q.size
+
+        # lmfit parameter name -> (parameter of the model, index of q)
+        self._targets = {}
+        arguments = []
+        for item in spec.parameters:
+            if not item.fitting:
+                continue
+            if item.q_vector or item.name in per_q:
+                names = [('{}_{}'.format(item.name, i), i)
+                         for i in range(nq)]
+            else:
+                names = [(item.name, None)]
+            for name, index in names:
+                self._targets[name] = (item.name, index)
+                arguments.append(inspect.Parameter(
+                    name, inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                    default=float(item.default)))
+
+        def evaluate(**params):
+            return self.bound(**self._values(params)).ravel()
+
+        evaluate.__name__ = spec.name
+        evaluate.__signature__ = inspect.Signature(arguments)
+
+        super().__init__(evaluate, independent_vars=[],
+                         param_names=list(self._targets), prefix=prefix)
+
+        for name, (parameter, _) in self._targets.items():
+            lower, upper = spec[parameter].bounds
+            self.set_param_hint(name, value=float(spec[parameter].default),
+                                min=lower, max=upper)
+
+    @property
+    def shape(self):
+        """ Shape (nq, nw) of the spectra """
+        return self.bound.shape
+
+    def _values(self, params: dict) -> dict:
+        """ Converts lmfit parameter values to arguments of the model """
+        nq = self.bound.q.size
+        values = {}
+        for name, value in params.items():
+            parameter, index = self._targets[name]
+            if index is None:
+                values[parameter] = value
+            else:
+                values.setdefault(parameter, np.empty(nq))[index] = value
+        return values
+
+    def jacobian(self, params, data=None, weights=None, **kwargs):
+        """
+        Derivatives of the weighted residual with respect to the varying
+        parameters, in the format of `Dfun` of `scipy.optimize.leastsq`
+
+        Return
+        ------
+        :class:`~numpy:numpy.ndarray`
+            array of shape (q.size * w.size, number of varying parameters)
+
+        """
+        values = self._values({self._strip_prefix(name): par.value
+                               for name, par in params.items()
+                               if self._strip_prefix(name) in self._targets})
+        varying = [self._strip_prefix(name) for name, par in params.items()
+                   if par.vary and par.expr is None]
+        derivatives = self.bound.jacobian(
+            names=sorted(set(self._targets[name][0] for name in varying)),
+            **values)
+
+        nq, nw = self.bound.shape
+        jacobian = np.zeros((nq * nw, len(varying)))
+        for column, name in enumerate(varying):
+            parameter, index = self._targets[name]
+            if index is None:
+                jacobian[:, column] = derivatives[parameter].ravel()
+            else:
+                jacobian[index * nw:(index + 1) * nw, column] = \
+                    derivatives[parameter][index]
+        if weights is not None:
+            jacobian *= np.reshape(weights, (-1, 1))
+        return jacobian
+
+    def fit(self, data, params=None, weights=None, method='leastsq',
+            fit_kws=None, analytic_jacobian: bool = True, **kwargs):
+        """
+        Fits the model to the spectra
+
+        Same as `lmfit.Model.fit`, with `data` and `weights` of shape
+        (nq, nw) or flattened. With the 'leastsq' method, analytic
+        derivatives are used unless `analytic_jacobian` is False or some
+        parameters are constrained by expressions, in which case finite
+        differences use relative steps of 1e-5 (`epsfcn` of 1e-10).
+        """
+        data = np.asarray(data, dtype=np.float64).ravel()
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64).ravel()
+        if params is None:
+            params = self.make_params()
+        fit_kws = dict(fit_kws or {})
+        if method == 'leastsq':
+            if analytic_jacobian and \
+                    all(par.expr is None for par in params.values()):
+                fit_kws.setdefault('Dfun', self.jacobian)
+            else:
+                # widths are computed in single precision: finite
+                # differences need steps larger than the default
+                fit_kws.setdefault('epsfcn', 1e-10)
+        return super().fit(data, params, weights, method=method,
+                           fit_kws=fit_kws, **kwargs)
@@ -0,0 +1,302 @@
+"""
+Fitting the models with Mantid
+
+The Mantid example registers one `IFunction1D` per model, evaluated once
+per spectrum in a `MultiDomainFunction`, with numerical derivatives
+(`NumDeriv=true`). This module generates the fit functions of any
+registered model:
+
+- :func:`make_function` fits one spectrum, with the momentum transfer as
+  attribute `Q`, as in the example, and analytic derivatives in
+  `functionDeriv1D`;
+- :func:`make_all_spectra_function` fits all the spectra of a dataset in
+  one vectorised call. The spectra, which share the same energy transfers,
+  are concatenated into one domain. Parameters taking one value per
+  spectrum are named `<name>_<index of q>`.
+
+The model parameters which are not fitted, *e.g.* `Nsites`, are attributes
+of the functions, and the physical bounds listed in
+:mod:`QENSmodels.registry` are added as constraints.
+
+In MantidWorkbench::
+
+    from QENSmodels.adapters import mantid as qens_mantid
+
+    qens_mantid.subscribe('sqwBrownianTranslationalDiffusion', q=Q,
+                          name='BrownianAllSpectra')
+    ws = mapi.CreateWorkspace(DataX=np.tile(hw, Q.size),
+                              DataY=data.ravel(), NSpec=1)
+    mapi.Fit(Function='name=BrownianAllSpectra,D=2.', InputWorkspace=ws,
+             Output='fit')
+
+"""
+import numpy as np
+from typing import Union, Optional, Iterable
+
+import QENSmodels
+from QENSmodels import registry
+
+try:
+    from mantid.api import IFunction1D, FunctionFactory
+except ImportError:
+    IFunction1D = None
+    FunctionFactory = None
+
+
+class _ModelFunction:
+    """
+    Methods of the generated fit functions
+
+    The generated classes also derive from `IFunction1D` (or from the class
+    given as `base`), which provides the declaration and access methods of
+    parameters and attributes.
+    """
+    #: specification of the model
+    spec = None  # type: registry.ModelSpec
+    #: momentum transfers of all-spectra functions, None for one spectrum
+    q = None  # type: Optional[np.ndarray]
+    #: resolution spectra of all-spectra functions
+    resolution = None  # type: Optional[np.ndarray]
+    #: (name of the fit parameter, model parameter, index of q or None)
+    targets = ()
+
+    def category(self) -> str:
+        return 'QuasiElastic'
+
+    def init(self):
+        for name, parameter, _ in self.targets:
+            item = self.spec[parameter]
+            self.declareParameter(name, float(item.default),
+                                  item.description)
+        if self.q is None:
+            self.declareAttribute('Q', 1.)
+        for item in self.spec.parameters:
+            if not item.fitting:
+                self.declareAttribute(
+                    item.name,
+                    int(item.default) if item.integer else
+                    float(item.default))
+
+        constraints = []
+        for name, parameter, _ in self.targets:
+            lower, upper = self.spec[parameter].bounds
+            if np.isfinite(lower) and np.isfinite(upper):
+                constraints.append('{!r}<{}<{!r}'.format(lower, name,
+                                                         upper))
+            elif np.isfinite(lower):
+                constraints.append('{!r}<{}'.format(lower, name))
+            elif np.isfinite(upper):
+                constraints.append('{}<{!r}'.format(name, upper))
+        if constraints:
+            self.addConstraints(','.join(constraints))
+
+    def _bound_model(self, xvals) -> 'QENSmodels.BoundModel':
+        """ Bound model of the energy transfers of the domain, rebuilt only
+        if the domain, Q or the attributes change """
+        if self.q is None:
+            q = np.array([self.getAttributeValue('Q')], dtype=np.float64)
+        else:
+            q = self.q
+        fixed = {item.name: self.getAttributeValue(item.name)
+                 for item in self.spec.parameters if not item.fitting}
+
+        xvals = np.asarray(xvals, dtype=np.float64)
+        if xvals.size % q.size:
+            raise ValueError('{} points cannot be split into {} spectra'
+                             .format(xvals.size, q.size))
+        w = xvals.reshape(q.size, -1)
+
+        bound = self.__dict__.get('_bound')
+        if bound is not None and bound.fixed == fixed and \
+                np.array_equal(bound.q, q) and \
+                np.array_equal(bound.w, w[0]):
+            return bound
+        if not np.array_equal(w, np.broadcast_to(w[0], w.shape)):
+            raise ValueError('all spectra should share the same energy '
+                             'transfers')
+        bound = QENSmodels.BoundModel(self.spec, w[0], q, self.resolution,
+                                      **fixed)
+        self.__dict__['_bound'] = bound
+        return bound
+
+    def _model_values(self, nq: int) -> dict:
+        """ Current values of the fit parameters, as passed to the model """
+        values = {}
+        for name, parameter, index in self.targets:
+            value = self.getParameterValue(name)
+            if index is None:
+                values[parameter] = value
+            else:
+                values.setdefault(parameter, np.empty(nq))[index] = value
+        return values
+
+    def function1D(self, xvals):
+        bound = self._bound_model(xvals)
+        return bound(**self._model_values(bound.q.size)).ravel()
+
+    def functionDeriv1D(self, xvals, jacobian):
+        bound = self._bound_model(xvals)
+        derivatives = bound.jacobian(
+            names=list(dict.fromkeys(item[1] for item in self.targets)),
+            **self._model_values(bound.q.size))
+        nw = bound.w.size
+        # the Jacobian is initialised to zero: parameters of one spectrum
+        # only set the rows of that spectrum
+        for ip, (_, parameter, index) in enumerate(self.targets):
+            if index is None:
+                column, offset = derivatives[parameter].ravel(), 0
+            else:
+                column, offset = derivatives[parameter][index], index * nw
+            for iy, value in enumerate(column.tolist()):
+                jacobian.set(offset + iy, ip, value)
+
+
+def _base(base: Optional[type]) -> type:
+    if base is not None:
+        return base
+    if IFunction1D is None:
+        raise ImportError('mantid is required to create fit functions')
+    return IFunction1D
+
+
+def make_function(
+        model: Union[str, 'registry.ModelSpec'],
+        name: Optional[str] = None,
+        base: Optional[type] = None
+) -> type:
+    """
+    Creates a Mantid fit function of one spectrum
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwBrownianTranslationalDiffusion'
+
+    name: str
+        name of the function in Mantid. Default to None (name of the
+        model).
+
+    base: type
+        class implementing the `IFunction1D` interface.
+        Default to None (`mantid.api.IFunction1D`).
+
+    Return
+    ------
+    type
+        subclass of `base`, to be registered with
+        `mantid.api.FunctionFactory.subscribe`
+
+    """
+    spec = registry.get(model) if isinstance(model, str) else model
+    targets = tuple((item.name, item.name, None)
+                    for item in spec.parameters if item.fitting)
+    return type(name or spec.name, (_ModelFunction, _base(base)),
+                {'spec': spec, 'targets': targets,
+                 '__doc__': spec.description})
+
+
+def make_all_spectra_function(
+        model: Union[str, 'registry.ModelSpec'],
+        q,
+        name: Optional[str] = None,
+        per_q: Iterable[str] = ('scale', 'center'),
+        resolution: Optional[np.ndarray] = None,
+        base: Optional[type] = None
+) -> type:
+    """
+    Creates a Mantid fit function of all the spectra of a dataset
+
+    The function is evaluated on the concatenated spectra, *i.e.* the
+    energy transfers repeated `q.size` times.
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwBrownianTranslationalDiffusion'
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfer of each spectrum
+
+    name: str
+        name of the function in Mantid. Default to None (name of the
+        model followed by 'AllSpectra').
+
+    per_q: iterable of str
+        'scale' and/or 'center', to fit them independently for each
+        spectrum. Default to ('scale', 'center'), as in the Mantid example.
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra, of shape (q.size, nw) or (nw,), convolved with
+        the model. Default to None (no convolution).
+
+    base: type
+        class implementing the `IFunction1D` interface.
+        Default to None (`mantid.api.IFunction1D`).
+
+    Return
+    ------
+    type
+        subclass of `base`, to be registered with
+        `mantid.api.FunctionFactory.subscribe`
+
+    """
+    spec = registry.get(model) if isinstance(model, str) else model
+    q = np.asarray(q, dtype=np.float64).reshape(-1)
+    per_q = set(per_q)
+    if not per_q <= {'scale', 'center'}:
+        raise ValueError('only scale and center can be fitted for each '
+                         'spectrum, not {}'.format(
+                             ', '.join(sorted(per_q - {'scale',
+                                                       'center'}))))
+
+    targets = []
+    for item in spec.parameters:
+        if not item.fitting:
+            continue
+        if item.q_vector or item.name in per_q:
+            targets.extend(('{}_{}'.format(item.name, i), item.name, i)
+                           for i in range(q.size))
+        else:
+            targets.append((item.name, item.name, None))
+    return type(name or spec.name + 'AllSpectra',
+                (_ModelFunction, _base(base)),
+                {'spec': spec, 'targets': tuple(targets), 'q': q,
+                 'resolution': resolution, '__doc__': spec.description})
+
+
+def subscribe(
+        model: Union[str, 'registry.ModelSpec'],
+        q=None,
+        **kwargs
+) -> type:
+    """
+    Creates a fit function and registers it in Mantid
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfer of each spectrum, to fit all spectra at once
+        (see :func:`make_all_spectra_function`). Default to None (function
+        of one spectrum, see :func:`make_function`).
+
+    **kwargs:
+        other arguments of :func:`make_function` or
+        :func:`make_all_spectra_function`
+
+    Return
+    ------
+    type
+        registered fit function
+
+    """
+    if FunctionFactory is None:
+        raise ImportError('mantid is required to register fit functions')
+    if q is None:
+        function = make_function(model, **kwargs)
+    else:
+        function = make_all_spectra_function(model, q, **kwargs)
+    FunctionFactory.subscribe(function)
+    return function
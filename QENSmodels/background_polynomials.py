@@ -1,12 +1,12 @@
 import numpy as np
-from numpy.polynomial import Polynomial
-from typing import Union
+from numpy.polynomial import polynomial
+from typing import Union, Optional
 
 
 def background_polynomials(
         x: Union[float, list, np.ndarray],
-        list_coefficients: Union[float, list] = 0.0
-) -> Polynomial:
+        list_coefficients: Union[float, list, np.ndarray] = 0.0
+) -> Union[float, np.ndarray]:
     r"""
     Polynomials of variable `w` and with coefficients contained in
     `list_coefficients`
@@ -17,9 +17,11 @@ def background_polynomials(
     x: list or :class:`~numpy:numpy.ndarray`
         domain of the function
 
-    list_coefficients: list or float
+    list_coefficients: list, float or :class:`~numpy:numpy.ndarray`
         list of coefficients for the polynomials in ascending order, i.e.
         the first element is the coefficient for the constant term.
+        An array of shape (nq, degree + 1) gives one polynomial per row
+        (see :func:`polynomial_backgrounds`).
         Default to 0 (no background).
 
     Return
@@ -38,6 +40,10 @@ def background_polynomials(
     >>> background_polynomials([1,2,3], [1,2,3])
     array([ 6., 17., 34.])
 
+    >>> background_polynomials([1, 2, 3], np.array([[1, 2], [0, 1]]))
+    array([[3., 5., 7.],
+           [1., 2., 3.]])
+
 
     Mathematically, `background_polynomials(x, [1,2,3])` corresponds to
     :math: 1 + 2x + 3x^2.
@@ -45,15 +51,135 @@ def background_polynomials(
 
     x = np.asarray(x)
 
+    if isinstance(list_coefficients, np.ndarray) and \
+            list_coefficients.ndim == 2:
+        return polynomial_backgrounds(x, list_coefficients)
+
+    if isinstance(list_coefficients, np.ndarray) and \
+            list_coefficients.ndim == 1 and \
+            np.issubdtype(list_coefficients.dtype, np.number):
+        list_coefficients = list_coefficients.tolist()
+
     # check that list_coefficients is a list and all elements are numbers
     if isinstance(list_coefficients, list) and \
             all(isinstance(w, (int, float)) for w in list_coefficients):
 
-        return Polynomial(list_coefficients)(x)
+        if not list_coefficients:
+            raise ValueError('problem with input')
+        return polynomial.polyval(x, np.array(list_coefficients,
+                                              dtype=np.float64))
 
     elif isinstance(list_coefficients, (int, float)):
 
-        return Polynomial(list_coefficients)(x)
+        return polynomial.polyval(x, [float(list_coefficients)])
 
     else:
         raise ValueError('problem with input')
+
+
+def polynomial_backgrounds(
+        w: Union[list, np.ndarray],
+        coefficients: np.ndarray,
+        out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Polynomial backgrounds of all momentum transfers, evaluated with a
+    vectorised Horner scheme
+
+    Parameters
+    ----------
+    w: list or :class:`~numpy:numpy.ndarray`
+        energy transfer, of shape (nw,)
+
+    coefficients: :class:`~numpy:numpy.ndarray`
+        coefficients in ascending order, of shape (nq, degree + 1)
+
+    out: :class:`~numpy:numpy.ndarray`
+        array of shape (nq, nw), *e.g.* the evaluated model, to which the
+        backgrounds are added. Default to None (a new array is allocated).
+
+    Return
+    ------
+    :class:`~numpy:numpy.ndarray`
+        array of shape (nq, nw)
+
+    Examples
+    --------
+    >>> w = np.linspace(-1, 1, 5)
+    >>> polynomial_backgrounds(w, np.array([[1., 0.5, 0.], [0., 0., 1.]]))
+    array([[0.5 , 0.75, 1.  , 1.25, 1.5 ],
+           [1.  , 0.25, 0.  , 0.25, 1.  ]])
+
+    """
+    w = np.asarray(w, dtype=np.float64).reshape(-1)
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    if coefficients.ndim != 2:
+        raise ValueError('coefficients should be of shape (nq, degree + 1)')
+    nq, ncoefficients = coefficients.shape
+    result = np.empty((nq, w.size))
+    result[...] = coefficients[:, -1:] if ncoefficients else 0.
+    for k in range(ncoefficients - 2, -1, -1):
+        result *= w
+        result += coefficients[:, k, None]
+    if out is None:
+        return result
+    out += result
+    return out
+
+
+class BoundBackground:
+    """
+    Polynomial backgrounds on a fixed energy-transfer grid
+
+    The powers of `w` (Vandermonde matrix) are computed once, so that the
+    backgrounds of all spectra are one matrix product, and their derivatives
+    with respect to the coefficients are the powers themselves.
+
+    Parameters
+    ----------
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer, of shape (nw,)
+
+    degree: int
+        degree of the polynomials
+
+    Examples
+    --------
+    >>> w = np.linspace(-1, 1, 5)
+    >>> background = BoundBackground(w, 1)
+    >>> background(np.array([[1., 0.5], [0., 2.]]))
+    array([[ 0.5 ,  0.75,  1.  ,  1.25,  1.5 ],
+           [-2.  , -1.  ,  0.  ,  1.  ,  2.  ]])
+    >>> background.jacobian.shape
+    (2, 5)
+
+    """
+
+    def __init__(self, w, degree: int):
+        if degree < 0:
+            raise ValueError('the degree of the background should be >= 0')
+        self.w = np.asarray(w, dtype=np.float64).reshape(-1)
+        self.degree = int(degree)
+        self.powers = self.w[None, :] ** np.arange(self.degree + 1)[:, None]
+
+    @property
+    def jacobian(self) -> np.ndarray:
+        """ Derivatives of each background with respect to its
+        coefficients, of shape (degree + 1, nw) """
+        return self.powers
+
+    def __call__(self, coefficients: np.ndarray,
+                 out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Backgrounds for coefficients of shape (nq, degree + 1), added to
+        `out` if given
+        """
+        coefficients = np.asarray(coefficients, dtype=np.float64)
+        if out is None:
+            return coefficients @ self.powers
+        out += coefficients @ self.powers
+        return out
+
+    def __repr__(self) -> str:
+        return 'BoundBackground(degree={}, nw={})'.format(self.degree,
+                                                          self.w.size)
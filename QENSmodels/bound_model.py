@@ -0,0 +1,255 @@
+"""
+Models bound to fixed energy and momentum transfer grids
+
+A fit evaluates the same model many times on the same grids. A
+:class:`BoundModel` checks the grids and the fixed parameters once, keeps
+what does not depend on the fitted parameters (integration weights, Fourier
+transforms of the resolution), and evaluates all momentum transfers in one
+vectorised pass.
+"""
+import numpy as np
+from typing import Union, Optional, Iterable, Dict
+
+import QENSmodels
+from QENSmodels import registry
+
+
+class BoundModel:
+    """
+    Model evaluated on fixed grids, optionally convolved with a resolution
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwBrownianTranslationalDiffusion'
+
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer (in 1/ps)
+
+    q: float, list or :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra of shape (q.size, w.size) or (w.size,).
+        Default to None (no convolution).
+
+    time_domain: bool
+        convolve the lines of the model with the resolution in the time
+        domain (see :class:`~QENSmodels.convolution.TimeDomainConvolution`)
+        instead of convolving the sampled model. The energy transfers should
+        be evenly spaced. Default to False.
+
+    **fixed:
+        values of parameters which are not fitted, *e.g.* `Nsites`. They are
+        validated once.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> w = np.linspace(-2, 2, 101)
+    >>> bound = BoundModel('sqwBrownianTranslationalDiffusion', w, [0.5, 1.])
+    >>> sqw = bound(D=0.5)
+    >>> sqw.shape
+    (2, 101)
+    >>> np.allclose(sqw, QENSmodels.sqwBrownianTranslationalDiffusion(
+    ...     w, [0.5, 1.], D=0.5))
+    True
+
+    """
+
+    def __init__(
+            self,
+            model: Union[str, 'registry.ModelSpec'],
+            w,
+            q,
+            resolution: Optional[np.ndarray] = None,
+            time_domain: bool = False,
+            **fixed
+    ):
+        self.spec = registry.get(model) if isinstance(model, str) else model
+        self.w = np.asarray(w, dtype=np.float64).reshape(-1)
+        self.q = np.asarray(q, dtype=np.float64).reshape(-1)
+
+        unknown = set(fixed) - set(self.spec.parameter_names)
+        if unknown:
+            raise TypeError('{} got unexpected parameter(s) {}'.format(
+                self.spec.name, ', '.join(sorted(unknown))))
+        for name, value in fixed.items():
+            self.spec[name].check(value)
+        self.fixed = fixed
+
+        # parameters which can take one value per momentum transfer
+        self.per_q_names = ['scale', 'center'] + [
+            item.name for item in self.spec.parameters if item.q_vector]
+
+        self._trapz = QENSmodels.lines.trapz_weights(self.w)
+
+        self.resolution = None
+        if resolution is not None:
+            self.resolution = QENSmodels.convolution.ResolutionOperator(
+                resolution)
+            if self.resolution.kernel_size != self.w.size or \
+                    self.resolution.resolution.shape[0] not in (1,
+                                                                self.q.size):
+                raise ValueError('resolution should be of shape (q.size, '
+                                 'w.size) or (w.size,)')
+
+        self.time_domain = None
+        if time_domain:
+            if resolution is None:
+                raise ValueError('time_domain requires a resolution')
+            self.time_domain = QENSmodels.convolution.TimeDomainConvolution(
+                self.w, resolution)
+
+    @property
+    def shape(self):
+        """ Shape of the evaluated model: (q.size, w.size) """
+        return self.q.size, self.w.size
+
+    def _values(self, params: dict) -> dict:
+        values = self.spec.defaults()
+        values.update(self.fixed)
+        values.update(params)
+        return values
+
+    def lines(self, **params):
+        """
+        Elastic weights, Lorentzian weights and widths of the model for the
+        bound momentum transfers (see :func:`QENSmodels.lines.model_lines`)
+        """
+        values = self._values(params)
+        del values['scale'], values['center']
+        return QENSmodels.lines.model_lines(self.spec.name, self.q, **values)
+
+    def evaluate(self, out: Optional[np.ndarray] = None, **params):
+        """
+        Evaluates the model, without resolution
+
+        `scale` and `center` can be given either as scalars or as one value
+        per momentum transfer. Parameter values are not checked.
+
+        Return
+        ------
+        :class:`~numpy:numpy.ndarray`
+            array of shape (q.size, w.size)
+
+        """
+        values = self._values(params)
+        scale = values.pop('scale')
+        center = values.pop('center')
+        elastic, weights, widths = QENSmodels.lines.model_lines(
+            self.spec.name, self.q, **values)
+        return QENSmodels.lines.evaluate_lines(
+            self.w, center, elastic, weights, widths, scale,
+            out=out, trapz=self._trapz)
+
+    def jacobian(
+            self,
+            names: Optional[Iterable[str]] = None,
+            **params
+    ) -> Dict[str, np.ndarray]:
+        """
+        Analytic derivatives of the model, convolved with the resolution if
+        any, with respect to its fitting parameters
+
+        Parameters
+        ----------
+        names: iterable of str
+            parameters to differentiate with respect to.
+            Default to None (all the fitting parameters).
+
+        **params:
+            values of the parameters
+
+        Return
+        ------
+        dict
+            maps the names of the parameters to arrays of shape
+            (q.size, w.size). For parameters taking one value per momentum
+            transfer, row `i` is the derivative with respect to the value
+            at `q[i]`.
+
+        """
+        if names is None:
+            names = self.spec.fitting_parameters
+        names = list(names)
+        values = self._values(params)
+        scale = values.pop('scale')
+        center = values.pop('center')
+        lines = QENSmodels.lines.model_lines(self.spec.name, self.q,
+                                             **values)
+        derivatives = QENSmodels.lines.model_lines_derivatives(
+            self.spec.name, self.q, lines, **values)
+        unknown = set(names) - set(derivatives) - {'scale', 'center'}
+        if unknown:
+            raise ValueError('no derivative with respect to {}'.format(
+                ', '.join(sorted(unknown))))
+        derivatives = {name: derivatives[name] for name in names
+                       if name in derivatives}
+        if self.time_domain is not None:
+            return self._time_domain_jacobian(names, scale, center, lines,
+                                              derivatives)
+        result = QENSmodels.lines.evaluate_lines_jacobian(
+            self.w, center, *lines, derivatives, scale=scale,
+            trapz=self._trapz,
+            with_respect_to=[name for name in names
+                             if name in ('scale', 'center')])
+        if self.resolution is not None:
+            result = {name: self.resolution(value)
+                      for name, value in result.items()}
+        return {name: result[name] for name in names}
+
+    def _time_domain_jacobian(self, names, scale, center, lines,
+                              derivatives) -> Dict[str, np.ndarray]:
+        """ Derivatives of the lines convolved in the time domain """
+        elastic, weights, widths = lines
+        nq = self.q.size
+        scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), (nq,))
+        unscaled = QENSmodels.lines.LineList.from_model_lines(
+            elastic, weights, widths, center)
+        operator = self.time_domain
+        result = {}
+        for name in names:
+            if name == 'scale':
+                result[name] = operator(unscaled)
+            elif name == 'center':
+                result[name] = operator.center_derivative(unscaled * scale)
+            else:
+                d_elastic, d_weights, d_widths = derivatives[name]
+                value = np.zeros(self.shape)
+                if d_elastic is not None or d_weights is not None:
+                    d_lines = QENSmodels.lines.LineList.from_model_lines(
+                        np.zeros(nq) if d_elastic is None else
+                        np.broadcast_to(d_elastic, (nq,)),
+                        np.zeros_like(weights) if d_weights is None else
+                        np.broadcast_to(d_weights, weights.shape),
+                        widths, center, scale)
+                    value += operator(d_lines)
+                if d_widths is not None:
+                    d_lines = QENSmodels.lines.LineList.from_model_lines(
+                        np.zeros(nq),
+                        weights * np.broadcast_to(d_widths, weights.shape),
+                        widths, center, scale)
+                    value += operator.width_derivative(d_lines)
+                result[name] = value
+        return result
+
+    def __call__(self, **params) -> np.ndarray:
+        """ Evaluates the model convolved with the resolution, if any """
+        if self.time_domain is not None:
+            values = self._values(params)
+            scale = values.pop('scale')
+            center = values.pop('center')
+            return self.time_domain(
+                QENSmodels.lines.LineList.from_model_lines(
+                    *QENSmodels.lines.model_lines(self.spec.name, self.q,
+                                                  **values),
+                    center=center, scale=scale))
+        model = self.evaluate(**params)
+        if self.resolution is not None:
+            model = self.resolution(model)
+        return model
+
+    def __repr__(self) -> str:
+        return 'BoundModel({!r}, nq={}, nw={})'.format(
+            self.spec.name, self.q.size, self.w.size)
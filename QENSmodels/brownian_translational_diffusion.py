@@ -2,10 +2,7 @@ import numpy as np
 from typing import Union, Tuple
 
 
-try:
-    import QENSmodels
-except ImportError:
-    print('Module QENSmodels not found')
+import QENSmodels
 
 
 def hwhmBrownianTranslationalDiffusion(
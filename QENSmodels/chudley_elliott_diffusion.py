@@ -1,10 +1,7 @@
 import numpy as np
 from typing import Union, Tuple
 
-try:
-    import QENSmodels
-except ImportError:
-    print('Module QENSmodels not found')
+import QENSmodels
 
 
 def hwhmChudleyElliottDiffusion(
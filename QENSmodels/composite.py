@@ -0,0 +1,298 @@
+"""
+Composite models
+
+The example notebooks combine models by adding the outputs of the model
+functions, *e.g.* a `lorentzian` and `sqwIsotropicRotationalDiffusion`,
+so that each component is evaluated on the energy grid separately. Here,
+models are combined as expressions (`model1 + model2`, `factor * model`,
+`convolve(model1, model2)`) whose components are represented by their
+lines (see :class:`QENSmodels.lines.LineList`). The lines of the whole
+expression are merged (coincident lines added, lines of zero weight
+dropped) and evaluated in one pass.
+"""
+import abc
+import numpy as np
+from math import inf
+from typing import List, Dict
+
+import QENSmodels
+from QENSmodels import registry
+from QENSmodels.lines import LineList
+
+# elementary line shapes, which can be components besides the registered
+# models
+_LINESHAPES = {
+    'lorentzian': registry.ModelSpec(
+        'lorentzian',
+        [registry.Parameter('scale', 1., (0., inf), linear=True,
+                            description='integrated intensity'),
+         registry.Parameter('center', 0., description='center of peak'),
+         registry.Parameter('hwhm', 1., (0., inf), q_vector=True,
+                            description='half-width at half-maximum')],
+        description='Lorentzian'),
+    'delta': registry.ModelSpec(
+        'delta',
+        [registry.Parameter('scale', 1., (0., inf), linear=True,
+                            description='integrated intensity'),
+         registry.Parameter('center', 0., description='center of peak')],
+        description='Delta function'),
+}
+
+
+class Expression(abc.ABC):
+    """
+    Base class of composite models
+
+    Expressions are evaluated as `expression(w, q, **params)`, where the
+    parameters are named after the parameters of the components, with their
+    prefix. Components having parameters of the same name share their
+    value. Subclasses define :attr:`components` and :meth:`lines`.
+    """
+
+    @property
+    @abc.abstractmethod
+    def components(self) -> List['Component']:
+        """ Models and line shapes of the expression """
+
+    @property
+    def parameter_names(self) -> List[str]:
+        """ Names of the parameters of the expression """
+        return list(self.defaults())
+
+    def defaults(self) -> Dict[str, float]:
+        """ Default values of the parameters """
+        values = {}
+        for component in self.components:
+            for name, value in component.defaults().items():
+                values.setdefault(name, value)
+        return values
+
+    @abc.abstractmethod
+    def lines(self, q, **params) -> LineList:
+        """
+        Lines of the expression for the momentum transfers `q`
+
+        Return
+        ------
+        :class:`~QENSmodels.lines.LineList`
+            lines, before merging
+
+        """
+
+    def __call__(self, w, q, **params) -> np.ndarray:
+        """
+        Evaluates the expression
+
+        Parameters
+        ----------
+        w: :class:`~numpy:numpy.ndarray`
+            energy transfer (in 1/ps)
+
+        q: float, list or :class:`~numpy:numpy.ndarray`
+            momentum transfer (in 1/Angstrom)
+
+        **params:
+            values of the parameters. Default values are used for missing
+            parameters.
+
+        Return
+        ------
+        :class:`~numpy:numpy.ndarray`
+            array of shape (q.size, w.size), or (w.size,) for one momentum
+            transfer, as for the models
+
+        """
+        unknown = set(params) - set(self.parameter_names)
+        if unknown:
+            raise TypeError('unexpected parameter(s) {}'.format(
+                ', '.join(sorted(unknown))))
+        q = np.asarray(q, dtype=np.float64).reshape(-1)
+        result = self.lines(q, **params).merged().evaluate(w)
+        return result[0] if q.size == 1 else result
+
+    def __add__(self, other: 'Expression') -> 'Expression':
+        if not isinstance(other, Expression):
+            return NotImplemented
+        return Sum(self, other)
+
+    def __mul__(self, factor) -> 'Expression':
+        if isinstance(factor, Expression) or np.ndim(factor) > 1:
+            return NotImplemented
+        return Scaled(factor, self)
+
+    __rmul__ = __mul__
+
+
+class Component(Expression):
+    """
+    Model or line shape in a composite model
+
+    Parameters
+    ----------
+    model: str
+        name of a registered model, *e.g.* 'sqwIsotropicRotationalDiffusion',
+        or 'lorentzian' or 'delta'
+
+    prefix: str
+        prefix of the names of the parameters. Default to ''.
+
+    **fixed:
+        values of the parameters which are not fitted, *e.g.* `Nsites`
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> w = np.linspace(-2, 2, 201)
+    >>> q = np.array([0.5, 1.])
+    >>> model = (Component('lorentzian', prefix='l_') +
+    ...          Component('sqwIsotropicRotationalDiffusion'))
+    >>> model.parameter_names
+    ['l_scale', 'l_center', 'l_hwhm', 'scale', 'center', 'radius', 'DR']
+    >>> sqw = model(w, q, l_scale=0.5, l_hwhm=0.2, radius=1.5, DR=0.3)
+    >>> np.allclose(
+    ...     sqw,
+    ...     QENSmodels.lorentzian(w, 0.5, 0., 0.2) +
+    ...     QENSmodels.sqwIsotropicRotationalDiffusion(w, q, radius=1.5,
+    ...                                                DR=0.3))
+    True
+
+    """
+
+    def __init__(self, model: str, prefix: str = '', **fixed):
+        if model in _LINESHAPES:
+            self.spec = _LINESHAPES[model]
+        else:
+            self.spec = registry.get(model)
+            if 'analytic_convolution' not in self.spec.supports:
+                raise ValueError('{} is not a sum of lines'.format(model))
+        self.prefix = prefix
+
+        unknown = set(fixed) - set(self.spec.parameter_names)
+        if unknown:
+            raise TypeError('{} got unexpected parameter(s) {}'.format(
+                self.spec.name, ', '.join(sorted(unknown))))
+        for name, value in fixed.items():
+            self.spec[name].check(value)
+        self.fixed = fixed
+
+    @property
+    def components(self) -> List['Component']:
+        return [self]
+
+    def defaults(self) -> Dict[str, float]:
+        return {self.prefix + item.name: item.default
+                for item in self.spec.parameters if item.fitting}
+
+    def lines(self, q, **params) -> LineList:
+        q = np.asarray(q, dtype=np.float64).reshape(-1)
+        values = {item.name: item.default for item in self.spec.parameters}
+        values.update(self.fixed)
+        for name in self.spec.fitting_parameters:
+            if self.prefix + name in params:
+                values[name] = params[self.prefix + name]
+                self.spec[name].check(values[name])
+
+        scale = values.pop('scale')
+        center = values.pop('center')
+        if self.spec.name == 'lorentzian':
+            hwhm = np.broadcast_to(np.asarray(values['hwhm'], np.float64),
+                                   (q.size,))
+            return LineList.from_model_lines(np.zeros(q.size),
+                                             np.ones((q.size, 1)),
+                                             hwhm[:, None], center, scale)
+        if self.spec.name == 'delta':
+            return LineList.from_model_lines(np.ones(q.size),
+                                             np.zeros((q.size, 0)),
+                                             np.zeros((q.size, 0)),
+                                             center, scale)
+        return LineList.from_model_lines(
+            *QENSmodels.lines.model_lines(self.spec.name, q, **values),
+            center=center, scale=scale)
+
+    def __repr__(self) -> str:
+        return 'Component({!r}{})'.format(
+            self.spec.name,
+            ', prefix={!r}'.format(self.prefix) if self.prefix else '')
+
+
+class Sum(Expression):
+    """ Sum of expressions """
+
+    def __init__(self, *terms: Expression):
+        self.terms = []
+        for term in terms:
+            # flatten nested sums
+            self.terms.extend(term.terms if isinstance(term, Sum)
+                              else [term])
+
+    @property
+    def components(self) -> List[Component]:
+        return [component for term in self.terms
+                for component in term.components]
+
+    def lines(self, q, **params) -> LineList:
+        result = self.terms[0].lines(q, **params)
+        for term in self.terms[1:]:
+            result = result + term.lines(q, **params)
+        return result
+
+    def __repr__(self) -> str:
+        return ' + '.join(repr(term) for term in self.terms)
+
+
+class Scaled(Expression):
+    """ Expression multiplied by a constant, or by one constant per
+    momentum transfer """
+
+    def __init__(self, factor, expression: Expression):
+        self.factor = factor
+        self.expression = expression
+
+    @property
+    def components(self) -> List[Component]:
+        return self.expression.components
+
+    def lines(self, q, **params) -> LineList:
+        return self.factor * self.expression.lines(q, **params)
+
+    def __repr__(self) -> str:
+        return '{!r} * ({!r})'.format(self.factor, self.expression)
+
+
+class Convolution(Expression):
+    """ Convolution of two expressions, computed analytically """
+
+    def __init__(self, left: Expression, right: Expression):
+        self.left = left
+        self.right = right
+
+    @property
+    def components(self) -> List[Component]:
+        return self.left.components + self.right.components
+
+    def lines(self, q, **params) -> LineList:
+        # merging first reduces the number of pairs of lines
+        return QENSmodels.lines.analytic_convolve(
+            self.left.lines(q, **params).merged(),
+            self.right.lines(q, **params).merged())
+
+    def __repr__(self) -> str:
+        return 'convolve({!r}, {!r})'.format(self.left, self.right)
+
+
+def convolve(left: Expression, right: Expression) -> Convolution:
+    """
+    Analytic convolution of two composite models
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> w = np.linspace(-2, 2, 201)
+    >>> model = convolve(Component('lorentzian', prefix='a_'),
+    ...                  Component('lorentzian', prefix='b_'))
+    >>> np.allclose(model(w, 1., a_hwhm=0.1, b_hwhm=0.2, b_center=0.1),
+    ...             QENSmodels.lorentzian(w, 1., 0.1, 0.3))
+    True
+
+    """
+    return Convolution(left, right)
@@ -0,0 +1,332 @@
+"""
+Convolution of models with measured resolution functions
+
+The resolution spectra of an experiment do not change during a fit: their
+Fourier transforms are computed once, so that each convolution of a model
+costs one forward and one inverse real FFT for all momentum transfers.
+Models made of lines can also be convolved in the time domain
+(:class:`TimeDomainConvolution`), which stays accurate for lines narrower
+than the energy step.
+"""
+import numpy as np
+from scipy import fft
+
+import QENSmodels
+from QENSmodels.lines import _BLOCK_SIZE
+
+
+class ResolutionOperator:
+    """
+    Convolution with one resolution spectrum per momentum transfer
+
+    Applying the operator to a model sampled on the same energy grid gives
+    the same result as
+    `numpy.convolve(model[i], resolution[i] / resolution[i].sum(),
+    mode='same')` for each spectrum `i`, as done in the example fits.
+
+    Parameters
+    ----------
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra, of shape (nq, nw), or (nw,) if the same
+        resolution is used for all spectra
+
+    normalize: bool
+        divide each resolution spectrum by its sum. Default to True.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> resolution = np.array([[0., 1., 2., 1., 0.], [0., 0., 1., 0., 0.]])
+    >>> operator = ResolutionOperator(resolution)
+    >>> model = np.array([[0., 0., 4., 0., 0.], [1., 2., 3., 4., 5.]])
+    >>> np.allclose(operator(model), [[0., 1., 2., 1., 0.],
+    ...                               [1., 2., 3., 4., 5.]])
+    True
+
+    """
+
+    def __init__(self, resolution: np.ndarray, normalize: bool = True):
+        resolution = np.asarray(resolution, dtype=np.float64)
+        if resolution.ndim == 1:
+            resolution = resolution[None, :]
+        if resolution.ndim != 2:
+            raise ValueError('resolution should be a 1D or 2D array')
+        if normalize:
+            resolution = resolution / resolution.sum(axis=1, keepdims=True)
+
+        self.resolution = resolution
+        self.kernel_size = resolution.shape[1]
+        self._fft_size = None
+        self._kernel_fft = None
+        self._size = None
+
+    def _prepare(self, size: int) -> None:
+        """ Computes the Fourier transforms of the kernels for models of
+        `size` points """
+        self._size = size
+        self._fft_size = fft.next_fast_len(size + self.kernel_size - 1,
+                                           real=True)
+        self._kernel_fft = fft.rfft(self.resolution, self._fft_size, axis=1)
+        # start of the 'same' part of the full convolution
+        self._start = (min(size, self.kernel_size) - 1) // 2
+        self._stop = self._start + max(size, self.kernel_size)
+
+    def __call__(self, model: np.ndarray) -> np.ndarray:
+        """
+        Convolves the model with the resolution
+
+        Parameters
+        ----------
+        model: :class:`~numpy:numpy.ndarray`
+            model of shape (nq, nw), or (nw,)
+
+        Return
+        ------
+        :class:`~numpy:numpy.ndarray`
+            convolved model, of the same shape as `model`
+
+        """
+        model = np.asarray(model, dtype=np.float64)
+        shape = model.shape
+        model = model.reshape(-1, shape[-1])
+        if model.shape[1] != self._size:
+            self._prepare(model.shape[1])
+        if self._kernel_fft.shape[0] not in (1, model.shape[0]):
+            raise ValueError('{} spectra cannot be convolved with {} '
+                             'resolution spectra'.format(
+                                 model.shape[0], self._kernel_fft.shape[0]))
+
+        spectrum = fft.rfft(model, self._fft_size, axis=1)
+        spectrum *= self._kernel_fft
+        result = fft.irfft(spectrum, self._fft_size, axis=1)
+        return result[:, self._start:self._stop].reshape(
+            shape[:-1] + (self._stop - self._start,))
+
+
+def _images(x, gamma, period, derivative=None):
+    """
+    Sum of the periodic images of unit Lorentzians, without the Lorentzians
+    themselves: :math:`\\sum_{n \\neq 0} L_\\gamma(x + n P)`, or its
+    derivative with respect to the width or the center
+    """
+    inelastic = gamma > 0
+    gamma = np.where(inelastic, gamma, 1.)
+    a = 2. * np.pi / period
+    e = np.exp(-a * gamma)
+    # periodic sum in closed form, written to be accurate for narrow and
+    # wide lines
+    one_minus_e = -np.expm1(-a * gamma)
+    one_minus_cos = 2. * np.square(np.sin(0.5 * a * x))
+    numerator = -np.expm1(-2. * a * gamma)
+    denominator = np.square(one_minus_e) + 2. * e * one_minus_cos
+    x2g2 = np.square(x) + np.square(gamma)
+    if derivative is None:
+        result = numerator / (period * denominator) - gamma / (np.pi * x2g2)
+    elif derivative == 'width':
+        result = 2. * a * e / period * (
+            e * denominator - numerator * (one_minus_e - one_minus_cos)
+        ) / np.square(denominator) - \
+            (np.square(x) - np.square(gamma)) / (np.pi * np.square(x2g2))
+    else:
+        # derivative with respect to the center, i.e. minus d/dx
+        result = a / period * numerator * 2. * e * np.sin(a * x) / \
+            np.square(denominator) - \
+            2. * gamma * x / (np.pi * np.square(x2g2))
+    return np.where(inelastic, result, 0.)
+
+
+class TimeDomainConvolution:
+    """
+    Convolution of lines with resolution spectra in the time domain
+
+    Sampling a Lorentzian narrower than the energy step before convolving it
+    with the resolution (:class:`ResolutionOperator`) misses most of its
+    area. Here, the Fourier transforms of the resolution spectra are
+    computed once and multiplied by the analytic Fourier transforms of the
+    lines (a constant for the elastic line, decaying exponentials for the
+    Lorentzians), so that one inverse real FFT gives the convolved spectra
+    of all momentum transfers, whatever the widths of the lines.
+
+    The lines are not cut at the edges of the energy range, and the
+    periodic images introduced by the discrete transform are subtracted
+    analytically. For lines wider than the energy step, the result matches
+    the convolution of the sampled model, except close to the edges where
+    :class:`ResolutionOperator` neglects the model outside the range.
+
+    Parameters
+    ----------
+    w: :class:`~numpy:numpy.ndarray`
+        evenly spaced energy transfers (in 1/ps)
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra on the same energy step, of shape (nq, nk), or
+        (nk,) if the same resolution is used for all spectra. As in
+        `numpy.convolve(model, resolution, mode='same')`, the point
+        `(nk - 1) // 2` of the resolution is at zero energy transfer.
+
+    normalize: bool
+        divide each resolution spectrum by its sum. Default to True.
+
+    Examples
+    --------
+    Lorentzians convolved with a Gaussian resolution are Voigt profiles,
+    even when they are much narrower than the energy step
+
+    >>> import numpy as np
+    >>> from scipy.special import voigt_profile
+    >>> w = np.linspace(-1, 1, 101)
+    >>> resolution = np.exp(-0.5 * (w / 0.1) ** 2)
+    >>> operator = TimeDomainConvolution(w, resolution)
+    >>> lines = QENSmodels.lines.LineList([[1.], [1.]], [[1e-4], [2.]],
+    ...                                   [[0.03], [0.]])
+    >>> sqw = operator(lines)
+    >>> np.allclose(sqw[0], voigt_profile(w - 0.03, 0.1, 1e-4))
+    True
+    >>> np.allclose(sqw[1], voigt_profile(w, 0.1, 2.))
+    True
+
+    """
+
+    def __init__(self, w: np.ndarray, resolution: np.ndarray,
+                 normalize: bool = True):
+        self.w = np.asarray(w, dtype=np.float64).reshape(-1)
+        if self.w.size < 2:
+            raise ValueError('at least two energy transfers are needed')
+        step = (self.w[-1] - self.w[0]) / (self.w.size - 1)
+        if not np.allclose(np.diff(self.w), step, rtol=1e-6, atol=0.):
+            raise ValueError('energy transfers should be evenly spaced')
+        self.step = step
+
+        resolution = np.asarray(resolution, dtype=np.float64)
+        if resolution.ndim == 1:
+            resolution = resolution[None, :]
+        if resolution.ndim != 2:
+            raise ValueError('resolution should be a 1D or 2D array')
+        if normalize:
+            resolution = resolution / resolution.sum(axis=1, keepdims=True)
+        self.resolution = resolution
+        self.kernel_size = resolution.shape[1]
+
+        # size of the linear convolution: the periodic images of the lines
+        # are subtracted, and are smooth over the energy range
+        self._fft_size = fft.next_fast_len(
+            self.w.size + self.kernel_size, real=True)
+        self.period = self._fft_size * step
+        kernel = np.zeros((resolution.shape[0], self._fft_size))
+        kernel[:, :self.kernel_size] = resolution
+        kernel = np.roll(kernel, -((self.kernel_size - 1) // 2), axis=1)
+        self._kernel_fft = fft.rfft(kernel, axis=1)
+        self._tau = 2. * np.pi / self.period * np.arange(
+            self._kernel_fft.shape[1])
+
+        # energy transfers of the circular grid, centred on the range
+        index = np.arange(self._fft_size)
+        middle = self.w.size + (self._fft_size - self.w.size) // 2
+        self._x = self.w[0] + np.where(index < middle, index,
+                                       index - self._fft_size) * step
+
+    def _transform(self, weights, widths, centers, derivative=None):
+        """ Fourier transform of the sum of lines (or of their derivatives
+        with respect to their widths or centers), on the circular grid """
+        nq = weights.shape[0]
+        tau = self._tau
+        used = np.any(weights != 0, axis=0)
+        weights, widths, centers = (weights[:, used], widths[:, used],
+                                    centers[:, used])
+        if not np.any(used):
+            return np.zeros((nq, tau.size), dtype=np.complex128)
+        # lines sharing their center: one phase factor per momentum transfer
+        shared = np.all(centers == centers[:, :1])
+        if shared:
+            # and often one center for all momentum transfers
+            centers = centers[:1, :1] if np.all(centers == centers[0, 0]) \
+                else centers[:, :1]
+
+        result = np.zeros((nq, tau.size),
+                          dtype=np.float64 if shared else np.complex128)
+        nlines = weights.shape[1]
+        step = max(1, _BLOCK_SIZE // max(1, nq * tau.size))
+        for start in range(0, nlines, step):
+            lines_ = slice(start, start + step)
+            block = np.exp(-widths[:, lines_, None] * tau)
+            if not shared:
+                block = block * np.exp(-1j * tau * (
+                    centers[:, lines_, None] - self.w[0]))
+            result += np.einsum('ql,qlm->qm', weights[:, lines_], block)
+        if shared:
+            result = result * np.exp(-1j * tau * (centers - self.w[0]))
+        if derivative == 'width':
+            result *= -tau
+        elif derivative == 'center':
+            result = result * (-1j * tau)
+        # samples of the periodic spectra have a sum N times their mean
+        result *= 1. / self.step
+
+        # periodic images of the Lorentzians
+        inelastic = np.any(widths != 0, axis=0)
+        if not np.any(inelastic):
+            return result
+        weights, widths = weights[:, inelastic], widths[:, inelastic]
+        if not shared:
+            centers = centers[:, inelastic]
+        images = np.zeros((nq, self._fft_size))
+        nlines = weights.shape[1]
+        step = max(1, _BLOCK_SIZE // max(1, nq * self._fft_size))
+        for start in range(0, nlines, step):
+            lines_ = slice(start, start + step)
+            x = self._x - (centers[:, :, None] if shared else
+                           centers[:, lines_, None])
+            images += np.einsum(
+                'ql,qlk->qk', weights[:, lines_],
+                _images(x, widths[:, lines_, None], self.period,
+                        derivative))
+        return result - fft.rfft(images, axis=1)
+
+    def _inverse(self, transform: np.ndarray) -> np.ndarray:
+        if self._kernel_fft.shape[0] not in (1, transform.shape[0]):
+            raise ValueError('{} spectra cannot be convolved with {} '
+                             'resolution spectra'.format(
+                                 transform.shape[0],
+                                 self._kernel_fft.shape[0]))
+        transform = transform * self._kernel_fft
+        return fft.irfft(transform, self._fft_size,
+                         axis=1)[:, :self.w.size]
+
+    @staticmethod
+    def _arrays(lines):
+        return lines.weights, lines.widths, lines.centers
+
+    def __call__(self, lines: 'QENSmodels.lines.LineList') -> np.ndarray:
+        """
+        Convolves lines with the resolution
+
+        Parameters
+        ----------
+        lines: :class:`~QENSmodels.lines.LineList`
+            lines of the model for each momentum transfer
+
+        Return
+        ------
+        :class:`~numpy:numpy.ndarray`
+            convolved spectra, of shape (lines.nq, w.size)
+
+        """
+        return self._inverse(self._transform(*self._arrays(lines)))
+
+    def width_derivative(
+            self,
+            lines: 'QENSmodels.lines.LineList'
+    ) -> np.ndarray:
+        """ Convolved sum of the derivatives of the lines with respect to
+        their widths, each weighted as in `lines` """
+        return self._inverse(self._transform(*self._arrays(lines),
+                                             derivative='width'))
+
+    def center_derivative(
+            self,
+            lines: 'QENSmodels.lines.LineList'
+    ) -> np.ndarray:
+        """ Convolved sum of the derivatives of the lines with respect to
+        their centers, each weighted as in `lines` """
+        return self._inverse(self._transform(*self._arrays(lines),
+                                             derivative='center'))
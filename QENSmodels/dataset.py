@@ -0,0 +1,99 @@
+import numpy as np
+from typing import Union, Optional, Iterator
+
+
+class QENSDataset:
+    r""" Container for :math:`S(q, \omega)` data measured on a common
+    energy-transfer grid
+
+    It is the structure consumed by the fitting tools of the library: one
+    spectrum per momentum transfer, all sharing the same `w` axis.
+
+    Parameters
+    ----------
+    w: list or :class:`~numpy:numpy.ndarray`
+        energy transfer, shared by all spectra
+
+    q: float, list or :class:`~numpy:numpy.ndarray`
+        momentum transfer of each spectrum
+
+    data: list or :class:`~numpy:numpy.ndarray`
+        intensities, of shape (q.size, w.size)
+
+    error: list or :class:`~numpy:numpy.ndarray`
+        uncertainties on `data`, of shape (q.size, w.size).
+        Default to None (no uncertainties).
+
+    metadata: dict
+        information attached to the dataset (units, run title, ...).
+        Default to None (empty dictionary).
+
+    Examples
+    --------
+    >>> dataset = QENSDataset([-1., 0., 1.], [0.5, 1.], [[1, 2, 1], [2, 4, 2]])
+    >>> dataset.nq, dataset.nw
+    (2, 3)
+    >>> dataset.data.dtype
+    dtype('float64')
+    >>> dataset.select([1]).data
+    array([[2., 4., 2.]])
+
+    """
+
+    def __init__(
+            self,
+            w: Union[list, np.ndarray],
+            q: Union[float, list, np.ndarray],
+            data: Union[list, np.ndarray],
+            error: Optional[Union[list, np.ndarray]] = None,
+            metadata: Optional[dict] = None
+    ):
+        self.w = np.asarray(w, dtype=np.float64).reshape(-1)
+        self.q = np.asarray(q, dtype=np.float64).reshape(-1)
+        self.data = np.asarray(data, dtype=np.float64).reshape(
+            self.q.size, -1)
+
+        if self.data.shape != (self.q.size, self.w.size):
+            raise ValueError('data should have shape (q.size, w.size) = '
+                             '({}, {})'.format(self.q.size, self.w.size))
+
+        if error is not None:
+            error = np.asarray(error, dtype=np.float64).reshape(
+                self.data.shape)
+        self.error = error
+
+        self.metadata = {} if metadata is None else dict(metadata)
+
+    @property
+    def nq(self) -> int:
+        """ Number of spectra """
+        return self.q.size
+
+    @property
+    def nw(self) -> int:
+        """ Number of energy-transfer points per spectrum """
+        return self.w.size
+
+    def select(
+            self,
+            indices: Union[int, slice, list, np.ndarray]
+    ) -> 'QENSDataset':
+        """ Returns a new dataset restricted to the spectra `indices` """
+        if isinstance(indices, (int, np.integer)):
+            indices = [indices]
+        return QENSDataset(
+            self.w,
+            self.q[indices],
+            self.data[indices],
+            None if self.error is None else self.error[indices],
+            self.metadata)
+
+    def iter_blocks(self, block_size: int) -> Iterator['QENSDataset']:
+        """ Yields consecutive datasets of at most `block_size` spectra """
+        if block_size < 1:
+            raise ValueError('block_size should be strictly positive')
+        for start in range(0, self.nq, block_size):
+            yield self.select(slice(start, start + block_size))
+
+    def __repr__(self) -> str:
+        return 'QENSDataset(nq={}, nw={})'.format(self.nq, self.nw)
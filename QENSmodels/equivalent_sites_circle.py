@@ -1,10 +1,7 @@
 import numpy as np
-from typing import Union, Tuple
+from typing import Union
 
-try:
-    import QENSmodels
-except ImportError:
-    print('Module QENSmodels not found')
+import QENSmodels
 
 
 def hwhmEquivalentSitesCircle(
@@ -12,7 +9,7 @@ def hwhmEquivalentSitesCircle(
         Nsites: int = 3,
         radius: float = 1.0,
         resTime: float = 1.0
-) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+) -> 'QENSmodels.LineSpectrum':
     """
     Returns some characteristics of `EquivalentSitesCircle` as functions
     of the momentum transfer `q`:
@@ -35,14 +32,11 @@ def hwhmEquivalentSitesCircle(
 
     Returns
     -------
-    hwhm: :class:`~numpy:numpy.ndarray`
-       half-width half maximum
-
-    eisf: :class:`~numpy:numpy.ndarray`
-       elastic incoherent structure factor
-
-    qisf: :class:`~numpy:numpy.ndarray`
-       quasi-elastic incoherent structure factor
+    :class:`~QENSmodels.line_spectrum.LineSpectrum`
+        half-width half maximum (`hwhm`), elastic incoherent structure
+        factor (`eisf`) and quasi-elastic incoherent structure factor
+        (`qisf`), which unpack to full arrays. `hwhm` is stored once,
+        being the same for all momentum transfers.
 
 
     Examples
@@ -81,8 +75,9 @@ def hwhmEquivalentSitesCircle(
     # index of sites in circle
     sites = np.arange(Nsites)
 
+    # same widths for all momentum transfers: a single row
     hwhm = 2.0 / resTime * np.sin(sites * np.pi / Nsites) ** 2
-    hwhm = np.tile(hwhm, (q.size, 1))
+    hwhm = hwhm[np.newaxis, :]
 
     # jump distances between sites
     jump_distance = 2.0 * radius * np.sin(sites * np.pi / Nsites)
@@ -102,7 +97,7 @@ def hwhmEquivalentSitesCircle(
     eisf = isf[:, 0]
     qisf = isf[:, 1:]
 
-    return hwhm, eisf, qisf
+    return QENSmodels.LineSpectrum(hwhm, eisf, qisf)
 
 
 def sqwEquivalentSitesCircle(
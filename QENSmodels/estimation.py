@@ -0,0 +1,337 @@
+"""
+Initial values of the parameters of the models, estimated from the data
+
+Fits starting far from the solution are slow or fail. The shape of each
+spectrum is first summarised by its integrated intensity, its elastic
+fraction and an apparent half-width (:func:`apparent_lines`), for all
+momentum transfers in one vectorised pass. The known q-dependence of the
+EISF and of the widths of each model (*e.g.* :math:`\\Gamma = Dq^2` for
+Brownian diffusion, or the EISF :math:`j_0^2(qr)` of isotropic rotational
+diffusion) is then inverted to give starting values of its parameters
+(:func:`estimate_initial`).
+"""
+import numpy as np
+from typing import Union, Optional, Dict
+
+import QENSmodels
+from QENSmodels import registry
+
+
+def apparent_lines(
+        w,
+        data: np.ndarray,
+        resolution: Optional[np.ndarray] = None,
+        widths: Optional[np.ndarray] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Apparent elastic line and Lorentzian of each spectrum
+
+    Each spectrum is compared with an elastic line, a Lorentzian and a
+    constant, for all the widths of a logarithmic grid at once: the
+    amplitudes are solved by linear least squares and the width of the best
+    match is refined by parabolic interpolation.
+
+    Parameters
+    ----------
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer (in 1/ps)
+
+    data: :class:`~numpy:numpy.ndarray`
+        spectra, of shape (nq, w.size) or (w.size,)
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra of shape (nq, w.size) or (w.size,).
+        Default to None (no convolution).
+
+    widths: :class:`~numpy:numpy.ndarray`
+        grid of half-widths to compare with. Default to None (40 widths from
+        the step to the range of `w`).
+
+    Return
+    ------
+    dict
+        'center' (common to all spectra), and 'intensity', 'eisf' and
+        'hwhm' of each spectrum, of shape (nq,)
+
+    Examples
+    --------
+    >>> w = np.linspace(-2, 2, 401)
+    >>> data = QENSmodels.sqwDeltaLorentz(w, [0.5, 1.], 2., 0.1, 0.3, 0.2)
+    >>> lines = apparent_lines(w, data)
+    >>> round(lines['center'], 2)
+    0.1
+    >>> np.round(lines['eisf'], 2), np.round(lines['hwhm'], 2)
+    (array([0.3, 0.3]), array([0.2, 0.2]))
+    >>> np.round(lines['intensity'], 1)
+    array([2., 2.])
+
+    """
+    w = np.asarray(w, dtype=np.float64).reshape(-1)
+    data = np.atleast_2d(np.asarray(data, dtype=np.float64))
+    nq = data.shape[0]
+    if widths is None:
+        step = np.min(np.diff(w))
+        widths = np.geomspace(step, np.ptp(w), 40)
+    widths = np.asarray(widths, dtype=np.float64).reshape(-1)
+
+    center = float(np.median(w[np.argmax(data, axis=1)]))
+    bound = QENSmodels.BoundModel('sqwDeltaLorentz', w, np.zeros(nq),
+                                  resolution)
+    elastic = bound(center=center, A0=1.)
+    # basis of each spectrum and width: elastic line, Lorentzian, constant
+    basis = np.empty((nq, widths.size, 3, w.size))
+    basis[:, :, 0] = elastic[:, None]
+    for j, width in enumerate(widths):
+        basis[:, j, 1] = bound(center=center, A0=0., hwhm=width)
+    basis[:, :, 2] = 1.
+
+    gram = np.einsum('qjkw,qjlw->qjkl', basis, basis)
+    target = np.einsum('qjkw,qw->qjk', basis, data)
+    amplitudes = _amplitudes(gram, target)
+    cost = np.einsum('qjk,qjkl,qjl->qj', amplitudes, gram, amplitudes) - \
+        2. * np.einsum('qjk,qjk->qj', amplitudes, target)
+
+    rows = np.arange(nq)
+    best = np.argmin(cost, axis=1)
+    # parabolic interpolation of the cost in log(width)
+    inner = np.clip(best, 1, widths.size - 2)
+    low, middle, high = (cost[rows, inner - 1], cost[rows, inner],
+                         cost[rows, inner + 1])
+    curvature = low - 2. * middle + high
+    shift = np.where(curvature > 0,
+                     0.5 * (low - high) / np.where(curvature > 0,
+                                                   curvature, 1.), 0.)
+    shift = np.where(best == inner, np.clip(shift, -1., 1.), 0.)
+    logs = np.log(widths)
+    hwhm = np.exp(logs[inner] + shift * (logs[inner + 1] - logs[inner]))
+
+    # amplitudes at the refined widths
+    basis = basis[:, 0]
+    basis[:, 1] = bound(center=center, A0=0., hwhm=hwhm)
+    amplitudes = _amplitudes(np.einsum('qkw,qlw->qkl', basis, basis),
+                             np.einsum('qkw,qw->qk', basis, data))
+    intensity = amplitudes[:, 0] + amplitudes[:, 1]
+    eisf = np.divide(amplitudes[:, 0], intensity,
+                     out=np.zeros(nq), where=intensity > 0)
+    return {'center': center, 'intensity': intensity, 'eisf': eisf,
+            'hwhm': hwhm}
+
+
+def _amplitudes(gram, target):
+    """ Solutions of the normal equations, with non-negative amplitudes of
+    the elastic line and of the Lorentzian """
+    scale = np.trace(gram, axis1=-2, axis2=-1)[..., None, None]
+    amplitudes = np.linalg.solve(gram + 1e-12 * scale * np.eye(3),
+                                 target[..., None])[..., 0]
+    amplitudes[..., :2] = np.maximum(amplitudes[..., :2], 0.)
+    return amplitudes
+
+
+def _slope(x, y) -> float:
+    """ Least-squares slope of a line through the origin """
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    denominator = np.sum(x * x)
+    return float(np.sum(x * y) / denominator) if denominator > 0 else np.nan
+
+
+def _model_lines(model, q, **params):
+    """ EISF and apparent width of the Lorentzians of a model, with
+    default values of the parameters not given """
+    values = registry.get(model).defaults()
+    del values['scale'], values['center']
+    values.update(params)
+    return QENSmodels.lines.quasielastic_summary(
+        *QENSmodels.lines.model_lines(model, q, **values))
+
+
+def _search(candidates, name, model, q, eisf, **params):
+    """ Value of a geometric parameter whose EISF best matches `eisf` """
+    costs = [np.nansum(np.square(
+        _model_lines(model, q, **dict(params, **{name: value}))[0] - eisf))
+        for value in candidates]
+    return float(candidates[int(np.argmin(costs))])
+
+
+def _rate(model, name, q, hwhm, inverse=False, **params):
+    """ Parameter by which all the widths of a model are multiplied (or
+    divided if `inverse`) """
+    _, mean = _model_lines(model, q, **dict(params, **{name: 1.}))
+    slope = _slope(mean, hwhm)
+    return 1. / slope if inverse else slope
+
+
+_RADII = np.linspace(0.2, 5., 97)
+
+
+def _brownian(q, eisf, hwhm, fixed):
+    return {'D': _slope(q ** 2, hwhm)}
+
+
+def _jump_translational(q, eisf, hwhm, fixed):
+    # 1 / hwhm = 1 / (D q^2) + resTime
+    slope, intercept = np.polyfit(1. / q ** 2, 1. / hwhm, 1)
+    if slope <= 0:
+        return {'D': _slope(q ** 2, hwhm)}
+    return {'D': 1. / slope, 'resTime': max(intercept, 0.)}
+
+
+def _chudley_elliott(q, eisf, hwhm, fixed):
+    best = None
+    for L in np.linspace(0.2, 10., 99):
+        shape = 6. * (1. - np.sinc(q * L / np.pi)) / L ** 2
+        D = _slope(shape, hwhm)
+        cost = np.sum(np.square(D * shape - hwhm))
+        if best is None or cost < best[0]:
+            best = cost, D, L
+    return {'D': best[1], 'L': best[2]}
+
+
+def _delta_lorentz(q, eisf, hwhm, fixed):
+    return {'A0': eisf, 'hwhm': hwhm}
+
+
+def _delta_two_lorentz(q, eisf, hwhm, fixed):
+    return {'A0': eisf, 'A1': 0.5 * (1. - eisf), 'hwhm1': 0.5 * hwhm,
+            'hwhm2': 2. * hwhm}
+
+
+def _sites(model):
+    def invert(q, eisf, hwhm, fixed):
+        params = {name: fixed[name] for name in ('Nsites', 'sigma')
+                  if name in fixed}
+        radius = fixed.get('radius')
+        if radius is None:
+            radius = _search(_RADII, 'radius', model, q, eisf, resTime=1.,
+                             **params)
+        return {'radius': radius,
+                'resTime': _rate(model, 'resTime', q, hwhm, inverse=True,
+                                 radius=radius, **params)}
+    return invert
+
+
+def _gaussian_model_3d(q, eisf, hwhm, fixed):
+    # EISF = exp(-q^2 <u_x^2>)
+    valid = (eisf > 0) & (eisf < 1)
+    variance = fixed.get('variance_ux', _slope(q[valid] ** 2,
+                                               -np.log(eisf[valid])))
+    if not variance > 0:
+        variance = registry.get('sqwGaussianModel3D')['variance_ux'].default
+    return {'variance_ux': variance,
+            'D': _rate('sqwGaussianModel3D', 'D', q, hwhm,
+                       variance_ux=variance)}
+
+
+def _isotropic_rotational(q, eisf, hwhm, fixed):
+    radius = fixed.get('radius')
+    if radius is None:
+        radius = _search(_RADII, 'radius', 'sqwIsotropicRotationalDiffusion',
+                         q, eisf, DR=1.)
+    return {'radius': radius,
+            'DR': _rate('sqwIsotropicRotationalDiffusion', 'DR', q, hwhm,
+                        radius=radius)}
+
+
+def _water_teixeira(q, eisf, hwhm, fixed):
+    # the narrowest Lorentzian, of largest weight, is the translational one
+    return _jump_translational(q, eisf, hwhm, fixed)
+
+
+_INVERSIONS = {
+    'sqwBrownianTranslationalDiffusion': _brownian,
+    'sqwChudleyElliottDiffusion': _chudley_elliott,
+    'sqwDeltaLorentz': _delta_lorentz,
+    'sqwDeltaTwoLorentz': _delta_two_lorentz,
+    'sqwEquivalentSitesCircle': _sites('sqwEquivalentSitesCircle'),
+    'sqwGaussianModel3D': _gaussian_model_3d,
+    'sqwIsotropicRotationalDiffusion': _isotropic_rotational,
+    'sqwJumpSitesLogNormDist': _sites('sqwJumpSitesLogNormDist'),
+    'sqwJumpTranslationalDiffusion': _jump_translational,
+    'sqwWaterTeixeira': _water_teixeira,
+}
+
+
+def estimate_initial(
+        model: Union[str, 'registry.ModelSpec'],
+        w,
+        q,
+        data: np.ndarray,
+        resolution: Optional[np.ndarray] = None,
+        **fixed
+) -> Dict[str, Union[float, np.ndarray]]:
+    """
+    Starting values of the parameters of a model, estimated from the data
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwIsotropicRotationalDiffusion'
+
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer (in 1/ps)
+
+    q: float, list or :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    data: :class:`~numpy:numpy.ndarray`
+        spectra, of shape (q.size, w.size)
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra of shape (q.size, w.size) or (w.size,).
+        Default to None (no convolution).
+
+    **fixed:
+        known values of parameters, *e.g.* `Nsites`, used in the estimation
+        of the others and returned unchanged
+
+    Return
+    ------
+    dict
+        values of the fitting parameters and of the fixed ones, within their
+        physical bounds: one scale factor per spectrum, and one value per
+        spectrum for parameters depending on q
+
+    Examples
+    --------
+    >>> w, q = np.linspace(-2, 2, 401), np.linspace(0.3, 1.5, 7)
+    >>> data = QENSmodels.sqwBrownianTranslationalDiffusion(w, q, 2., 0.,
+    ...                                                     D=0.3)
+    >>> initial = estimate_initial('sqwBrownianTranslationalDiffusion', w,
+    ...                            q, data)
+    >>> round(initial['D'], 2)
+    0.3
+    >>> np.round(initial['scale'], 1)
+    array([2., 2., 2., 2., 2., 2., 2.])
+
+    """
+    spec = registry.get(model) if isinstance(model, str) else model
+    unknown = set(fixed) - set(spec.parameter_names)
+    if unknown:
+        raise TypeError('{} got unexpected parameter(s) {}'.format(
+            spec.name, ', '.join(sorted(unknown))))
+    if spec.name not in _INVERSIONS:
+        raise ValueError('no estimation of the parameters of {}'.format(
+            spec.name))
+    q = np.asarray(q, dtype=np.float64).reshape(-1)
+    lines = apparent_lines(w, np.reshape(data, (q.size, -1)), resolution)
+
+    values = {'scale': lines['intensity'], 'center': lines['center']}
+    values.update(_INVERSIONS[spec.name](q, lines['eisf'], lines['hwhm'],
+                                         fixed))
+    values.update(fixed)
+
+    result = {}
+    for item in spec.parameters:
+        value = values.get(item.name)
+        if value is None or np.any(~np.isfinite(value)):
+            value = item.default
+        if not item.integer:
+            lower, upper = item.bounds
+            if item.strict:
+                # strict bounds are excluded from the valid range
+                lower = np.nextafter(lower, upper) if lower == 0 else \
+                    lower + 1e-6 * abs(lower)
+            value = np.clip(np.asarray(value, dtype=np.float64), lower, upper)
+            value = float(value) if value.ndim == 0 else value
+        result[item.name] = value
+    return result
@@ -0,0 +1,1361 @@
+"""
+Fitting with linear parameters solved by variable projection
+
+The scale factor, the fractions of the lines (*e.g.* `A0` and `A1` of
+`sqwDeltaTwoLorentz`) and the coefficients of a polynomial background enter
+the models linearly. For given values of the other parameters (widths,
+geometry), the best linear parameters of each spectrum are the solution of a
+small linear least-squares problem. A :class:`SeparableModel` solves these
+problems inside each evaluation of the residuals, so that the nonlinear
+optimiser only sees the few parameters shared by all spectra (variable
+projection, Golub and Pereyra): global fits with one amplitude per spectrum
+need far fewer iterations and converge more reliably.
+
+The linear parameters are kept in their physical bounds: the scale factor
+and the fractions of the lines are obtained from the non-negative weights of
+the model evaluated at the vertices of the fractions (*e.g.* a delta and a
+Lorentzian for `sqwDeltaLorentz`), while background coefficients are not
+bounded.
+
+When the spectra are fitted one at a time, :func:`sequential_fit` starts the
+fit of each spectrum from the solution of its neighbour in q, since the
+parameters of the models vary smoothly with the momentum transfer.
+
+When the :math:`\\chi^2` surface has several minima (*e.g.* radius and
+rotational diffusion coefficient of `sqwIsotropicRotationalDiffusion`),
+:func:`multistart_fit` screens many starting points sampled in a hypercube
+of the parameters and refines only the most promising ones.
+
+Spectra of few counts per channel, *e.g.* on backscattering spectrometers,
+are better fitted by minimising the Poisson deviance (Cash statistic, see
+:func:`poisson_deviance`) than the :math:`\\chi^2`:
+`fit(data, statistic='cash')`. The linear parameters of each spectrum are
+then solved by a few Newton iterations, since the deviance is convex in
+them, and the nonlinear ones are optimised by L-BFGS-B with the analytic
+gradient of the deviance.
+
+Examples
+--------
+>>> import numpy as np
+>>> w = np.linspace(-2, 2, 201)
+>>> q = np.array([0.4, 0.8, 1.2])
+>>> scale = np.array([[1.], [2.], [3.]])
+>>> data = scale * QENSmodels.sqwDeltaLorentz(w, q, A0=0.3, hwhm=0.2) + 0.01
+>>> model = SeparableModel('sqwDeltaLorentz', w, q, background=0,
+...                        center=0.)
+>>> model.nonlinear
+['hwhm']
+>>> result = model.fit(data, hwhm=0.5)
+>>> np.round(result.params['scale'], 4)
+array([1., 2., 3.])
+>>> np.round(result.params['A0'], 4)
+array([0.3, 0.3, 0.3])
+>>> np.round(result.params['hwhm'], 4)
+array([0.2, 0.2, 0.2])
+>>> np.round(result.background, 4)
+array([[0.01],
+       [0.01],
+       [0.01]])
+
+"""
+import time
+import numpy as np
+from scipy.optimize import least_squares, lsq_linear, minimize
+from scipy.special import xlogy
+from typing import Union, Optional, Dict, List
+
+import QENSmodels
+from QENSmodels import registry
+
+
+def poisson_deviance(data: np.ndarray, model: np.ndarray) -> float:
+    """
+    Poisson deviance (Cash statistic) of counts for expected counts
+
+    :math:`D = 2 \\sum (m - n + n \\ln(n / m))`, where `n` are the
+    measured and `m` the expected counts, is twice the negative
+    log-likelihood of the counts, up to a constant. For many counts, it tends
+    to the :math:`\\chi^2` with errors :math:`\\sqrt{n}`.
+
+    Parameters
+    ----------
+    data: :class:`~numpy:numpy.ndarray`
+        measured counts `n`, >= 0
+
+    model: :class:`~numpy:numpy.ndarray`
+        expected counts `m`, of the same shape
+
+    Return
+    ------
+    float
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> round(poisson_deviance(np.array([0., 2., 5.]),
+    ...                        np.array([1., 2., 4.])), 4)
+    2.2314
+
+    """
+    data = np.asarray(data, dtype=np.float64)
+    model = np.asarray(model, dtype=np.float64)
+    return 2. * float(np.sum(model) - np.sum(data) +
+                      np.sum(xlogy(data, data)) - np.sum(xlogy(data, model)))
+
+
+class FitResult:
+    """
+    Parameters and statistics of a fit
+
+    Attributes
+    ----------
+    model: str
+        name of the model
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfers of the fitted spectra
+
+    params: dict
+        values of all the parameters of the model: floats, or arrays of
+        shape (nq,) for parameters taking one value per spectrum
+
+    background: :class:`~numpy:numpy.ndarray` or None
+        coefficients of the polynomial backgrounds, of shape (nq, degree + 1)
+        in ascending order
+
+    best_fit: :class:`~numpy:numpy.ndarray`
+        fitted spectra, of shape (nq, nw)
+
+    x: :class:`~numpy:numpy.ndarray`
+        optimised values of the nonlinear parameters
+
+    chi2: float
+        reduced :math:`\\chi^2`, or reduced Poisson deviance if `statistic`
+        is 'cash'
+
+    nfev, njev: int
+        number of evaluations of the residuals and of the Jacobian
+
+    success: bool
+        whether the optimiser converged
+
+    message: str
+        message of the optimiser
+
+    data, errors: :class:`~numpy:numpy.ndarray` or None
+        fitted spectra and their errors
+
+    separable: :class:`SeparableModel` or None
+        model which was fitted, *e.g.* to refit resampled data (see
+        :func:`~QENSmodels.uncertainty.bootstrap`)
+
+    statistic: str
+        minimised statistic: 'chi2' or 'cash'
+
+    stderr: dict
+        standard errors of the fitted parameters, from their covariance
+        matrix (see :meth:`SeparableModel.covariance`): floats, or arrays
+        of shape (nq,) for parameters taking one value per spectrum. The
+        errors of parameters at a bound are 0.
+
+    background_stderr: :class:`~numpy:numpy.ndarray` or None
+        standard errors of the coefficients of the backgrounds
+
+    chi2_q: :class:`~numpy:numpy.ndarray`
+        contribution of each spectrum to `chi2`, scaled so that their mean
+        is `chi2`
+
+    wall_time: float
+        duration of the fit, in seconds
+
+    """
+
+    def __init__(self, model, q, params, background, best_fit, x, chi2,
+                 nfev, njev, success, message, data=None, errors=None,
+                 separable=None, statistic='chi2', stderr=None,
+                 background_stderr=None, chi2_q=None, wall_time=None):
+        self.model = model
+        self.q = q
+        self.params = params
+        self.background = background
+        self.best_fit = best_fit
+        self.x = x
+        self.chi2 = chi2
+        self.nfev = nfev
+        self.njev = njev
+        self.success = success
+        self.message = message
+        self.data = data
+        self.errors = errors
+        self.separable = separable
+        self.statistic = statistic
+        self.stderr = {} if stderr is None else stderr
+        self.background_stderr = background_stderr
+        self.chi2_q = chi2_q
+        self.wall_time = wall_time
+
+    def to_records(self) -> List[dict]:
+        """
+        One record per spectrum, as stored by
+        :class:`~QENSmodels.results_store.FitResultsWriter`: the values
+        and standard errors of the parameters, the contribution of the
+        spectrum to the :math:`\\chi^2` and the duration of the fit
+        """
+        def row(value, i):
+            return float(value) if np.ndim(value) == 0 else float(value[i])
+
+        records = []
+        for i, q in enumerate(self.q):
+            record = {
+                'model': self.model, 'q': float(q), 'chi2': self.chi2,
+                'nfev': self.nfev, 'njev': self.njev,
+                'success': bool(self.success),
+                'statistic': self.statistic,
+                'params': {name: row(value, i)
+                           for name, value in self.params.items()},
+                'errors': {name: row(value, i)
+                           for name, value in self.stderr.items()}}
+            if self.chi2_q is not None:
+                record['chi2_q'] = float(self.chi2_q[i])
+            if self.wall_time is not None:
+                record['timings'] = {'fit': self.wall_time}
+            if self.background is not None:
+                record['background'] = {
+                    'c{}'.format(k): float(value)
+                    for k, value in enumerate(self.background[i])}
+                if self.background_stderr is not None:
+                    record['errors'].update(
+                        ('background/c{}'.format(k), float(value))
+                        for k, value in enumerate(
+                            self.background_stderr[i]))
+            records.append(record)
+        return records
+
+    def __repr__(self) -> str:
+        return 'FitResult({!r}, nq={}, chi2={:.4g}, nfev={})'.format(
+            self.model, self.q.size, self.chi2, self.nfev)
+
+
+class SeparableModel:
+    """
+    Model whose linear parameters are solved for each spectrum
+
+    The linear parameters are the scale factor, the fractions of the lines
+    (registered as `linear`, unless one of them is fixed) and the
+    coefficients of an optional polynomial background, added after the
+    convolution with the resolution. The other fitting parameters, which
+    are not fixed, are nonlinear: those taking one value per momentum
+    transfer have one entry per spectrum in the vector of nonlinear
+    parameters.
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwIsotropicRotationalDiffusion'
+
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer (in 1/ps)
+
+    q: float, list or :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra of shape (q.size, w.size) or (w.size,).
+        Default to None (no convolution).
+
+    background: int
+        degree of the polynomial background of each spectrum.
+        Default to None (no background).
+
+    time_domain: bool
+        convolve the lines with the resolution in the time domain (see
+        :class:`~QENSmodels.bound_model.BoundModel`). Default to False.
+
+    **fixed:
+        values of the parameters which are not fitted
+
+    """
+
+    def __init__(
+            self,
+            model: Union[str, 'registry.ModelSpec'],
+            w,
+            q,
+            resolution: Optional[np.ndarray] = None,
+            background: Optional[int] = None,
+            time_domain: bool = False,
+            **fixed
+    ):
+        self.bound = QENSmodels.BoundModel(model, w, q, resolution,
+                                           time_domain=time_domain, **fixed)
+        self.spec = self.bound.spec
+        self.fixed = fixed
+        if 'scale' in fixed:
+            raise ValueError('scale is solved for each spectrum and cannot '
+                             'be fixed')
+
+        free = [name for name in self.spec.fitting_parameters
+                if name not in fixed]
+        fractions = [name for name in free
+                     if self.spec[name].linear and name != 'scale']
+        if len(fractions) < len([item for item in self.spec.parameters
+                                 if item.linear and item.name != 'scale']):
+            # fractions are only separable together
+            fractions = []
+        self.fractions = fractions
+        self.linear = ['scale'] + fractions
+        self.nonlinear = [name for name in free if name not in self.linear]
+
+        self.degree = background
+        # powers of w, shared by all spectra
+        self.background = None if background is None else \
+            QENSmodels.BoundBackground(self.bound.w, background)
+
+        nq = self.bound.q.size
+        self._slices = {}
+        start = 0
+        for name in self.nonlinear:
+            size = nq if self.spec[name].q_vector else 1
+            self._slices[name] = slice(start, start + size)
+            start += size
+        self.size = start
+
+    @property
+    def shape(self):
+        """ Shape (nq, nw) of the spectra """
+        return self.bound.shape
+
+    @property
+    def ncolumns(self) -> int:
+        """ Number of linear coefficients of each spectrum """
+        return len(self.fractions) + 1 + (
+            0 if self.degree is None else self.degree + 1)
+
+    def x0(self, **params) -> np.ndarray:
+        """ Vector of nonlinear parameters, from their values or defaults,
+        within the bounds """
+        unknown = set(params) - set(self.spec.parameter_names)
+        if unknown:
+            raise TypeError('{} got unexpected parameter(s) {}'.format(
+                self.spec.name, ', '.join(sorted(unknown))))
+        x = np.empty(self.size)
+        for name, indices in self._slices.items():
+            x[indices] = params.get(name, self.spec[name].default)
+        lower, upper = self.bounds()
+        return np.clip(x, lower, upper)
+
+    def bounds(self):
+        """ Lower and upper bounds of the nonlinear parameters, in the
+        format used by `scipy.optimize` """
+        lower, upper = np.empty(self.size), np.empty(self.size)
+        for name, indices in self._slices.items():
+            lower[indices], upper[indices] = self.spec[name].bounds
+        return lower, upper
+
+    def values(self, x: np.ndarray) -> Dict[str, Union[float, np.ndarray]]:
+        """ Values of the nonlinear parameters in `x` """
+        return {name: x[indices] if self.spec[name].q_vector
+                else float(x[indices][0])
+                for name, indices in self._slices.items()}
+
+    def basis(self, x: np.ndarray) -> np.ndarray:
+        """
+        Spectra whose linear combinations are the models, of shape
+        (nq, ncolumns, nw): the model (convolved with the resolution, if
+        any) of unit scale at each vertex of the fractions of the lines,
+        then the powers of `w` of the background
+        """
+        values = self.values(x)
+        columns = []
+        for vertex in range(len(self.fractions) + 1):
+            fractions = {name: float(i == vertex)
+                         for i, name in enumerate(self.fractions)}
+            columns.append(self.bound(scale=1., **values, **fractions))
+        if self.background is not None:
+            columns.extend(np.broadcast_to(power, self.shape)
+                           for power in self.background.jacobian)
+        return np.stack(columns, axis=1)
+
+    def _lower(self) -> np.ndarray:
+        """ Lower bounds of the linear coefficients """
+        nmodel = len(self.fractions) + 1
+        lower = np.full(self.ncolumns, -np.inf)
+        lower[:nmodel] = 0.
+        return lower
+
+    def solve(self, basis: np.ndarray, data: np.ndarray,
+              weights: Optional[np.ndarray] = None):
+        """
+        Linear coefficients of each spectrum
+
+        Parameters
+        ----------
+        basis: :class:`~numpy:numpy.ndarray`
+            output of :meth:`basis`
+
+        data: :class:`~numpy:numpy.ndarray`
+            spectra of shape (nq, nw)
+
+        weights: :class:`~numpy:numpy.ndarray`
+            inverse of the errors of the data. Default to None (all 1).
+
+        Return
+        ------
+        coefficients: :class:`~numpy:numpy.ndarray`
+            array of shape (nq, ncolumns)
+
+        projector: tuple
+            weighted basis with columns of unit norm, their Gram matrices
+            and the columns which are not at a bound, used to project the
+            Jacobian
+
+        """
+        if weights is not None:
+            basis = basis * weights[:, None, :]
+            data = data * weights
+        norms = np.sqrt(np.einsum('qkw,qkw->qk', basis, basis))
+        free = norms > 0
+        basis = basis / np.where(free, norms, 1.)[:, :, None]
+        gram = np.einsum('qkw,qlw->qkl', basis, basis)
+        target = np.einsum('qkw,qw->qk', basis, data)
+        coefficients = self._free_solve(gram, target, free)
+
+        # bounded problem where the unbounded solution is not feasible
+        lower = self._lower()
+        for row in np.flatnonzero(np.any(coefficients < lower, axis=1)):
+            solution = lsq_linear(basis[row].T, data[row],
+                                  bounds=(lower, np.inf), method='bvls')
+            coefficients[row] = solution.x
+            free[row] &= solution.active_mask == 0
+
+        coefficients = coefficients / np.where(norms > 0, norms, 1.)
+        return coefficients, (basis, gram, free)
+
+    @staticmethod
+    def _free_solve(gram, target, free):
+        """ Solves the normal equations restricted to the free columns """
+        mask = free[:, :, None] & free[:, None, :]
+        gram = np.where(mask, gram, 0.)
+        index = np.arange(gram.shape[1])
+        gram[:, index, index] += ~free
+        return np.linalg.solve(gram, np.where(free, target, 0.)[..., None]
+                               )[..., 0]
+
+    def poisson_solve(self, basis: np.ndarray, data: np.ndarray,
+                      coefficients: Optional[np.ndarray] = None,
+                      iterations: int = 50):
+        """
+        Linear coefficients of each spectrum minimising the Poisson deviance
+
+        The deviance is convex in the linear coefficients: it is minimised by
+        Newton iterations with a backtracking line search, within the bounds
+        of the coefficients.
+
+        Parameters
+        ----------
+        basis: :class:`~numpy:numpy.ndarray`
+            output of :meth:`basis`
+
+        data: :class:`~numpy:numpy.ndarray`
+            counts of shape (nq, nw)
+
+        coefficients: :class:`~numpy:numpy.ndarray`
+            initial coefficients of shape (nq, ncolumns), *e.g.* of the
+            previous evaluation. Default to None (weighted least squares).
+
+        iterations: int
+            maximum number of Newton iterations. Default to 50.
+
+        Return
+        ------
+        coefficients: :class:`~numpy:numpy.ndarray`
+            array of shape (nq, ncolumns)
+
+        model: :class:`~numpy:numpy.ndarray`
+            expected counts of shape (nq, nw), floored at a small positive
+            value
+
+        """
+        norms = np.sqrt(np.einsum('qkw,qkw->qk', basis, basis))
+        columns = norms > 0
+        norms = np.where(columns, norms, 1.)
+        basis = basis / norms[:, :, None]
+        lower = self._lower()
+        floor = 1e-12 * max(float(data.max()), 1.)
+        tolerance = 1e-12 * (data.sum(axis=1) + 1.)
+        index = np.arange(self.ncolumns)
+        model = np.empty(self.shape)
+
+        def objective(values):
+            """ Deviance of each spectrum, up to a constant; fills
+            `model` with the expected counts """
+            np.einsum('qk,qkw->qw', values, basis, out=model)
+            np.maximum(model, floor, out=model)
+            return model.sum(axis=1) - \
+                np.einsum('qw,qw->q', data, np.log(model))
+
+        # Newton iterations are slow from expected counts close to 0: the
+        # given coefficients are only kept where they are better than the
+        # least-squares solution with errors sqrt(data)
+        try:
+            start, _ = self.solve(basis, data,
+                                  1. / np.sqrt(np.maximum(data, 1.)))
+        except np.linalg.LinAlgError:
+            # identical columns, e.g. lines of zero width at a bound: the
+            # same number of counts in each line
+            nmodel = len(self.fractions) + 1
+            start = np.zeros((self.shape[0], self.ncolumns))
+            start[:, :nmodel] = data.sum(axis=1, keepdims=True) / nmodel / \
+                np.maximum(basis[:, :nmodel].sum(axis=2), floor)
+        value = objective(start)
+        if coefficients is not None:
+            coefficients = coefficients * norms
+            better = objective(coefficients) < value
+            start[better] = coefficients[better]
+            value = objective(start)
+        coefficients = start
+        for _ in range(iterations):
+            ratio = data / model
+            gradient = np.einsum('qw,qkw->qk', 1. - ratio, basis)
+            ratio /= model
+            hessian = np.einsum('qkw,qlw->qkl', basis * ratio[:, None, :],
+                                basis)
+            # damping of the columns without counts
+            hessian[:, index, index] += 1e-10 * hessian[:, index, index].max(
+                axis=1, keepdims=True) + 1e-300
+            free = columns & ((coefficients > lower) | (gradient < 0))
+            step = -self._free_solve(hessian, gradient, free)
+            # half the Newton decrement estimates the distance to the minimum
+            done = -np.einsum('qk,qk->q', gradient, step) <= tolerance
+            if done.all():
+                break
+            step[done] = 0.
+            length = np.ones(self.shape[0])
+            trial = np.maximum(coefficients + step, lower)
+            for _ in range(30):
+                new = objective(trial)
+                worse = new > value
+                if not worse.any():
+                    break
+                length[worse] *= 0.5
+                trial[worse] = np.maximum(
+                    coefficients[worse] + length[worse, None] * step[worse],
+                    lower)
+            else:
+                trial[worse] = coefficients[worse]
+                new = objective(trial)
+            coefficients, value = trial, new
+        return coefficients / norms, model
+
+    def linear_values(self, coefficients: np.ndarray) -> dict:
+        """ Scale factor and fractions of the lines of each spectrum from
+        the linear coefficients """
+        nmodel = len(self.fractions) + 1
+        scale = coefficients[:, :nmodel].sum(axis=1)
+        values = {'scale': scale}
+        for i, name in enumerate(self.fractions):
+            values[name] = np.divide(coefficients[:, i], scale,
+                                     out=np.zeros_like(scale),
+                                     where=scale > 0)
+        return values
+
+    def evaluate(self, x: np.ndarray, coefficients: np.ndarray) -> np.ndarray:
+        """ Spectra of shape (nq, nw) for nonlinear parameters `x` and
+        linear coefficients """
+        return np.einsum('qk,qkw->qw', coefficients, self.basis(x))
+
+    def _projected_jacobian(self, x, coefficients, projector, weights):
+        """ Jacobian of the weighted residuals with respect to `x`, with the
+        linear parameters projected out (Kaufman) """
+        basis, gram, free = projector
+        nq, nw = self.shape
+        derivatives = self.bound.jacobian(
+            self.nonlinear, **self.values(x),
+            **self.linear_values(coefficients))
+        jacobian = np.zeros((nq, nw, self.size))
+        for name, indices in self._slices.items():
+            value = derivatives[name]
+            if weights is not None:
+                value = value * weights
+            # component along the columns is absorbed by the linear
+            # parameters
+            along = self._free_solve(
+                gram, np.einsum('qkw,qw->qk', basis, value), free)
+            value = value - np.einsum('qk,qkw->qw', along, basis)
+            if self.spec[name].q_vector:
+                rows = np.arange(nq)
+                jacobian[rows, :, indices.start + rows] = value
+            else:
+                jacobian[:, :, indices.start] = value
+        return jacobian.reshape(nq * nw, self.size)
+
+    def covariance(self, x: np.ndarray, coefficients: np.ndarray,
+                   weights: Optional[np.ndarray] = None):
+        """
+        Covariance matrices of the nonlinear parameters and of the linear
+        coefficients of each spectrum, for unit variance of the weighted
+        residuals
+
+        The inverse of the normal matrix of all the parameters is obtained
+        by blocks: the block of the nonlinear parameters is the inverse of
+        the Schur complement of the linear ones, *i.e.* of the normal
+        matrix of the Jacobian projected as in the fits. Coefficients at a
+        bound are not varied.
+
+        Parameters
+        ----------
+        x: :class:`~numpy:numpy.ndarray`
+            nonlinear parameters
+
+        coefficients: :class:`~numpy:numpy.ndarray`
+            linear coefficients, of shape (nq, ncolumns)
+
+        weights: :class:`~numpy:numpy.ndarray`
+            inverse of the errors of the data. Default to None (all 1).
+
+        Return
+        ------
+        x_covariance: :class:`~numpy:numpy.ndarray`
+            array of shape (size, size)
+
+        coefficients_covariance: :class:`~numpy:numpy.ndarray`
+            array of shape (nq, ncolumns, ncolumns)
+
+        """
+        nq, nw = self.shape
+        basis = self.basis(x)
+        jacobian = np.zeros((nq, nw, self.size))
+        if self.size:
+            derivatives = self.bound.jacobian(
+                self.nonlinear, **self.values(x),
+                **self.linear_values(coefficients))
+            for name, indices in self._slices.items():
+                if self.spec[name].q_vector:
+                    rows = np.arange(nq)
+                    jacobian[rows, :, indices.start + rows] = \
+                        derivatives[name]
+                else:
+                    jacobian[:, :, indices.start] = derivatives[name]
+        if weights is not None:
+            basis = basis * weights[:, None, :]
+            jacobian *= weights[:, :, None]
+
+        free = (coefficients > self._lower()) & \
+            np.any(basis != 0., axis=2)
+        mask = free[:, :, None] & free[:, None, :]
+        index = np.arange(self.ncolumns)
+        gram = np.where(mask, np.einsum('qkw,qlw->qkl', basis, basis), 0.)
+        gram[:, index, index] += ~free
+        cross = np.where(free[:, :, None],
+                         np.einsum('qkw,qwi->qki', basis, jacobian), 0.)
+        # A^-1 G, of shape (nq, ncolumns, size)
+        solved = np.linalg.solve(gram, cross)
+        schur = np.einsum('qwi,qwj->ij', jacobian, jacobian) - \
+            np.einsum('qki,qkj->ij', cross, solved)
+        x_covariance = np.linalg.pinv(schur, hermitian=True) if self.size \
+            else np.zeros((0, 0))
+        coefficients_covariance = np.where(
+            mask, np.linalg.inv(gram) + np.einsum(
+                'qki,ij,qlj->qkl', solved, x_covariance, solved), 0.)
+        return x_covariance, coefficients_covariance
+
+    def _stderr(self, x, coefficients, weights, variance):
+        """ Standard errors of the parameters and of the backgrounds """
+        x_covariance, covariance = self.covariance(x, coefficients, weights)
+        x_covariance *= variance
+        covariance *= variance
+        errors = np.sqrt(np.maximum(np.diag(x_covariance), 0.))
+        stderr = {name: errors[indices] if self.spec[name].q_vector
+                  else float(errors[indices][0])
+                  for name, indices in self._slices.items()}
+
+        # scale and fractions of the lines from the coefficients of the
+        # vertices of the fractions
+        nmodel = len(self.fractions) + 1
+        model = covariance[:, :nmodel, :nmodel]
+        scale = coefficients[:, :nmodel].sum(axis=1)
+        stderr['scale'] = np.sqrt(np.maximum(model.sum(axis=(1, 2)), 0.))
+        for i, name in enumerate(self.fractions):
+            fraction = np.divide(coefficients[:, i], scale,
+                                 out=np.zeros_like(scale), where=scale > 0)
+            gradient = -fraction[:, None] * np.ones(nmodel)
+            gradient[:, i] += 1.
+            gradient /= np.where(scale > 0, scale, np.inf)[:, None]
+            stderr[name] = np.sqrt(np.maximum(np.einsum(
+                'qk,qkl,ql->q', gradient, model, gradient), 0.))
+        background = None if self.degree is None else np.sqrt(np.maximum(
+            np.diagonal(covariance, axis1=1, axis2=2)[:, nmodel:], 0.))
+        return stderr, background
+
+    def chi2(self, data: np.ndarray, x: np.ndarray,
+             errors: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Reduced :math:`\\chi^2` with the best linear parameters, for one
+        vector of nonlinear parameters `x` or for each row of `x`
+
+        Examples
+        --------
+        >>> import numpy as np
+        >>> w = np.linspace(-2, 2, 201)
+        >>> data = QENSmodels.sqwBrownianTranslationalDiffusion(w, 1., D=0.2)
+        >>> model = SeparableModel('sqwBrownianTranslationalDiffusion', w,
+        ...                        1., center=0.)
+        >>> chi2 = model.chi2(data, np.array([[0.1], [0.2], [0.4]]))
+        >>> int(np.argmin(chi2))
+        1
+
+        """
+        data = np.asarray(data, dtype=np.float64).reshape(self.shape)
+        weights = None if errors is None else \
+            1. / np.asarray(errors, dtype=np.float64).reshape(self.shape)
+        x = np.asarray(x, dtype=np.float64)
+        nq, nw = self.shape
+        dof = max(1, nq * nw - self.size - nq * self.ncolumns)
+        chi2 = np.empty(x.shape[:-1])
+        for index in np.ndindex(chi2.shape):
+            basis = self.basis(x[index])
+            coefficients, _ = self.solve(basis, data, weights)
+            residuals = np.einsum('qk,qkw->qw', coefficients, basis) - data
+            if weights is not None:
+                residuals *= weights
+            chi2[index] = np.sum(np.square(residuals)) / dof
+        return chi2 if chi2.ndim else float(chi2)
+
+    def fit(self, data: np.ndarray, errors: Optional[np.ndarray] = None,
+            x0: Optional[np.ndarray] = None, statistic: str = 'chi2',
+            **params) -> FitResult:
+        """
+        Fits the spectra with `scipy.optimize.least_squares`, or with
+        L-BFGS-B for the Poisson deviance
+
+        Parameters
+        ----------
+        data: :class:`~numpy:numpy.ndarray`
+            spectra, of shape (nq, nw)
+
+        errors: :class:`~numpy:numpy.ndarray`
+            errors of the data, of the same shape. Default to None (no
+            weighting).
+
+        x0: :class:`~numpy:numpy.ndarray`
+            initial vector of nonlinear parameters, *e.g.* `x` of a previous
+            fit. Default to None (from `params`).
+
+        statistic: str
+            'chi2': least squares, weighted by the errors if any.
+            'cash': Poisson deviance of the data, which are counts (see
+            :func:`poisson_deviance`); `errors` should be None.
+            Default to 'chi2'.
+
+        **params:
+            initial values of the nonlinear parameters. Default to the
+            default values of the model.
+
+        Return
+        ------
+        :class:`FitResult`
+
+        """
+        start = time.perf_counter()
+        data = np.asarray(data, dtype=np.float64).reshape(self.shape)
+        if x0 is None:
+            x0 = self.x0(**params)
+        if statistic == 'cash':
+            if errors is not None:
+                raise ValueError('the Poisson deviance does not use errors')
+            if np.any(data < 0):
+                raise ValueError('counts should be >= 0 for the Poisson '
+                                 'deviance')
+            return self._cash_fit(data, x0, start)
+        if statistic != 'chi2':
+            raise ValueError("statistic should be 'chi2' or 'cash'")
+        if errors is not None:
+            errors = np.asarray(errors, dtype=np.float64).reshape(self.shape)
+        weights = None if errors is None else 1. / errors
+
+        cache = {}
+
+        def separate(x):
+            key = x.tobytes()
+            if key not in cache:
+                cache.clear()
+                basis = self.basis(x)
+                coefficients, projector = self.solve(basis, data, weights)
+                residuals = np.einsum('qk,qkw->qw', coefficients, basis) - \
+                    data
+                if weights is not None:
+                    residuals *= weights
+                cache[key] = coefficients, projector, residuals
+            return cache[key]
+
+        def residuals(x):
+            return separate(x)[2].ravel()
+
+        def jacobian(x):
+            coefficients, projector, _ = separate(x)
+            return self._projected_jacobian(x, coefficients, projector,
+                                            weights)
+
+        if self.size:
+            solution = least_squares(residuals, x0, jac=jacobian,
+                                     bounds=self.bounds())
+            x, nfev, njev = solution.x, solution.nfev, solution.njev or 0
+            success, message = solution.success, solution.message
+        else:
+            x, nfev, njev = x0, 1, 0
+            success, message = True, 'only linear parameters'
+        coefficients, _, residuals_ = separate(x)
+        return self._result(x, coefficients, residuals_, nfev, njev, success,
+                            message, data, errors, start=start)
+
+    def _cash_fit(self, data: np.ndarray, x0: np.ndarray,
+                  start: float) -> FitResult:
+        """ Fits counts by minimising the Poisson deviance """
+        constant = float(np.sum(xlogy(data, data)) - np.sum(data))
+        # linear coefficients of the last evaluation, starting the next one
+        state = {}
+
+        def separate(x):
+            key = x.tobytes()
+            if state.get('key') != key:
+                state['coefficients'], state['model'] = self.poisson_solve(
+                    self.basis(x), data, state.get('coefficients'))
+                state['key'] = key
+            return state['coefficients'], state['model']
+
+        def deviance(x):
+            coefficients, model = separate(x)
+            value = 2. * (float(np.sum(model)) -
+                          float(np.sum(xlogy(data, model))) + constant)
+            # the linear coefficients are optimal: only the explicit
+            # dependence on x contributes to the gradient
+            factor = 2. * (1. - data / model)
+            derivatives = self.bound.jacobian(
+                self.nonlinear, **self.values(x),
+                **self.linear_values(coefficients))
+            gradient = np.empty(self.size)
+            for name, indices in self._slices.items():
+                rows = np.einsum('qw,qw->q', factor, derivatives[name])
+                gradient[indices] = rows if self.spec[name].q_vector \
+                    else rows.sum()
+            return value, gradient
+
+        if self.size:
+            solution = minimize(deviance, x0, jac=True, method='L-BFGS-B',
+                                bounds=list(zip(*self.bounds())))
+            x, nfev = solution.x, solution.nfev
+            njev = solution.get('njev', nfev)
+            success, message = solution.success, solution.message
+        else:
+            x, nfev, njev = x0, 1, 0
+            success, message = True, 'only linear parameters'
+        coefficients, model = separate(x)
+        # deviance residuals, whose squares sum to the deviance
+        terms = 2. * (model - data + xlogy(data, data) - xlogy(data, model))
+        residuals = np.sign(data - model) * np.sqrt(np.maximum(terms, 0.))
+        return self._result(x, coefficients, residuals, nfev, njev, success,
+                            message, data, None, 'cash', start, model)
+
+    def _result(self, x, coefficients, residuals, nfev, njev, success,
+                message, data=None, errors=None, statistic='chi2',
+                start=None, model=None) -> FitResult:
+        nq, nw = self.shape
+        params = self.spec.defaults()
+        params.update(self.fixed)
+        params.update(self.values(x))
+        params.update(self.linear_values(coefficients))
+        nmodel = len(self.fractions) + 1
+        background = None if self.degree is None else \
+            coefficients[:, nmodel:].copy()
+        dof = max(1, nq * nw - self.size - nq * self.ncolumns)
+        squares = np.square(residuals).sum(axis=1)
+        chi2 = float(squares.sum() / dof)
+        if statistic == 'cash':
+            # inverse of the Fisher information of Poisson counts
+            weights, variance = 1. / np.sqrt(model), 1.
+        else:
+            # scaled by the reduced chi2, as in lmfit
+            weights, variance = None if errors is None else 1. / errors, \
+                chi2
+        stderr, background_stderr = self._stderr(x, coefficients, weights,
+                                                 variance)
+        return FitResult(self.spec.name, self.bound.q, params, background,
+                         self.evaluate(x, coefficients), x, chi2, nfev, njev,
+                         success, message, data, errors, self, statistic,
+                         stderr, background_stderr, squares * nq / dof,
+                         None if start is None else
+                         time.perf_counter() - start)
+
+    def __repr__(self) -> str:
+        return 'SeparableModel({!r}, nonlinear={}, linear={})'.format(
+            self.spec.name, self.nonlinear, self.linear)
+
+
+class SweepResult:
+    """
+    Results of the fits of each spectrum of a q-sweep
+
+    Attributes
+    ----------
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfers, in the order of the data
+
+    results: list of :class:`FitResult`
+        best fit of each spectrum
+
+    nfev: :class:`~numpy:numpy.ndarray`
+        evaluations of the residuals spent on each spectrum, over all the
+        passes
+
+    """
+
+    def __init__(self, q, results, nfev):
+        self.q = q
+        self.results = results
+        self.nfev = nfev
+
+    @property
+    def params(self) -> Dict[str, np.ndarray]:
+        """ Fitted values of the parameters, of shape (nq,) """
+        return {name: np.array([np.ravel(result.params[name])[0]
+                                for result in self.results])
+                for name in self.results[0].params}
+
+    @property
+    def background(self) -> Optional[np.ndarray]:
+        """ Coefficients of the backgrounds, of shape (nq, degree + 1) """
+        if self.results[0].background is None:
+            return None
+        return np.concatenate([result.background for result in self.results])
+
+    @property
+    def chi2(self) -> np.ndarray:
+        """ Reduced :math:`\\chi^2` of each spectrum """
+        return np.array([result.chi2 for result in self.results])
+
+    def to_records(self) -> List[dict]:
+        """ One record per spectrum (see :meth:`FitResult.to_records`) """
+        return [record for result in self.results
+                for record in result.to_records()]
+
+    def __repr__(self) -> str:
+        return 'SweepResult(nq={}, nfev={})'.format(self.q.size,
+                                                    int(self.nfev.sum()))
+
+
+def _sweep_chain(task):
+    """ Fits a contiguous range of spectra, in order of q, starting from
+    a seed spectrum and warm-starting each fit from its neighbours """
+    (model, w, q, data, errors, resolution, background, time_domain, fixed,
+     initial, seed, extrapolate, passes, tolerance) = task
+    models = [SeparableModel(model, w, q[i:i + 1],
+                             None if resolution is None else resolution[i],
+                             background, time_domain, **fixed)
+              for i in range(q.size)]
+    results = [None] * q.size
+    nfev = np.zeros(q.size, dtype=int)
+
+    def fit(i, x0):
+        result = models[i].fit(data[i], None if errors is None else
+                               errors[i], x0=x0)
+        nfev[i] += result.nfev
+        if results[i] is None or result.chi2 < results[i].chi2:
+            results[i] = result
+
+    def guess(i, previous):
+        """ Starting point of spectrum `i` from the spectra fitted before
+        it, in the order of the sweep """
+        x0 = results[previous[-1]].x
+        if extrapolate and len(previous) > 1:
+            j, k = previous[-1], previous[-2]
+            if q[j] != q[k]:
+                slope = (x0 - results[k].x) / (q[j] - q[k])
+                extrapolated = x0 + slope * (q[i] - q[j])
+                if np.all(np.isfinite(extrapolated)):
+                    x0 = extrapolated
+        return np.clip(x0, *models[i].bounds())
+
+    def sweep(order):
+        for n in range(1, len(order)):
+            fit(order[n], guess(order[n], order[max(0, n - 2):n]))
+
+    with QENSmodels.lines.tolerance(**tolerance):
+        fit(seed, models[seed].x0(**initial))
+        sweep(list(range(seed, q.size)))
+        sweep(list(range(seed, -1, -1)))
+        for index in range(1, passes):
+            # refit from the neighbours, alternately backward and forward
+            order = list(range(q.size))
+            sweep(order[::-1] if index % 2 else order)
+    return results, nfev
+
+
+def sequential_fit(
+        model: Union[str, 'registry.ModelSpec'],
+        w,
+        q,
+        data: np.ndarray,
+        errors: Optional[np.ndarray] = None,
+        resolution: Optional[np.ndarray] = None,
+        background: Optional[int] = None,
+        initial: Optional[dict] = None,
+        seeds: Optional[List[int]] = None,
+        extrapolate: bool = True,
+        passes: int = 1,
+        n_workers: int = 1,
+        time_domain: bool = False,
+        **fixed
+) -> SweepResult:
+    """
+    Fits the spectra one at a time, each from the solution of its neighbour
+
+    The parameters of the models vary smoothly with `q`. The spectra are
+    sorted by momentum transfer and fitted with a :class:`SeparableModel`
+    in sweeps starting from seed spectra: each fit starts from the solution
+    of the previous spectrum of the sweep, linearly extrapolated from the
+    two previous spectra if `extrapolate`. Additional passes sweep all the
+    spectra backward then forward again, and keep the best fit of each
+    spectrum.
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwJumpTranslationalDiffusion'
+
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer (in 1/ps)
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    data: :class:`~numpy:numpy.ndarray`
+        spectra, of shape (q.size, w.size)
+
+    errors: :class:`~numpy:numpy.ndarray`
+        errors of the data. Default to None (no weighting).
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra of shape (q.size, w.size) or (w.size,).
+        Default to None (no convolution).
+
+    background: int
+        degree of the polynomial backgrounds. Default to None.
+
+    initial: dict
+        initial values of the nonlinear parameters for the seed spectra.
+        Default to None (default values of the model).
+
+    seeds: list of int
+        indices of the seed spectra, each starting an independent chain of
+        fits over the spectra closest to it. Default to None (the spectrum
+        of lowest q).
+
+    extrapolate: bool
+        extrapolate the starting point of each fit linearly from the two
+        previous fits of the sweep. The previous solution is used as is
+        when these two fits share the same momentum transfer. Default to
+        True.
+
+    passes: int
+        number of sweeps over the spectra. Default to 1.
+
+    n_workers: int
+        number of processes running the chains of several seeds.
+        Default to 1 (no parallelism).
+
+    time_domain: bool
+        convolve the lines with the resolution in the time domain.
+        Default to False.
+
+    **fixed:
+        values of the parameters which are not fitted
+
+    Return
+    ------
+    :class:`SweepResult`
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> w, q = np.linspace(-2, 2, 201), np.linspace(0.2, 1.8, 9)
+    >>> bound = QENSmodels.BoundModel('sqwDeltaLorentz', w, q)
+    >>> data = bound(A0=0.2, hwhm=0.1 + 0.3 * q ** 2)
+    >>> sweep = sequential_fit('sqwDeltaLorentz', w, q, data,
+    ...                        initial={'hwhm': 0.5}, center=0.)
+    >>> np.allclose(sweep.params['hwhm'], 0.1 + 0.3 * q ** 2)
+    True
+
+    """
+    w = np.asarray(w, dtype=np.float64).reshape(-1)
+    q = np.asarray(q, dtype=np.float64).reshape(-1)
+    data = np.asarray(data, dtype=np.float64).reshape(q.size, w.size)
+    if errors is not None:
+        errors = np.asarray(errors, dtype=np.float64).reshape(data.shape)
+    if resolution is not None:
+        resolution = np.broadcast_to(np.asarray(resolution, dtype=np.float64),
+                                     data.shape)
+    if passes < 1:
+        raise ValueError('passes should be >= 1')
+
+    order = np.argsort(q, kind='stable')
+    seeds = [order[0]] if seeds is None else list(seeds)
+    # positions of the seeds in order of q, and ranges of spectra closest
+    # to each seed
+    positions = sorted(int(np.flatnonzero(order == seed)[0])
+                       for seed in seeds)
+    if len(set(positions)) != len(positions):
+        raise ValueError('seeds should be different spectra')
+    limits = [0] + [(first + second + 1) // 2 for first, second
+                    in zip(positions[:-1], positions[1:])] + [q.size]
+
+    tolerance = QENSmodels.lines.get_tolerance()
+    tasks = []
+    for position, start, stop in zip(positions, limits[:-1], limits[1:]):
+        rows = order[start:stop]
+        tasks.append((
+            model, w, q[rows], data[rows],
+            None if errors is None else errors[rows],
+            None if resolution is None else resolution[rows],
+            background, time_domain, fixed, dict(initial or {}),
+            position - start, extrapolate, passes, tolerance))
+
+    if n_workers > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            chains = list(executor.map(_sweep_chain, tasks))
+    else:
+        chains = [_sweep_chain(task) for task in tasks]
+
+    results = [None] * q.size
+    nfev = np.zeros(q.size, dtype=int)
+    for start, (chain, counts) in zip(limits[:-1], chains):
+        for n, (result, count) in enumerate(zip(chain, counts)):
+            results[order[start + n]] = result
+            nfev[order[start + n]] = count
+    return SweepResult(q, results, nfev)
+
+
+class MultiStartResult:
+    """
+    Distinct minima found by a multi-start fit
+
+    Attributes
+    ----------
+    minima: list of :class:`FitResult`
+        refined fits converged to different parameters, by increasing
+        :math:`\\chi^2`
+
+    seeds: dict
+        sampled starting values of the parameters, of shape (n_seeds,)
+
+    screening: :class:`~numpy:numpy.ndarray`
+        reduced :math:`\\chi^2` at each seed
+
+    nfev: int
+        evaluations of the residuals, over the screening and all the
+        refinements
+
+    """
+
+    def __init__(self, minima, seeds, screening, nfev):
+        self.minima = minima
+        self.seeds = seeds
+        self.screening = screening
+        self.nfev = nfev
+
+    @property
+    def best(self) -> FitResult:
+        """ Fit of lowest :math:`\\chi^2` """
+        return self.minima[0]
+
+    def __repr__(self) -> str:
+        return 'MultiStartResult(minima={}, best chi2={:.4g}, nfev={})'\
+            .format(len(self.minima), self.best.chi2, self.nfev)
+
+
+def _refine(task):
+    """ Local fit from one seed """
+    (model, w, q, data, errors, resolution, background, time_domain, fixed,
+     x0, tolerance) = task
+    separable = SeparableModel(model, w, q, resolution, background,
+                               time_domain, **fixed)
+    with QENSmodels.lines.tolerance(**tolerance):
+        return separable.fit(data, errors, x0=x0)
+
+
+def multistart_fit(
+        model: Union[str, 'registry.ModelSpec'],
+        w,
+        q,
+        data: np.ndarray,
+        errors: Optional[np.ndarray] = None,
+        resolution: Optional[np.ndarray] = None,
+        background: Optional[int] = None,
+        ranges: Optional[dict] = None,
+        n_seeds: int = 64,
+        n_best: int = 4,
+        method: str = 'sobol',
+        seed: Optional[int] = 0,
+        n_workers: int = 1,
+        rtol: float = 1e-3,
+        time_domain: bool = False,
+        **fixed
+) -> MultiStartResult:
+    """
+    Global fit of all spectra, refined from the best of many starting points
+
+    Starting points are sampled in a hypercube of the nonlinear parameters
+    (see :func:`~QENSmodels.lookup.parameter_samples`). The reduced
+    :math:`\\chi^2` of all of them is computed with the best linear
+    parameters (see :meth:`SeparableModel.chi2`), which costs one evaluation
+    of the model each, and only the `n_best` most promising ones are refined
+    with :meth:`SeparableModel.fit`. Fits converging to the same parameters
+    are merged.
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwIsotropicRotationalDiffusion'
+
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer (in 1/ps)
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    data: :class:`~numpy:numpy.ndarray`
+        spectra, of shape (q.size, w.size)
+
+    errors: :class:`~numpy:numpy.ndarray`
+        errors of the data. Default to None (no weighting).
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra of shape (q.size, w.size) or (w.size,).
+        Default to None (no convolution).
+
+    background: int
+        degree of the polynomial backgrounds. Default to None.
+
+    ranges: dict
+        lower and upper values of the sampled parameters. Non-fitting
+        integer parameters, *e.g.* `Nsites`, can be sampled too. Default to
+        a decade on each side of the default value of the positive
+        parameters, within their bounds; unbounded parameters (`center`)
+        start from their default value.
+
+    n_seeds: int
+        number of starting points screened. Default to 64.
+
+    n_best: int
+        number of starting points refined. Default to 4.
+
+    method: str
+        sampling of the starting points: 'sobol', 'latin' or 'random'.
+        Default to 'sobol'.
+
+    seed: int
+        seed of the sampling. Default to 0.
+
+    n_workers: int
+        number of processes refining the starting points. Default to 1 (no
+        parallelism).
+
+    rtol: float
+        relative difference of the nonlinear parameters below which two
+        fits are the same minimum. Default to 1e-3.
+
+    time_domain: bool
+        convolve the lines with the resolution in the time domain.
+        Default to False.
+
+    **fixed:
+        values of the parameters which are not fitted
+
+    Return
+    ------
+    :class:`MultiStartResult`
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> w, q = np.linspace(-2, 2, 201), np.array([0.5, 1., 1.5])
+    >>> data = QENSmodels.sqwIsotropicRotationalDiffusion(w, q, radius=1.5,
+    ...                                                   DR=0.3)
+    >>> result = multistart_fit('sqwIsotropicRotationalDiffusion', w, q,
+    ...                         data, n_seeds=16, n_best=2, center=0.)
+    >>> round(result.best.params['radius'], 4), round(
+    ...     result.best.params['DR'], 4)
+    (1.5, 0.3)
+
+    """
+    spec = registry.get(model) if isinstance(model, str) else model
+    w = np.asarray(w, dtype=np.float64).reshape(-1)
+    q = np.asarray(q, dtype=np.float64).reshape(-1)
+    data = np.asarray(data, dtype=np.float64).reshape(q.size, w.size)
+    if n_best < 1:
+        raise ValueError('n_best should be >= 1')
+    ranges = dict(ranges or {})
+
+    # parameters of the SeparableModel, and non-fitting ones to sample
+    reference = SeparableModel(spec, w, q, resolution, background,
+                               time_domain, **fixed)
+    for name in ranges:
+        if name in fixed or name in reference.linear:
+            raise ValueError('{} is {} and cannot be sampled'.format(
+                name, 'fixed' if name in fixed else 'solved linearly'))
+        if name not in reference.nonlinear and \
+                not (spec[name].integer and not spec[name].fitting):
+            raise ValueError('{} cannot be sampled'.format(name))
+    for name in reference.nonlinear:
+        lower, upper = spec[name].bounds
+        default = spec[name].default
+        if name not in ranges and lower >= 0 and default > 0:
+            ranges[name] = (max(default / 10., lower),
+                            min(default * 10., upper))
+    seeds = QENSmodels.parameter_samples(spec, ranges, n_seeds, method,
+                                         seed)
+    discrete = [name for name in ranges if name not in reference.nonlinear]
+
+    # screening: one evaluation of each starting point
+    models = {}
+    starts, groups = [], []
+    screening = np.empty(n_seeds)
+    for i in range(n_seeds):
+        group = tuple(int(seeds[name][i]) for name in discrete)
+        if group not in models:
+            models[group] = SeparableModel(
+                spec, w, q, resolution, background, time_domain,
+                **dict(fixed, **dict(zip(discrete, group))))
+        separable = models[group]
+        x0 = separable.x0(**{name: seeds[name][i]
+                             for name in separable.nonlinear
+                             if name in seeds})
+        screening[i] = separable.chi2(data, x0, errors)
+        starts.append(x0)
+        groups.append(group)
+
+    best = np.argsort(screening, kind='stable')[:n_best]
+    tasks = [(spec.name, w, q, data, errors, resolution, background,
+              time_domain, dict(fixed, **dict(zip(discrete, groups[i]))),
+              starts[i], QENSmodels.lines.get_tolerance()) for i in best]
+    if n_workers > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_refine, tasks))
+    else:
+        results = [models[groups[i]].fit(data, errors, x0=starts[i])
+                   for i in best]
+
+    minima = []
+    for result, i in sorted(zip(results, best), key=lambda item:
+                            item[0].chi2):
+        same = any(
+            groups[i] == groups[j] and np.allclose(
+                result.x, other.x, rtol=rtol, atol=rtol * np.abs(
+                    result.x).max(initial=0.))
+            for other, j in minima)
+        if not same:
+            minima.append((result, i))
+    nfev = n_seeds + sum(result.nfev for result in results)
+    return MultiStartResult([result for result, _ in minima], seeds,
+                            screening, nfev)
@@ -1,17 +1,14 @@
 import numpy as np
-from typing import Union, Tuple
+from typing import Union
 
-try:
-    import QENSmodels
-except ImportError:
-    print('Module QENSmodels not found')
+import QENSmodels
 
 
 def hwhmGaussianModel3D(
         q: Union[float, list, np.ndarray],
         D: float = 1.,
         variance_ux: float = 1.
-) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+) -> 'QENSmodels.LineSpectrum':
     """
     Returns some characteristics of `GaussianModel3D` as functions
     of the momentum transfer `q`:
@@ -35,15 +32,11 @@ def hwhmGaussianModel3D(
 
     Returns
     -------
-
-    hwhm: :class:`~numpy:numpy.ndarray`
-        half-width half maximum
-
-    eisf: :class:`~numpy:numpy.ndarray`
-        elastic incoherent structure factor
-
-    qisf: :class:`~numpy:numpy.ndarray`
-        quasi-elastic incoherent structure factor
+    :class:`~QENSmodels.line_spectrum.LineSpectrum`
+        half-width half maximum (`hwhm`), elastic incoherent structure
+        factor (`eisf`) and quasi-elastic incoherent structure factor
+        (`qisf`), which unpack to full arrays. `hwhm` is stored once,
+        being the same for all momentum transfers.
 
     Examples
     --------
@@ -74,7 +67,6 @@ def hwhmGaussianModel3D(
     numberLorentz = 100
 
     qisf = np.zeros((q.size, numberLorentz))
-    hwhm = np.zeros((q.size, numberLorentz))
     al = np.zeros((q.size, numberLorentz))
 
     arg = q**2 * variance_ux
@@ -97,11 +89,12 @@ def hwhmGaussianModel3D(
 
     eisf = al[:, 0]
 
-    for i in range(1, numberLorentz):
-        hwhm[:, i] = np.repeat(i * D / variance_ux, q.size)
-        qisf[:, i] = al[:, i]
+    qisf[:, 1:] = al[:, 1:]
 
-    return hwhm, eisf, qisf
+    # same widths for all momentum transfers: a single row
+    hwhm = np.arange(numberLorentz)[np.newaxis, :] * D / variance_ux
+
+    return QENSmodels.LineSpectrum(hwhm, eisf, qisf)
 
 
 def sqwGaussianModel3D(
@@ -194,7 +187,8 @@ def sqwGaussianModel3D(
       According to Volino's paper, as a rule of thumb, the number of
       terms to be considered in practical calculations must be (much)
       larger than :math:`Q^2<u_x^2>`. Therefore this condition should be
-      checked when using this model.
+      checked when using this model. Conversely, the terms of negligible
+      weight can be dropped with :func:`QENSmodels.lines.tolerance`.
 
     References
     ----------
@@ -217,10 +211,15 @@ def sqwGaussianModel3D(
     # # Number of Lorentzians used to represent the infinite sum in R
     numberLorentz = hwhm.shape[1]
 
+    # Lorentzians kept under the tolerances of QENSmodels.lines.tolerance
+    keep = QENSmodels.lines.truncation_mask(eisf, qisf)
+
     # Sum of Lorentzians
     for i in range(q.size):
         sqw[i, :] = eisf[i] * QENSmodels.delta(w, scale, center)
         for j in range(1, numberLorentz):
+            if not keep[i, j]:
+                continue
             sqw[i, :] += qisf[i, j] * QENSmodels.lorentzian(w,
                                                             scale,
                                                             center,
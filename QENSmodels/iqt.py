@@ -0,0 +1,672 @@
+"""
+Intermediate scattering functions I(q, t)
+
+All the models are sums of an elastic line and of Lorentzians, whose
+Fourier transforms are a constant and decaying exponentials:
+
+.. math::
+
+    I(q, t) = scale \\left(EISF(q) + \\sum_l A_l(q) e^{-\\Gamma_l(q) |t|}
+    \\right)
+
+so that the models can be fitted to neutron spin-echo data in the time
+domain without sampling problems. The center of the lines only adds a
+phase factor and does not appear in I(q, t). Spin-echo data are usually
+normalised by their value at t = 0: with `normalized=True`, the functions
+return :math:`I(q, t) / I(q, 0)`, which does not depend on `scale`.
+
+Examples
+--------
+Joint fit of backscattering spectra and normalised spin-echo data, with the
+analytic derivatives of both models
+
+>>> import numpy as np
+>>> from scipy.optimize import least_squares
+>>> w, t = np.linspace(-2, 2, 201), np.linspace(0., 20., 50)
+>>> q = np.array([0.5, 1.])
+>>> spectra = QENSmodels.BoundModel('sqwJumpTranslationalDiffusion', w, q)
+>>> echoes = BoundIqt('sqwJumpTranslationalDiffusion', t, q,
+...                   normalized=True)
+>>> data = np.concatenate([spectra(D=0.2, resTime=1.).ravel(),
+...                        echoes(D=0.2, resTime=1.).ravel()])
+>>> names = ['D', 'resTime']
+>>> def residuals(x):
+...     params = dict(zip(names, x))
+...     return np.concatenate([spectra(**params).ravel(),
+...                            echoes(**params).ravel()]) - data
+>>> def jacobian(x):
+...     params = dict(zip(names, x))
+...     first = spectra.jacobian(names, **params)
+...     second = echoes.jacobian(names, **params)
+...     return np.array([np.concatenate([first[name].ravel(),
+...                                      second[name].ravel()])
+...                      for name in names]).T
+>>> result = least_squares(residuals, [0.1, 0.5], jac=jacobian,
+...                        bounds=(0., np.inf))
+>>> np.round(result.x, 4)
+array([0.2, 1. ])
+
+"""
+import numpy as np
+from typing import Union, Optional, Iterable, Dict
+
+import QENSmodels
+from QENSmodels import registry
+from QENSmodels.lines import _BLOCK_SIZE
+
+
+def _decays(t: np.ndarray, widths: np.ndarray, nblocks: int = 1):
+    """ Yields slices of lines and the exponential decays of these lines,
+    of shape (nq, lines, t.size), by blocks of limited size """
+    nq, nlines = widths.shape
+    step = max(1, _BLOCK_SIZE // max(1, nblocks * nq * t.size))
+    for start in range(0, nlines, step):
+        lines_ = slice(start, start + step)
+        yield lines_, np.exp(-widths[:, lines_, None] * t)
+
+
+def _evaluate(spec, t, q, values: dict, normalized: bool) -> np.ndarray:
+    """ I(q, t) for parameter values which are not checked; `scale` can
+    take one value per momentum transfer """
+    values = dict(values)
+    scale = values.pop('scale')
+    values.pop('center')
+    elastic, weights, widths = QENSmodels.lines.model_lines(spec.name, q,
+                                                            **values)
+    result = np.repeat(elastic[:, None], t.size, axis=1)
+    for lines_, decay in _decays(t, widths):
+        result += np.einsum('ql,qlt->qt', weights[:, lines_], decay)
+    if normalized:
+        result /= (elastic + weights.sum(axis=1))[:, None]
+    else:
+        result *= np.reshape(scale, (-1, 1))
+    return result
+
+
+def _jacobian(spec, t, q, values: dict, normalized: bool,
+              names: Iterable[str]) -> Dict[str, np.ndarray]:
+    """ Derivatives of :func:`_evaluate` with respect to `names` """
+    values = dict(values)
+    scale = np.reshape(values.pop('scale'), (-1, 1))
+    values.pop('center')
+    lines = QENSmodels.lines.model_lines(spec.name, q, **values)
+    elastic, weights, widths = lines
+    derivatives = QENSmodels.lines.model_lines_derivatives(
+        spec.name, q, lines, **values)
+    names = list(names)
+    unknown = set(names) - set(derivatives) - {'scale', 'center'}
+    if unknown:
+        raise ValueError('no derivative with respect to {}'.format(
+            ', '.join(sorted(unknown))))
+
+    model = np.repeat(elastic[:, None], t.size, axis=1)
+    result = {}
+    for name in derivatives:
+        if name not in names:
+            continue
+        d_elastic = derivatives[name][0]
+        result[name] = np.zeros((q.size, t.size)) if d_elastic is None \
+            else np.repeat(np.broadcast_to(d_elastic, (q.size,))[:, None],
+                           t.size, axis=1)
+
+    for lines_, decay in _decays(t, widths, 3):
+        model += np.einsum('ql,qlt->qt', weights[:, lines_], decay)
+        t_decay = None
+        for name in result:
+            _, d_weights, d_widths = derivatives[name]
+            if d_weights is not None:
+                d_weights = np.broadcast_to(d_weights, weights.shape)
+                result[name] += np.einsum('ql,qlt->qt',
+                                          d_weights[:, lines_], decay)
+            if d_widths is not None:
+                if t_decay is None:
+                    t_decay = decay * t
+                d_widths = np.broadcast_to(d_widths, widths.shape)
+                result[name] -= np.einsum(
+                    'ql,qlt->qt',
+                    weights[:, lines_] * d_widths[:, lines_], t_decay)
+
+    if normalized:
+        initial = (elastic + weights.sum(axis=1))[:, None]
+        model /= initial
+        for name, value in result.items():
+            d_elastic, d_weights, _ = derivatives[name]
+            d_initial = np.zeros(q.size)
+            if d_elastic is not None:
+                d_initial = d_initial + d_elastic
+            if d_weights is not None:
+                d_initial = d_initial + np.broadcast_to(
+                    d_weights, weights.shape).sum(axis=1)
+            value -= model * d_initial[:, None]
+            value /= initial
+        if 'scale' in names:
+            result['scale'] = np.zeros((q.size, t.size))
+    else:
+        for value in result.values():
+            value *= scale
+        if 'scale' in names:
+            result['scale'] = model
+    if 'center' in names:
+        result['center'] = np.zeros((q.size, t.size))
+    return {name: result[name] for name in names}
+
+
+def _prepare(model: str, t, q, params: dict):
+    spec = registry.get(model)
+    t = np.abs(np.asarray(t, dtype=np.float64)).reshape(-1)
+    q = np.asarray(q, dtype=np.float64).reshape(-1)
+    return spec, t, q, spec.validate(q, **params)
+
+
+def iqt(
+        model: str,
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        normalized: bool = False,
+        **params
+) -> np.ndarray:
+    """
+    Intermediate scattering function of a registered model
+
+    Parameters
+    ----------
+    model: str
+        name of the model :math:`S(q, \\omega)`, *e.g.*
+        'sqwIsotropicRotationalDiffusion'
+
+    t: float, list or :class:`~numpy:numpy.ndarray`
+        time (in ps)
+
+    q: float, list or :class:`~numpy:numpy.ndarray`
+        momentum transfer (non-fitting, in 1/Angstrom)
+
+    normalized: bool
+        divide by I(q, 0). Default to False.
+
+    **params:
+        parameters of the model. `center` is ignored.
+
+    Return
+    ------
+    :class:`~numpy:numpy.ndarray`
+        array of shape (q.size, t.size), or (t.size,) for one momentum
+        transfer
+
+    Examples
+    --------
+    >>> iqt('sqwDeltaLorentz', [0., 1.], 1., A0=0.5, hwhm=np.log(2.))
+    array([1.  , 0.75])
+
+    """
+    spec, t, q, values = _prepare(model, t, q, params)
+    result = _evaluate(spec, t, q, values, normalized)
+    return result[0] if q.size == 1 else result
+
+
+def iqt_jacobian(
+        model: str,
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        normalized: bool = False,
+        names: Optional[Iterable[str]] = None,
+        **params
+) -> Dict[str, np.ndarray]:
+    """
+    Analytic derivatives of :func:`iqt` with respect to the parameters
+
+    Parameters
+    ----------
+    model, t, q, normalized, **params:
+        as in :func:`iqt`
+
+    names: iterable of str
+        parameters to differentiate with respect to. Default to None (all
+        the fitting parameters but `center`, on which I(q, t) does not
+        depend).
+
+    Return
+    ------
+    dict
+        maps the names of the parameters to arrays of shape
+        (q.size, t.size)
+
+    Examples
+    --------
+    >>> jacobian = iqt_jacobian('sqwBrownianTranslationalDiffusion',
+    ...                         [0., 1.], [1.], D=0.5)
+    >>> sorted(jacobian)
+    ['D', 'scale']
+    >>> np.round(jacobian['D'], 4)
+    array([[ 0.    , -0.6065]])
+
+    """
+    spec, t, q, values = _prepare(model, t, q, params)
+    if names is None:
+        names = [name for name in spec.fitting_parameters
+                 if name != 'center']
+    return _jacobian(spec, t, q, values, normalized, names)
+
+
+class BoundIqt:
+    """
+    Intermediate scattering function evaluated on fixed time and momentum
+    transfer grids
+
+    Counterpart of :class:`~QENSmodels.bound_model.BoundModel` in the time
+    domain, with the same methods.
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwBrownianTranslationalDiffusion'
+
+    t: :class:`~numpy:numpy.ndarray`
+        time (in ps)
+
+    q: float, list or :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    normalized: bool
+        divide by I(q, 0), as for spin-echo data. Default to False.
+
+    **fixed:
+        values of parameters which are not fitted, *e.g.* `Nsites`. They are
+        validated once.
+
+    """
+
+    def __init__(
+            self,
+            model: Union[str, 'registry.ModelSpec'],
+            t,
+            q,
+            normalized: bool = False,
+            **fixed
+    ):
+        self.spec = registry.get(model) if isinstance(model, str) else model
+        self.t = np.asarray(t, dtype=np.float64).reshape(-1)
+        self.q = np.asarray(q, dtype=np.float64).reshape(-1)
+        self.normalized = normalized
+
+        unknown = set(fixed) - set(self.spec.parameter_names)
+        if unknown:
+            raise TypeError('{} got unexpected parameter(s) {}'.format(
+                self.spec.name, ', '.join(sorted(unknown))))
+        for name, value in fixed.items():
+            self.spec[name].check(value)
+        self.fixed = fixed
+
+        # parameters which can take one value per momentum transfer
+        self.per_q_names = ['scale', 'center'] + [
+            item.name for item in self.spec.parameters if item.q_vector]
+
+        self._abs_t = np.abs(self.t)
+
+    @property
+    def shape(self):
+        """ Shape of the evaluated model: (q.size, t.size) """
+        return self.q.size, self.t.size
+
+    def _values(self, params: dict) -> dict:
+        values = self.spec.defaults()
+        values.update(self.fixed)
+        values.update(params)
+        return values
+
+    def __call__(self, **params) -> np.ndarray:
+        """
+        Evaluates I(q, t), of shape (q.size, t.size)
+
+        `scale` can be given as one value per momentum transfer. Parameter
+        values are not checked.
+        """
+        return _evaluate(self.spec, self._abs_t, self.q,
+                         self._values(params), self.normalized)
+
+    def jacobian(
+            self,
+            names: Optional[Iterable[str]] = None,
+            **params
+    ) -> Dict[str, np.ndarray]:
+        """
+        Analytic derivatives with respect to the fitting parameters, as
+        arrays of shape (q.size, t.size) (see
+        :meth:`QENSmodels.bound_model.BoundModel.jacobian`)
+        """
+        if names is None:
+            names = self.spec.fitting_parameters
+        return _jacobian(self.spec, self._abs_t, self.q,
+                         self._values(params), self.normalized, names)
+
+    def __repr__(self) -> str:
+        return 'BoundIqt({!r}, nq={}, nt={}{})'.format(
+            self.spec.name, self.q.size, self.t.size,
+            ', normalized=True' if self.normalized else '')
+
+
+def iqtBrownianTranslationalDiffusion(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        D: float = 1.,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of
+    :func:`~QENSmodels.sqwBrownianTranslationalDiffusion`
+
+    Parameters
+    ----------
+    t: float, list or :class:`~numpy:numpy.ndarray`
+        time (in ps)
+
+    q: float, list or :class:`~numpy:numpy.ndarray`
+        momentum transfer (non-fitting, in 1/Angstrom)
+
+    scale: float
+        scale factor. Default to 1.
+
+    D: float
+        diffusion coefficient (in Angstrom^2/ps). Default to 1.
+
+    normalized: bool
+        divide by I(q, 0). Default to False.
+
+    Return
+    ------
+    :class:`~numpy:numpy.ndarray`
+        array of shape (q.size, t.size), or (t.size,) for one momentum
+        transfer
+
+    Examples
+    --------
+    >>> np.round(iqtBrownianTranslationalDiffusion([0., 1.], 1., D=0.5), 4)
+    array([1.    , 0.6065])
+
+    """
+    return iqt('sqwBrownianTranslationalDiffusion', t, q, normalized,
+               scale=scale, D=D)
+
+
+def iqtChudleyElliottDiffusion(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        D: float = 0.23,
+        L: float = 1.,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of
+    :func:`~QENSmodels.sqwChudleyElliottDiffusion`
+
+    Parameters
+    ----------
+    t, q, scale, normalized:
+        see :func:`iqtBrownianTranslationalDiffusion`
+
+    D: float
+        diffusion coefficient (in Angstrom^2/ps). Default to 0.23.
+
+    L: float
+        jump distance (in Angstrom). Default to 1.
+
+    """
+    return iqt('sqwChudleyElliottDiffusion', t, q, normalized,
+               scale=scale, D=D, L=L)
+
+
+def iqtDeltaLorentz(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        A0: Union[float, list, np.ndarray] = 0.,
+        hwhm: Union[float, list, np.ndarray] = 1.,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of :func:`~QENSmodels.sqwDeltaLorentz`
+
+    Parameters
+    ----------
+    t, q, scale, normalized:
+        see :func:`iqtBrownianTranslationalDiffusion`
+
+    A0: float, list or :class:`~numpy:numpy.ndarray`
+        amplitude of the delta function. Default to 0.
+
+    hwhm: float, list or :class:`~numpy:numpy.ndarray`
+        half-width at half-maximum of the Lorentzian (in 1/ps).
+        Default to 1.
+
+    """
+    return iqt('sqwDeltaLorentz', t, q, normalized, scale=scale, A0=A0,
+               hwhm=hwhm)
+
+
+def iqtDeltaTwoLorentz(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        A0: Union[float, list, np.ndarray] = 1.,
+        A1: Union[float, list, np.ndarray] = 1.,
+        hwhm1: Union[float, list, np.ndarray] = 1.,
+        hwhm2: Union[float, list, np.ndarray] = 1.,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of
+    :func:`~QENSmodels.sqwDeltaTwoLorentz`
+
+    Parameters
+    ----------
+    t, q, scale, normalized:
+        see :func:`iqtBrownianTranslationalDiffusion`
+
+    A0, A1: float, list or :class:`~numpy:numpy.ndarray`
+        amplitudes of the delta function and of the first Lorentzian.
+        Default to 1.
+
+    hwhm1, hwhm2: float, list or :class:`~numpy:numpy.ndarray`
+        half-widths at half-maximum of the Lorentzians (in 1/ps).
+        Default to 1.
+
+    """
+    return iqt('sqwDeltaTwoLorentz', t, q, normalized, scale=scale, A0=A0,
+               A1=A1, hwhm1=hwhm1, hwhm2=hwhm2)
+
+
+def iqtEquivalentSitesCircle(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        Nsites: int = 3,
+        radius: float = 1.,
+        resTime: float = 1.,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of
+    :func:`~QENSmodels.sqwEquivalentSitesCircle`
+
+    Parameters
+    ----------
+    t, q, scale, normalized:
+        see :func:`iqtBrownianTranslationalDiffusion`
+
+    Nsites: int
+        number of sites in circle (non-fitting). Default to 3.
+
+    radius: float
+        radius of the circle (in Angstrom). Default to 1.
+
+    resTime: float
+        residence time in a site (in ps). Default to 1.
+
+    """
+    return iqt('sqwEquivalentSitesCircle', t, q, normalized, scale=scale,
+               Nsites=Nsites, radius=radius, resTime=resTime)
+
+
+def iqtGaussianModel3D(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        D: float = 1.,
+        variance_ux: float = 1.,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of
+    :func:`~QENSmodels.sqwGaussianModel3D`
+
+    Parameters
+    ----------
+    t, q, scale, normalized:
+        see :func:`iqtBrownianTranslationalDiffusion`
+
+    D: float
+        diffusion coefficient (in Angstrom^2/ps). Default to 1.
+
+    variance_ux: float
+        variance of the displacement (in Angstrom^2). Default to 1.
+
+    """
+    return iqt('sqwGaussianModel3D', t, q, normalized, scale=scale, D=D,
+               variance_ux=variance_ux)
+
+
+def iqtIsotropicRotationalDiffusion(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        radius: float = 1.,
+        DR: float = 1.,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of
+    :func:`~QENSmodels.sqwIsotropicRotationalDiffusion`
+
+    Parameters
+    ----------
+    t, q, scale, normalized:
+        see :func:`iqtBrownianTranslationalDiffusion`
+
+    radius: float
+        radius of rotation (in Angstrom). Default to 1.
+
+    DR: float
+        rotational diffusion coefficient (in 1/ps). Default to 1.
+
+    Examples
+    --------
+    >>> result = iqtIsotropicRotationalDiffusion([0., 100.], [0.5, 1.],
+    ...                                          normalized=True)
+    >>> np.round(result, 3)
+    array([[1.   , 0.919],
+           [1.   , 0.708]])
+
+    """
+    return iqt('sqwIsotropicRotationalDiffusion', t, q, normalized,
+               scale=scale, radius=radius, DR=DR)
+
+
+def iqtJumpSitesLogNormDist(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        Nsites: int = 3,
+        radius: float = 1.,
+        resTime: float = 1.,
+        sigma: float = 1.,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of
+    :func:`~QENSmodels.sqwJumpSitesLogNormDist`
+
+    Parameters
+    ----------
+    t, q, scale, normalized:
+        see :func:`iqtBrownianTranslationalDiffusion`
+
+    Nsites: int
+        number of sites in circle (non-fitting). Default to 3.
+
+    radius: float
+        radius of the circle (in Angstrom). Default to 1.
+
+    resTime: float
+        center of the distribution of residence times (in ps).
+        Default to 1.
+
+    sigma: float
+        log-standard deviation of the distribution. Default to 1.
+
+    """
+    return iqt('sqwJumpSitesLogNormDist', t, q, normalized, scale=scale,
+               Nsites=Nsites, radius=radius, resTime=resTime, sigma=sigma)
+
+
+def iqtJumpTranslationalDiffusion(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        D: float = 0.23,
+        resTime: float = 1.25,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of
+    :func:`~QENSmodels.sqwJumpTranslationalDiffusion`
+
+    Parameters
+    ----------
+    t, q, scale, normalized:
+        see :func:`iqtBrownianTranslationalDiffusion`
+
+    D: float
+        diffusion coefficient (in Angstrom^2/ps). Default to 0.23.
+
+    resTime: float
+        residence time (in ps). Default to 1.25.
+
+    """
+    return iqt('sqwJumpTranslationalDiffusion', t, q, normalized,
+               scale=scale, D=D, resTime=resTime)
+
+
+def iqtWaterTeixeira(
+        t: Union[float, list, np.ndarray],
+        q: Union[float, list, np.ndarray],
+        scale: float = 1.,
+        D: float = 0.23,
+        resTime: float = 1.25,
+        radius: float = 1.,
+        DR: float = 1.,
+        normalized: bool = False
+) -> np.ndarray:
+    """
+    Intermediate scattering function of :func:`~QENSmodels.sqwWaterTeixeira`
+
+    Parameters
+    ----------
+    t, q, scale, normalized:
+        see :func:`iqtBrownianTranslationalDiffusion`
+
+    D: float
+        diffusion coefficient (in Angstrom^2/ps). Default to 0.23.
+
+    resTime: float
+        residence time (in ps). Default to 1.25.
+
+    radius: float
+        radius of rotation (in Angstrom). Default to 1.
+
+    DR: float
+        rotational diffusion coefficient (in 1/ps). Default to 1.
+
+    """
+    return iqt('sqwWaterTeixeira', t, q, normalized, scale=scale, D=D,
+               resTime=resTime, radius=radius, DR=DR)
@@ -1,18 +1,15 @@
 import numpy as np
 from scipy.special import spherical_jn
-from typing import Union, Tuple
+from typing import Union
 
-try:
-    import QENSmodels
-except ImportError:
-    print('Module QENSmodels not found')
+import QENSmodels
 
 
 def hwhmIsotropicRotationalDiffusion(
         q: Union[float, list, np.ndarray],
         radius: float = 1.0,
         DR: float = 1.0
-) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+) -> 'QENSmodels.LineSpectrum':
     """
     Returns some characteristics of `IsotropicRotationalDiffusion` as functions
     of the momentum transfer `q`:
@@ -32,14 +29,11 @@ def hwhmIsotropicRotationalDiffusion(
 
     Returns
     -------
-    hwhm: :class:`~numpy:numpy.ndarray`
-       half-width half maximum
-
-    eisf: :class:`~numpy:numpy.ndarray`
-       elastic incoherent structure factor
-
-    qisf: :class:`~numpy:numpy.ndarray`
-       quasi-elastic incoherent structure factor
+    :class:`~QENSmodels.line_spectrum.LineSpectrum`
+        half-width half maximum (`hwhm`), elastic incoherent structure
+        factor (`eisf`) and quasi-elastic incoherent structure factor
+        (`qisf`), which unpack to full arrays. `hwhm` is stored once,
+        being the same for all momentum transfers.
 
 
     Examples
@@ -84,7 +78,6 @@ def hwhmIsotropicRotationalDiffusion(
 
     numberLorentz = 6
     qisf = np.zeros((q.size, numberLorentz))
-    hwhm = np.zeros((q.size, numberLorentz))
     jl = np.zeros((q.size, numberLorentz))
 
     arg = q * radius
@@ -95,8 +88,6 @@ def hwhmIsotropicRotationalDiffusion(
         # to solve warnings for arg=0
         jl[:, i] = spherical_jn(i, arg)
 
-        hwhm[:, i] = np.repeat(i * (i + 1) * DR, q.size)
-
         if idx.size > 0:
             if i == 0:
                 jl[idx, i] = 1.0
@@ -105,7 +96,12 @@ def hwhmIsotropicRotationalDiffusion(
     eisf = jl[:, 0] ** 2
     for i in range(1, numberLorentz):
         qisf[:, i] = (2 * i + 1) * jl[:, i] ** 2
-    return hwhm, eisf, qisf
+
+    # same widths for all momentum transfers: a single row
+    orders = np.arange(numberLorentz)
+    hwhm = (orders * (orders + 1) * DR)[np.newaxis, :]
+
+    return QENSmodels.LineSpectrum(hwhm, eisf, qisf)
 
 
 def sqwIsotropicRotationalDiffusion(
@@ -215,10 +211,15 @@ def sqwIsotropicRotationalDiffusion(
     # Number of Lorentzians used to represent the infinite sum in R
     numberLorentz = hwhm.shape[1]
 
+    # Lorentzians kept under the tolerances of QENSmodels.lines.tolerance
+    keep = QENSmodels.lines.truncation_mask(eisf, qisf)
+
     # Sum of Lorentzians
     for i in range(q.size):
         sqw[i, :] = eisf[i] * QENSmodels.delta(w, scale, center)
         for j in range(1, numberLorentz):
+            if not keep[i, j]:
+                continue
             sqw[i, :] += qisf[i, j] * QENSmodels.lorentzian(
                 w,
                 scale,
@@ -1,10 +1,7 @@
 import numpy as np
-from typing import Union, Tuple
+from typing import Union
 
-try:
-    import QENSmodels
-except ImportError:
-    print('Module QENSmodels not found')
+import QENSmodels
 
 
 def hwhmJumpSitesLogNormDist(
@@ -13,7 +10,7 @@ def hwhmJumpSitesLogNormDist(
         radius: float = 1.0,
         resTime: float = 1.0,
         sigma: float = 1.0
-) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+) -> 'QENSmodels.LineSpectrum':
     """ Returns some characteristics of `JumpSitesLogNormDist` as functions
     of the momentum transfer `q`:
     the half-width half-maximum (`hwhm`), the elastic incoherent structure
@@ -40,15 +37,11 @@ def hwhmJumpSitesLogNormDist(
 
     Returns
     -------
-
-    hwhm: :class:`~numpy:numpy.ndarray`
-        half-width half maximum
-
-    eisf: :class:`~numpy:numpy.ndarray`
-        elastic incoherent structure factor
-
-    qisf: :class:`~numpy:numpy.ndarray`
-        quasi-elastic incoherent structure factor
+    :class:`~QENSmodels.line_spectrum.LineSpectrum`
+        half-width half maximum (`hwhm`), elastic incoherent structure
+        factor (`eisf`) and quasi-elastic incoherent structure factor
+        (`qisf`), which unpack to full arrays. `hwhm` is stored once,
+        being the same for all momentum transfers.
 
 
     Examples
@@ -85,8 +78,7 @@ def hwhmJumpSitesLogNormDist(
     # number of sites has to be an integer
     Nsites = int(Nsites)
 
-    hwhm_equiv, eisf, qisf_equiv = \
-        QENSmodels.hwhmEquivalentSitesCircle(q, Nsites, radius, resTime)
+    equiv = QENSmodels.hwhmEquivalentSitesCircle(q, Nsites, radius, resTime)
 
     # number of lorentzians used in distribution is 2 * nmax + 1
     n_max = 10
@@ -106,21 +98,14 @@ def hwhmJumpSitesLogNormDist(
     gi = np.exp(-0.5 * np.log(ratio) ** 2 / sigma ** 2)
     gi /= np.sum(gi)  # normalize so sum gi = 1
 
-    # distribution of hwhm for each jumping distance
-    hwhm = np.zeros((q.size, Nsites, 2 * n_max + 1))
-    for qiter in range(q.size):
-        for isite in range(Nsites):
-            # corresponding hwhm for each gi and jumping distance
-            hwhm[qiter, isite, :] = hwhm_equiv[qiter, isite] * ratio
+    # distribution of hwhm for each jumping distance: corresponding hwhm
+    # for each gi and jumping distance, the same for all momentum transfers
+    hwhm = equiv.hwhm[:, :, np.newaxis] * ratio
 
     # quasielastic terms
-    qisf = np.zeros((q.size, Nsites - 1, 2 * n_max + 1))
-    for qiter in range(q.size):
-        for ilor in range(2 * n_max + 1):
-            for isite in range(0, Nsites - 1):
-                qisf[qiter, isite, ilor] = qisf_equiv[qiter, isite] * gi[ilor]
+    qisf = equiv.qisf[:, :, np.newaxis] * gi
 
-    return hwhm, eisf, qisf
+    return QENSmodels.LineSpectrum(hwhm, equiv.eisf, qisf)
 
 
 def sqwJumpSitesLogNormDist(
@@ -261,11 +246,15 @@ def sqwJumpSitesLogNormDist(
     # (Note that hwhm has dimensions [q.size, Nsites], as hwhm[:, 0]
     # contains a width=0, corresponding to the elastic line
     # (eisf), while qisf has dimensions [q.size, Nsites-1])
+    # Lorentzians kept under the tolerances of QENSmodels.lines.tolerance
+    keep = QENSmodels.lines.truncation_mask(eisf, qisf)
     for i in range(q.size):
         # elastic term
         sqw[i, :] = eisf[i] * QENSmodels.delta(w, scale, center)
         for j in range(numberLorentz):
             for k in range(numberSamplingDistrib):
+                if not keep[i, j, k]:
+                    continue
                 # quasielastic terms
                 sqw[i, :] += qisf[i, j, k] * QENSmodels.lorentzian(
                     w,
@@ -0,0 +1,243 @@
+"""
+:math:`\\chi^2` landscapes over grids of parameters
+
+:func:`scan` evaluates the reduced :math:`\\chi^2` of a model at every
+point of a Cartesian grid of its nonlinear parameters, with the scale
+factors, fractions of the lines and backgrounds solved for each point (see
+:class:`~QENSmodels.fitting.SeparableModel`). The grid is split in chunks of
+bounded size, optionally evaluated by several processes. The resulting
+:class:`ScanResult` gives the arrays for contour plots, the profiles of
+each parameter and their profile-likelihood confidence intervals.
+"""
+import numpy as np
+from typing import Union, Optional, Dict, Tuple
+
+import QENSmodels
+from QENSmodels import registry
+
+
+class ScanResult:
+    """
+    Reduced :math:`\\chi^2` over a grid of parameters
+
+    Attributes
+    ----------
+    names: list of str
+        scanned parameters, in the order of the axes of `chi2`
+
+    grid: dict
+        values of each scanned parameter
+
+    chi2: :class:`~numpy:numpy.ndarray`
+        reduced :math:`\\chi^2` at each point of the grid, of shape
+        (grid[names[0]].size, grid[names[1]].size, ...). For a contour plot
+        of two parameters, use `contour(grid[x], grid[y], chi2.T)`.
+
+    dof: int
+        number of degrees of freedom of the reduced :math:`\\chi^2`
+
+    """
+
+    def __init__(self, names, grid, chi2, dof):
+        self.names = names
+        self.grid = grid
+        self.chi2 = chi2
+        self.dof = dof
+
+    @property
+    def minimum(self) -> Dict[str, float]:
+        """ Values of the parameters at the grid point of lowest
+        :math:`\\chi^2` """
+        index = np.unravel_index(np.nanargmin(self.chi2), self.chi2.shape)
+        return {name: float(self.grid[name][i])
+                for name, i in zip(self.names, index)}
+
+    def profile(self, name: str) -> np.ndarray:
+        """ Lowest reduced :math:`\\chi^2` over the other parameters, for
+        each value of parameter `name` """
+        axis = self.names.index(name)
+        others = tuple(i for i in range(self.chi2.ndim) if i != axis)
+        return np.nanmin(self.chi2, axis=others) if others else self.chi2
+
+    def interval(self, name: str, delta: float = 1.) -> Tuple[float, float]:
+        """
+        Profile-likelihood confidence interval of parameter `name`
+
+        The interval contains the values whose profile :math:`\\chi^2` (not
+        reduced) is within `delta` of its minimum, interpolated linearly
+        between the grid points. `delta` = 1 gives the 68% interval of one
+        parameter, 3.84 the 95% interval, when the errors of the data were
+        given to :func:`scan`. A bound is NaN if the interval extends beyond
+        the grid.
+        """
+        values = self.grid[name]
+        profile = self.profile(name) * self.dof
+        level = np.nanmin(profile) + delta
+        best = int(np.nanargmin(profile))
+        bounds = []
+        for step in (-1, 1):
+            i = best
+            while 0 <= i + step < values.size and profile[i + step] <= level:
+                i += step
+            if not 0 <= i + step < values.size:
+                bounds.append(np.nan)
+                continue
+            inside, outside = profile[i], profile[i + step]
+            fraction = (level - inside) / (outside - inside)
+            bounds.append(float(values[i] + fraction *
+                                (values[i + step] - values[i])))
+        return bounds[0], bounds[1]
+
+    def __repr__(self) -> str:
+        return 'ScanResult({})'.format(', '.join(
+            '{}={}'.format(name, self.grid[name].size)
+            for name in self.names))
+
+
+def _scan_chunk(task):
+    """ Reduced chi2 at the grid points of flat indices [start, stop) """
+    (model, w, q, data, errors, resolution, background, time_domain, fixed,
+     grid, start, stop, tolerance) = task
+    if not isinstance(model, QENSmodels.SeparableModel):
+        model = QENSmodels.SeparableModel(model, w, q, resolution,
+                                          background, time_domain, **fixed)
+    shape = tuple(values.size for values in grid.values())
+    indices = dict(zip(grid, np.unravel_index(np.arange(start, stop),
+                                              shape)))
+    x = np.stack([grid[name][indices[name]] for name in model.nonlinear],
+                 axis=-1)
+    # parameters depending on q take the same value for all the spectra
+    x = np.repeat(x, [model.shape[0] if model.spec[name].q_vector else 1
+                      for name in model.nonlinear], axis=1)
+    with QENSmodels.lines.tolerance(**tolerance):
+        return model.chi2(data, x, errors)
+
+
+def scan(
+        model: Union[str, 'registry.ModelSpec'],
+        w,
+        q,
+        data: np.ndarray,
+        grid: Dict[str, np.ndarray],
+        errors: Optional[np.ndarray] = None,
+        resolution: Optional[np.ndarray] = None,
+        background: Optional[int] = None,
+        chunk_size: int = 4096,
+        n_workers: int = 1,
+        time_domain: bool = False,
+        **fixed
+) -> ScanResult:
+    """
+    Reduced :math:`\\chi^2` over a Cartesian grid of the nonlinear
+    parameters
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwIsotropicRotationalDiffusion'
+
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer (in 1/ps)
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    data: :class:`~numpy:numpy.ndarray`
+        spectra, of shape (q.size, w.size)
+
+    grid: dict
+        values of the scanned parameters, *e.g.*
+        {'radius': np.linspace(0.5, 2, 200), 'DR': np.geomspace(0.01, 1, 200)}.
+        All the nonlinear parameters must be either scanned or fixed; the
+        linear ones are solved at each point.
+
+    errors: :class:`~numpy:numpy.ndarray`
+        errors of the data. Default to None (no weighting).
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra of shape (q.size, w.size) or (w.size,).
+        Default to None (no convolution).
+
+    background: int
+        degree of the polynomial backgrounds. Default to None.
+
+    chunk_size: int
+        maximum number of grid points of each task, which bounds the
+        memory used for their parameters and the work sent to each
+        process. The points are evaluated one at a time. Default to 4096.
+
+    n_workers: int
+        number of processes evaluating the chunks. Default to 1 (no
+        parallelism).
+
+    time_domain: bool
+        convolve the lines with the resolution in the time domain.
+        Default to False.
+
+    **fixed:
+        values of the parameters which are not scanned
+
+    Return
+    ------
+    :class:`ScanResult`
+
+    Examples
+    --------
+    >>> w, q = np.linspace(-2, 2, 201), np.array([0.5, 1., 1.5])
+    >>> data = QENSmodels.sqwIsotropicRotationalDiffusion(w, q, radius=1.5,
+    ...                                                   DR=0.3)
+    >>> result = scan('sqwIsotropicRotationalDiffusion', w, q, data,
+    ...               {'radius': np.linspace(1., 2., 11),
+    ...                'DR': np.array([0.1, 0.2, 0.3, 0.4, 0.5])},
+    ...               center=0.)
+    >>> result.chi2.shape
+    (11, 5)
+    >>> result.minimum
+    {'radius': 1.5, 'DR': 0.3}
+
+    """
+    spec = registry.get(model) if isinstance(model, str) else model
+    w = np.asarray(w, dtype=np.float64).reshape(-1)
+    q = np.asarray(q, dtype=np.float64).reshape(-1)
+    data = np.asarray(data, dtype=np.float64).reshape(q.size, w.size)
+    separable = QENSmodels.SeparableModel(spec, w, q, resolution, background,
+                                          time_domain, **fixed)
+    grid = {name: np.asarray(values, dtype=np.float64).reshape(-1)
+            for name, values in grid.items()}
+    for name, values in grid.items():
+        if name not in separable.nonlinear:
+            raise ValueError('{} is {} and cannot be scanned'.format(
+                name, 'solved linearly' if name in separable.linear
+                else 'fixed' if name in fixed else 'not a fitted parameter'))
+        spec[name].check(values)
+    missing = [name for name in separable.nonlinear if name not in grid]
+    if missing:
+        raise ValueError('{} should be scanned or fixed'.format(
+            ', '.join(missing)))
+    if chunk_size < 1:
+        raise ValueError('chunk_size should be >= 1')
+
+    names = list(grid)
+    shape = tuple(grid[name].size for name in names)
+    total = int(np.prod(shape))
+    starts = range(0, total, chunk_size)
+    # the workers do not share the truncation of the lines of this process
+    tolerance = QENSmodels.lines.get_tolerance()
+    if n_workers > 1 and len(starts) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        tasks = [(spec.name, w, q, data, errors, resolution, background,
+                  time_domain, fixed, grid, start,
+                  min(start + chunk_size, total), tolerance)
+                 for start in starts]
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            chunks = list(executor.map(_scan_chunk, tasks))
+    else:
+        chunks = [_scan_chunk((separable, w, q, data, errors, resolution,
+                               background, time_domain, fixed, grid, start,
+                               min(start + chunk_size, total), tolerance))
+                  for start in starts]
+
+    nq, nw = separable.shape
+    dof = max(1, nq * nw - separable.size - nq * separable.ncolumns)
+    return ScanResult(names, grid, np.concatenate(chunks).reshape(shape),
+                      dof)
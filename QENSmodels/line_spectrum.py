@@ -0,0 +1,90 @@
+"""
+Compact results of the `hwhm*` functions
+
+The widths of most models do not depend on the momentum transfer, and the
+log-normal distribution of widths multiplies the widths of jumps between
+sites by the same ratios at all momentum transfers. The `hwhm*` functions
+of these models return a :class:`LineSpectrum`, whose arrays keep their
+natural shapes and are broadcast to one row per momentum transfer only when
+needed.
+"""
+import numpy as np
+from typing import Tuple, Iterator
+
+
+class LineSpectrum:
+    """
+    Widths and incoherent structure factors of a model
+
+    The arrays are broadcastable to their usual shapes, whose first axis is
+    the momentum transfer. Unpacking a `LineSpectrum` gives these full
+    arrays, as the tuples returned before::
+
+        hwhm, eisf, qisf = hwhmEquivalentSitesCircle(q)
+
+    Parameters
+    ----------
+    hwhm: :class:`~numpy:numpy.ndarray`
+        half-widths at half-maximum, with a first axis of size 1 if they do
+        not depend on the momentum transfer
+
+    eisf: :class:`~numpy:numpy.ndarray`
+        elastic incoherent structure factor, of shape (nq,)
+
+    qisf: :class:`~numpy:numpy.ndarray`
+        quasi-elastic incoherent structure factors, of shape (nq, ...)
+
+    Examples
+    --------
+    >>> spectrum = LineSpectrum(np.array([[0., 1., 2.]]), np.ones(4),
+    ...                         np.zeros((4, 3)))
+    >>> spectrum.q_independent_widths
+    True
+    >>> hwhm, eisf, qisf = spectrum
+    >>> hwhm.shape
+    (4, 3)
+
+    """
+
+    def __init__(self, hwhm, eisf, qisf):
+        self.eisf = np.asarray(eisf)
+        self.nq = self.eisf.shape[0]
+        self.hwhm = np.asarray(hwhm)
+        self.qisf = np.asarray(qisf)
+        if self.hwhm.shape[0] not in (1, self.nq) or \
+                self.qisf.shape[0] not in (1, self.nq):
+            raise ValueError('hwhm and qisf should have one row or one row '
+                             'per momentum transfer')
+
+    @property
+    def q_independent_widths(self) -> bool:
+        """ True if the widths are the same for all momentum transfers """
+        return self.hwhm.shape[0] == 1
+
+    def _full(self, value: np.ndarray) -> np.ndarray:
+        """ Copy of `value` with one row per momentum transfer """
+        return np.array(np.broadcast_to(value, (self.nq,) + value.shape[1:]))
+
+    def materialize(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Full arrays of hwhm, eisf and qisf, with one row per momentum
+        transfer """
+        return self._full(self.hwhm), self._full(self.eisf), \
+            self._full(self.qisf)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return iter(self.materialize())
+
+    def __len__(self) -> int:
+        return 3
+
+    def __getitem__(self, index):
+        """ Full array(s) of the requested components only, *e.g.*
+        `spectrum[0]` for the widths """
+        components = (self.hwhm, self.eisf, self.qisf)[index]
+        if isinstance(index, slice):
+            return tuple(self._full(value) for value in components)
+        return self._full(components)
+
+    def __repr__(self) -> str:
+        return 'LineSpectrum(nq={}, hwhm={}, qisf={})'.format(
+            self.nq, self.hwhm.shape, self.qisf.shape)
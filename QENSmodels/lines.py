@@ -0,0 +1,1181 @@
+"""
+Delta and Lorentzian line representation of the models
+
+All the models of the library are sums of an elastic line (delta function)
+and of Lorentzians centred on the same energy. This module decomposes each
+model into its elastic weight and the weights and widths of its Lorentzians,
+for all momentum transfers at once, and evaluates such line lists on an
+energy grid in a single vectorised pass.
+"""
+import contextlib
+import numpy as np
+from scipy.special import spherical_jn
+from typing import Tuple, Optional, Dict, Iterable, Iterator
+
+import QENSmodels
+
+# maximum number of elements of the temporary (q, lines, w) blocks
+_BLOCK_SIZE = 2 ** 20
+
+# tolerances of the truncation of the series of lines (see `tolerance`)
+_TOLERANCE = {'rtol': 0., 'atol': 0.}
+
+
+def get_tolerance() -> Dict[str, float]:
+    """ Current tolerances of the truncation of the series of lines """
+    return dict(_TOLERANCE)
+
+
+def set_tolerance(
+        rtol: Optional[float] = None,
+        atol: Optional[float] = None
+) -> Dict[str, float]:
+    """
+    Sets the tolerances of the truncation of the series of lines
+
+    See :func:`tolerance`. Arguments left to None are not changed.
+
+    Return
+    ------
+    dict
+        previous tolerances, which can be passed back to
+        :func:`set_tolerance`
+
+    """
+    previous = get_tolerance()
+    for name, value in (('rtol', rtol), ('atol', atol)):
+        if value is None:
+            continue
+        if not value >= 0:
+            raise ValueError('{} should be positive or zero'.format(name))
+        _TOLERANCE[name] = float(value)
+    return previous
+
+
+@contextlib.contextmanager
+def tolerance(rtol: float = 0., atol: float = 0.) -> Iterator[None]:
+    r"""
+    Context in which the models drop their negligible lines
+
+    The models made of series of Lorentzians (`sqwGaussianModel3D` sums 99
+    of them, `sqwJumpSitesLogNormDist` 21 per site and
+    `sqwIsotropicRotationalDiffusion` 5 orders) keep all their terms by
+    default, although many have negligible weights at low q. Within this
+    context, for each momentum transfer, the Lorentzians of smallest
+    weights are dropped as long as the sum of their absolute weights stays
+    below
+
+    .. math::
+
+        \max(atol, rtol (|EISF(q)| + \sum_l |A_l(q)|))
+
+    The elastic line is always kept. Since each Lorentzian has a unit area,
+    this bounds the integral over the energy transfer of the error on
+    :math:`S(q, \omega) / scale`, before or after convolution with a
+    normalised resolution, and the error on :math:`I(q, t) / scale` at all
+    times.
+
+    The truncation applies to the `sqw` functions of these three models and
+    to all the evaluations based on :func:`model_lines` (bound models,
+    composite models, adapters, intermediate scattering functions).
+
+    Parameters
+    ----------
+    rtol: float
+        tolerance relative to the total weight of the lines. Default to 0.
+
+    atol: float
+        absolute tolerance on the weights. Default to 0.
+
+    Examples
+    --------
+    >>> q = np.array([0.1, 2.])
+    >>> with tolerance(rtol=1e-8):
+    ...     elastic, weights, widths = model_lines(
+    ...         'sqwGaussianModel3D', q, D=1., variance_ux=1.)
+    >>> weights.shape
+    (2, 20)
+    >>> np.count_nonzero(weights, axis=1)
+    array([ 3, 20])
+
+    """
+    previous = set_tolerance(rtol, atol)
+    try:
+        yield
+    finally:
+        set_tolerance(**previous)
+
+
+def truncation_mask(elastic, weights) -> np.ndarray:
+    """
+    Lines kept under the current tolerances (see :func:`tolerance`)
+
+    Parameters
+    ----------
+    elastic: :class:`~numpy:numpy.ndarray`
+        weights of the elastic line, of shape (nq,)
+
+    weights: :class:`~numpy:numpy.ndarray`
+        weights of the Lorentzians, of shape (nq, ...)
+
+    Return
+    ------
+    :class:`~numpy:numpy.ndarray`
+        boolean array of the shape of `weights`, True for the lines to keep
+
+    """
+    weights = np.asarray(weights)
+    if not (_TOLERANCE['rtol'] or _TOLERANCE['atol']):
+        return np.ones(weights.shape, dtype=bool)
+    nq = weights.shape[0]
+    magnitude = np.abs(weights.reshape(nq, -1))
+    total = np.abs(np.asarray(elastic, dtype=np.float64)).reshape(-1) + \
+        magnitude.sum(axis=1)
+    threshold = np.maximum(_TOLERANCE['atol'], _TOLERANCE['rtol'] * total)
+    # smallest lines first: drop them while their sum is below threshold
+    order = np.argsort(magnitude, axis=1, kind='stable')
+    dropped = np.cumsum(np.take_along_axis(magnitude, order, axis=1),
+                        axis=1) <= threshold[:, None]
+    keep = np.empty(magnitude.shape, dtype=bool)
+    np.put_along_axis(keep, order, ~dropped, axis=1)
+    return keep.reshape(weights.shape)
+
+
+def _truncate(elastic, weights, widths):
+    """ Lines kept under the current tolerances, moved to the first
+    columns of each row, and the selection to apply to the derivatives
+    (None if all the lines are kept) """
+    keep = truncation_mask(elastic, weights)
+    if np.all(keep):
+        return (elastic, weights, widths), None
+    # kept lines first, in their original order
+    order = np.argsort(~keep, axis=1, kind='stable')[
+        :, :max(1, keep.sum(axis=1).max())]
+    selection = keep, order
+    return (elastic, _select(weights, selection),
+            _select(widths, selection)), selection
+
+
+def _select(values, selection):
+    keep, order = selection
+    values = np.where(keep, np.broadcast_to(values, keep.shape), 0.)
+    return np.take_along_axis(values, order, axis=1)
+
+
+def _single_line(hwhm, eisf, qisf):
+    """ Lines of models made of one Lorentzian """
+    return eisf, np.reshape(qisf, (-1, 1)), np.reshape(hwhm, (-1, 1))
+
+
+def _brownian(q, D):
+    return _single_line(*QENSmodels.hwhmBrownianTranslationalDiffusion(q, D))
+
+
+def _chudley_elliott(q, D, L):
+    return _single_line(*QENSmodels.hwhmChudleyElliottDiffusion(q, D, L))
+
+
+def _jump_translational(q, D, resTime):
+    return _single_line(
+        *QENSmodels.hwhmJumpTranslationalDiffusion(q, D, resTime))
+
+
+def _delta_lorentz(q, A0, hwhm):
+    A0 = np.broadcast_to(A0, q.shape).astype(np.float64)
+    return A0, (1. - A0)[:, None], np.broadcast_to(hwhm, q.shape)[:, None]
+
+
+def _delta_two_lorentz(q, A0, A1, hwhm1, hwhm2):
+    A0 = np.broadcast_to(A0, q.shape).astype(np.float64)
+    A1 = np.broadcast_to(A1, q.shape)
+    weights = np.stack([A1, 1. - A0 - A1], axis=1)
+    widths = np.stack([np.broadcast_to(hwhm1, q.shape),
+                       np.broadcast_to(hwhm2, q.shape)], axis=1)
+    return A0, weights, widths
+
+
+def _series(eisf, qisf, hwhm):
+    """ Lines of the `hwhm*` functions of series models: widths which do not
+    depend on `q` are broadcast, not copied """
+    qisf = qisf.reshape(eisf.shape[0], -1)
+    widths = hwhm.reshape(hwhm.shape[0], -1)
+    return eisf, qisf, np.broadcast_to(widths, qisf.shape)
+
+
+def _equivalent_sites_circle(q, Nsites, radius, resTime):
+    spectrum = QENSmodels.hwhmEquivalentSitesCircle(q, Nsites, radius,
+                                                    resTime)
+    return _series(spectrum.eisf, spectrum.qisf, spectrum.hwhm[:, 1:])
+
+
+def _gaussian_model_3d(q, D, variance_ux):
+    spectrum = QENSmodels.hwhmGaussianModel3D(q, D, variance_ux)
+    return _series(spectrum.eisf, spectrum.qisf[:, 1:], spectrum.hwhm[:, 1:])
+
+
+def _isotropic_rotational(q, radius, DR):
+    spectrum = QENSmodels.hwhmIsotropicRotationalDiffusion(q, radius, DR)
+    return _series(spectrum.eisf, spectrum.qisf[:, 1:], spectrum.hwhm[:, 1:])
+
+
+def _jump_sites_log_norm(q, Nsites, radius, resTime, sigma):
+    spectrum = QENSmodels.hwhmJumpSitesLogNormDist(
+        q, Nsites, radius, resTime, sigma)
+    return _series(spectrum.eisf, spectrum.qisf, spectrum.hwhm[:, 1:])
+
+
+def _water_teixeira(q, D, resTime, radius, DR):
+    # jump translational diffusion (a single Lorentzian) convolved with
+    # isotropic rotational diffusion: widths add up
+    hwhm1, _, _ = QENSmodels.hwhmJumpTranslationalDiffusion(q, D, resTime)
+    rotation = QENSmodels.hwhmIsotropicRotationalDiffusion(q, radius, DR)
+    weights = np.concatenate([rotation.eisf[:, None], rotation.qisf[:, 1:]],
+                             axis=1)
+    widths = hwhm1[:, None] + rotation.hwhm
+    return np.zeros(q.size), weights, widths
+
+
+_DECOMPOSITIONS = {
+    'sqwBrownianTranslationalDiffusion': _brownian,
+    'sqwChudleyElliottDiffusion': _chudley_elliott,
+    'sqwDeltaLorentz': _delta_lorentz,
+    'sqwDeltaTwoLorentz': _delta_two_lorentz,
+    'sqwEquivalentSitesCircle': _equivalent_sites_circle,
+    'sqwGaussianModel3D': _gaussian_model_3d,
+    'sqwIsotropicRotationalDiffusion': _isotropic_rotational,
+    'sqwJumpSitesLogNormDist': _jump_sites_log_norm,
+    'sqwJumpTranslationalDiffusion': _jump_translational,
+    'sqwWaterTeixeira': _water_teixeira,
+}
+
+
+def model_lines(
+        model: str,
+        q: np.ndarray,
+        **params
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decomposes a model into an elastic line and Lorentzians
+
+    Parameters
+    ----------
+    model: str
+        name of the model, *e.g.* 'sqwIsotropicRotationalDiffusion'
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    **params:
+        parameters of the model, except `scale` and `center`
+
+    Return
+    ------
+    elastic: :class:`~numpy:numpy.ndarray`
+        weight of the elastic line, of shape (q.size,)
+
+    weights: :class:`~numpy:numpy.ndarray`
+        weights of the Lorentzians, of shape (q.size, number of lines)
+
+    widths: :class:`~numpy:numpy.ndarray`
+        half-widths at half-maximum of the Lorentzians, of the same shape as
+        `weights`
+
+    Examples
+    --------
+    >>> elastic, weights, widths = model_lines(
+    ...     'sqwDeltaTwoLorentz', np.array([0.5, 1.]), A0=0.2, A1=0.5,
+    ...     hwhm1=0.1, hwhm2=1.)
+    >>> elastic
+    array([0.2, 0.2])
+    >>> weights
+    array([[0.5, 0.3],
+           [0.5, 0.3]])
+    >>> widths[0]
+    array([0.1, 1. ])
+
+    """
+    lines, _ = _truncate(*_all_lines(model, q, **params))
+    return lines
+
+
+def quasielastic_summary(
+        elastic: np.ndarray,
+        weights: np.ndarray,
+        widths: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    EISF and apparent half-width of lines, *e.g.* from :func:`model_lines`
+
+    The apparent half-width is that of the single Lorentzian with the same
+    area and peak height as the sum of the Lorentzians.
+
+    Return
+    ------
+    eisf, hwhm: :class:`~numpy:numpy.ndarray`
+        arrays of shape (nq,)
+
+    Examples
+    --------
+    >>> eisf, hwhm = quasielastic_summary(
+    ...     *model_lines('sqwDeltaTwoLorentz', np.array([1.]), A0=0.2,
+    ...                  A1=0.4, hwhm1=0.1, hwhm2=0.4))
+    >>> float(eisf[0]), round(float(hwhm[0]), 4)
+    (0.2, 0.16)
+
+    """
+    elastic = np.asarray(elastic, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    widths = np.broadcast_to(widths, weights.shape)
+    total = weights.sum(axis=1)
+    height = np.sum(np.divide(weights, widths, out=np.zeros_like(weights),
+                              where=widths > 0), axis=1)
+    hwhm = np.divide(total, height, out=np.zeros_like(total),
+                     where=height > 0)
+    return elastic / (elastic + total), hwhm
+
+
+def _all_lines(model, q, **params):
+    """ Lines of a model, without truncation """
+    try:
+        decomposition = _DECOMPOSITIONS[model]
+    except KeyError:
+        raise ValueError('{} cannot be decomposed into lines'.format(model))
+    q = np.asarray(q, dtype=np.float64).reshape(-1)
+    elastic, weights, widths = decomposition(q, **params)
+    weights = np.asarray(weights, dtype=np.float64)
+    return (np.asarray(elastic, dtype=np.float64).reshape(q.size),
+            weights,
+            np.broadcast_to(np.asarray(widths, dtype=np.float64),
+                            weights.shape))
+
+
+# Derivatives of the lines with respect to the parameters of the models.
+# Each function returns a dictionary mapping the name of a parameter to the
+# derivatives of (elastic, weights, widths); None stands for zero. Rows of
+# the derivatives of q-dependent parameters are taken with respect to the
+# value of the parameter for that row.
+
+def _d_brownian(q, lines, D):
+    return {'D': (None, None, q[:, None] ** 2)}
+
+
+def _d_chudley_elliott(q, lines, D, L):
+    u = q * L
+    j0 = spherical_jn(0, u)
+    j1 = spherical_jn(1, u)
+    return {'D': (None, None, (6. * (1. - j0) / L ** 2)[:, None]),
+            'L': (None, None, (6. * D * (q * j1 / L ** 2
+                                         - 2. * (1. - j0) / L ** 3))[:, None])}
+
+
+def _d_jump_translational(q, lines, D, resTime):
+    dq2 = D * q ** 2
+    denominator = (1. + resTime * dq2) ** 2
+    return {'D': (None, None, (q ** 2 / denominator)[:, None]),
+            'resTime': (None, None, (-dq2 ** 2 / denominator)[:, None])}
+
+
+def _d_delta_lorentz(q, lines, A0, hwhm):
+    ones = np.ones((q.size, 1))
+    return {'A0': (ones[:, 0], -ones, None),
+            'hwhm': (None, None, ones)}
+
+
+def _d_delta_two_lorentz(q, lines, A0, A1, hwhm1, hwhm2):
+    ones = np.ones(q.size)
+    zeros = np.zeros(q.size)
+    return {'A0': (ones, np.stack([zeros, -ones], axis=1), None),
+            'A1': (None, np.stack([ones, -ones], axis=1), None),
+            'hwhm1': (None, None, np.stack([ones, zeros], axis=1)),
+            'hwhm2': (None, None, np.stack([zeros, ones], axis=1))}
+
+
+def _d_sites_isf(q, Nsites, radius):
+    """ Derivative with respect to the radius of the incoherent structure
+    factors of jumps between equivalent sites on a circle """
+    sites = np.arange(Nsites)
+    jump_distance = 2. * radius * np.sin(sites * np.pi / Nsites)
+    QR = np.outer(q, jump_distance)
+    cosines = np.cos(2. * np.pi * np.outer(sites, sites) / Nsites)
+    return (-spherical_jn(1, QR) * QR / radius) @ cosines / Nsites
+
+
+def _d_equivalent_sites_circle(q, lines, Nsites, radius, resTime):
+    d_isf = _d_sites_isf(q, int(Nsites), radius)
+    return {'radius': (d_isf[:, 0], d_isf[:, 1:], None),
+            'resTime': (None, None, -lines[2] / resTime)}
+
+
+def _d_gaussian_model_3d(q, lines, D, variance_ux):
+    elastic, weights, widths = lines
+    orders = np.arange(1, weights.shape[1] + 1)
+    q2 = q[:, None] ** 2
+    return {'D': (None, None, widths / D),
+            'variance_ux': (-q ** 2 * elastic,
+                            weights * (orders / variance_ux - q2),
+                            -widths / variance_ux)}
+
+
+def _d_isf_rotation(q, radius, norders):
+    """ Derivative with respect to the radius of (2l+1) j_l(q radius)^2 """
+    orders = np.arange(norders)
+    arg = np.outer(q, np.ones(norders)) * radius
+    return ((2 * orders + 1) * 2. * spherical_jn(orders, arg)
+            * spherical_jn(orders, arg, derivative=True) * q[:, None])
+
+
+def _d_isotropic_rotational(q, lines, radius, DR):
+    d_isf = _d_isf_rotation(q, radius, lines[1].shape[1] + 1)
+    return {'radius': (d_isf[:, 0], d_isf[:, 1:], None),
+            'DR': (None, None, lines[2] / DR)}
+
+
+def _d_jump_sites_log_norm(q, lines, Nsites, radius, resTime, sigma):
+    Nsites = int(Nsites)
+    widths = lines[2]
+    nsamples = widths.shape[1] // (Nsites - 1)
+    n_max = (nsamples - 1) // 2
+    # log(ratio) = (k / n_max - 1) * sigma * sqrt(-2 log(0.1)); the weights
+    # of the distribution do not depend on sigma
+    slope = (np.arange(nsamples) / n_max - 1.) * np.sqrt(-2. * np.log(0.1))
+    gi = np.exp(-0.5 * slope ** 2)
+    gi /= np.sum(gi)
+    d_isf = _d_sites_isf(q, Nsites, radius)
+    return {'radius': (d_isf[:, 0],
+                       (d_isf[:, 1:, None] * gi).reshape(q.size, -1),
+                       None),
+            'resTime': (None, None, -widths / resTime),
+            'sigma': (None, None, widths * np.tile(slope, Nsites - 1))}
+
+
+def _d_water_teixeira(q, lines, D, resTime, radius, DR):
+    translation = _d_jump_translational(q, None, D, resTime)
+    d_isf = _d_isf_rotation(q, radius, lines[1].shape[1])
+    orders = np.arange(lines[1].shape[1])
+    return {'D': (None, None, translation['D'][2]),
+            'resTime': (None, None, translation['resTime'][2]),
+            'radius': (None, d_isf, None),
+            'DR': (None, None, np.broadcast_to(
+                (orders * (orders + 1.))[None, :], lines[2].shape))}
+
+
+_DERIVATIVES = {
+    'sqwBrownianTranslationalDiffusion': _d_brownian,
+    'sqwChudleyElliottDiffusion': _d_chudley_elliott,
+    'sqwDeltaLorentz': _d_delta_lorentz,
+    'sqwDeltaTwoLorentz': _d_delta_two_lorentz,
+    'sqwEquivalentSitesCircle': _d_equivalent_sites_circle,
+    'sqwGaussianModel3D': _d_gaussian_model_3d,
+    'sqwIsotropicRotationalDiffusion': _d_isotropic_rotational,
+    'sqwJumpSitesLogNormDist': _d_jump_sites_log_norm,
+    'sqwJumpTranslationalDiffusion': _d_jump_translational,
+    'sqwWaterTeixeira': _d_water_teixeira,
+}
+
+
+def model_lines_derivatives(
+        model: str,
+        q: np.ndarray,
+        lines: Optional[tuple] = None,
+        **params
+) -> Dict[str, tuple]:
+    """
+    Derivatives of the lines of a model with respect to its parameters
+
+    Parameters
+    ----------
+    model: str
+        name of the model, *e.g.* 'sqwIsotropicRotationalDiffusion'
+
+    q: :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    lines: tuple
+        output of :func:`model_lines` for the same parameters, if already
+        computed
+
+    **params:
+        parameters of the model, except `scale` and `center`
+
+    Return
+    ------
+    dict
+        maps the name of each fitting parameter to the derivatives of
+        (elastic, weights, widths), of the same shapes as the output of
+        :func:`model_lines`. For q-dependent parameters, row `i` is the
+        derivative with respect to the value of the parameter at `q[i]`.
+
+    Examples
+    --------
+    >>> derivatives = model_lines_derivatives(
+    ...     'sqwBrownianTranslationalDiffusion', np.array([1., 2.]), D=0.5)
+    >>> derivatives['D'][2]
+    array([[1.],
+           [4.]])
+
+    """
+    if model not in _DERIVATIVES:
+        raise ValueError('{} cannot be decomposed into lines'.format(model))
+    q = np.asarray(q, dtype=np.float64).reshape(-1)
+    # the derivatives are computed for all the lines, then truncated as the
+    # lines
+    all_lines = _all_lines(model, q, **params)
+    _, selection = _truncate(*all_lines)
+    if lines is None or selection is not None:
+        lines = all_lines
+    shapes = (lines[0].shape, lines[1].shape, lines[2].shape)
+    derivatives = {}
+    for name, terms in _DERIVATIVES[model](q, lines, **params).items():
+        terms = tuple(
+            np.zeros(shape) if term is None
+            else np.broadcast_to(np.asarray(term, dtype=np.float64), shape)
+            for term, shape in zip(terms, shapes))
+        if selection is not None:
+            terms = (terms[0], _select(terms[1], selection),
+                     _select(terms[2], selection))
+        derivatives[name] = terms
+    return derivatives
+
+
+def trapz_weights(w: np.ndarray) -> np.ndarray:
+    """ Weights `t` such that `y @ t` is the trapezoidal integral of `y` """
+    w = np.asarray(w, dtype=np.float64)
+    weights = np.zeros(w.size)
+    if w.size > 1:
+        steps = np.diff(w)
+        weights[:-1] += 0.5 * steps
+        weights[1:] += 0.5 * steps
+    return weights
+
+
+def _row_groups(*arrays):
+    """
+    Rows of arrays of shape (nq, lines) and the number of leading columns
+    holding their non-zero lines
+
+    Rows whose lines fit in at most half of the columns, *e.g.* truncated
+    series at low q, are grouped by number of lines and evaluated
+    separately. Rows without lines are skipped.
+    """
+    nonzero = arrays[0] != 0
+    for array in arrays[1:]:
+        nonzero = nonzero | (array != 0)
+    nlines = nonzero.shape[1]
+    if nlines == 0:
+        return
+    lengths = np.where(np.any(nonzero, axis=1),
+                       nlines - np.argmax(nonzero[:, ::-1], axis=1), 0)
+    longest = lengths.max(initial=0)
+    if longest == 0:
+        return
+    if np.all(2 * lengths > longest):
+        yield slice(None), longest
+        return
+    # groups of rows needing up to 1, 2, 4, 8... lines
+    groups = np.ceil(np.log2(np.maximum(lengths, 1))).astype(int)
+    for group in np.unique(groups[lengths > 0]):
+        rows = np.flatnonzero((groups == group) & (lengths > 0))
+        yield rows, lengths[rows].max()
+
+
+def evaluate_lines(
+        w: np.ndarray,
+        center,
+        elastic: np.ndarray,
+        weights: np.ndarray,
+        widths: np.ndarray,
+        scale=1.,
+        out: Optional[np.ndarray] = None,
+        trapz: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Evaluates an elastic line and Lorentzians for all momentum transfers
+
+    The result is identical to summing `QENSmodels.delta` and
+    `QENSmodels.lorentzian` term by term: each Lorentzian whose sampled area
+    exceeds 1 is renormalised, and Lorentzians of zero width are elastic.
+
+    Parameters
+    ----------
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer (in 1/ps)
+
+    center: float or :class:`~numpy:numpy.ndarray` of shape (nq,)
+        center of the lines
+
+    elastic: :class:`~numpy:numpy.ndarray`
+        weights of the elastic line, of shape (nq,)
+
+    weights: :class:`~numpy:numpy.ndarray`
+        weights of the Lorentzians, of shape (nq, number of lines)
+
+    widths: :class:`~numpy:numpy.ndarray`
+        half-widths at half-maximum of the Lorentzians, of shape
+        (nq, number of lines)
+
+    scale: float or :class:`~numpy:numpy.ndarray` of shape (nq,)
+        scale factor. Default to 1.
+
+    out: :class:`~numpy:numpy.ndarray`
+        array of shape (nq, w.size) where to write the result.
+        Default to None (a new array is allocated).
+
+    trapz: :class:`~numpy:numpy.ndarray`
+        output of :func:`trapz_weights` for `w`, if already known.
+
+    Return
+    ------
+    :class:`~numpy:numpy.ndarray`
+        array of shape (nq, w.size)
+
+    Examples
+    --------
+    >>> w = np.linspace(-2, 2, 5)
+    >>> sqw = evaluate_lines(w, 0., np.array([0.5]), np.array([[0.5]]),
+    ...                      np.array([[1.]]))
+    >>> np.allclose(sqw[0],
+    ...             0.5 * QENSmodels.delta(w) + 0.5 * QENSmodels.lorentzian(w))
+    True
+
+    """
+    w = np.asarray(w, dtype=np.float64).reshape(-1)
+    elastic = np.asarray(elastic, dtype=np.float64)
+    nq = elastic.size
+    weights = np.asarray(weights, dtype=np.float64).reshape(nq, -1)
+    widths = np.asarray(widths, dtype=np.float64).reshape(nq, -1)
+    center = np.broadcast_to(np.asarray(center, dtype=np.float64), (nq,))
+    scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), (nq,))
+
+    if out is None:
+        out = np.zeros((nq, w.size))
+    else:
+        out[...] = 0.
+
+    # Lorentzians of zero width are delta functions
+    zero = widths == 0
+    if np.any(zero):
+        elastic = elastic + np.sum(np.where(zero, weights, 0.), axis=1)
+        weights = np.where(zero, 0., weights)
+        widths = np.where(zero, 1., widths)
+
+    # lines with no weight at any q do not contribute
+    used = np.any(weights != 0, axis=0)
+    if not np.all(used):
+        weights = weights[:, used]
+        widths = widths[:, used]
+
+    if w.size > 1 and trapz is None:
+        trapz = trapz_weights(w)
+
+    # squared distance to the center, shared by all q if possible
+    if np.all(center == center[0]):
+        x2 = np.square(w - center[0])[None, None, :]
+    else:
+        x2 = np.square(w[None, :] - center[:, None])[:, None, :]
+
+    if nq > 1 and x2.shape[0] == 1 and np.all(widths == widths[:1]):
+        # widths and center shared by all q: each Lorentzian is sampled once
+        nlines = widths.shape[1]
+        step = max(1, _BLOCK_SIZE // max(1, w.size))
+        for start in range(0, nlines, step):
+            gamma = widths[0, start:min(start + step, nlines), None]
+            block = x2[0] + np.square(gamma)
+            np.divide(gamma / np.pi, block, out=block)
+            factor = weights[:, start:min(start + step, nlines)] * \
+                scale[:, None]
+            if w.size > 1:
+                # area normalisation of lorentzian
+                area = block @ trapz
+                factor = factor / np.where(area > 1, area, 1.)
+            out += factor @ block
+        groups = []
+    else:
+        groups = _row_groups(weights)
+
+    for rows, nlines in groups:
+        x2_rows = x2 if x2.shape[0] == 1 else x2[rows]
+        nrows = weights[rows].shape[0]
+        step = max(1, _BLOCK_SIZE // max(1, nrows * w.size))
+        for start in range(0, nlines, step):
+            gamma = widths[rows, start:min(start + step, nlines), None]
+            block = x2_rows + np.square(gamma)
+            np.divide(gamma / np.pi, block, out=block)
+            factor = weights[rows, start:min(start + step, nlines)] * \
+                scale[rows, None]
+            if w.size > 1:
+                # area normalisation of lorentzian
+                area = block @ trapz
+                factor = factor / np.where(area > 1, area, 1.)
+            if factor.shape[1] == 1:
+                out[rows] += factor * block[:, 0, :]
+            else:
+                out[rows] += np.einsum('ql,qlw->qw', factor, block)
+
+    # elastic line, as in delta
+    if np.any(elastic):
+        rows, index, dx = _delta_rows(w, center, nq)
+        out[rows, index] += elastic[rows] * scale[rows] / dx
+
+    return out
+
+
+def _delta_rows(w, center, nq):
+    """ Rows and indices of the elastic line, as placed by `delta`, and the
+    grid spacing """
+    if w.size == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), 1.
+    low, high = w.min(), w.max()
+    dx = (high - low) / (w.size - 1) if w.size > 1 else 1.
+    rows = np.nonzero((low <= center) & (center <= high))[0]
+    index = np.argmin(np.abs(w[None, :] - center[rows, None]), axis=1)
+    return rows, index, dx
+
+
+def evaluate_lines_jacobian(
+        w: np.ndarray,
+        center,
+        elastic: np.ndarray,
+        weights: np.ndarray,
+        widths: np.ndarray,
+        derivatives: Dict[str, tuple],
+        scale=1.,
+        trapz: Optional[np.ndarray] = None,
+        with_respect_to: Iterable[str] = ('scale', 'center')
+) -> Dict[str, np.ndarray]:
+    """
+    Derivatives of :func:`evaluate_lines` with respect to the parameters
+
+    Parameters
+    ----------
+    w, center, elastic, weights, widths, scale, trapz:
+        as in :func:`evaluate_lines`
+
+    derivatives: dict
+        derivatives of (elastic, weights, widths) with respect to the
+        parameters of the model, as returned by
+        :func:`model_lines_derivatives`
+
+    with_respect_to: iterable of str
+        which of 'scale' and 'center' to differentiate with respect to.
+        Default to both.
+
+    Return
+    ------
+    dict
+        maps the names of the parameters to arrays of shape (nq, w.size).
+        Row `i` of the derivatives with respect to `scale`, `center` and
+        q-dependent parameters is the derivative with respect to their
+        value at `q[i]`.
+
+    Notes
+    -----
+    The derivatives are analytic. The position of the elastic line does not
+    vary continuously with `center`, so that it does not contribute to the
+    derivative with respect to `center`.
+
+    """
+    w = np.asarray(w, dtype=np.float64).reshape(-1)
+    elastic = np.asarray(elastic, dtype=np.float64)
+    nq = elastic.size
+    weights = np.asarray(weights, dtype=np.float64).reshape(nq, -1)
+    widths = np.asarray(widths, dtype=np.float64).reshape(nq, -1)
+    center = np.broadcast_to(np.asarray(center, dtype=np.float64), (nq,))
+    scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), (nq,))
+    with_respect_to = set(with_respect_to)
+    names = list(derivatives)
+    d_elastic = {name: derivatives[name][0] for name in names}
+    d_weights = {name: derivatives[name][1] for name in names}
+    d_widths = {name: derivatives[name][2] for name in names}
+
+    # Lorentzians of zero width are delta functions
+    zero = widths == 0
+    if np.any(zero):
+        elastic = elastic + np.sum(np.where(zero, weights, 0.), axis=1)
+        weights = np.where(zero, 0., weights)
+        widths = np.where(zero, 1., widths)
+        for name in names:
+            d_elastic[name] = d_elastic[name] + np.sum(
+                np.where(zero, d_weights[name], 0.), axis=1)
+            d_weights[name] = np.where(zero, 0., d_weights[name])
+            d_widths[name] = np.where(zero, 0., d_widths[name])
+
+    if w.size > 1 and trapz is None:
+        trapz = trapz_weights(w)
+
+    if np.all(center == center[0]):
+        x = (w - center[0])[None, None, :]
+    else:
+        x = (w[None, :] - center[:, None])[:, None, :]
+    x2 = np.square(x)
+
+    def normalised(block, derivative, inverse, renormalised):
+        # derivative of block / area, if the area is renormalised
+        if inverse is None:
+            return derivative
+        correction = np.where(renormalised, derivative @ trapz, 0.)
+        return (derivative - block * correction[..., None]) * \
+            inverse[..., None]
+
+    model = np.zeros((nq, w.size))
+    result = {name: np.zeros((nq, w.size)) for name in names}
+    if 'center' in with_respect_to:
+        result['center'] = np.zeros((nq, w.size))
+
+    groups = _row_groups(weights, *(d_weights[name] for name in names),
+                         *(d_widths[name] for name in names))
+    for rows, nlines in groups:
+        x_rows = x if x.shape[0] == 1 else x[rows]
+        x2_rows = x2 if x2.shape[0] == 1 else x2[rows]
+        nrows = weights[rows].shape[0]
+        step = max(1, _BLOCK_SIZE // max(1, 3 * nrows * w.size))
+        for start in range(0, nlines, step):
+            lines_ = rows, slice(start, min(start + step, nlines))
+            gamma = widths[lines_][..., None]
+            denominator = x2_rows + np.square(gamma)
+            block = gamma / np.pi / denominator
+            inverse = renormalised = None
+            if w.size > 1:
+                area = block @ trapz
+                renormalised = area > 1
+                inverse = np.where(renormalised, 1. / area, 1.)
+                block *= inverse[..., None]
+            d_gamma = normalised(block,
+                                 (x2_rows - np.square(gamma)) / np.pi /
+                                 np.square(denominator),
+                                 inverse, renormalised)
+
+            model[rows] += np.einsum('ql,qlw->qw', weights[lines_], block)
+            if 'center' in with_respect_to:
+                d_center = normalised(block,
+                                      2. * gamma * x_rows / np.pi /
+                                      np.square(denominator),
+                                      inverse, renormalised)
+                result['center'][rows] += np.einsum(
+                    'ql,qlw->qw', weights[lines_], d_center)
+            for name in names:
+                result[name][rows] += np.einsum(
+                    'ql,qlw->qw', d_weights[name][lines_], block)
+                result[name][rows] += np.einsum(
+                    'ql,qlw->qw', weights[lines_] * d_widths[name][lines_],
+                    d_gamma)
+
+    # elastic line
+    rows, index, dx = _delta_rows(w, center, nq)
+    model[rows, index] += elastic[rows] / dx
+    for name in names:
+        result[name][rows, index] += d_elastic[name][rows] / dx
+
+    for value in result.values():
+        value *= scale[:, None]
+    if 'scale' in with_respect_to:
+        result['scale'] = model
+    return result
+
+
+class LineList:
+    """
+    Lines of a model for each momentum transfer
+
+    Each line has a weight, a half-width at half-maximum and a center, which
+    can depend on the momentum transfer. Lines of zero width are elastic
+    (delta functions). Lists of lines can be added, scaled and convolved
+    analytically, since the convolution of two Lorentzians is a Lorentzian
+    whose width and center are the sums of theirs.
+
+    Parameters
+    ----------
+    weights: :class:`~numpy:numpy.ndarray`
+        weights of the lines, of shape (nq, number of lines)
+
+    widths: :class:`~numpy:numpy.ndarray`
+        half-widths at half-maximum, broadcastable to the shape of `weights`
+
+    centers: :class:`~numpy:numpy.ndarray`
+        centers, broadcastable to the shape of `weights`
+
+    Examples
+    --------
+    >>> lorentzian = LineList([[1.]], [[0.1]], [[0.]])
+    >>> elastic = LineList([[0.5]], [[0.]], [[0.]])
+    >>> lines = (elastic + lorentzian + 0.5 * elastic).convolve(lorentzian)
+    >>> lines.merged().widths
+    array([[0.1, 0.2]])
+    >>> lines.merged().weights
+    array([[0.75, 1.  ]])
+
+    """
+
+    def __init__(self, weights, widths, centers):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 2:
+            raise ValueError('weights should be of shape (nq, number of '
+                             'lines)')
+        self.weights, self.widths, self.centers = np.broadcast_arrays(
+            weights,
+            np.asarray(widths, dtype=np.float64),
+            np.asarray(centers, dtype=np.float64))
+        if self.weights.shape != weights.shape:
+            raise ValueError('widths and centers should be broadcastable to '
+                             'the shape of weights')
+
+    @classmethod
+    def from_model_lines(cls, elastic, weights, widths, center=0.,
+                         scale=1.) -> 'LineList':
+        """ Lines of the output of :func:`model_lines`, with a center and a
+        scale factor which can depend on the momentum transfer """
+        elastic = np.asarray(elastic, dtype=np.float64).reshape(-1, 1)
+        nq = elastic.shape[0]
+        scale = np.broadcast_to(np.asarray(scale, dtype=np.float64),
+                                (nq,))[:, None]
+        center = np.broadcast_to(np.asarray(center, dtype=np.float64),
+                                 (nq,))[:, None]
+        weights = np.asarray(weights, dtype=np.float64).reshape(nq, -1)
+        widths = np.broadcast_to(widths, weights.shape)
+        return cls(np.concatenate([elastic, weights], axis=1) * scale,
+                   np.concatenate([np.zeros((nq, 1)), widths], axis=1),
+                   center)
+
+    @property
+    def nq(self) -> int:
+        """ Number of momentum transfers """
+        return self.weights.shape[0]
+
+    @property
+    def nlines(self) -> int:
+        """ Number of lines """
+        return self.weights.shape[1]
+
+    def _rows(self, other: 'LineList') -> int:
+        if self.nq != other.nq and 1 not in (self.nq, other.nq):
+            raise ValueError('lines of {} and {} momentum transfers cannot '
+                             'be combined'.format(self.nq, other.nq))
+        return max(self.nq, other.nq)
+
+    def __add__(self, other: 'LineList') -> 'LineList':
+        if not isinstance(other, LineList):
+            return NotImplemented
+        nq = self._rows(other)
+        return LineList(*(
+            np.concatenate([np.broadcast_to(mine, (nq, self.nlines)),
+                            np.broadcast_to(theirs, (nq, other.nlines))],
+                           axis=1)
+            for mine, theirs in zip((self.weights, self.widths,
+                                     self.centers),
+                                    (other.weights, other.widths,
+                                     other.centers))))
+
+    def __mul__(self, factor) -> 'LineList':
+        """ Scales the lines by a number or one number per momentum
+        transfer """
+        factor = np.asarray(factor, dtype=np.float64)
+        if factor.ndim > 1:
+            return NotImplemented
+        return LineList(self.weights * factor.reshape(-1, 1), self.widths,
+                        self.centers)
+
+    __rmul__ = __mul__
+
+    def convolve(self, other: 'LineList') -> 'LineList':
+        """ Convolution with other lines: weights multiply, widths and
+        centers add """
+        nq = self._rows(other)
+
+        def pairs(mine, theirs, operation):
+            return operation(mine[:, :, None], theirs[:, None, :]).reshape(
+                nq, self.nlines * other.nlines)
+
+        return LineList(pairs(self.weights, other.weights, np.multiply),
+                        pairs(self.widths, other.widths, np.add),
+                        pairs(self.centers, other.centers, np.add))
+
+    def merged(self) -> 'LineList':
+        """
+        Equivalent list with fewer lines
+
+        Lines of zero weight at all momentum transfers are dropped, and
+        lines with the same width and center at all momentum transfers,
+        including elastic lines at the same center, are replaced by a single
+        line whose weight is the sum of theirs.
+        """
+        used = np.any(self.weights != 0, axis=0)
+        weights = self.weights[:, used]
+        keys = np.concatenate([self.widths[:, used].T,
+                               self.centers[:, used].T], axis=1)
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        if unique.shape[0] < weights.shape[1]:
+            groups = np.zeros((weights.shape[1], unique.shape[0]))
+            groups[np.arange(weights.shape[1]), inverse.reshape(-1)] = 1.
+            weights = weights @ groups
+            used = np.any(weights != 0, axis=0)
+            weights, unique = weights[:, used], unique[used]
+        else:
+            unique = keys
+        return LineList(weights, unique[:, :self.nq].T, unique[:, self.nq:].T)
+
+    def shifted(self, center) -> 'LineList':
+        """ Lines moved by `center`, a number or one number per momentum
+        transfer """
+        center = np.asarray(center, dtype=np.float64)
+        return LineList(self.weights, self.widths,
+                        self.centers + center.reshape(-1, 1))
+
+    def evaluate(self, w: np.ndarray, out: Optional[np.ndarray] = None,
+                 trapz: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Evaluates the lines on the energy transfers `w`
+
+        As in :func:`evaluate_lines`, the result is identical to summing
+        `QENSmodels.delta` and `QENSmodels.lorentzian` line by line.
+
+        Return
+        ------
+        :class:`~numpy:numpy.ndarray`
+            array of shape (nq, w.size)
+
+        """
+        w = np.asarray(w, dtype=np.float64).reshape(-1)
+        nq = self.nq
+        if out is None:
+            out = np.zeros((nq, w.size))
+        else:
+            out[...] = 0.
+
+        elastic = (self.widths == 0) & (self.weights != 0)
+        if np.any(elastic):
+            rows, lines_ = np.nonzero(elastic)
+            inside, index, dx = _delta_rows(w, self.centers[rows, lines_],
+                                            rows.size)
+            np.add.at(out, (rows[inside], index),
+                      self.weights[rows[inside], lines_[inside]] / dx)
+
+        inelastic = (self.widths != 0) & (self.weights != 0)
+        used = np.any(inelastic, axis=0)
+        if not np.any(used):
+            return out
+        weights = np.where(inelastic, self.weights, 0.)[:, used]
+        widths = np.where(inelastic, self.widths, 1.)[:, used]
+        centers = self.centers[:, used]
+
+        if w.size > 1 and trapz is None:
+            trapz = trapz_weights(w)
+
+        # squared distances to the centers, shared if possible
+        if np.all(centers == centers[0, 0]):
+            x2 = np.square(w - centers[0, 0])[None, None, :]
+        elif np.all(centers == centers[:, :1]):
+            x2 = np.square(w[None, :] - centers[:, :1])[:, None, :]
+        else:
+            x2 = None
+
+        nlines = weights.shape[1]
+        step = max(1, _BLOCK_SIZE // max(1, nq * w.size))
+        for start in range(0, nlines, step):
+            lines_ = slice(start, start + step)
+            gamma = widths[:, lines_, None]
+            if x2 is None:
+                block = np.square(w - centers[:, lines_, None])
+                block += np.square(gamma)
+            else:
+                block = x2 + np.square(gamma)
+            np.divide(gamma / np.pi, block, out=block)
+            factor = weights[:, lines_]
+            if w.size > 1:
+                # area normalisation of lorentzian
+                area = block @ trapz
+                factor = factor / np.where(area > 1, area, 1.)
+            out += np.einsum('ql,qlw->qw', factor, block)
+        return out
+
+
+def hwhm_lines(hwhm, eisf, qisf) -> LineList:
+    """
+    Lines of the output of a `hwhm*` function
+
+    The widths of the quasi-elastic terms either include the zero width of
+    the elastic term as first column (*e.g.* `hwhmGaussianModel3D`) or not
+    (*e.g.* `hwhmEquivalentSitesCircle`).
+
+    Parameters
+    ----------
+    hwhm, eisf, qisf:
+        output of a `hwhm*` function: widths, elastic and quasi-elastic
+        incoherent structure factors
+
+    Return
+    ------
+    :class:`LineList`
+        elastic line followed by the quasi-elastic lines, centred on 0
+
+    Examples
+    --------
+    >>> lines = hwhm_lines(*QENSmodels.hwhmEquivalentSitesCircle(
+    ...     [0.5, 1.], Nsites=3, radius=1., resTime=1.))
+    >>> lines.nlines
+    3
+    >>> np.allclose(lines.weights.sum(axis=1), 1.)
+    True
+
+    """
+    eisf = np.asarray(eisf, dtype=np.float64).reshape(-1)
+    nq = eisf.size
+    hwhm = np.asarray(hwhm, dtype=np.float64)
+    qisf = np.asarray(qisf, dtype=np.float64)
+    # second axis: quasi-elastic terms
+    hwhm = hwhm.reshape((nq, -1) + hwhm.shape[2:])
+    qisf = qisf.reshape((nq, -1) + qisf.shape[2:])
+    if hwhm.shape[1] == qisf.shape[1] + 1:
+        hwhm = hwhm[:, 1:]
+    if hwhm.shape != qisf.shape:
+        raise ValueError('widths of shape {} do not match QISF of shape {}'
+                         .format(hwhm.shape, qisf.shape))
+    return LineList.from_model_lines(eisf, qisf.reshape(nq, -1),
+                                     hwhm.reshape(nq, -1))
+
+
+def analytic_convolve(first, second) -> LineList:
+    r"""
+    Analytic convolution of two models made of an elastic line and
+    Lorentzians
+
+    The elastic line of one model convolved with a Lorentzian of the other
+    is that Lorentzian, and the convolution of two Lorentzians is a
+    Lorentzian whose width is the sum of their widths, so that the result
+    is a sum of lines with weights
+    :math:`EISF_1 EISF_2, EISF_1 QISF_{2,j}, QISF_{1,i} EISF_2,
+    QISF_{1,i} QISF_{2,j}` and widths :math:`0, \Gamma_{2,j},
+    \Gamma_{1,i}, \Gamma_{1,i} + \Gamma_{2,j}`.
+
+    Parameters
+    ----------
+    first, second: tuple or :class:`LineList`
+        outputs (hwhm, eisf, qisf) of `hwhm*` functions for the same
+        momentum transfers, or lines
+
+    Return
+    ------
+    :class:`LineList`
+        merged lines of the convolution, centred on 0 and of unit scale:
+        use :meth:`LineList.shifted`, multiplication and
+        :meth:`LineList.evaluate` to compute :math:`S(q, \omega)`.
+
+    Examples
+    --------
+    Jump translational diffusion convolved with jumps between equivalent
+    sites on a circle
+
+    >>> q = np.array([0.5, 1.])
+    >>> lines = analytic_convolve(
+    ...     QENSmodels.hwhmJumpTranslationalDiffusion(q, D=0.2, resTime=1.),
+    ...     QENSmodels.hwhmEquivalentSitesCircle(q, Nsites=3, radius=1.,
+    ...                                          resTime=1.))
+    >>> lines.nlines
+    3
+    >>> sqw = (2. * lines).evaluate(np.linspace(-2, 2, 201))
+    >>> sqw.shape
+    (2, 201)
+
+    """
+    first = first if isinstance(first, LineList) else hwhm_lines(*first)
+    second = second if isinstance(second, LineList) else \
+        hwhm_lines(*second)
+    return first.convolve(second).merged()
@@ -0,0 +1,293 @@
+"""
+Lookup of initial parameters in a library of simulated spectra
+
+The EISF and widths of models with many lines, *e.g.*
+`sqwJumpSitesLogNormDist`, `sqwWaterTeixeira` or `sqwGaussianModel3D`, are
+not easily inverted from the data (see :mod:`QENSmodels.estimation`).
+A :class:`SpectralIndex` simulates once the spectra of a model over a
+hypercube of its parameters, on the grids of an instrument and with its
+resolution. The spectra are normalised, compressed by principal component
+analysis and indexed in a k-d tree, which can be saved to disk. Measured
+spectra are then projected on the same components and the parameters of the
+nearest simulated spectra are used as starting values of the fits.
+"""
+import numpy as np
+from typing import Union, Optional, Dict, Tuple
+
+import QENSmodels
+from QENSmodels import registry
+
+try:
+    from scipy.stats import qmc
+except ImportError:  # scipy < 1.7
+    qmc = None
+
+
+def parameter_samples(
+        model: Union[str, 'registry.ModelSpec'],
+        ranges: Dict[str, Tuple[float, float]],
+        size: int,
+        method: str = 'sobol',
+        seed: Optional[int] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Values of parameters filling a hypercube
+
+    Ranges of positive values spanning at least a decade are sampled
+    uniformly in logarithm; integer parameters are rounded.
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model
+
+    ranges: dict
+        lower and upper values of the sampled parameters,
+        *e.g.* {'D': (0.01, 1.)}
+
+    size: int
+        number of samples
+
+    method: str
+        'sobol' (scrambled Sobol sequence), 'latin' (Latin hypercube) or
+        'random'. Default to 'sobol'.
+
+    seed: int
+        seed of the random generator. Default to None.
+
+    Return
+    ------
+    dict
+        values of each parameter, of shape (size,)
+
+    Examples
+    --------
+    >>> samples = parameter_samples('sqwIsotropicRotationalDiffusion',
+    ...                             {'radius': (1., 2.), 'DR': (0.01, 1.)},
+    ...                             64, seed=1)
+    >>> samples['radius'].shape
+    (64,)
+    >>> bool(np.all((samples['DR'] >= 0.01) & (samples['DR'] <= 1.)))
+    True
+
+    """
+    spec = registry.get(model) if isinstance(model, str) else model
+    names = list(ranges)
+    for name in names:
+        lower, upper = ranges[name]
+        if not lower <= upper:
+            raise ValueError('the range of {} should be (lower, upper)'
+                             .format(name))
+        spec[name].check([lower, upper])
+
+    if method not in ('sobol', 'latin', 'random'):
+        raise ValueError("method should be 'sobol', 'latin' or 'random'")
+    if qmc is None or method == 'random':
+        unit = np.random.default_rng(seed).random((size, len(names)))
+    elif method == 'sobol':
+        sampler = qmc.Sobol(len(names), seed=seed)
+        # the balance of Sobol sequences needs powers of 2
+        unit = sampler.random(2 ** int(np.ceil(np.log2(max(size, 1)))))
+        unit = unit[:size]
+    else:
+        unit = qmc.LatinHypercube(len(names), seed=seed).random(size)
+
+    samples = {}
+    for i, name in enumerate(names):
+        lower, upper = (float(value) for value in ranges[name])
+        if spec[name].integer:
+            values = np.clip(np.round(
+                lower - 0.5 + (upper - lower + 1.) * unit[:, i]), lower,
+                upper)
+        elif lower > 0 and upper >= 10 * lower:
+            values = lower * (upper / lower) ** unit[:, i]
+        else:
+            values = lower + (upper - lower) * unit[:, i]
+        samples[name] = values
+    return samples
+
+
+def _features(data: np.ndarray) -> np.ndarray:
+    """ Spectra normalised to unit area, concatenated over q """
+    area = np.abs(data).sum(axis=-1, keepdims=True)
+    data = np.divide(data, area, out=np.zeros_like(data), where=area > 0)
+    return data.reshape(data.shape[:-2] + (-1,))
+
+
+class SpectralIndex:
+    """
+    Library of simulated spectra of a model, indexed for nearest-neighbour
+    searches
+
+    Parameters
+    ----------
+    model: str or :class:`~QENSmodels.registry.ModelSpec`
+        registered model, *e.g.* 'sqwWaterTeixeira'
+
+    w: :class:`~numpy:numpy.ndarray`
+        energy transfer (in 1/ps)
+
+    q: float, list or :class:`~numpy:numpy.ndarray`
+        momentum transfer (in 1/Angstrom)
+
+    ranges: dict
+        lower and upper values of the parameters of the library (see
+        :func:`parameter_samples`). The other parameters take their value in
+        `fixed`, or their default value.
+
+    resolution: :class:`~numpy:numpy.ndarray`
+        resolution spectra of shape (q.size, w.size) or (w.size,).
+        Default to None (no convolution).
+
+    size: int
+        number of simulated parameter sets. Default to 4096.
+
+    components: int
+        number of principal components kept. Default to 16.
+
+    seed: int
+        seed of the sampling of the parameters. Default to 0.
+
+    **fixed:
+        values of the parameters which are not sampled
+
+    Notes
+    -----
+    Each spectrum is normalised to unit area before the comparison, so that
+    the scale factors do not matter. Backgrounds should be subtracted from
+    the data first.
+
+    Examples
+    --------
+    >>> w, q = np.linspace(-2, 2, 201), np.linspace(0.3, 1.5, 5)
+    >>> index = SpectralIndex('sqwJumpTranslationalDiffusion', w, q,
+    ...                       {'D': (0.05, 1.), 'resTime': (0.1, 2.)},
+    ...                       size=256, center=0.)
+    >>> data = QENSmodels.sqwJumpTranslationalDiffusion(w, q, 3., 0.,
+    ...                                                 D=0.3, resTime=1.)
+    >>> params = index.query(data)
+    >>> 0.25 < params['D'] < 0.35, 0.8 < params['resTime'] < 1.2
+    (True, True)
+
+    """
+
+    def __init__(
+            self,
+            model: Union[str, 'registry.ModelSpec'],
+            w,
+            q,
+            ranges: Dict[str, Tuple[float, float]],
+            resolution: Optional[np.ndarray] = None,
+            size: int = 4096,
+            components: int = 16,
+            seed: int = 0,
+            **fixed
+    ):
+        self.spec = registry.get(model) if isinstance(model, str) else model
+        overlap = set(ranges) & set(fixed)
+        if overlap:
+            raise ValueError('{} cannot be both sampled and fixed'.format(
+                ', '.join(sorted(overlap))))
+        if 'scale' in ranges:
+            raise ValueError('the spectra are normalised: scale cannot be '
+                             'sampled')
+        self.w = np.asarray(w, dtype=np.float64).reshape(-1)
+        self.q = np.asarray(q, dtype=np.float64).reshape(-1)
+        self.names = list(ranges)
+        self.fixed = fixed
+        self.samples = parameter_samples(self.spec, ranges, size,
+                                         seed=seed)
+
+        bound = QENSmodels.BoundModel(self.spec, self.w, self.q, resolution,
+                                      **fixed)
+        features = np.empty((size, self.q.size * self.w.size))
+        for i in range(size):
+            features[i] = _features(bound(**{
+                name: self.samples[name][i] for name in self.names}))
+
+        self.mean = features.mean(axis=0)
+        features -= self.mean
+        _, _, vt = np.linalg.svd(features, full_matrices=False)
+        self.components = vt[:components]
+        self._build(features @ self.components.T)
+
+    def _build(self, coordinates: np.ndarray):
+        from scipy.spatial import cKDTree
+        self.coordinates = coordinates
+        self.tree = cKDTree(coordinates)
+
+    @property
+    def shape(self):
+        """ Shape (q.size, w.size) of the spectra of the library """
+        return self.q.size, self.w.size
+
+    def query(self, data: np.ndarray, k: int = 1) -> Dict[str, np.ndarray]:
+        """
+        Parameters of the simulated spectra nearest to measured spectra
+
+        Parameters
+        ----------
+        data: :class:`~numpy:numpy.ndarray`
+            spectra on the grids of the library, of shape (q.size, w.size),
+            or (n, q.size, w.size) for n datasets, *e.g.* kinetic runs
+
+        k: int
+            number of neighbours. Default to 1.
+
+        Return
+        ------
+        dict
+            values of the sampled parameters, of shape `(n,)` for several
+            datasets, with an additional last axis of length `k` if k > 1,
+            followed by the fixed values
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if data.shape[-2:] != self.shape:
+            raise ValueError('the spectra should be of shape {}, got {}'
+                             .format(self.shape, data.shape[-2:]))
+        coordinates = (_features(data) - self.mean) @ self.components.T
+        _, neighbours = self.tree.query(coordinates, k=k)
+        params = {name: self.samples[name][neighbours]
+                  for name in self.names}
+        if data.ndim == 2 and k == 1:
+            params = {name: value.item() for name, value in params.items()}
+        params.update(self.fixed)
+        return params
+
+    def save(self, filename: str):
+        """ Saves the library to a NumPy `.npz` file """
+        fixed = {'fixed_' + name: value for name, value in self.fixed.items()}
+        np.savez(filename, model=self.spec.name, w=self.w, q=self.q,
+                 names=np.array(self.names, dtype=str),
+                 samples=np.array([self.samples[name]
+                                   for name in self.names]),
+                 mean=self.mean, components=self.components,
+                 coordinates=self.coordinates, **fixed)
+
+    @classmethod
+    def load(cls, filename: str) -> 'SpectralIndex':
+        """ Loads a library saved by :meth:`save` """
+        with np.load(filename) as stored:
+            index = cls.__new__(cls)
+            index.spec = registry.get(str(stored['model']))
+            index.w = stored['w']
+            index.q = stored['q']
+            index.names = [str(name) for name in stored['names']]
+            index.samples = dict(zip(index.names, stored['samples']))
+            index.fixed = {}
+            for key in stored.files:
+                if key.startswith('fixed_'):
+                    value = stored[key]
+                    index.fixed[key[6:]] = value.item() \
+                        if value.ndim == 0 else value
+            index.mean = stored['mean']
+            index.components = stored['components']
+            index._build(stored['coordinates'])
+        return index
+
+    def __len__(self) -> int:
+        return self.coordinates.shape[0]
+
+    def __repr__(self) -> str:
+        return 'SpectralIndex({!r}, size={}, components={}, shape={})'.format(
+            self.spec.name, len(self), self.components.shape[0], self.shape)
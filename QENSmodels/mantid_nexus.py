@@ -0,0 +1,179 @@
+import numpy as np
+from typing import Optional, Iterator
+
+import QENSmodels
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+def _decode(value) -> str:
+    """ Converts an attribute read by h5py to a string """
+    if isinstance(value, np.ndarray):
+        value = value.flat[0] if value.size else ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return str(value)
+
+
+def _bin_centres(axis: np.ndarray, npoints: int) -> np.ndarray:
+    """ Returns point values, converting bin boundaries if needed """
+    if axis.size == npoints + 1:
+        return 0.5 * (axis[:-1] + axis[1:])
+    if axis.size != npoints:
+        raise ValueError('axis of size {} does not match {} data points'
+                         .format(axis.size, npoints))
+    return axis
+
+
+def _read_header(workspace, filename: str, entry: str):
+    """ Returns w, q and metadata of a processed workspace """
+    values = workspace['values']
+    nspec, nbins = values.shape
+
+    axis1 = workspace['axis1']
+    if axis1.ndim == 2:
+        # ragged x-axes are stored as one row per spectrum: they have to be
+        # identical to be represented by a QENSDataset
+        w = np.asarray(axis1[0], dtype=np.float64)
+        if not np.all(np.asarray(axis1[:], dtype=np.float64) == w):
+            raise ValueError('spectra of {} do not share a common energy '
+                             'axis'.format(filename))
+    else:
+        w = np.asarray(axis1[:], dtype=np.float64)
+    w = _bin_centres(w, nbins)
+
+    if 'axis2' in workspace:
+        q = _bin_centres(np.asarray(workspace['axis2'][:],
+                                    dtype=np.float64), nspec)
+        q_units = _decode(workspace['axis2'].attrs.get('units', ''))
+    else:
+        q = np.arange(nspec, dtype=np.float64)
+        q_units = ''
+
+    metadata = {'filename': filename,
+                'entry': entry,
+                'w_units': _decode(axis1.attrs.get('units', '')),
+                'q_units': q_units,
+                'data_units': _decode(values.attrs.get('units', ''))}
+
+    parent = workspace.parent
+    if 'title' in parent:
+        metadata['title'] = _decode(parent['title'][()])
+
+    return w, q, metadata
+
+
+def iter_mantid_nexus(
+        filename: str,
+        block_size: int = 64,
+        entry: str = 'mantid_workspace_1'
+) -> Iterator['QENSmodels.QENSDataset']:
+    """
+    Streams the spectra of a Mantid processed NeXus file in blocks
+
+    Only `block_size` spectra are read from disk at a time, so that files
+    larger than the available memory can be fed to fitting jobs.
+
+    Parameters
+    ----------
+    filename: str
+        path to a processed NeXus file written by Mantid (`SaveNexusProcessed`)
+
+    block_size: int
+        maximum number of spectra in each yielded dataset. Default to 64.
+
+    entry: str
+        name of the workspace group in the file.
+        Default to 'mantid_workspace_1'.
+
+    Return
+    ------
+    iterator of :class:`~QENSmodels.dataset.QENSDataset`
+        consecutive blocks of spectra
+
+    Notes
+    -----
+    * The layout read is `<entry>/workspace/values`, `errors`, `axis1`
+      (energy transfer) and `axis2` (spectrum axis, *e.g.* momentum transfer
+      after `SofQW`). Bin boundaries are converted to bin centres.
+
+    * No unit conversion is performed: the units stored in the file are
+      copied to the `metadata` of the datasets.
+
+    """
+    if h5py is None:
+        raise ImportError('h5py is required to read NeXus files')
+
+    if block_size < 1:
+        raise ValueError('block_size should be strictly positive')
+
+    with h5py.File(filename, 'r') as handle:
+        workspace = handle[entry]['workspace']
+        w, q, metadata = _read_header(workspace, filename, entry)
+
+        values = workspace['values']
+        errors = workspace['errors'] if 'errors' in workspace else None
+
+        for start in range(0, q.size, block_size):
+            stop = min(start + block_size, q.size)
+            yield QENSmodels.QENSDataset(
+                w,
+                q[start:stop],
+                values[start:stop],
+                None if errors is None else errors[start:stop],
+                metadata)
+
+
+def read_mantid_nexus(
+        filename: str,
+        entry: str = 'mantid_workspace_1',
+        spectra: Optional[list] = None
+) -> 'QENSmodels.QENSDataset':
+    """
+    Reads a Mantid processed NeXus file into a single dataset
+
+    Parameters
+    ----------
+    filename: str
+        path to a processed NeXus file written by Mantid (`SaveNexusProcessed`)
+
+    entry: str
+        name of the workspace group in the file.
+        Default to 'mantid_workspace_1'.
+
+    spectra: list of int
+        indices of the spectra to read, without duplicates. The spectra of
+        the dataset are in the same order. Default to None (all spectra).
+
+    Return
+    ------
+    :class:`~QENSmodels.dataset.QENSDataset`
+        data, errors and axes of the workspace
+
+    """
+    if h5py is None:
+        raise ImportError('h5py is required to read NeXus files')
+
+    with h5py.File(filename, 'r') as handle:
+        workspace = handle[entry]['workspace']
+        w, q, metadata = _read_header(workspace, filename, entry)
+
+        if spectra is None:
+            index, order = slice(None), slice(None)
+        else:
+            spectra = [int(item) for item in spectra]
+            if len(set(spectra)) != len(spectra):
+                raise ValueError('spectra should not contain duplicates')
+            # h5py needs increasing indices for fancy selection: the rows
+            # read are put back in the requested order
+            index = sorted(spectra)
+            order = np.searchsorted(index, spectra)
+
+        data = workspace['values'][index][order]
+        error = workspace['errors'][index][order] \
+            if 'errors' in workspace else None
+
+    return QENSmodels.QENSDataset(w, q[index][order], data, error, metadata)
@@ -0,0 +1,399 @@
+import contextlib
+import functools
+import importlib
+import inspect
+import json
+import marshal
+import sys
+import time
+import tracemalloc
+import numpy as np
+from typing import Optional, Iterator, Dict, List
+
+import QENSmodels
+
+# modules which are not instrumented: they do not compute models
+_EXCLUDED_MODULES = ('QENSmodels.profiling',
+                     'QENSmodels.results_store',
+                     'QENSmodels.mantid_nexus',
+                     'QENSmodels.registry')
+
+# optimisers called by the fitting utilities, instrumented where the
+# modules of QENSmodels refer to them
+_OPTIMISERS = ('scipy.optimize.least_squares',
+               'scipy.optimize.lsq_linear',
+               'scipy.optimize.minimize')
+
+_active = None
+
+
+def _size(value) -> int:
+    """ Number of array elements in an argument or returned value """
+    if isinstance(value, np.ndarray):
+        return value.size
+    if isinstance(value, (list, tuple)):
+        return sum(_size(item) if isinstance(item, (np.ndarray, tuple))
+                   else 1 for item in value)
+    return 0
+
+
+class _FunctionStats:
+    """ Statistics of the calls of one function """
+
+    __slots__ = ('key', 'ncalls', 'primitive_calls', 'tottime', 'cumtime',
+                 'times', 'input_size', 'output_size', 'alloc_peak',
+                 'callers')
+
+    def __init__(self, key):
+        self.key = key
+        self.ncalls = 0
+        self.primitive_calls = 0
+        self.tottime = 0.
+        self.cumtime = 0.
+        self.times: List[float] = []
+        self.input_size = 0
+        self.output_size = 0
+        self.alloc_peak = 0
+        # name of caller -> [ncalls, primitive calls, tottime, cumtime]
+        self.callers: Dict[str, list] = {}
+
+
+class _Frame:
+    """ Call being timed """
+
+    __slots__ = ('name', 'start', 'child_time', 'recursive',
+                 'caller_recursive', 'memory_start', 'memory_peak')
+
+    def __init__(self, name, recursive, caller_recursive):
+        self.name = name
+        # the function, or the same caller -> function edge, is already
+        # being timed, as counted by cProfile
+        self.recursive = recursive
+        self.caller_recursive = caller_recursive
+        self.child_time = 0.
+        self.memory_start = 0
+        self.memory_peak = 0
+        self.start = 0.
+
+
+class Profile:
+    """
+    Statistics collected by :func:`profile`
+
+    For each instrumented function (keyed by `module.function` or
+    `module.Class.method`), it records
+    the number of calls, the total time spent in the function itself
+    (`tottime`), the cumulative time including the functions it calls
+    (`cumtime`), percentiles of the wall time per call, the number of array
+    elements passed and returned, and, if memory tracking is enabled, the
+    peak memory allocated during the calls.
+
+    """
+
+    def __init__(self, track_memory: bool = False):
+        self.track_memory = track_memory
+        self._stats: Dict[str, _FunctionStats] = {}
+        self._stack: List[_Frame] = []
+        self._codes: Dict[str, tuple] = {}
+
+    def _wrap(self, function, name):
+        stats = self._stats.setdefault(name, _FunctionStats(name))
+        code = getattr(function, '__code__', None)
+        if code is None:
+            # built-in functions are reported as cProfile does
+            self._codes[name] = ('~', 0, '<{}>'.format(name))
+        else:
+            self._codes[name] = (code.co_filename, code.co_firstlineno,
+                                 function.__name__)
+        track_memory = self.track_memory and hasattr(tracemalloc,
+                                                     'reset_peak')
+        stack = self._stack
+        timer = time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            caller = stack[-1].name if stack else None
+            frame = _Frame(name, any(item.name == name for item in stack),
+                           any(outer.name == caller and inner.name == name
+                               for outer, inner in zip(stack, stack[1:])))
+            if track_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                if stack:
+                    stack[-1].memory_peak = max(stack[-1].memory_peak, peak)
+                tracemalloc.reset_peak()
+                frame.memory_start = current
+            stack.append(frame)
+            frame.start = timer()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                elapsed = timer() - frame.start
+                stack.pop()
+                if track_memory:
+                    peak = max(frame.memory_peak,
+                               tracemalloc.get_traced_memory()[1])
+                    stats.alloc_peak = max(stats.alloc_peak,
+                                           peak - frame.memory_start)
+                    if stack:
+                        stack[-1].memory_peak = max(stack[-1].memory_peak,
+                                                    peak)
+                self._record(stats, frame, elapsed)
+            stats.input_size += _size(args) + _size(list(kwargs.values()))
+            stats.output_size += _size(result) if isinstance(
+                result, (np.ndarray, tuple)) else 0
+            return result
+
+        return wrapper
+
+    def _record(self, stats, frame, elapsed):
+        own_time = elapsed - frame.child_time
+        stats.ncalls += 1
+        stats.tottime += own_time
+        stats.times.append(elapsed)
+        if not frame.recursive:
+            stats.primitive_calls += 1
+            stats.cumtime += elapsed
+
+        caller = self._stack[-1].name if self._stack else None
+        if self._stack:
+            self._stack[-1].child_time += elapsed
+        if caller is not None:
+            entry = stats.callers.setdefault(caller, [0, 0, 0., 0.])
+            entry[0] += 1
+            entry[1] += 0 if frame.caller_recursive else 1
+            entry[2] += own_time
+            entry[3] += 0. if frame.caller_recursive else elapsed
+
+    def as_dict(self) -> dict:
+        """ Returns the statistics as a dictionary keyed by function name
+
+        Times are given in seconds, `alloc_peak` in bytes (0 if memory was
+        not tracked).
+        """
+        results = {}
+        for name, stats in self._stats.items():
+            if stats.ncalls == 0:
+                continue
+            times = np.asarray(stats.times)
+            p50, p90, p99 = np.percentile(times, [50, 90, 99])
+            results[name] = {
+                'ncalls': stats.ncalls,
+                'tottime': stats.tottime,
+                'cumtime': stats.cumtime,
+                'mean': float(times.mean()),
+                'p50': float(p50),
+                'p90': float(p90),
+                'p99': float(p99),
+                'max': float(times.max()),
+                'input_size': stats.input_size,
+                'output_size': stats.output_size,
+                'alloc_peak': stats.alloc_peak,
+                'callers': {caller: values[0]
+                            for caller, values in stats.callers.items()}}
+        return results
+
+    def dump_stats(self, filename: str) -> None:
+        """ Writes the statistics in the format read by :mod:`pstats`
+
+        The file can be inspected with *e.g.*
+        `pstats.Stats(filename).sort_stats('cumtime').print_stats()` or
+        with visualisation tools such as `snakeviz`.
+        """
+        stats_dict = {}
+        for name, stats in self._stats.items():
+            if stats.ncalls == 0:
+                continue
+            # unlike the totals, the callers give all the calls first
+            callers = {self._codes[caller]: tuple(values)
+                       for caller, values in stats.callers.items()}
+            stats_dict[self._codes[name]] = (stats.primitive_calls,
+                                             stats.ncalls,
+                                             stats.tottime,
+                                             stats.cumtime,
+                                             callers)
+        with open(filename, 'wb') as handle:
+            marshal.dump(stats_dict, handle)
+
+    def write_jsonl(self, filename: str) -> None:
+        """ Writes one JSON object per function and per line """
+        with open(filename, 'w') as handle:
+            for name, values in sorted(self.as_dict().items()):
+                handle.write(json.dumps(dict(values, function=name)) + '\n')
+
+    def summary(self, sort: str = 'cumtime', limit: int = 20) -> str:
+        """ Returns a table of the most expensive functions """
+        lines = ['{:>8} {:>10} {:>10} {:>10} {:>10}  {}'.format(
+            'ncalls', 'tottime', 'cumtime', 'p50', 'p99', 'function')]
+        rows = sorted(self.as_dict().items(),
+                      key=lambda item: item[1][sort], reverse=True)
+        for name, values in rows[:limit]:
+            lines.append('{:>8} {:>10.4g} {:>10.4g} {:>10.4g} {:>10.4g}  {}'
+                         .format(values['ncalls'], values['tottime'],
+                                 values['cumtime'], values['p50'],
+                                 values['p99'], name))
+        return '\n'.join(lines)
+
+
+def _package_modules() -> dict:
+    """ Returns name -> module of the loaded and instrumented modules of
+    QENSmodels """
+    return {name: module for name, module in list(sys.modules.items())
+            if module is not None and name.startswith('QENSmodels.') and
+            name not in _EXCLUDED_MODULES}
+
+
+def _instrumented_functions(extra: List[str]) -> dict:
+    """ Returns function -> name of all functions defined in the loaded
+    QENSmodels modules, of the optimisers and of the dotted names listed in
+    `extra`
+    """
+    functions = {}
+    for module_name, module in _package_modules().items():
+        for item in vars(module).values():
+            if inspect.isfunction(item) and item.__module__ == module_name:
+                functions[item] = '{}.{}'.format(
+                    module_name[len('QENSmodels.'):], item.__name__)
+
+    for dotted_name in _OPTIMISERS + tuple(extra):
+        module_name, _, attribute = dotted_name.rpartition('.')
+        item = getattr(importlib.import_module(module_name), attribute)
+        if not callable(item) or inspect.isclass(item):
+            raise TypeError('{} is not a function'.format(dotted_name))
+        functions[item] = dotted_name
+    return functions
+
+
+def _instrumented_methods() -> list:
+    """ Returns (class, attribute, function, name) for the methods, static
+    and class methods of the classes defined in the loaded QENSmodels
+    modules. Special methods other than `__call__` are left out. """
+    methods = []
+    for module_name, module in _package_modules().items():
+        for item in vars(module).values():
+            if not inspect.isclass(item) or item.__module__ != module_name:
+                continue
+            for attribute, value in vars(item).items():
+                if attribute.startswith('__') and attribute != '__call__':
+                    continue
+                function = value.__func__ if isinstance(
+                    value, (staticmethod, classmethod)) else value
+                if inspect.isfunction(function):
+                    methods.append((item, attribute, function,
+                                    '{}.{}.{}'.format(
+                                        module_name[len('QENSmodels.'):],
+                                        item.__name__, attribute)))
+    return methods
+
+
+@contextlib.contextmanager
+def profile(
+        track_memory: bool = False,
+        extra: Optional[List[str]] = None
+) -> Iterator[Profile]:
+    """
+    Context manager recording calls of the models and their kernels
+
+    While the context is active, every function defined in the loaded
+    modules of `QENSmodels` (public models such as `sqw*`, `hwhm*`,
+    `lorentzian` or `delta`, and internal helpers) is replaced by a timing
+    wrapper, in the package namespace, in the modules referring to it and in
+    the dictionaries dispatching to it (*e.g.* the decompositions of the
+    models into lines). The methods of the classes of `QENSmodels`, *e.g.*
+    `convolution.ResolutionOperator.__call__`,
+    `bound_model.BoundModel.jacobian` or `fitting.SeparableModel.fit`, and
+    the `scipy.optimize` functions called by the fitting utilities are
+    instrumented too, so that the time spent in the optimisers is separated
+    from the time spent evaluating the models. The original functions are
+    restored on exit, so that profiling has no cost when it is not enabled.
+
+    Parameters
+    ----------
+    track_memory: bool
+        record the peak memory allocated during each call, using
+        :mod:`tracemalloc` (requires Python >= 3.9). This slows down the
+        calls significantly. Default to False.
+
+    extra: list of str
+        dotted names of additional functions to instrument, *e.g.*
+        `['numpy.convolve']`. Only calls made through the module attribute
+        or through the modules of `QENSmodels` are recorded. Default to None.
+
+    Return
+    ------
+    :class:`Profile`
+        statistics, filled in while the context is active
+
+    Examples
+    --------
+    >>> import QENSmodels
+    >>> with QENSmodels.profile() as prof:
+    ...     sqw = QENSmodels.sqwIsotropicRotationalDiffusion([1, 2], [0.3, 0.4])
+    >>> stats = prof.as_dict()
+    >>> stats['isotropic_rotational_diffusion.sqwIsotropicRotationalDiffusion']['ncalls']
+    1
+    >>> stats['lorentzian.lorentzian']['ncalls']
+    10
+
+    """  # noqa: E501
+    global _active
+    if _active is not None:
+        raise RuntimeError('profiling is already active')
+
+    # load all the submodules of the package, so that models used for the
+    # first time within the context are instrumented too
+    for name in QENSmodels.__all__:
+        getattr(QENSmodels, name)
+
+    profiler = Profile(track_memory)
+    functions = _instrumented_functions(extra or [])
+    wrappers = {function: profiler._wrap(function, name)
+                for function, name in functions.items()}
+
+    # replace every reference to the instrumented functions in the modules
+    # of QENSmodels, in their dispatch tables (e.g. lines._DECOMPOSITIONS)
+    # and in the modules of the extra functions
+    package = [vars(module) for module in _package_modules().values()]
+    package.append(vars(QENSmodels))
+    namespaces = package + [
+        value for namespace in package
+        for attribute, value in namespace.items()
+        if isinstance(value, dict) and attribute != '__builtins__']
+    namespaces.extend(vars(importlib.import_module(name.rpartition('.')[0]))
+                      for name in extra or [])
+    patched = []
+    for namespace in namespaces:
+        for attribute, value in list(namespace.items()):
+            try:
+                wrapper = wrappers.get(value)
+            except TypeError:
+                # unhashable attribute
+                continue
+            if wrapper is not None:
+                patched.append((namespace, attribute, value))
+                namespace[attribute] = wrapper
+
+    for cls, attribute, function, name in _instrumented_methods():
+        original = vars(cls)[attribute]
+        wrapper = profiler._wrap(function, name)
+        if isinstance(original, (staticmethod, classmethod)):
+            wrapper = type(original)(wrapper)
+        patched.append((cls, attribute, original))
+        setattr(cls, attribute, wrapper)
+
+    started_tracing = False
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+
+    _active = profiler
+    try:
+        yield profiler
+    finally:
+        for namespace, attribute, value in reversed(patched):
+            if isinstance(namespace, dict):
+                namespace[attribute] = value
+            else:
+                setattr(namespace, attribute, value)
+        if started_tracing:
+            tracemalloc.stop()
+        _active = None
@@ -0,0 +1,440 @@
+"""
+Machine-readable description of the QENS models
+
+Each model :math:`S(q, \\omega)` of the library is described by a
+:class:`ModelSpec` listing its parameters (defaults, units, physical bounds,
+integer and q-dependent parameters, fitting or non-fitting role), the
+function returning its widths and structure factors, and the features it
+supports. Fitting adapters and drivers use these specifications to build
+parameter vectors and bounds, and to validate parameter values once, before
+entering their inner loops.
+"""
+import numpy as np
+from typing import Optional, Tuple, List, Dict, Iterable
+
+import QENSmodels
+
+inf = np.inf
+
+
+class Parameter:
+    """
+    Description of a model parameter
+
+    Parameters
+    ----------
+    name: str
+        name of the argument of the model function
+
+    default: float
+        default value of the argument
+
+    bounds: tuple of float
+        physical lower and upper bounds. Default to (-inf, inf).
+
+    strict: bool
+        if True, the finite bounds are excluded from the valid range
+        (*e.g.* a diffusion coefficient D > 0). Default to False.
+
+    integer: bool
+        the parameter only takes integer values. Default to False.
+
+    q_vector: bool
+        the parameter can take one value per momentum transfer.
+        Default to False.
+
+    fitting: bool
+        the parameter can be optimised. Non-fitting parameters (*e.g.* the
+        number of sites) are kept fixed. Default to True.
+
+    linear: bool
+        the model is linear in this parameter (*e.g.* scale factors and
+        elastic fractions). Default to False.
+
+    units: str
+        physical units. Default to '' (no unit).
+
+    description: str
+        short description. Default to ''.
+
+    """
+
+    def __init__(
+            self,
+            name: str,
+            default: float,
+            bounds: Tuple[float, float] = (-inf, inf),
+            strict: bool = False,
+            integer: bool = False,
+            q_vector: bool = False,
+            fitting: bool = True,
+            linear: bool = False,
+            units: str = '',
+            description: str = ''
+    ):
+        self.name = name
+        self.default = default
+        self.bounds = (float(bounds[0]), float(bounds[1]))
+        self.strict = strict
+        self.integer = integer
+        self.q_vector = q_vector
+        self.fitting = fitting
+        self.linear = linear
+        self.units = units
+        self.description = description
+
+    def check(self, value) -> None:
+        """ Raises a ValueError if `value` is outside the physical range """
+        lower, upper = self.bounds
+        value = np.asarray(value)
+        if self.strict:
+            invalid = np.any(value <= lower) or np.any(value >= upper)
+        else:
+            invalid = np.any(value < lower) or np.any(value > upper)
+        if invalid or np.any(np.isnan(value)):
+            raise ValueError('{}{} should be {}'.format(
+                self.name,
+                ', the {},'.format(self.description)
+                if self.description else '',
+                self._range()))
+        if self.integer and np.any(value != np.round(value)):
+            raise ValueError('{} should be an integer'.format(self.name))
+
+    def _range(self) -> str:
+        """ Valid range of the parameter, in words """
+        lower, upper = self.bounds
+        if np.isinf(upper):
+            return '{} {:g}'.format('>' if self.strict else '>=', lower)
+        if np.isinf(lower):
+            return '{} {:g}'.format('<' if self.strict else '<=', upper)
+        brackets = '()' if self.strict else '[]'
+        return 'in {}{:g}, {:g}{}'.format(brackets[0], lower, upper,
+                                          brackets[1])
+
+    def __repr__(self) -> str:
+        return 'Parameter({!r}, default={!r}, bounds={!r})'.format(
+            self.name, self.default, self.bounds)
+
+
+class ModelSpec:
+    """
+    Description of a model :math:`S(q, \\omega)`
+
+    Parameters
+    ----------
+    name: str
+        name of the model function in `QENSmodels`, *e.g.*
+        'sqwIsotropicRotationalDiffusion'
+
+    parameters: list of :class:`Parameter`
+        parameters of the function, after `w` and `q`, in the order of its
+        signature
+
+    hwhm: str
+        name of the function returning the widths, EISF and QISF of the
+        model, if any. Default to None.
+
+    supports: iterable of str
+        features of the model:
+
+        - 'vectorised': one call evaluates all momentum transfers
+        - 'jacobian': analytic derivatives with respect to the parameters
+        - 'analytic_convolution': the model is a sum of a delta and
+          Lorentzians, so its convolution with another such model is known
+          analytically
+
+    description: str
+        one-line description of the model
+
+    """
+
+    def __init__(
+            self,
+            name: str,
+            parameters: List[Parameter],
+            hwhm: Optional[str] = None,
+            supports: Iterable[str] = (),
+            description: str = ''
+    ):
+        self.name = name
+        self.parameters = list(parameters)
+        self.hwhm = hwhm
+        self.supports = frozenset(supports)
+        self.description = description
+        self._by_name = {item.name: item for item in self.parameters}
+
+    @property
+    def function(self):
+        """ Model function :math:`S(q, \\omega)` """
+        return getattr(QENSmodels, self.name)
+
+    @property
+    def hwhm_function(self):
+        """ Function returning the widths, EISF and QISF, or None """
+        return None if self.hwhm is None else getattr(QENSmodels, self.hwhm)
+
+    @property
+    def parameter_names(self) -> List[str]:
+        """ Names of all the parameters, in the order of the signature """
+        return [item.name for item in self.parameters]
+
+    @property
+    def fitting_parameters(self) -> List[str]:
+        """ Names of the parameters which can be optimised """
+        return [item.name for item in self.parameters if item.fitting]
+
+    def __getitem__(self, name: str) -> Parameter:
+        return self._by_name[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def defaults(self) -> Dict[str, float]:
+        """ Default values of the parameters """
+        return {item.name: item.default for item in self.parameters}
+
+    def bounds(
+            self,
+            names: Optional[List[str]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """ Lower and upper bounds of the parameters `names` (default: the
+        fitting parameters), in the format used by `scipy.optimize`
+        """
+        if names is None:
+            names = self.fitting_parameters
+        lower = np.array([self[name].bounds[0] for name in names])
+        upper = np.array([self[name].bounds[1] for name in names])
+        return lower, upper
+
+    def validate(self, q=None, **params) -> dict:
+        """
+        Checks parameter values and completes them with the defaults
+
+        Parameters
+        ----------
+        q: float, list or :class:`~numpy:numpy.ndarray`
+            momentum transfer. If given, the q-dependent parameters are
+            broadcast to the size of `q`. Default to None.
+
+        **params:
+            values of the parameters
+
+        Return
+        ------
+        dict
+            values of all the parameters: floats, integers, or arrays of the
+            size of `q` for q-dependent parameters
+
+        """
+        unknown = set(params) - set(self._by_name)
+        if unknown:
+            raise TypeError('{} got unexpected parameter(s) {}'.format(
+                self.name, ', '.join(sorted(unknown))))
+
+        nq = None if q is None else np.asarray(q).size
+
+        values = {}
+        for item in self.parameters:
+            value = params.get(item.name, item.default)
+            item.check(value)
+            if item.q_vector:
+                value = np.asarray(value, dtype=np.float64).reshape(-1)
+                if nq is not None:
+                    if value.size == 1:
+                        value = np.repeat(value, nq)
+                    elif value.size != nq:
+                        raise ValueError('{} should have 1 or {} values'
+                                         .format(item.name, nq))
+            else:
+                if np.ndim(value) != 0:
+                    raise ValueError('{} should be a scalar'.format(
+                        item.name))
+                value = int(value) if item.integer else float(value)
+            values[item.name] = value
+        return values
+
+    def __call__(self, w, q, **params):
+        """ Evaluates the model """
+        return self.function(w, q, **params)
+
+    def __repr__(self) -> str:
+        return 'ModelSpec({!r}, parameters={})'.format(
+            self.name, self.parameter_names)
+
+
+_models = {}  # type: Dict[str, ModelSpec]
+
+
+def register(spec: ModelSpec) -> ModelSpec:
+    """ Adds a model to the registry """
+    if spec.name in _models:
+        raise ValueError('{} is already registered'.format(spec.name))
+    _models[spec.name] = spec
+    return spec
+
+
+def get(name: str) -> ModelSpec:
+    """
+    Returns the specification of a registered model
+
+    Examples
+    --------
+    >>> spec = get('sqwIsotropicRotationalDiffusion')
+    >>> spec.parameter_names
+    ['scale', 'center', 'radius', 'DR']
+    >>> spec.hwhm
+    'hwhmIsotropicRotationalDiffusion'
+    >>> spec['DR'].bounds
+    (0.0, inf)
+    >>> spec.validate(DR=-1.)
+    Traceback (most recent call last):
+    ...
+    ValueError: DR, the rotational diffusion coefficient, should be > 0
+
+    """
+    try:
+        return _models[name]
+    except KeyError:
+        raise KeyError('{} is not a registered model. Available models: {}'
+                       .format(name, ', '.join(_models)))
+
+
+def names() -> List[str]:
+    """ Names of the registered models """
+    return list(_models)
+
+
+def _scale() -> Parameter:
+    return Parameter('scale', 1., (0., inf), linear=True,
+                     description='scale factor')
+
+
+def _center() -> Parameter:
+    return Parameter('center', 0., units='1/ps',
+                     description='center of peak')
+
+
+_lines_models = ('vectorised', 'jacobian', 'analytic_convolution')
+
+register(ModelSpec(
+    'sqwBrownianTranslationalDiffusion',
+    [_scale(), _center(),
+     Parameter('D', 1., (0., inf), strict=True, units='Angstrom^2/ps',
+               description='diffusion coefficient')],
+    hwhm='hwhmBrownianTranslationalDiffusion',
+    supports=_lines_models,
+    description='Continuous long-range isotropic translational diffusion'))
+
+register(ModelSpec(
+    'sqwChudleyElliottDiffusion',
+    [_scale(), _center(),
+     Parameter('D', 0.23, (0., inf), strict=True, units='Angstrom^2/ps',
+               description='diffusion coefficient'),
+     Parameter('L', 1., (0., inf), strict=True, units='Angstrom',
+               description='jump length')],
+    hwhm='hwhmChudleyElliottDiffusion',
+    supports=_lines_models,
+    description='Jump diffusion on a lattice'))
+
+register(ModelSpec(
+    'sqwDeltaLorentz',
+    [_scale(), _center(),
+     Parameter('A0', 0., (0., 1.), q_vector=True, linear=True,
+               description='proportion of immobile atoms'),
+     Parameter('hwhm', 1., (0., inf), q_vector=True, units='1/ps',
+               description='half width half maximum')],
+    supports=_lines_models,
+    description='Delta and Lorentzian'))
+
+register(ModelSpec(
+    'sqwDeltaTwoLorentz',
+    [_scale(), _center(),
+     Parameter('A0', 1., (0., 1.), q_vector=True, linear=True,
+               description='proportion of immobile atoms'),
+     Parameter('A1', 1., (0., 1.), q_vector=True, linear=True,
+               description='weight of the first Lorentzian'),
+     Parameter('hwhm1', 1., (0., inf), q_vector=True, units='1/ps',
+               description='half width half maximum of the first '
+                           'Lorentzian'),
+     Parameter('hwhm2', 1., (0., inf), q_vector=True, units='1/ps',
+               description='half width half maximum of the second '
+                           'Lorentzian')],
+    supports=_lines_models,
+    description='Delta and two Lorentzians'))
+
+register(ModelSpec(
+    'sqwEquivalentSitesCircle',
+    [_scale(), _center(),
+     Parameter('Nsites', 3, (2, inf), integer=True, fitting=False,
+               description='number of sites in circle'),
+     Parameter('radius', 1., (0., inf), strict=True, units='Angstrom',
+               description='radius of the circle'),
+     Parameter('resTime', 1., (0., inf), strict=True, units='ps',
+               description='residence time')],
+    hwhm='hwhmEquivalentSitesCircle',
+    supports=_lines_models,
+    description='Jumps between equivalent sites on a circle'))
+
+register(ModelSpec(
+    'sqwGaussianModel3D',
+    [_scale(), _center(),
+     Parameter('D', 1., (0., inf), strict=True, units='Angstrom^2/ps',
+               description='diffusion coefficient'),
+     Parameter('variance_ux', 1., (0., inf), strict=True,
+               units='Angstrom^2', description='variance <u_x^2>')],
+    hwhm='hwhmGaussianModel3D',
+    supports=_lines_models,
+    description='Localized diffusion with Gaussian statistics'))
+
+register(ModelSpec(
+    'sqwIsotropicRotationalDiffusion',
+    [_scale(), _center(),
+     Parameter('radius', 1., (0., inf), strict=True, units='Angstrom',
+               description='radius of rotation'),
+     Parameter('DR', 1., (0., inf), strict=True, units='1/ps',
+               description='rotational diffusion coefficient')],
+    hwhm='hwhmIsotropicRotationalDiffusion',
+    supports=_lines_models,
+    description='Continuous rotational diffusion on a sphere'))
+
+register(ModelSpec(
+    'sqwJumpSitesLogNormDist',
+    [_scale(), _center(),
+     Parameter('Nsites', 3, (2, inf), integer=True, fitting=False,
+               description='number of sites in circle'),
+     Parameter('radius', 1., (0., inf), strict=True, units='Angstrom',
+               description='radius of the circle'),
+     Parameter('resTime', 1., (0., inf), strict=True, units='ps',
+               description='residence time'),
+     Parameter('sigma', 1., (0., inf), strict=True,
+               description='standard deviation of the distribution')],
+    hwhm='hwhmJumpSitesLogNormDist',
+    supports=_lines_models,
+    description='Jumps between sites on a circle with a log-normal '
+                'distribution of residence times'))
+
+register(ModelSpec(
+    'sqwJumpTranslationalDiffusion',
+    [_scale(), _center(),
+     Parameter('D', 0.23, (0., inf), strict=True, units='Angstrom^2/ps',
+               description='diffusion coefficient'),
+     Parameter('resTime', 1.25, (0., inf), units='ps',
+               description='residence time')],
+    hwhm='hwhmJumpTranslationalDiffusion',
+    supports=_lines_models,
+    description='Jump translational diffusion'))
+
+register(ModelSpec(
+    'sqwWaterTeixeira',
+    [_scale(), _center(),
+     Parameter('D', 0.23, (0., inf), strict=True, units='Angstrom^2/ps',
+               description='diffusion coefficient'),
+     Parameter('resTime', 1.25, (0., inf), units='ps',
+               description='residence time'),
+     Parameter('radius', 1., (0., inf), strict=True, units='Angstrom',
+               description='radius of rotation'),
+     Parameter('DR', 1., (0., inf), strict=True, units='1/ps',
+               description='rotational diffusion coefficient')],
+    supports=_lines_models,
+    description='Jump translational diffusion convolved with isotropic '
+                'rotational diffusion'))
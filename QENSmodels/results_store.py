@@ -0,0 +1,344 @@
+import multiprocessing
+import queue as queue_module
+import threading
+import numpy as np
+from numbers import Number
+from typing import Optional, Iterable, Dict, List
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+def _flatten(record: dict, prefix: str = '') -> dict:
+    """ Flattens nested dictionaries into 'group/name' keys """
+    flat = {}
+    for key, value in record.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '/'))
+        else:
+            flat[name] = value
+    return flat
+
+
+def _column_kind(value) -> str:
+    """ Returns 'str' or 'float' depending on the type of `value` """
+    if isinstance(value, (str, bytes)):
+        return 'str'
+    if isinstance(value, (Number, np.number, np.bool_)) or \
+            (isinstance(value, np.ndarray) and value.ndim == 0):
+        return 'float'
+    raise TypeError('only scalar numbers and strings can be stored, '
+                    'got {}'.format(type(value).__name__))
+
+
+class FitResultsWriter:
+    r"""
+    Append-only columnar HDF5 store for fit results
+
+    Each record is a (possibly nested) dictionary of scalars, *e.g.* model
+    name, parameter values, uncertainties, :math:`\chi^2`, `q`, run
+    metadata and timings. Nested keys are flattened to `group/name` columns,
+    each stored as a separate chunked and compressed one-dimensional dataset,
+    so that a single quantity can be read back for thousands of fits
+    without touching the others.
+
+    Records are buffered in memory and written `chunk_size` at a time.
+    Numbers are stored as float64 (missing values as NaN), strings as
+    variable-length UTF-8 (missing values as empty strings).
+
+    Parameters
+    ----------
+    filename: str
+        path to the HDF5 file. Existing stores are appended to.
+
+    group: str
+        name of the HDF5 group holding the columns. Default to 'fits'.
+
+    chunk_size: int
+        number of records per HDF5 chunk and per write. Default to 1024.
+
+    compression: str
+        HDF5 compression filter. Default to 'gzip'.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'fits.h5')
+    >>> with FitResultsWriter(filename) as writer:
+    ...     writer.append({'model': 'sqwBrownianTranslationalDiffusion',
+    ...                    'q': 0.5, 'chi2': 1.1, 'params': {'D': 0.23}})
+    ...     writer.append({'model': 'sqwBrownianTranslationalDiffusion',
+    ...                    'q': 0.7, 'chi2': 0.9, 'params': {'D': 0.25}})
+    >>> read_fit_results(filename, ['q', 'params/D'])['params/D']
+    array([0.23, 0.25])
+
+    """
+
+    def __init__(
+            self,
+            filename: str,
+            group: str = 'fits',
+            chunk_size: int = 1024,
+            compression: Optional[str] = 'gzip'
+    ):
+        if h5py is None:
+            raise ImportError('h5py is required to store fit results')
+        if chunk_size < 1:
+            raise ValueError('chunk_size should be strictly positive')
+
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.compression = compression
+
+        self._file = h5py.File(filename, 'a')
+        self._group = self._file.require_group(group)
+        self._nrows = int(self._group.attrs.get('nrows', 0))
+        self._buffer = []  # type: List[dict]
+
+        # name -> kind of the existing columns
+        self._columns = {}  # type: Dict[str, str]
+        self._group.visititems(self._register_column)
+        # name -> kind of the columns, including those not yet created
+        self._kinds = dict(self._columns)
+
+    def _register_column(self, name: str, item) -> None:
+        if isinstance(item, h5py.Dataset):
+            self._columns[name] = \
+                'str' if h5py.check_string_dtype(item.dtype) else 'float'
+
+    @property
+    def nrows(self) -> int:
+        """ Number of records stored, including those not yet flushed """
+        return self._nrows + len(self._buffer)
+
+    def append(self, record: dict) -> None:
+        """ Adds one fit record to the store """
+        record = _flatten(record)
+        # all the columns are checked before any is registered
+        kinds = {}
+        for name, value in record.items():
+            if value is not None:
+                kind = _column_kind(value)
+                if self._kinds.get(name, kind) != kind:
+                    raise TypeError('column {} stores {} values'.format(
+                        name, self._kinds[name]))
+                kinds[name] = kind
+        self._kinds.update(kinds)
+        self._buffer.append(record)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def extend(self, records: Iterable[dict]) -> None:
+        """ Adds several fit records to the store """
+        for record in records:
+            self.append(record)
+
+    def _create_column(self, name: str, kind: str) -> None:
+        if kind == 'str':
+            dtype, fill = h5py.string_dtype('utf-8'), ''
+        else:
+            dtype, fill = np.float64, np.nan
+        column = self._group.create_dataset(
+            name,
+            shape=(self._nrows,),
+            maxshape=(None,),
+            dtype=dtype,
+            chunks=(self.chunk_size,),
+            compression=self.compression,
+            shuffle=kind == 'float' and self.compression is not None,
+            fillvalue=None if kind == 'str' else fill)
+        if kind == 'str' and self._nrows > 0:
+            column[:] = [fill] * self._nrows
+        self._columns[name] = kind
+
+    def flush(self) -> None:
+        """ Writes the buffered records to disk """
+        if not self._buffer:
+            return
+
+        for record in self._buffer:
+            for name, value in record.items():
+                if name not in self._columns and value is not None:
+                    self._create_column(name, self._kinds[name])
+
+        start, stop = self._nrows, self._nrows + len(self._buffer)
+        for name, kind in self._columns.items():
+            if kind == 'str':
+                values = []
+                for record in self._buffer:
+                    value = record.get(name)
+                    if isinstance(value, bytes):
+                        value = value.decode('utf-8')
+                    values.append('' if value is None else str(value))
+            else:
+                values = np.array(
+                    [np.nan if record.get(name) is None else record[name]
+                     for record in self._buffer], dtype=np.float64)
+            column = self._group[name]
+            column.resize((stop,))
+            column[start:stop] = values
+
+        self._nrows = stop
+        self._group.attrs['nrows'] = stop
+        self._buffer = []
+        self._file.flush()
+
+    def close(self) -> None:
+        """ Flushes the buffered records and closes the file """
+        if self._file.id.valid:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self) -> 'FitResultsWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class QueuedFitResultsWriter:
+    """
+    Single writer collecting fit records sent by several processes
+
+    HDF5 files cannot be safely written by several processes at the same
+    time: worker processes put their records (plain dictionaries) on
+    `queue` and a background thread of the parent process appends them to a
+    :class:`FitResultsWriter`.
+
+    Parameters
+    ----------
+    filename: str
+        path to the HDF5 file
+
+    queue: queue-like object
+        queue shared with the workers. Default to None, a new
+        `multiprocessing.Queue` is created; pass *e.g.* a
+        `multiprocessing.Manager().Queue()` to send it as an argument of
+        tasks submitted to a process pool.
+
+    **kwargs:
+        keyword arguments of :class:`FitResultsWriter`
+
+    Attributes
+    ----------
+    rejected: list of dict
+        records which were not written: the first one the writer failed
+        on, and all the records received after it
+
+    Notes
+    -----
+    Workers may put a single record or a list of records; sending lists
+    reduces the number of queue transfers for fast fits.
+
+    If the writer fails on a record, *e.g.* a string in a column of
+    numbers, the following records are not written but kept in
+    `rejected`, and the error is raised by :meth:`close` and :meth:`put`.
+
+    """
+
+    _sentinel = None
+
+    def __init__(self, filename: str, queue=None, **kwargs):
+        self.writer = FitResultsWriter(filename, **kwargs)
+        self.queue = multiprocessing.Queue() if queue is None else queue
+        self.rejected = []  # type: List[dict]
+        self._error = None  # type: Optional[BaseException]
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                item = self.queue.get(timeout=1.0)
+            except queue_module.Empty:
+                continue
+            if item is self._sentinel:
+                break
+            for record in [item] if isinstance(item, dict) else item:
+                if self._error is None:
+                    try:
+                        self.writer.append(record)
+                        continue
+                    except Exception as error:
+                        self._error = error
+                self.rejected.append(record)
+
+    def _raise(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def put(self, records) -> None:
+        """ Queues one record or a list of records, from this process """
+        self._raise()
+        self.queue.put(records)
+
+    def close(self) -> None:
+        """
+        Waits for all queued records to be written and closes the file
+
+        Raises the error of the writer, if it failed on a record
+        """
+        if self._thread.is_alive():
+            self.queue.put(self._sentinel)
+            self._thread.join()
+        try:
+            self.writer.close()
+        finally:
+            self._raise()
+
+    def __enter__(self) -> 'QueuedFitResultsWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def read_fit_results(
+        filename: str,
+        columns: Optional[List[str]] = None,
+        group: str = 'fits'
+) -> Dict[str, np.ndarray]:
+    """
+    Reads columns of a fit-results store
+
+    Parameters
+    ----------
+    filename: str
+        path to a file written by :class:`FitResultsWriter`
+
+    columns: list of str
+        names of the columns to read, *e.g.* `['q', 'params/D']`.
+        Default to None (all columns).
+
+    group: str
+        name of the HDF5 group holding the columns. Default to 'fits'.
+
+    Return
+    ------
+    dict
+        column name -> :class:`~numpy:numpy.ndarray` (strings are returned
+        as arrays of Python `str`)
+
+    """
+    if h5py is None:
+        raise ImportError('h5py is required to read fit results')
+
+    with h5py.File(filename, 'r') as handle:
+        root = handle[group]
+        if columns is None:
+            columns = []
+            root.visititems(
+                lambda name, item: columns.append(name)  # type: ignore
+                if isinstance(item, h5py.Dataset) else None)
+
+        results = {}
+        for name in columns:
+            column = root[name]
+            if h5py.check_string_dtype(column.dtype):
+                results[name] = column.asstr()[:].astype(object)
+            else:
+                results[name] = column[:]
+    return results
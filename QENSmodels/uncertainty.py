@@ -0,0 +1,198 @@
+"""
+Uncertainties of fitted parameters by bootstrap
+
+Errors derived from the covariance matrix of a fit assume a locally linear
+model and Gaussian errors, which is often not the case for QENS data.
+:func:`bootstrap` refits many resampled copies of the data, starting from
+the best fit, and gives percentile intervals of the fitted parameters and
+of derived quantities: the EISF and the apparent half-width of the
+quasielastic lines at each momentum transfer (see
+:func:`~QENSmodels.lines.quasielastic_summary`).
+
+Each copy is resampled by its own random generator, spawned from a single
+seed, so that the results do not depend on the number of processes.
+"""
+import numpy as np
+from typing import Optional, Dict, Tuple
+
+import QENSmodels
+
+
+class BootstrapResult:
+    """
+    Fitted parameters and derived quantities of resampled data
+
+    Attributes
+    ----------
+    samples: dict
+        values of each fitted parameter, of 'background' if any, and of
+        'eisf' and 'hwhm', for each copy of the data: arrays of shape (n,)
+        for parameters shared by all spectra, (n, nq) otherwise. The
+        apparent half-width is the `hwhm` parameter of `sqwDeltaLorentz`.
+
+    best: dict
+        the same quantities for the original fit
+
+    success: :class:`~numpy:numpy.ndarray`
+        whether the refit of each copy converged, of shape (n,)
+
+    """
+
+    def __init__(self, samples, best, success):
+        self.samples = samples
+        self.best = best
+        self.success = success
+
+    def interval(self, name: str, level: float = 0.683
+                 ) -> Tuple[np.ndarray, np.ndarray]:
+        """ Lower and upper percentiles of `name` containing a fraction
+        `level` of the converged refits """
+        if not 0 < level < 1:
+            raise ValueError('level should be in (0, 1)')
+        values = self.samples[name][self.success]
+        lower, upper = np.percentile(
+            values, [50. * (1. - level), 50. * (1. + level)], axis=0)
+        return lower, upper
+
+    def intervals(self, level: float = 0.683
+                  ) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """ Intervals of all the quantities (see :meth:`interval`) """
+        return {name: self.interval(name, level) for name in self.samples}
+
+    def __repr__(self) -> str:
+        return 'BootstrapResult(n={}, converged={})'.format(
+            self.success.size, int(self.success.sum()))
+
+
+def _derived(separable, params) -> Dict[str, np.ndarray]:
+    """ EISF and apparent half-width at each q """
+    values = {name: value for name, value in params.items()
+              if name not in ('scale', 'center')}
+    eisf, hwhm = QENSmodels.lines.quasielastic_summary(
+        *QENSmodels.lines.model_lines(separable.spec.name, separable.bound.q,
+                                      **values))
+    return {'eisf': eisf, 'hwhm': hwhm}
+
+
+def _summary(separable, result) -> Dict[str, np.ndarray]:
+    """ Fitted and derived quantities of a fit """
+    summary = {name: np.asarray(result.params[name], dtype=np.float64)
+               for name in separable.nonlinear + separable.linear}
+    if result.background is not None:
+        summary['background'] = result.background
+    summary.update(_derived(separable, result.params))
+    return summary
+
+
+def _replicates(task):
+    """ Refits of the copies of the data resampled by generators `seeds` """
+    (separable, data, best_fit, errors, method, x0, statistic, seeds,
+     tolerance) = task
+    nq, nw = data.shape
+    if method == 'residuals':
+        residuals = data - best_fit
+        if errors is not None:
+            residuals = residuals / errors
+    summaries, success = [], []
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        if method == 'poisson':
+            copy = rng.poisson(data).astype(np.float64)
+        else:
+            index = rng.integers(0, nw, size=(nq, nw))
+            noise = np.take_along_axis(residuals, index, axis=1)
+            copy = best_fit + (noise if errors is None else errors * noise)
+        if statistic == 'cash':
+            # resampled residuals can give negative counts
+            np.maximum(copy, 0., out=copy)
+        with QENSmodels.lines.tolerance(**tolerance):
+            result = separable.fit(copy, errors, x0=x0,
+                                   statistic=statistic)
+            summaries.append(_summary(separable, result))
+        success.append(result.success)
+    return summaries, success
+
+
+def bootstrap(
+        fit_result: 'QENSmodels.FitResult',
+        n: int = 1000,
+        method: str = 'residuals',
+        seed: Optional[int] = None,
+        n_workers: int = 1
+) -> BootstrapResult:
+    """
+    Bootstrap distributions of fitted parameters, EISF and half-widths
+
+    Parameters
+    ----------
+    fit_result: :class:`~QENSmodels.fitting.FitResult`
+        result of :meth:`~QENSmodels.fitting.SeparableModel.fit`. The
+        copies are refitted with the same statistic.
+
+    n: int
+        number of resampled copies of the data. Default to 1000.
+
+    method: str
+        'residuals': the residuals of each spectrum (divided by the errors,
+        if any) are drawn with replacement and added to the best fit.
+        'poisson': the data are counts, each drawn from a Poisson
+        distribution of mean the measured count.
+        Default to 'residuals'.
+
+    seed: int
+        seed of the random generators. Default to None.
+
+    n_workers: int
+        number of processes refitting the copies. Default to 1 (no
+        parallelism).
+
+    Return
+    ------
+    :class:`BootstrapResult`
+
+    Examples
+    --------
+    >>> w, q = np.linspace(-2, 2, 201), np.array([0.5, 1.])
+    >>> rng = np.random.default_rng(0)
+    >>> data = QENSmodels.sqwBrownianTranslationalDiffusion(w, q, D=0.2)
+    >>> data = data + 0.01 * rng.standard_normal(data.shape)
+    >>> model = QENSmodels.SeparableModel(
+    ...     'sqwBrownianTranslationalDiffusion', w, q, center=0.)
+    >>> result = bootstrap(model.fit(data, D=0.1), n=50, seed=1)
+    >>> lower, upper = result.interval('D')
+    >>> bool(lower < result.best['D'] < upper)
+    True
+    >>> result.samples['hwhm'].shape
+    (50, 2)
+
+    """
+    separable = fit_result.separable
+    if separable is None or fit_result.data is None:
+        raise ValueError('the fit result does not hold its model and data')
+    if method not in ('residuals', 'poisson'):
+        raise ValueError("method should be 'residuals' or 'poisson'")
+    data, errors = fit_result.data, fit_result.errors
+    if method == 'poisson' and np.any(data < 0):
+        raise ValueError('counts should be >= 0 for Poisson resampling')
+    if n < 1:
+        raise ValueError('n should be >= 1')
+
+    seeds = np.random.SeedSequence(seed).spawn(n)
+    size = int(np.ceil(n / (4 * max(1, n_workers))))
+    tolerance = QENSmodels.lines.get_tolerance()
+    tasks = [(separable, data, fit_result.best_fit, errors, method,
+              fit_result.x, fit_result.statistic, seeds[start:start + size],
+              tolerance) for start in range(0, n, size)]
+    if n_workers > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            chunks = list(executor.map(_replicates, tasks))
+    else:
+        chunks = [_replicates(task) for task in tasks]
+
+    summaries = [summary for chunk, _ in chunks for summary in chunk]
+    success = np.array([value for _, chunk in chunks for value in chunk])
+    samples = {name: np.array([summary[name] for summary in summaries])
+               for name in summaries[0]}
+    return BootstrapResult(samples, _summary(separable, fit_result),
+                           success)
@@ -0,0 +1,55 @@
+"""
+Benchmarks of the convolution of models with an instrument resolution
+"""
+import numpy as np
+from scipy.signal import fftconvolve
+
+import QENSmodels
+
+from .common import NQ, NW, q_grid, w_grid, resolution
+
+
+class Convolution:
+    """ Resolution convolution as done in the example notebooks """
+    params = (['direct', 'fft'], NQ, NW)
+    param_names = ['method', 'nq', 'nw']
+    timeout = 600
+
+    def setup(self, method, nq, nw):
+        if method == 'direct' and nq * nw ** 2 > 1e10:
+            # direct convolution is quadratic in nw: skip the largest grids
+            raise NotImplementedError
+        self.w = w_grid(nw)
+        self.dw = self.w[1] - self.w[0]
+        self.res = resolution(self.w)
+        self.model = np.atleast_2d(
+            QENSmodels.sqwBrownianTranslationalDiffusion(self.w, q_grid(nq),
+                                                         D=0.1))
+
+    def time_convolve(self, method, nq, nw):
+        if method == 'direct':
+            for spectrum in self.model:
+                np.convolve(spectrum, self.res, mode='same') * self.dw
+        else:
+            fftconvolve(self.model, self.res[np.newaxis, :], mode='same',
+                        axes=1) * self.dw
+
+    def peakmem_convolve(self, method, nq, nw):
+        self.time_convolve(method, nq, nw)
+
+
+class BoundModelConvolution:
+    """ Convolution of the sampled model or of its lines in the time
+    domain, resolution transforms computed once """
+    params = (['sampled', 'time_domain'], NQ, NW)
+    param_names = ['method', 'nq', 'nw']
+    timeout = 600
+
+    def setup(self, method, nq, nw):
+        w = w_grid(nw)
+        self.bound = QENSmodels.BoundModel(
+            'sqwJumpTranslationalDiffusion', w, q_grid(nq), resolution(w),
+            time_domain=method == 'time_domain')
+
+    def time_call(self, method, nq, nw):
+        self.bound(D=0.1, resTime=1.)
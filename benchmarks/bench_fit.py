@@ -0,0 +1,344 @@
+"""
+Benchmarks of fit loops using scipy.optimize, as in the example notebooks
+"""
+import numpy as np
+from scipy.optimize import least_squares
+
+import QENSmodels
+
+from .common import q_grid, w_grid, resolution
+
+
+class FitLoop:
+    """ Global fit of Brownian diffusion convolved with the resolution
+
+    The diffusion coefficient is shared by all spectra; the scale factor
+    is fitted for each q.
+    """
+    params = ([1, 10], [100, 2000])
+    param_names = ['nq', 'nw']
+    timeout = 600
+
+    def setup(self, nq, nw):
+        self.w = w_grid(nw)
+        self.dw = self.w[1] - self.w[0]
+        self.q = q_grid(nq)
+        self.res = resolution(self.w)
+
+        rng = np.random.default_rng(42)
+        ideal = self.model(np.concatenate([[0.1], np.ones(nq)]))
+        self.data = ideal + 0.01 * ideal.max() * rng.standard_normal(
+            ideal.shape)
+        self.p0 = np.concatenate([[0.05], 0.5 * np.ones(nq)])
+
+    def model(self, params):
+        sqw = np.atleast_2d(QENSmodels.sqwBrownianTranslationalDiffusion(
+            self.w, self.q, D=params[0]))
+        return np.array([
+            scale * np.convolve(spectrum, self.res, mode='same') * self.dw
+            for scale, spectrum in zip(params[1:], sqw)])
+
+    def residuals(self, params):
+        return (self.model(params) - self.data).ravel()
+
+    def fit(self):
+        return least_squares(self.residuals, self.p0,
+                             bounds=(0, np.inf))
+
+    def time_fit(self, nq, nw):
+        self.fit()
+
+    def peakmem_fit(self, nq, nw):
+        self.fit()
+
+    def track_nfev(self, nq, nw):
+        return self.fit().nfev
+
+    track_nfev.unit = 'evaluations'
+
+
+class BumpsFitness:
+    """ Evaluation of the bumps likelihood of a global fit
+
+    One `bumps.curve.Curve` per spectrum, as in the example notebooks,
+    compared with a single `QENSFitness` for all spectra.
+    """
+    params = ([10, 100], [500, 2000], ['curves', 'fitness'])
+    param_names = ['nq', 'nw', 'adapter']
+
+    def setup(self, nq, nw, adapter):
+        try:
+            import bumps.names as bmp
+            from QENSmodels.adapters.bumps import QENSFitness
+        except ImportError:
+            raise NotImplementedError('bumps is not installed')
+
+        w = w_grid(nw)
+        q = q_grid(nq)
+        res = resolution(w)
+        data = np.ones((nq, nw))
+
+        if adapter == 'fitness':
+            fitness = QENSFitness('sqwBrownianTranslationalDiffusion', w, q,
+                                  data, resolution=res, per_q=['scale'],
+                                  D=0.1)
+            fitness.D.range(0, 1)
+            models = [fitness]
+        else:
+            def model_convol(x, q, scale=1, center=0, D=1, resolution=None):
+                model = QENSmodels.sqwBrownianTranslationalDiffusion(
+                    x, q, scale, center, D)
+                return np.convolve(model, resolution / resolution.sum(),
+                                   mode='same')
+
+            models = []
+            for i in range(nq):
+                curve = bmp.Curve(model_convol, w, data[i], name=str(i),
+                                  q=q[i], scale=1., center=0., D=0.1,
+                                  resolution=res)
+                curve.D.range(0, 1)
+                if i > 0:
+                    curve.D = models[0].D
+                models.append(curve)
+        self.problem = bmp.FitProblem(models)
+        self.p = self.problem.getp()
+
+    def time_nllf(self, nq, nw, adapter):
+        self.problem.setp(self.p)
+        self.problem.nllf()
+
+
+class LmfitModel:
+    """ Global lmfit fit of all spectra with a `QENSModel`, with analytic
+    or finite-difference derivatives """
+    params = ([1, 10], [500, 2000], [True, False])
+    param_names = ['nq', 'nw', 'analytic_jacobian']
+
+    def setup(self, nq, nw, analytic_jacobian):
+        try:
+            from QENSmodels.adapters.lmfit import QENSModel
+        except ImportError:
+            raise NotImplementedError('lmfit is not installed')
+
+        w = w_grid(nw)
+        q = q_grid(nq)
+        res = resolution(w)
+        self.model = QENSModel('sqwJumpTranslationalDiffusion', w, q, res,
+                               per_q=['scale'])
+        self.data = self.model.eval(
+            **self.model.make_params(D=0.2, resTime=0.5).valuesdict())
+        self.params = self.model.make_params(D=0.1, resTime=1.)
+        self.params['center'].vary = False
+
+    def fit(self, analytic_jacobian):
+        return self.model.fit(self.data, self.params,
+                              analytic_jacobian=analytic_jacobian)
+
+    def time_fit(self, nq, nw, analytic_jacobian):
+        self.fit(analytic_jacobian)
+
+    def track_nfev(self, nq, nw, analytic_jacobian):
+        return self.fit(analytic_jacobian).nfev
+
+    track_nfev.unit = 'evaluations'
+
+
+class SeparableFit:
+    """ Global fit of Brownian diffusion with the scale factors solved for
+    each spectrum (variable projection), to compare with `FitLoop` """
+    params = ([1, 10, 100], [100, 2000])
+    param_names = ['nq', 'nw']
+    timeout = 600
+
+    def setup(self, nq, nw):
+        w = w_grid(nw)
+        q = q_grid(nq)
+        res = resolution(w)
+        self.model = QENSmodels.SeparableModel(
+            'sqwBrownianTranslationalDiffusion', w, q, res, center=0.)
+
+        rng = np.random.default_rng(42)
+        ideal = QENSmodels.BoundModel('sqwBrownianTranslationalDiffusion',
+                                      w, q, res)(D=0.1)
+        self.data = ideal + 0.01 * ideal.max() * rng.standard_normal(
+            ideal.shape)
+
+    def fit(self):
+        return self.model.fit(self.data, D=0.05)
+
+    def time_fit(self, nq, nw):
+        self.fit()
+
+    def track_nfev(self, nq, nw):
+        return self.fit().nfev
+
+    track_nfev.unit = 'evaluations'
+
+
+class SequentialFit:
+    """ Fits of each spectrum from the same initial values, or from the
+    solution of the neighbouring spectrum (q-sweep) """
+    params = (['independent', 'sweep'], [10, 50])
+    param_names = ['method', 'nq']
+    timeout = 600
+
+    def setup(self, method, nq):
+        self.w = w_grid(500)
+        self.q = q_grid(nq)
+        self.res = resolution(self.w)
+        self.data = QENSmodels.BoundModel(
+            'sqwDeltaLorentz', self.w, self.q, self.res)(
+            A0=0.2, hwhm=0.05 + 0.3 * self.q ** 2)
+
+    def fit(self, method):
+        if method == 'sweep':
+            return QENSmodels.sequential_fit(
+                'sqwDeltaLorentz', self.w, self.q, self.data,
+                resolution=self.res, initial={'hwhm': 1.},
+                center=0.).nfev.sum()
+        nfev = 0
+        for i in range(self.q.size):
+            model = QENSmodels.SeparableModel(
+                'sqwDeltaLorentz', self.w, self.q[i:i + 1], self.res,
+                center=0.)
+            nfev += model.fit(self.data[i:i + 1], hwhm=1.).nfev
+        return nfev
+
+    def time_fit(self, method, nq):
+        self.fit(method)
+
+    def track_nfev(self, method, nq):
+        return self.fit(method)
+
+    track_nfev.unit = 'evaluations'
+
+
+class SpectralLookup:
+    """ Initial parameters of many datasets (*e.g.* kinetic runs) looked up
+    in a library of simulated spectra """
+    params = [1, 1000]
+    param_names = ['ndatasets']
+    timeout = 600
+
+    def setup(self, ndatasets):
+        w = w_grid(500)
+        q = q_grid(10)
+        res = resolution(w)
+        self.index = QENSmodels.SpectralIndex(
+            'sqwWaterTeixeira', w, q,
+            {'D': (0.05, 1.), 'resTime': (0.1, 5.), 'radius': (0.5, 2.),
+             'DR': (0.05, 2.)}, res, size=1024, center=0.)
+        data = QENSmodels.BoundModel('sqwWaterTeixeira', w, q, res)(
+            D=0.2, resTime=1., radius=1., DR=0.3)
+        self.data = np.stack([data] * ndatasets)
+
+    def time_query(self, ndatasets):
+        self.index.query(self.data)
+
+
+class MultiStartFit:
+    """ Local fit of isotropic rotational diffusion from the default values,
+    compared with a multi-start fit screening 64 starting points """
+    params = ['local', 'multistart']
+    param_names = ['method']
+    timeout = 600
+
+    def setup(self, method):
+        self.w = w_grid(500)
+        self.q = q_grid(10)
+        self.res = resolution(self.w)
+        self.data = QENSmodels.BoundModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q, self.res)(
+            radius=1.3, DR=0.4)
+
+    def fit(self, method):
+        if method == 'multistart':
+            return QENSmodels.multistart_fit(
+                'sqwIsotropicRotationalDiffusion', self.w, self.q, self.data,
+                resolution=self.res, center=0.).best
+        return QENSmodels.SeparableModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q, self.res,
+            center=0.).fit(self.data)
+
+    def time_fit(self, method):
+        self.fit(method)
+
+    def track_chi2(self, method):
+        return self.fit(method).chi2
+
+    track_chi2.unit = 'chi2'
+
+
+class Scan:
+    """ Reduced chi2 of isotropic rotational diffusion over a grid of radii
+    and rotational diffusion coefficients """
+    params = [20, 50]
+    param_names = ['npoints']
+    timeout = 600
+
+    def setup(self, npoints):
+        self.w = w_grid(500)
+        self.q = q_grid(10)
+        self.res = resolution(self.w)
+        self.data = QENSmodels.BoundModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q, self.res)(
+            radius=1.3, DR=0.4)
+        self.grid = {'radius': np.linspace(1., 2., npoints),
+                     'DR': np.geomspace(0.1, 1., npoints)}
+
+    def time_scan(self, npoints):
+        QENSmodels.scan('sqwIsotropicRotationalDiffusion', self.w, self.q,
+                        self.data, self.grid, resolution=self.res, center=0.)
+
+
+class Bootstrap:
+    """ Bootstrap refits of Brownian diffusion, warm-started from the best
+    fit """
+    params = [1, 4]
+    param_names = ['n_workers']
+    timeout = 600
+
+    def setup(self, n_workers):
+        w = w_grid(500)
+        q = q_grid(10)
+        res = resolution(w)
+        rng = np.random.default_rng(42)
+        ideal = QENSmodels.BoundModel('sqwBrownianTranslationalDiffusion',
+                                      w, q, res)(D=0.1)
+        data = ideal + 0.01 * ideal.max() * rng.standard_normal(ideal.shape)
+        self.fit = QENSmodels.SeparableModel(
+            'sqwBrownianTranslationalDiffusion', w, q, res, center=0.).fit(
+            data, D=0.05)
+
+    def time_bootstrap(self, n_workers):
+        QENSmodels.bootstrap(self.fit, n=100, seed=0, n_workers=n_workers)
+
+
+class PoissonFit:
+    """ Fits of low counts by least squares and by Poisson deviance """
+    params = ['chi2', 'cash']
+    param_names = ['statistic']
+
+    def setup(self, statistic):
+        w = w_grid(500)
+        q = q_grid(10)
+        res = resolution(w)
+        ideal = QENSmodels.BoundModel(
+            'sqwIsotropicRotationalDiffusion', w, q, res, center=0.)(
+            scale=20., radius=1.3, DR=0.4) + 0.5
+        self.data = np.random.default_rng(42).poisson(ideal).astype(float)
+        self.errors = None if statistic == 'cash' else \
+            np.sqrt(np.maximum(self.data, 1.))
+        self.model = QENSmodels.SeparableModel(
+            'sqwIsotropicRotationalDiffusion', w, q, res, background=0,
+            center=0.)
+
+    def fit(self, statistic):
+        return self.model.fit(self.data, self.errors, statistic=statistic,
+                              radius=1., DR=0.2)
+
+    def time_fit(self, statistic):
+        self.fit(statistic)
+
+    def track_radius(self, statistic):
+        return float(self.fit(statistic).params['radius'])
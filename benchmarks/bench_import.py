@@ -0,0 +1,23 @@
+"""
+Benchmarks of the import time of QENSmodels, in a fresh interpreter
+"""
+
+
+class Import:
+    """ Startup cost paid by short-lived worker processes """
+
+    def timeraw_import(self):
+        return 'import QENSmodels'
+
+    def timeraw_import_and_first_model(self):
+        return """
+        import QENSmodels
+        QENSmodels.sqwBrownianTranslationalDiffusion
+        """
+
+    def timeraw_import_all_models(self):
+        return """
+        import QENSmodels
+        for name in QENSmodels.__all__:
+            getattr(QENSmodels, name)
+        """
@@ -0,0 +1,190 @@
+"""
+Time and peak-memory benchmarks of the public functions of QENSmodels
+"""
+import numpy as np
+
+import QENSmodels
+
+from .common import NQ, NW, LINESHAPES, HWHM_MODELS, SQW_MODELS
+from .common import q_grid, w_grid
+
+
+class LineShapes:
+    """ Elementary functions of the energy transfer only """
+    params = (sorted(LINESHAPES), NW)
+    param_names = ['function', 'nw']
+
+    def setup(self, function, nw):
+        self.function = getattr(QENSmodels, function)
+        self.kwargs = LINESHAPES[function]
+        self.w = w_grid(nw)
+
+    def time_lineshape(self, function, nw):
+        self.function(self.w, **self.kwargs)
+
+    def peakmem_lineshape(self, function, nw):
+        self.function(self.w, **self.kwargs)
+
+
+class Hwhm:
+    """ Widths, EISF and QISF as functions of q """
+    params = (sorted(HWHM_MODELS), NQ)
+    param_names = ['function', 'nq']
+
+    def setup(self, function, nq):
+        self.function = getattr(QENSmodels, function)
+        self.kwargs = HWHM_MODELS[function]
+        self.q = q_grid(nq)
+
+    def time_hwhm(self, function, nq):
+        self.function(self.q, **self.kwargs)
+
+    def peakmem_hwhm(self, function, nq):
+        self.function(self.q, **self.kwargs)
+
+
+class Sqw:
+    """ Full models S(q, w) on (nq, nw) grids """
+    params = (sorted(SQW_MODELS), NQ, NW)
+    param_names = ['model', 'nq', 'nw']
+    # the largest grids of the series models take minutes per call
+    timeout = 1200
+    number = 1
+    repeat = (1, 3, 30.)
+
+    def setup(self, model, nq, nw):
+        self.function = getattr(QENSmodels, model)
+        self.kwargs = SQW_MODELS[model]
+        self.w = w_grid(nw)
+        self.q = q_grid(nq)
+
+    def time_sqw(self, model, nq, nw):
+        self.function(self.w, self.q, **self.kwargs)
+
+    def peakmem_sqw(self, model, nq, nw):
+        self.function(self.w, self.q, **self.kwargs)
+
+
+class SitesModels:
+    """ Models whose number of Lorentzians depends on the number of sites """
+    params = (['sqwEquivalentSitesCircle', 'sqwJumpSitesLogNormDist'],
+              [2, 6, 12, 24], [10, 100])
+    param_names = ['model', 'Nsites', 'nq']
+    timeout = 600
+
+    def setup(self, model, Nsites, nq):
+        self.function = getattr(QENSmodels, model)
+        self.kwargs = dict(SQW_MODELS[model], Nsites=Nsites)
+        self.w = w_grid(2000)
+        self.q = q_grid(nq)
+
+    def time_sqw(self, model, Nsites, nq):
+        self.function(self.w, self.q, **self.kwargs)
+
+    def peakmem_sqw(self, model, Nsites, nq):
+        self.function(self.w, self.q, **self.kwargs)
+
+
+class GaussianModel3DTerms:
+    """ sqwGaussianModel3D as a function of q^2 <u_x^2>
+
+    The number of terms of the series is fixed to 100, but the number of
+    terms with a significant weight grows with q^2 <u_x^2>.
+    """
+    params = ([0.1, 1., 10., 50.], [10, 100])
+    param_names = ['q2_variance', 'nq']
+    timeout = 600
+
+    def setup(self, q2_variance, nq):
+        self.w = w_grid(2000)
+        self.q = q_grid(nq)
+        self.variance_ux = q2_variance / self.q.max() ** 2
+
+    def time_sqw(self, q2_variance, nq):
+        QENSmodels.sqwGaussianModel3D(self.w, self.q, D=0.5,
+                                      variance_ux=self.variance_ux)
+
+    def peakmem_sqw(self, q2_variance, nq):
+        QENSmodels.sqwGaussianModel3D(self.w, self.q, D=0.5,
+                                      variance_ux=self.variance_ux)
+
+
+class TruncatedSeries:
+    """ sqwGaussianModel3D bound to its grids, with and without dropping
+    the terms of negligible weight """
+    params = ([0., 1e-8, 1e-4], [10, 100])
+    param_names = ['rtol', 'nq']
+    timeout = 600
+
+    def setup(self, rtol, nq):
+        self.bound = QENSmodels.BoundModel('sqwGaussianModel3D', w_grid(2000),
+                                           q_grid(nq))
+
+    def time_bound_model(self, rtol, nq):
+        with QENSmodels.lines.tolerance(rtol=rtol):
+            self.bound(D=0.5, variance_ux=1.)
+
+
+class LogNormSamples:
+    """ sqwJumpSitesLogNormDist as a function of the distribution width
+
+    The number of samples of the log-normal distribution is fixed to 21
+    per site; `sigma` sets the spread of the sampled widths.
+    """
+    params = ([0.1, 1., 3.], [10, 100])
+    param_names = ['sigma', 'nq']
+    timeout = 600
+
+    def setup(self, sigma, nq):
+        self.w = w_grid(2000)
+        self.q = q_grid(nq)
+
+    def time_sqw(self, sigma, nq):
+        QENSmodels.sqwJumpSitesLogNormDist(self.w, self.q, Nsites=3,
+                                           sigma=sigma)
+
+
+class Composite:
+    """ Lorentzian plus isotropic rotational diffusion, as in the bumps
+    example notebook: sum of the model functions or composite model """
+    params = (['functions', 'composite'], [10, 100], [2000])
+    param_names = ['method', 'nq', 'nw']
+
+    def setup(self, method, nq, nw):
+        from QENSmodels.composite import Component
+
+        self.w = w_grid(nw)
+        self.q = q_grid(nq)
+        self.model = (Component('lorentzian', prefix='l_') +
+                      Component('sqwIsotropicRotationalDiffusion'))
+
+    def time_evaluate(self, method, nq, nw):
+        if method == 'functions':
+            QENSmodels.lorentzian(self.w, 0.5, 0., 0.2) + \
+                QENSmodels.sqwIsotropicRotationalDiffusion(
+                    self.w, self.q, radius=1., DR=1.)
+        else:
+            self.model(self.w, self.q, l_scale=0.5, l_hwhm=0.2, radius=1.,
+                       DR=1.)
+
+
+class Backgrounds:
+    """ Quadratic background of each spectrum: one call per spectrum, as in
+    the example notebooks, a vectorised Horner scheme, or a matrix product
+    with the powers of w of a bound grid """
+    params = (['loop', 'horner', 'bound'], NQ, NW)
+    param_names = ['method', 'nq', 'nw']
+
+    def setup(self, method, nq, nw):
+        self.w = w_grid(nw)
+        self.coefficients = np.tile([1., 0.1, 0.01], (nq, 1))
+        self.bound = QENSmodels.BoundBackground(self.w, 2)
+
+    def time_backgrounds(self, method, nq, nw):
+        if method == 'loop':
+            for row in self.coefficients:
+                QENSmodels.background_polynomials(self.w, list(row))
+        elif method == 'horner':
+            QENSmodels.polynomial_backgrounds(self.w, self.coefficients)
+        else:
+            self.bound(self.coefficients)
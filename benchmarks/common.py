@@ -0,0 +1,60 @@
+"""
+Grids and parameter values shared by the benchmarks
+"""
+import numpy as np
+
+# number of momentum transfers (spectra) and of energy-transfer points
+NQ = [1, 10, 100, 1000]
+NW = [100, 2000, 20000]
+
+# parameter values of each public function (besides its grid arguments)
+LINESHAPES = {
+    'lorentzian': {'scale': 1., 'center': 0., 'hwhm': 0.1},
+    'gaussian': {'scale': 1., 'center': 0., 'sigma': 0.1},
+    'delta': {'scale': 1., 'center': 0.},
+    'background_polynomials': {'list_coefficients': [1., 0.1, 0.01]},
+}
+
+HWHM_MODELS = {
+    'hwhmBrownianTranslationalDiffusion': {'D': 0.1},
+    'hwhmChudleyElliottDiffusion': {'D': 0.23, 'L': 1.},
+    'hwhmEquivalentSitesCircle': {'Nsites': 3, 'radius': 1.,
+                                  'resTime': 1.},
+    'hwhmGaussianModel3D': {'D': 0.5, 'variance_ux': 1.},
+    'hwhmIsotropicRotationalDiffusion': {'radius': 1., 'DR': 1.},
+    'hwhmJumpSitesLogNormDist': {'Nsites': 3, 'radius': 1., 'resTime': 1.,
+                                 'sigma': 1.},
+    'hwhmJumpTranslationalDiffusion': {'D': 0.23, 'resTime': 1.25},
+}
+
+SQW_MODELS = {
+    'sqwBrownianTranslationalDiffusion': {'D': 0.1},
+    'sqwChudleyElliottDiffusion': {'D': 0.23, 'L': 1.},
+    'sqwDeltaLorentz': {'A0': 0.3, 'hwhm': 0.1},
+    'sqwDeltaTwoLorentz': {'A0': 0.3, 'A1': 0.3, 'hwhm1': 0.1,
+                           'hwhm2': 0.5},
+    'sqwEquivalentSitesCircle': {'Nsites': 3, 'radius': 1., 'resTime': 1.},
+    'sqwGaussianModel3D': {'D': 0.5, 'variance_ux': 1.},
+    'sqwIsotropicRotationalDiffusion': {'radius': 1., 'DR': 1.},
+    'sqwJumpSitesLogNormDist': {'Nsites': 3, 'radius': 1., 'resTime': 1.,
+                                'sigma': 1.},
+    'sqwJumpTranslationalDiffusion': {'D': 0.23, 'resTime': 1.25},
+    'sqwWaterTeixeira': {'D': 0.23, 'resTime': 1.25, 'radius': 1.,
+                         'DR': 1.},
+}
+
+
+def q_grid(nq):
+    """ Momentum transfers (in 1/Angstrom) of `nq` spectra """
+    return np.linspace(0.2, 2., nq)
+
+
+def w_grid(nw):
+    """ Symmetric energy-transfer grid (in 1/ps) of `nw` points """
+    return np.linspace(-2., 2., nw)
+
+
+def resolution(w, sigma=0.02):
+    """ Gaussian instrument resolution sampled on `w` """
+    res = np.exp(-0.5 * (w / sigma) ** 2)
+    return res / np.trapz(res, w)
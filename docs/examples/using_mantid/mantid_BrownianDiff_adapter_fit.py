@@ -0,0 +1,53 @@
+"""
+mantid_BrownianDiff_adapter_fit
+===============================
+
+Same fit as `mantid_BrownianDiff_fit.py`, with the fit function generated by
+`QENSmodels.adapters.mantid`: all spectra are evaluated in one call, with
+analytic derivatives.
+To use, simply open this script in MantidWorkbench and run it.
+"""
+
+import mantid.simpleapi as mapi
+import numpy as np
+import QENSmodels
+from QENSmodels.adapters import mantid as qens_mantid
+
+# make fake data
+nb_points = 500
+hw = np.linspace(-5, 5, nb_points)
+Q = np.linspace(0.1, 0.4, 4)
+
+added_noise = np.random.normal(0, 1, (Q.size, nb_points))
+brownian_diff_noisy = QENSmodels.sqwBrownianTranslationalDiffusion(
+    hw,
+    Q,
+    scale=10,
+    center=0.1,
+    D=5
+) * (1 + 0.1 * added_noise) + 0.01 * added_noise
+
+# all spectra are concatenated in a single spectrum
+QENS_data = mapi.CreateWorkspace(DataX=np.tile(hw, Q.size),
+                                 DataY=brownian_diff_noisy.ravel(),
+                                 NSpec=1)
+
+# fit function with one scale and one center per spectrum and a shared D
+qens_mantid.subscribe('sqwBrownianTranslationalDiffusion',
+                      q=Q,
+                      name='BrownianDiffusionAllSpectra')
+
+initial_values = ','.join(
+    ['scale_{}=7.,center_{}=0.'.format(i, i) for i in range(Q.size)] +
+    ['D=2.'])
+
+mapi.Fit(Function='name=BrownianDiffusionAllSpectra,' + initial_values,
+         InputWorkspace='QENS_data',
+         CreateOutput=True,
+         MaxIterations=500,
+         Output='fit')
+
+paramTable = mapi.mtd['fit_Parameters']
+for row in range(paramTable.rowCount() - 1):
+    print('{}: {:.2f}'.format(paramTable.column(0)[row],
+                              paramTable.column(1)[row]))
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+import numpy
+
+import QENSmodels
+
+try:
+    import bumps.names as bmp
+    from bumps import fitters
+    from QENSmodels.adapters.bumps import QENSFitness
+except ImportError:
+    bmp = None
+
+
+@unittest.skipIf(bmp is None, 'bumps is not installed')
+class TestBumpsAdapter(unittest.TestCase):
+    """ Tests QENSmodels.adapters.bumps.QENSFitness """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 201)
+        self.q = numpy.array([0.4, 0.8, 1.2, 1.6])
+        self.resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        scales = numpy.array([[1.], [2.], [3.], [4.]])
+        sqw = scales * QENSmodels.sqwBrownianTranslationalDiffusion(
+            self.w, self.q, D=0.15)
+        self.data = numpy.array([
+            numpy.convolve(item, self.resolution / self.resolution.sum(),
+                           mode='same') for item in sqw])
+
+    def test_parameters(self):
+        """ Test parameters shared by all spectra or fitted per q """
+        fitness = QENSFitness('sqwDeltaLorentz', self.w, self.q, self.data,
+                              name='m_', per_q=['scale'], A0=0.2)
+        pars = fitness.parameters()
+        self.assertEqual(sorted(pars), ['A0', 'center', 'hwhm', 'scale'])
+        self.assertEqual(len(pars['A0']), 4)
+        self.assertEqual(pars['A0'][0].value, 0.2)
+        self.assertEqual(pars['A0'][0].bounds.limits, (0., 1.))
+        self.assertEqual(fitness.center.name, 'm_center')
+        self.assertTrue(fitness.center.fixed)
+
+    def test_non_fitting_parameters(self):
+        """ Test that non-fitting parameters are fixed in the model """
+        fitness = QENSFitness('sqwEquivalentSitesCircle', self.w, self.q,
+                              self.data, Nsites=5)
+        self.assertNotIn('Nsites', fitness.parameters())
+        self.assertEqual(fitness.model.fixed, {'Nsites': 5})
+
+    def test_fit(self):
+        """ Test a global fit of all spectra with a shared D """
+        fitness = QENSFitness('sqwBrownianTranslationalDiffusion', self.w,
+                              self.q, self.data, resolution=self.resolution,
+                              per_q=['scale'], D=0.05)
+        fitness.D.range(1e-3, 1.)
+        for par in fitness.scale:
+            par.range(0., 10.)
+        result = fitters.fit(bmp.FitProblem(fitness), method='lm',
+                             steps=100)
+        numpy.testing.assert_allclose(result.x, [0.15, 1., 2., 3., 4.],
+                                      rtol=1e-5)
+
+    def test_resynth_and_save(self):
+        """ Test Monte Carlo resampling and saving of the data """
+        fitness = QENSFitness('sqwBrownianTranslationalDiffusion', self.w,
+                              self.q, self.data,
+                              error=numpy.full(self.data.shape, 0.01))
+        fitness.resynth_data()
+        self.assertFalse(numpy.array_equal(fitness.y, self.data))
+        fitness.restore_data()
+        numpy.testing.assert_array_equal(fitness.y, self.data)
+
+        with tempfile.TemporaryDirectory() as directory:
+            basename = os.path.join(directory, 'fit')
+            fitness.save(basename)
+            saved = numpy.loadtxt(basename + '.dat')
+        self.assertEqual(saved.shape, (self.w.size, 1 + 3 * self.q.size))
+
+    def test_raised_errors(self):
+        """ Test unknown parameters and invalid uncertainties """
+        self.assertRaises(TypeError, QENSFitness,
+                          'sqwBrownianTranslationalDiffusion', self.w,
+                          self.q, self.data, Dt=1.)
+        self.assertRaises(ValueError, QENSFitness,
+                          'sqwBrownianTranslationalDiffusion', self.w,
+                          self.q, self.data,
+                          error=numpy.zeros(self.data.shape))
+
+
+if __name__ == '__main__':
+    unittest.main()
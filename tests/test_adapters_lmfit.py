@@ -0,0 +1,112 @@
+import unittest
+import numpy
+
+import QENSmodels
+
+try:
+    import lmfit
+    from QENSmodels.adapters.lmfit import QENSModel
+except ImportError:
+    lmfit = None
+
+
+@unittest.skipIf(lmfit is None, 'lmfit is not installed')
+class TestLmfitAdapter(unittest.TestCase):
+    """ Tests QENSmodels.adapters.lmfit.QENSModel """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 201)
+        self.q = numpy.array([0.4, 0.8, 1.2, 1.6])
+        self.resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        scales = numpy.array([[1.], [2.], [3.], [4.]])
+        sqw = scales * QENSmodels.sqwJumpTranslationalDiffusion(
+            self.w, self.q, D=0.15, resTime=0.8)
+        self.data = numpy.array([
+            numpy.convolve(item, self.resolution / self.resolution.sum(),
+                           mode='same') for item in sqw])
+
+    def test_parameters(self):
+        """ Test names, default values and bounds of the parameters """
+        model = QENSModel('sqwDeltaLorentz', self.w, self.q,
+                          per_q=['scale'], prefix='m_')
+        self.assertEqual(model.param_names,
+                         ['m_scale_{}'.format(i) for i in range(4)] +
+                         ['m_center'] +
+                         ['m_A0_{}'.format(i) for i in range(4)] +
+                         ['m_hwhm_{}'.format(i) for i in range(4)])
+        params = model.make_params()
+        self.assertEqual(params['m_A0_2'].value, 0.)
+        self.assertEqual((params['m_A0_2'].min, params['m_A0_2'].max),
+                         (0., 1.))
+        self.assertEqual(params['m_scale_0'].value, 1.)
+
+    def test_non_fitting_parameters(self):
+        """ Test that non-fitting parameters are fixed in the model """
+        model = QENSModel('sqwEquivalentSitesCircle', self.w, self.q,
+                          Nsites=5)
+        self.assertNotIn('Nsites', model.param_names)
+        self.assertEqual(model.bound.fixed, {'Nsites': 5})
+
+    def test_jacobian(self):
+        """ Test the analytic Jacobian against finite differences """
+        model = QENSModel('sqwJumpTranslationalDiffusion', self.w, self.q,
+                          self.resolution, per_q=['scale'])
+        params = model.make_params(D=0.1, resTime=0.5, center=0.01)
+        for i in range(4):
+            params['scale_{}'.format(i)].value = i + 1.
+        weights = numpy.full(self.data.size, 2.)
+        jacobian = model.jacobian(params, weights=weights)
+        self.assertEqual(jacobian.shape, (self.data.size, 7))
+
+        for column, name in enumerate(params):
+            # the hwhm functions work in single precision: large steps
+            step = 1e-2 * params[name].value
+            values = params.valuesdict()
+            values[name] += step
+            plus = model.eval(**values)
+            values[name] -= 2. * step
+            minus = model.eval(**values)
+            expected = 2. * (plus - minus) / (2. * step)
+            numpy.testing.assert_allclose(
+                jacobian[:, column], expected, rtol=0,
+                atol=1e-3 * numpy.abs(expected).max(), err_msg=name)
+
+    def test_fit(self):
+        """ Test a global fit with resolution and analytic derivatives """
+        model = QENSModel('sqwJumpTranslationalDiffusion', self.w, self.q,
+                          self.resolution, per_q=['scale'])
+        params = model.make_params(D=0.05, resTime=0.5)
+        params['center'].vary = False
+        result = model.fit(self.data, params)
+        self.assertTrue(result.success)
+        numpy.testing.assert_allclose(
+            [result.params[name].value
+             for name in ('D', 'resTime', 'scale_0', 'scale_3')],
+            [0.15, 0.8, 1., 4.], rtol=1e-4)
+        self.assertEqual(result.best_fit.shape, (self.data.size,))
+
+    def test_expression_constraint(self):
+        """ Test fits with parameters constrained by expressions """
+        model = QENSModel('sqwJumpTranslationalDiffusion', self.w, self.q,
+                          self.resolution, per_q=['scale'])
+        params = model.make_params(D=0.05, resTime=0.5)
+        params['center'].vary = False
+        for i in range(1, 4):
+            params['scale_{}'.format(i)].expr = '{} * scale_0'.format(i + 1)
+        result = model.fit(self.data, params)
+        numpy.testing.assert_allclose(
+            [result.params[name].value for name in ('D', 'scale_3')],
+            [0.15, 4.], rtol=1e-4)
+
+    def test_raised_errors(self):
+        """ Test unknown and invalid parameters """
+        self.assertRaises(ValueError, QENSModel,
+                          'sqwBrownianTranslationalDiffusion', self.w,
+                          self.q, per_q=['D'])
+        self.assertRaises(TypeError, QENSModel,
+                          'sqwBrownianTranslationalDiffusion', self.w,
+                          self.q, Dt=1.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import unittest
+import numpy
+
+import QENSmodels
+from QENSmodels.adapters import mantid
+
+
+class IFunction1D:
+    """ Stand-in of mantid.api.IFunction1D, as used by the adapter """
+
+    def __init__(self):
+        self._names = []
+        self._parameters = {}
+        self._attributes = {}
+        self.constraints = []
+        self.init()
+
+    def declareParameter(self, name, value=0., description=''):
+        self._names.append(name)
+        self._parameters[name] = value
+
+    def nParams(self):
+        return len(self._names)
+
+    def parameterName(self, index):
+        return self._names[index]
+
+    def getParameterValue(self, name):
+        return self._parameters[name]
+
+    def setParameter(self, name, value):
+        self._parameters[name] = value
+
+    def declareAttribute(self, name, value):
+        self._attributes[name] = value
+
+    def getAttributeValue(self, name):
+        return self._attributes[name]
+
+    def setAttributeValue(self, name, value):
+        self._attributes[name] = value
+
+    def addConstraints(self, constraints):
+        self.constraints.extend(constraints.split(','))
+
+
+class Jacobian:
+    """ Stand-in of the Jacobian passed to functionDeriv1D, initialised to
+    zero as in Mantid """
+
+    def __init__(self, npoints, nparams):
+        self.values = numpy.zeros((npoints, nparams))
+
+    def set(self, iy, ip, value):
+        self.values[iy, ip] = value
+
+
+class TestMantidAdapter(unittest.TestCase):
+    """ Tests QENSmodels.adapters.mantid """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 201)
+        self.q = numpy.array([0.4, 0.8, 1.2])
+
+    def finite_differences(self, function, xvals):
+        """ Derivatives of function1D with respect to all parameters """
+        columns = []
+        for index in range(function.nParams()):
+            name = function.parameterName(index)
+            value = function.getParameterValue(name)
+            # the hwhm functions work in single precision: large steps
+            step = 1e-2 * value if value else 1e-4
+            function.setParameter(name, value + step)
+            plus = function.function1D(xvals)
+            function.setParameter(name, value - step)
+            minus = function.function1D(xvals)
+            function.setParameter(name, value)
+            columns.append((plus - minus) / (2. * step))
+        return numpy.array(columns).T
+
+    def test_single_spectrum(self):
+        """ Test evaluation and derivatives of one spectrum """
+        cls = mantid.make_function('sqwEquivalentSitesCircle',
+                                   base=IFunction1D)
+        self.assertEqual(cls.__name__, 'sqwEquivalentSitesCircle')
+        function = cls()
+        self.assertEqual(function.category(), 'QuasiElastic')
+        self.assertEqual(function._names,
+                         ['scale', 'center', 'radius', 'resTime'])
+        self.assertEqual(function._attributes, {'Q': 1., 'Nsites': 3})
+        self.assertIn('0.0<scale', function.constraints)
+
+        function.setAttributeValue('Q', 0.8)
+        function.setAttributeValue('Nsites', 5)
+        function.setParameter('scale', 2.)
+        function.setParameter('resTime', 0.5)
+        numpy.testing.assert_allclose(
+            function.function1D(self.w),
+            QENSmodels.sqwEquivalentSitesCircle(self.w, 0.8, 2., 0., 5, 1.,
+                                                0.5),
+            rtol=1e-12)
+
+        jacobian = Jacobian(self.w.size, function.nParams())
+        function.functionDeriv1D(self.w, jacobian)
+        expected = self.finite_differences(function, self.w)
+        # no derivative of the elastic line with respect to the center
+        numpy.testing.assert_allclose(
+            jacobian.values[:, [0, 2, 3]], expected[:, [0, 2, 3]], rtol=0,
+            atol=1e-3 * numpy.abs(expected).max())
+
+    def test_all_spectra(self):
+        """ Test evaluation and derivatives of all spectra at once """
+        resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        cls = mantid.make_all_spectra_function(
+            'sqwJumpTranslationalDiffusion', self.q, resolution=resolution,
+            base=IFunction1D)
+        self.assertEqual(cls.__name__,
+                         'sqwJumpTranslationalDiffusionAllSpectra')
+        function = cls()
+        self.assertEqual(function._names,
+                         ['scale_0', 'scale_1', 'scale_2', 'center_0',
+                          'center_1', 'center_2', 'D', 'resTime'])
+        for i in range(3):
+            function.setParameter('scale_{}'.format(i), i + 1.)
+            function.setParameter('center_{}'.format(i), 0.01 * i)
+        function.setParameter('D', 0.1)
+        function.setParameter('resTime', 0.5)
+
+        xvals = numpy.tile(self.w, self.q.size)
+        expected = [numpy.convolve(
+            QENSmodels.sqwJumpTranslationalDiffusion(
+                self.w, q, i + 1., 0.01 * i, 0.1, 0.5),
+            resolution / resolution.sum(), mode='same')
+            for i, q in enumerate(self.q)]
+        numpy.testing.assert_allclose(function.function1D(xvals),
+                                      numpy.ravel(expected), rtol=1e-6,
+                                      atol=1e-12)
+
+        jacobian = Jacobian(xvals.size, function.nParams())
+        function.functionDeriv1D(xvals, jacobian)
+        numpy.testing.assert_allclose(
+            jacobian.values, self.finite_differences(function, xvals),
+            rtol=0, atol=1e-3 * numpy.abs(jacobian.values).max())
+
+    def test_bound_model_cache(self):
+        """ Test that the bound model is rebuilt only when needed """
+        function = mantid.make_function('sqwBrownianTranslationalDiffusion',
+                                        base=IFunction1D)()
+        function.function1D(self.w)
+        bound = function._bound
+        function.setParameter('D', 0.5)
+        function.function1D(self.w)
+        self.assertIs(function._bound, bound)
+        function.setAttributeValue('Q', 0.5)
+        function.function1D(self.w)
+        self.assertIsNot(function._bound, bound)
+
+    def test_raised_errors(self):
+        """ Test invalid domains and per-spectrum parameters """
+        function = mantid.make_all_spectra_function(
+            'sqwBrownianTranslationalDiffusion', self.q,
+            base=IFunction1D)()
+        self.assertRaises(ValueError, function.function1D, self.w[:-1])
+        xvals = numpy.concatenate([self.w, self.w, 2. * self.w])
+        self.assertRaises(ValueError, function.function1D, xvals)
+        self.assertRaises(ValueError, mantid.make_all_spectra_function,
+                          'sqwBrownianTranslationalDiffusion', self.q,
+                          per_q=['D'], base=IFunction1D)
+        if mantid.IFunction1D is None:
+            self.assertRaises(ImportError, mantid.make_function,
+                              'sqwBrownianTranslationalDiffusion')
+            self.assertRaises(ImportError, mantid.subscribe,
+                              'sqwBrownianTranslationalDiffusion')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -63,6 +63,51 @@ class TestBackgroundPolynomials(unittest.TestCase):
             actual_data,
             decimal=13)
 
+    def test_per_q_coefficients(self):
+        """ Test the backgrounds of all spectra against one call per
+        spectrum """
+        w = numpy.linspace(-2, 2, 101)
+        coefficients = numpy.array([[1., 2., 3.],
+                                    [0.5, 0., -1.],
+                                    [0., 0., 0.]])
+        expected = [QENSmodels.background_polynomials(w, list(row))
+                    for row in coefficients]
+        numpy.testing.assert_allclose(
+            QENSmodels.polynomial_backgrounds(w, coefficients), expected,
+            rtol=1e-13)
+        numpy.testing.assert_allclose(
+            QENSmodels.background_polynomials(w, coefficients), expected,
+            rtol=1e-13)
+        bound = QENSmodels.BoundBackground(w, 2)
+        numpy.testing.assert_allclose(bound(coefficients), expected,
+                                      rtol=1e-13, atol=1e-14)
+
+        # added to an existing array, e.g. the model
+        out = numpy.ones((3, w.size))
+        self.assertIs(bound(coefficients, out=out), out)
+        numpy.testing.assert_allclose(out, numpy.add(expected, 1.),
+                                      rtol=1e-13)
+        out = numpy.ones((3, w.size))
+        QENSmodels.polynomial_backgrounds(w, coefficients, out=out)
+        numpy.testing.assert_allclose(out, numpy.add(expected, 1.),
+                                      rtol=1e-13)
+
+        self.assertRaises(ValueError, QENSmodels.polynomial_backgrounds, w,
+                          coefficients[0])
+        self.assertRaises(ValueError, QENSmodels.BoundBackground, w, -1)
+
+    def test_jacobian(self):
+        """ Test the derivatives with respect to the coefficients """
+        w = numpy.linspace(-2, 2, 11)
+        bound = QENSmodels.BoundBackground(w, 3)
+        coefficients = numpy.array([[0.1, 0.2, 0.3, 0.4]])
+        for k in range(4):
+            step = numpy.zeros((1, 4))
+            step[0, k] = 1.
+            numpy.testing.assert_allclose(
+                bound(coefficients + step) - bound(coefficients),
+                bound.jacobian[k:k + 1], atol=1e-12)
+
 
 if __name__ == '__main__':
     unittest.main()
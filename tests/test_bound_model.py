@@ -0,0 +1,123 @@
+import unittest
+import numpy
+
+import QENSmodels
+
+
+class TestBoundModel(unittest.TestCase):
+    """ Tests QENSmodels.BoundModel """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 301)
+        self.q = numpy.array([0.3, 0.9, 1.5])
+
+    def test_matches_model(self):
+        """ Test that a bound model gives the same result as the function """
+        bound = QENSmodels.BoundModel('sqwEquivalentSitesCircle', self.w,
+                                      self.q, Nsites=4)
+        numpy.testing.assert_allclose(
+            bound(scale=2., radius=1.5, resTime=0.5),
+            QENSmodels.sqwEquivalentSitesCircle(self.w, self.q, 2., 0., 4,
+                                                1.5, 0.5),
+            rtol=1e-12)
+
+    def test_resolution(self):
+        """ Test convolution with the resolution of each spectrum """
+        resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        bound = QENSmodels.BoundModel('sqwJumpTranslationalDiffusion',
+                                      self.w, self.q, resolution)
+        sqw = QENSmodels.sqwJumpTranslationalDiffusion(self.w, self.q)
+        expected = [numpy.convolve(item, resolution / resolution.sum(),
+                                   mode='same') for item in sqw]
+        numpy.testing.assert_allclose(bound(), expected, rtol=1e-6,
+                                      atol=1e-12)
+
+    def test_jacobian(self):
+        """ Test analytic derivatives against finite differences """
+        models = {
+            'sqwBrownianTranslationalDiffusion': {'D': 0.3},
+            'sqwChudleyElliottDiffusion': {'D': 0.2, 'L': 1.5},
+            'sqwDeltaTwoLorentz': {'A0': 0.1, 'A1': [0.2, 0.3, 0.4],
+                                   'hwhm1': 0.05, 'hwhm2': 0.5},
+            'sqwJumpSitesLogNormDist': {'radius': 2., 'resTime': 0.5,
+                                        'sigma': 0.5},
+            'sqwWaterTeixeira': {'D': 0.2, 'resTime': 1., 'radius': 1.,
+                                 'DR': 0.5},
+        }
+        resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        for model, params in models.items():
+            bound = QENSmodels.BoundModel(model, self.w, self.q, resolution)
+            params = {name: numpy.asarray(value, dtype=float)
+                      for name, value in params.items()}
+            params['scale'] = numpy.array([1., 2., 3.])
+            jacobian = bound.jacobian(**params)
+            self.assertEqual(sorted(jacobian),
+                             sorted(list(params) + ['center']))
+            for name, value in params.items():
+                # the hwhm functions work in single precision: large steps
+                step = 1e-2 * value
+                plus = dict(params, **{name: value + step})
+                minus = dict(params, **{name: value - step})
+                expected = (bound(**plus) - bound(**minus)) / \
+                    (2. * numpy.reshape(step, (-1, 1)))
+                numpy.testing.assert_allclose(
+                    jacobian[name], expected, rtol=0,
+                    atol=1e-3 * numpy.abs(expected).max(),
+                    err_msg='{} {}'.format(model, name))
+
+    def test_jacobian_center(self):
+        """ Test the derivative with respect to the center """
+        bound = QENSmodels.BoundModel('sqwJumpTranslationalDiffusion',
+                                      self.w, self.q)
+        jacobian = bound.jacobian(names=['center'], center=0.1)
+        expected = (bound(center=0.10001) - bound(center=0.09999)) / 2e-5
+        numpy.testing.assert_allclose(jacobian['center'], expected,
+                                      rtol=0,
+                                      atol=1e-4 * numpy.abs(expected).max())
+        self.assertRaises(ValueError, bound.jacobian, names=['Nsites'])
+
+    def test_time_domain(self):
+        """ Test convolution in the time domain and its derivatives """
+        resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        sampled = QENSmodels.BoundModel('sqwWaterTeixeira', self.w, self.q,
+                                        resolution)
+        bound = QENSmodels.BoundModel('sqwWaterTeixeira', self.w, self.q,
+                                      resolution, time_domain=True)
+        params = {'scale': numpy.array([1., 2., 3.]),
+                  'center': numpy.array([0.01, 0., -0.02]),
+                  'D': 0.2, 'resTime': 1., 'radius': 1., 'DR': 0.5}
+        # the lines are wider than the energy step: same as the sampled
+        # model, away from the edges
+        numpy.testing.assert_allclose(bound(**params)[:, 50:-50],
+                                      sampled(**params)[:, 50:-50],
+                                      rtol=0, atol=1e-3)
+
+        jacobian = bound.jacobian(**params)
+        for name, value in params.items():
+            step = 1e-2 * numpy.abs(value) + 1e-5 * (name == 'center')
+            plus = dict(params, **{name: value + step})
+            minus = dict(params, **{name: value - step})
+            expected = (bound(**plus) - bound(**minus)) / \
+                (2. * numpy.reshape(step, (-1, 1)))
+            numpy.testing.assert_allclose(
+                jacobian[name], expected, rtol=0,
+                atol=1e-3 * numpy.abs(expected).max(), err_msg=name)
+        self.assertRaises(ValueError, QENSmodels.BoundModel,
+                          'sqwWaterTeixeira', self.w, self.q,
+                          time_domain=True)
+
+    def test_raised_errors(self):
+        """ Test validation of fixed parameters and resolution shape """
+        self.assertRaises(ValueError, QENSmodels.BoundModel,
+                          'sqwEquivalentSitesCircle', self.w, self.q,
+                          Nsites=1)
+        self.assertRaises(TypeError, QENSmodels.BoundModel,
+                          'sqwEquivalentSitesCircle', self.w, self.q,
+                          sites=3)
+        self.assertRaises(ValueError, QENSmodels.BoundModel,
+                          'sqwBrownianTranslationalDiffusion', self.w,
+                          self.q, numpy.ones((2, self.w.size)))
+
+
+if __name__ == '__main__':
+    unittest.main()
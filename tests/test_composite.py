@@ -0,0 +1,98 @@
+import unittest
+import numpy
+
+import QENSmodels
+from QENSmodels.composite import Component, convolve
+
+
+class TestComposite(unittest.TestCase):
+    """ Tests QENSmodels.composite """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 401)
+        self.q = numpy.array([0.3, 0.9, 1.5])
+
+    def test_sum(self):
+        """ Test a sum of a Lorentzian, a delta and a model """
+        model = (Component('lorentzian', prefix='l_') +
+                 Component('delta', prefix='d_') +
+                 Component('sqwEquivalentSitesCircle', Nsites=4))
+        self.assertEqual(model.parameter_names,
+                         ['l_scale', 'l_center', 'l_hwhm', 'd_scale',
+                          'd_center', 'scale', 'center', 'radius',
+                          'resTime'])
+        result = model(self.w, self.q, l_scale=0.5, l_center=0.1,
+                       l_hwhm=[0.1, 0.2, 0.3], d_scale=0.2, scale=2.,
+                       radius=1.5, resTime=0.5)
+        expected = [
+            QENSmodels.lorentzian(self.w, 0.5, 0.1, hwhm) +
+            QENSmodels.delta(self.w, 0.2, 0.) +
+            QENSmodels.sqwEquivalentSitesCircle(self.w, q, 2., 0., 4, 1.5,
+                                                0.5)
+            for q, hwhm in zip(self.q, [0.1, 0.2, 0.3])]
+        numpy.testing.assert_allclose(result, expected, rtol=1e-12,
+                                      atol=1e-12)
+
+    def test_scaled_and_shared_parameters(self):
+        """ Test scaling and parameters shared by components """
+        model = 2. * Component('sqwBrownianTranslationalDiffusion') + \
+            Component('lorentzian') * [1., 2., 3.]
+        self.assertEqual(model.parameter_names,
+                         ['scale', 'center', 'D', 'hwhm'])
+        result = model(self.w, self.q, scale=0.5, center=0.1, D=0.2)
+        expected = [
+            2. * QENSmodels.sqwBrownianTranslationalDiffusion(
+                self.w, q, 0.5, 0.1, 0.2) +
+            factor * QENSmodels.lorentzian(self.w, 0.5, 0.1, 1.)
+            for q, factor in zip(self.q, [1., 2., 3.])]
+        numpy.testing.assert_allclose(result, expected, rtol=1e-6)
+
+    def test_convolution(self):
+        """ Test that translation convolved with rotation is the model of
+        Teixeira """
+        model = convolve(
+            Component('sqwJumpTranslationalDiffusion'),
+            Component('sqwIsotropicRotationalDiffusion', prefix='r_'))
+        result = model(self.w, self.q, scale=2., D=0.2, resTime=1.,
+                       r_radius=1., r_DR=0.5)
+        expected = QENSmodels.sqwWaterTeixeira(self.w, self.q, 2., 0., 0.2,
+                                               1., 1., 0.5)
+        numpy.testing.assert_allclose(result, expected, rtol=1e-5,
+                                      atol=1e-6 * expected.max())
+
+    def test_merged_lines(self):
+        """ Test that coincident lines are merged before evaluation """
+        model = Component('sqwDeltaLorentz', prefix='a_') + \
+            Component('sqwDeltaLorentz', prefix='b_')
+        lines = model.lines(self.q, a_A0=0.2, b_A0=0.5, a_hwhm=0.1,
+                            b_hwhm=0.1)
+        self.assertEqual(lines.nlines, 4)
+        merged = lines.merged()
+        self.assertEqual(merged.nlines, 2)
+        numpy.testing.assert_allclose(merged.weights, [[0.7, 1.3]] * 3)
+
+    def test_single_q(self):
+        """ Test that one momentum transfer gives one spectrum """
+        result = Component('sqwBrownianTranslationalDiffusion')(self.w, 1.)
+        self.assertEqual(result.shape, self.w.shape)
+
+    def test_raised_errors(self):
+        """ Test unknown models and invalid parameters """
+        self.assertRaises(KeyError, Component, 'gaussian')
+        self.assertRaises(TypeError, Component, 'lorentzian', Nsites=3)
+        model = Component('sqwBrownianTranslationalDiffusion')
+        self.assertRaises(TypeError, model, self.w, self.q, L=1.)
+        self.assertRaises(ValueError, model, self.w, self.q, D=-1.)
+
+    def test_abstract(self):
+        """ Test that expressions without lines cannot be created """
+        self.assertRaises(TypeError, QENSmodels.composite.Expression)
+
+        class Incomplete(QENSmodels.composite.Expression):
+            components = []
+
+        self.assertRaises(TypeError, Incomplete)
+
+
+if __name__ == '__main__':
+    unittest.main()
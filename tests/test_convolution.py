@@ -0,0 +1,120 @@
+import unittest
+import numpy
+from scipy.special import voigt_profile
+
+from QENSmodels.convolution import ResolutionOperator, TimeDomainConvolution
+from QENSmodels.lines import LineList
+
+
+class TestResolutionOperator(unittest.TestCase):
+    """ Tests convolution with cached resolution spectra """
+
+    def setUp(self):
+        rng = numpy.random.default_rng(1)
+        self.model = rng.random((4, 200))
+
+    def reference(self, resolution):
+        resolution = numpy.broadcast_to(resolution, self.model.shape[:1] +
+                                        resolution.shape[-1:])
+        return numpy.array([
+            numpy.convolve(spectrum, kernel / kernel.sum(), mode='same')
+            for spectrum, kernel in zip(self.model, resolution)])
+
+    def test_same_as_numpy_convolve(self):
+        """ Test that the result matches numpy.convolve(mode='same') """
+        w = numpy.linspace(-1, 1, 200)
+        resolution = numpy.exp(-0.5 * (w[None, :] / [[0.05], [0.1], [0.2],
+                                                     [0.3]]) ** 2)
+        operator = ResolutionOperator(resolution)
+        numpy.testing.assert_allclose(operator(self.model),
+                                      self.reference(resolution),
+                                      atol=1e-12)
+
+    def test_shared_resolution(self):
+        """ Test a single resolution spectrum applied to all spectra """
+        resolution = numpy.hanning(51)
+        operator = ResolutionOperator(resolution)
+        numpy.testing.assert_allclose(operator(self.model),
+                                      self.reference(resolution),
+                                      atol=1e-12)
+        # 1D input
+        numpy.testing.assert_allclose(operator(self.model[0]),
+                                      self.reference(resolution)[0],
+                                      atol=1e-12)
+
+    def test_raised_error_wrong_number_of_spectra(self):
+        """ Test that an error is raised if the numbers of spectra differ """
+        operator = ResolutionOperator(numpy.ones((3, 200)))
+        self.assertRaises(ValueError, operator, self.model)
+
+
+class TestTimeDomainConvolution(unittest.TestCase):
+    """ Tests convolution of lines in the time domain """
+
+    def setUp(self):
+        self.w = numpy.linspace(-1, 1, 201)
+        self.sigma = numpy.array([[0.04], [0.05], [0.1]])
+        self.resolution = numpy.exp(-0.5 * (self.w / self.sigma) ** 2)
+        self.operator = TimeDomainConvolution(self.w, self.resolution)
+
+    def test_voigt_profiles(self):
+        """ Test Lorentzians of any width against Voigt profiles """
+        widths = numpy.array([1e-5, 1e-3, 0.05, 1., 20.])
+        centers = numpy.array([0., 0.0137, -0.1, 0.2, 0.])
+        lines = LineList(numpy.ones((3, 5)), widths, centers)
+        expected = sum(voigt_profile(self.w - center, self.sigma, width)
+                       for width, center in zip(widths, centers))
+        numpy.testing.assert_allclose(self.operator(lines), expected,
+                                      rtol=0, atol=1e-10)
+
+    def test_elastic_line(self):
+        """ Test that an elastic line gives the resolution """
+        lines = LineList([[2.], [2.], [2.]], 0., 0.)
+        numpy.testing.assert_allclose(
+            self.operator(lines),
+            2. * self.resolution / self.resolution.sum(axis=1,
+                                                       keepdims=True) /
+            (self.w[1] - self.w[0]), rtol=0, atol=1e-10)
+
+    def test_sampled_convolution(self):
+        """ Test lines wider than the energy step against the convolution
+        of the sampled model, away from the edges """
+        lines = LineList(numpy.ones((3, 2)), [[0.05, 0.2]], 0.)
+        expected = ResolutionOperator(self.resolution)(
+            lines.evaluate(self.w))
+        numpy.testing.assert_allclose(self.operator(lines)[:, 50:-50],
+                                      expected[:, 50:-50], rtol=1e-3)
+
+    def test_derivatives(self):
+        """ Test derivatives with respect to widths and centers against
+        finite differences """
+        weights = numpy.array([[1., 0.5]])
+        widths = numpy.array([[0.003, 0.3]])
+        centers = numpy.array([[0.01, -0.05]])
+        operator = TimeDomainConvolution(self.w, self.resolution[1])
+
+        def spectra(widths, centers):
+            return operator(LineList(weights, widths, centers))
+
+        step = 1e-6
+        expected = (spectra(widths + step, centers) -
+                    spectra(widths - step, centers)) / (2. * step)
+        numpy.testing.assert_allclose(
+            operator.width_derivative(LineList(weights, widths, centers)),
+            expected, rtol=0, atol=1e-6 * numpy.abs(expected).max())
+        expected = (spectra(widths, centers + step) -
+                    spectra(widths, centers - step)) / (2. * step)
+        numpy.testing.assert_allclose(
+            operator.center_derivative(LineList(weights, widths, centers)),
+            expected, rtol=0, atol=1e-6 * numpy.abs(expected).max())
+
+    def test_raised_errors(self):
+        """ Test uneven energy transfers and wrong numbers of spectra """
+        self.assertRaises(ValueError, TimeDomainConvolution,
+                          numpy.square(self.w), self.resolution)
+        lines = LineList(numpy.ones((2, 1)), 0.1, 0.)
+        self.assertRaises(ValueError, self.operator, lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
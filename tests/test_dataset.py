@@ -0,0 +1,50 @@
+import unittest
+import numpy
+
+import QENSmodels
+
+
+class TestQENSDataset(unittest.TestCase):
+    """ Tests QENSmodels.QENSDataset container """
+
+    def setUp(self):
+        self.w = numpy.linspace(-1, 1, 5)
+        self.q = numpy.array([0.2, 0.4, 0.6])
+        self.data = numpy.arange(15.).reshape(3, 5)
+
+    def test_shapes(self):
+        """ Test that inputs are stored as float arrays of matching shape """
+        dataset = QENSmodels.QENSDataset(self.w, self.q, self.data,
+                                         numpy.sqrt(self.data))
+        self.assertEqual(dataset.nq, 3)
+        self.assertEqual(dataset.nw, 5)
+        self.assertEqual(dataset.error.shape, (3, 5))
+        self.assertEqual(dataset.metadata, {})
+
+    def test_single_spectrum(self):
+        """ Test that a 1D spectrum with a float q is reshaped to 2D """
+        dataset = QENSmodels.QENSDataset(self.w, 0.5, self.data[0])
+        self.assertEqual(dataset.data.shape, (1, 5))
+        self.assertIsNone(dataset.error)
+
+    def test_raised_error_wrong_shape(self):
+        """ Test that an error is raised if data does not match w and q """
+        self.assertRaises(ValueError,
+                          QENSmodels.QENSDataset,
+                          self.w[:4], self.q, self.data)
+
+    def test_iter_blocks(self):
+        """ Test splitting of the dataset in blocks of spectra """
+        dataset = QENSmodels.QENSDataset(self.w, self.q, self.data,
+                                         metadata={'title': 'test'})
+        blocks = list(dataset.iter_blocks(2))
+        self.assertEqual([block.nq for block in blocks], [2, 1])
+        numpy.testing.assert_array_equal(blocks[1].data, self.data[2:])
+        numpy.testing.assert_array_equal(blocks[1].q, [0.6])
+        self.assertEqual(blocks[0].metadata['title'], 'test')
+
+        self.assertRaises(ValueError, next, dataset.iter_blocks(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
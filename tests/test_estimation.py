@@ -0,0 +1,100 @@
+import unittest
+import numpy
+
+import QENSmodels
+from QENSmodels import registry
+
+
+class TestEstimation(unittest.TestCase):
+    """ Tests QENSmodels.estimation """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 401)
+        self.q = numpy.linspace(0.3, 2., 10)
+        self.resolution = numpy.exp(-0.5 * (self.w / 0.03) ** 2)
+        self.params = {
+            'sqwBrownianTranslationalDiffusion': {'D': 0.2},
+            'sqwChudleyElliottDiffusion': {'D': 0.2, 'L': 1.5},
+            'sqwDeltaLorentz': {'A0': 0.3, 'hwhm': 0.3},
+            'sqwDeltaTwoLorentz': {'A0': 0.3, 'A1': 0.3, 'hwhm1': 0.1,
+                                   'hwhm2': 0.6},
+            'sqwEquivalentSitesCircle': {'Nsites': 3, 'radius': 1.5,
+                                         'resTime': 2.},
+            'sqwGaussianModel3D': {'D': 0.3, 'variance_ux': 0.5},
+            'sqwIsotropicRotationalDiffusion': {'radius': 1.3, 'DR': 0.2},
+            'sqwJumpSitesLogNormDist': {'Nsites': 3, 'radius': 1.5,
+                                        'resTime': 2., 'sigma': 0.3},
+            'sqwJumpTranslationalDiffusion': {'D': 0.2, 'resTime': 1.},
+            'sqwWaterTeixeira': {'D': 0.2, 'resTime': 1., 'radius': 1.,
+                                 'DR': 0.3},
+        }
+
+    def data(self, model):
+        return QENSmodels.BoundModel(model, self.w, self.q, self.resolution)(
+            scale=2., center=0.1, **self.params[model])
+
+    def test_apparent_lines(self):
+        """ Test the elastic fraction, intensity and width of spectra made
+        of an elastic line and a Lorentzian """
+        hwhm = numpy.linspace(0.05, 0.8, self.q.size)
+        eisf = numpy.linspace(0.9, 0.1, self.q.size)
+        data = QENSmodels.BoundModel('sqwDeltaLorentz', self.w, self.q,
+                                     self.resolution)(
+            scale=self.q, center=0.1, A0=eisf, hwhm=hwhm)
+        lines = QENSmodels.apparent_lines(self.w, data + 0.01,
+                                          self.resolution)
+        self.assertAlmostEqual(lines['center'], 0.1, 6)
+        numpy.testing.assert_allclose(lines['hwhm'], hwhm, rtol=5e-3)
+        numpy.testing.assert_allclose(lines['eisf'], eisf, rtol=5e-3)
+        numpy.testing.assert_allclose(lines['intensity'], self.q, rtol=1e-2)
+
+    def test_estimates(self):
+        """ Test that the estimates of all models are close to the values
+        of the parameters of noiseless data """
+        for model in registry.names():
+            fixed = {'Nsites': 3} if model in (
+                'sqwEquivalentSitesCircle', 'sqwJumpSitesLogNormDist') \
+                else {}
+            initial = QENSmodels.estimate_initial(
+                model, self.w, self.q, self.data(model), self.resolution,
+                **fixed)
+            spec = registry.get(model)
+            self.assertEqual(sorted(initial), sorted(spec.parameter_names))
+            self.assertAlmostEqual(initial['center'], 0.1, 6)
+            numpy.testing.assert_allclose(initial['scale'], 2., rtol=0.3,
+                                          err_msg=model)
+            for name, value in self.params[model].items():
+                self.assertTrue(spec[name].default <= 0 or
+                                numpy.all(initial[name] > 0))
+                if name in ('D', 'radius') or model == 'sqwDeltaLorentz':
+                    numpy.testing.assert_allclose(
+                        initial[name], value, rtol=0.25,
+                        err_msg='{} {}'.format(model, name))
+
+    def test_fit(self):
+        """ Test fits started from the estimates """
+        for model in ['sqwGaussianModel3D', 'sqwIsotropicRotationalDiffusion',
+                      'sqwJumpTranslationalDiffusion']:
+            data = self.data(model)
+            initial = QENSmodels.estimate_initial(model, self.w, self.q,
+                                                  data, self.resolution)
+            separable = QENSmodels.SeparableModel(
+                model, self.w, self.q, self.resolution, center=0.1)
+            result = separable.fit(data, **{
+                name: initial[name] for name in separable.nonlinear})
+            for name, value in self.params[model].items():
+                numpy.testing.assert_allclose(result.params[name], value,
+                                              rtol=1e-5, err_msg=name)
+
+    def test_errors(self):
+        """ Test the errors raised for invalid inputs """
+        self.assertRaises(TypeError, QENSmodels.estimate_initial,
+                          'sqwDeltaLorentz', self.w, self.q,
+                          self.data('sqwDeltaLorentz'), radius=1.)
+        self.assertRaises(KeyError, QENSmodels.estimate_initial,
+                          'sqwUnknown', self.w, self.q,
+                          self.data('sqwDeltaLorentz'))
+
+
+if __name__ == '__main__':
+    unittest.main()
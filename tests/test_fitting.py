@@ -0,0 +1,489 @@
+import os
+import tempfile
+import unittest
+import numpy
+from scipy.optimize import least_squares, minimize
+from scipy.stats import poisson
+
+import QENSmodels
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+class TestSeparableModel(unittest.TestCase):
+    """ Tests QENSmodels.fitting """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 301)
+        self.q = numpy.array([0.3, 0.7, 1.1, 1.5])
+        self.resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        self.scale = numpy.array([1., 2., 3., 4.])
+
+    def test_parameters(self):
+        """ Test the split of the parameters into linear and nonlinear """
+        model = QENSmodels.SeparableModel('sqwDeltaTwoLorentz', self.w,
+                                          self.q, center=0.)
+        self.assertEqual(model.linear, ['scale', 'A0', 'A1'])
+        self.assertEqual(model.nonlinear, ['hwhm1', 'hwhm2'])
+        # one value of each width per spectrum
+        self.assertEqual(model.size, 2 * self.q.size)
+
+        # fractions are not separable when one of them is fixed
+        model = QENSmodels.SeparableModel('sqwDeltaTwoLorentz', self.w,
+                                          self.q, A0=0.2)
+        self.assertEqual(model.linear, ['scale'])
+        self.assertEqual(model.nonlinear, ['center', 'A1', 'hwhm1', 'hwhm2'])
+
+    def test_fit(self):
+        """ Test that fits recover the parameters of noiseless data with a
+        linear background """
+        bound = QENSmodels.BoundModel('sqwDeltaTwoLorentz', self.w, self.q,
+                                      self.resolution)
+        params = {'A0': numpy.array([0.1, 0.2, 0.3, 0.4]), 'A1': 0.3,
+                  'hwhm1': 0.1, 'hwhm2': numpy.array([0.5, 0.6, 0.7, 0.8])}
+        data = bound(scale=self.scale, **params) + 0.02 + 0.01 * self.w
+        model = QENSmodels.SeparableModel(
+            'sqwDeltaTwoLorentz', self.w, self.q, self.resolution,
+            background=1, center=0.)
+        result = model.fit(data, hwhm1=0.2, hwhm2=1.)
+        self.assertTrue(result.success)
+        numpy.testing.assert_allclose(result.params['scale'], self.scale,
+                                      rtol=1e-6)
+        for name, value in params.items():
+            numpy.testing.assert_allclose(
+                result.params[name], numpy.broadcast_to(value, (4,)),
+                rtol=1e-5, err_msg=name)
+        numpy.testing.assert_allclose(
+            result.background, numpy.tile([0.02, 0.01], (4, 1)), atol=1e-8)
+        numpy.testing.assert_allclose(result.best_fit, data, atol=1e-8)
+
+    def test_fewer_evaluations(self):
+        """ Test that solving the scale factors takes fewer evaluations
+        than fitting them with the other parameters """
+        bound = QENSmodels.BoundModel('sqwIsotropicRotationalDiffusion',
+                                      self.w, self.q, self.resolution,
+                                      center=0.)
+        data = bound(scale=self.scale, radius=1.3, DR=0.4)
+        model = QENSmodels.SeparableModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q,
+            self.resolution, center=0.)
+        result = model.fit(data, radius=0.5, DR=0.1)
+        numpy.testing.assert_allclose(result.x, [1.3, 0.4], rtol=1e-5)
+
+        def residuals(x):
+            return (bound(scale=x[2:], radius=x[0], DR=x[1]) - data).ravel()
+
+        def jacobian(x):
+            derivatives = bound.jacobian(['radius', 'DR', 'scale'],
+                                         scale=x[2:], radius=x[0], DR=x[1])
+            columns = [derivatives['radius'].ravel(),
+                       derivatives['DR'].ravel()]
+            for i in range(self.q.size):
+                column = numpy.zeros(bound.shape)
+                column[i] = derivatives['scale'][i]
+                columns.append(column.ravel())
+            return numpy.array(columns).T
+
+        full = least_squares(residuals, [0.5, 0.1, 1., 1., 1., 1.],
+                             jac=jacobian, bounds=(0., numpy.inf))
+        self.assertLess(result.nfev, full.nfev)
+
+    def test_jacobian(self):
+        """ Test the projected Jacobian against finite differences of the
+        residuals at the solution """
+        bound = QENSmodels.BoundModel('sqwJumpTranslationalDiffusion',
+                                      self.w, self.q, self.resolution)
+        data = bound(scale=self.scale, D=0.2, resTime=0.8)
+        model = QENSmodels.SeparableModel(
+            'sqwJumpTranslationalDiffusion', self.w, self.q,
+            self.resolution, background=0)
+        x = numpy.array([0., 0.2, 0.8])
+
+        def residuals(x):
+            basis = model.basis(x)
+            coefficients, _ = model.solve(basis, data)
+            return (numpy.einsum('qk,qkw->qw', coefficients, basis) -
+                    data).ravel()
+
+        basis = model.basis(x)
+        coefficients, projector = model.solve(basis, data)
+        jacobian = model._projected_jacobian(x, coefficients, projector,
+                                             None)
+        for i in range(x.size):
+            # the hwhm functions work in single precision: large steps
+            step = numpy.zeros(x.size)
+            step[i] = 1e-3 * max(x[i], 0.1)
+            numpy.testing.assert_allclose(
+                jacobian[:, i],
+                (residuals(x + step) - residuals(x - step)) / (2 * step[i]),
+                atol=1e-3 * numpy.abs(jacobian[:, i]).max())
+
+    def test_bounds(self):
+        """ Test that the linear parameters stay within their physical
+        bounds """
+        data = numpy.tile(QENSmodels.lorentzian(self.w, hwhm=0.3),
+                          (self.q.size, 1))
+        data[0] *= -1.
+        model = QENSmodels.SeparableModel('sqwDeltaLorentz', self.w, self.q,
+                                          center=0.)
+        result = model.fit(data, hwhm=0.3)
+        self.assertEqual(result.params['scale'][0], 0.)
+        numpy.testing.assert_allclose(result.params['scale'][1:], 1.,
+                                      rtol=1e-6)
+        self.assertTrue(numpy.all(result.params['A0'] >= 0.))
+        self.assertTrue(numpy.all(result.params['A0'] <= 1.))
+
+    def test_records(self):
+        """ Test the records of the fitted parameters of each spectrum """
+        data = QENSmodels.sqwBrownianTranslationalDiffusion(
+            self.w, self.q, D=0.2)
+        model = QENSmodels.SeparableModel(
+            'sqwBrownianTranslationalDiffusion', self.w, self.q,
+            background=0, center=0.)
+        result = model.fit(data, D=0.1)
+        records = result.to_records()
+        self.assertEqual(len(records), self.q.size)
+        self.assertEqual(records[2]['q'], self.q[2])
+        self.assertAlmostEqual(records[2]['params']['D'], 0.2, 6)
+        self.assertAlmostEqual(records[2]['params']['scale'], 1., 6)
+        self.assertEqual(sorted(records[2]['background']), ['c0'])
+        self.assertEqual(sorted(records[2]['errors']),
+                         ['D', 'background/c0', 'scale'])
+        self.assertEqual(records[2]['errors']['D'], result.stderr['D'])
+        self.assertEqual(records[2]['timings']['fit'], result.wall_time)
+        self.assertGreater(result.wall_time, 0.)
+        self.assertAlmostEqual(numpy.mean(result.chi2_q), result.chi2)
+
+    @unittest.skipIf(h5py is None, 'h5py is not installed')
+    def test_records_store(self):
+        """ Test that the records round-trip through a results store """
+        data = QENSmodels.sqwBrownianTranslationalDiffusion(
+            self.w, self.q, D=0.2) + 0.01 * numpy.cos(50. * self.w)
+        model = QENSmodels.SeparableModel(
+            'sqwBrownianTranslationalDiffusion', self.w, self.q,
+            background=0, center=0.)
+        result = model.fit(data, D=0.1)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'fits.h5')
+            with QENSmodels.FitResultsWriter(filename) as writer:
+                writer.extend(result.to_records())
+            stored = QENSmodels.read_fit_results(filename)
+        numpy.testing.assert_array_equal(stored['q'], self.q)
+        numpy.testing.assert_array_equal(stored['params/D'],
+                                         result.params['D'])
+        numpy.testing.assert_array_equal(stored['errors/D'],
+                                         result.stderr['D'])
+        numpy.testing.assert_array_equal(stored['errors/scale'],
+                                         result.stderr['scale'])
+        numpy.testing.assert_array_equal(stored['errors/background/c0'],
+                                         result.background_stderr[:, 0])
+        numpy.testing.assert_array_equal(stored['chi2_q'], result.chi2_q)
+        numpy.testing.assert_array_equal(stored['timings/fit'],
+                                         result.wall_time)
+        self.assertEqual(list(stored['statistic']), ['chi2'] * self.q.size)
+
+    def test_stderr(self):
+        """ Test the standard errors against the covariance of all the
+        parameters fitted together """
+        bound = QENSmodels.BoundModel('sqwDeltaLorentz', self.w, self.q,
+                                      self.resolution, center=0.)
+        rng = numpy.random.default_rng(0)
+        errors = numpy.full(bound.shape, 0.01)
+        data = bound(scale=self.scale, A0=0.3,
+                     hwhm=numpy.array([0.1, 0.2, 0.3, 0.4])) + 0.02 + \
+            errors * rng.standard_normal(bound.shape)
+        model = QENSmodels.SeparableModel(
+            'sqwDeltaLorentz', self.w, self.q, self.resolution,
+            background=0, center=0.)
+        result = model.fit(data, errors, hwhm=0.2)
+
+        def residuals(p):
+            return (bound(hwhm=p[:4], scale=p[4:8], A0=p[8:12]) +
+                    p[12:, None] - data).ravel() / errors.ravel()
+
+        p = numpy.concatenate([result.params['hwhm'], result.params['scale'],
+                               result.params['A0'], result.background[:, 0]])
+        jacobian = numpy.empty((data.size, p.size))
+        for i in range(p.size):
+            step = numpy.zeros(p.size)
+            step[i] = 1e-7
+            jacobian[:, i] = (residuals(p + step) -
+                              residuals(p - step)) / 2e-7
+        expected = numpy.sqrt(result.chi2 * numpy.diag(
+            numpy.linalg.inv(jacobian.T @ jacobian))).reshape(4, 4)
+        for i, name in enumerate(['hwhm', 'scale', 'A0']):
+            numpy.testing.assert_allclose(result.stderr[name], expected[i],
+                                          rtol=1e-4, err_msg=name)
+        numpy.testing.assert_allclose(result.background_stderr[:, 0],
+                                      expected[3], rtol=1e-4)
+
+    def test_errors(self):
+        """ Test the errors raised for invalid inputs """
+        self.assertRaises(ValueError, QENSmodels.SeparableModel,
+                          'sqwDeltaLorentz', self.w, self.q, scale=1.)
+        self.assertRaises(ValueError, QENSmodels.SeparableModel,
+                          'sqwDeltaLorentz', self.w, self.q, background=-1)
+        model = QENSmodels.SeparableModel('sqwDeltaLorentz', self.w, self.q)
+        self.assertRaises(TypeError, model.x0, D=1.)
+
+
+class TestSequentialFit(unittest.TestCase):
+    """ Tests QENSmodels.fitting.sequential_fit """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 301)
+        # unsorted momentum transfers
+        order = [3, 0, 7, 1, 12, 5, 2, 9, 4, 11, 6, 10, 8]
+        self.q = numpy.linspace(0.2, 2., 13)[order]
+        self.resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        self.radius = 1. + 0.2 * self.q
+        self.DR = 0.3 + 0.1 * self.q ** 2
+        self.data = numpy.concatenate([
+            QENSmodels.BoundModel(
+                'sqwIsotropicRotationalDiffusion', self.w, self.q[i:i + 1],
+                self.resolution)(scale=1. + self.q[i],
+                                 radius=self.radius[i], DR=self.DR[i])
+            for i in range(self.q.size)])
+        self.initial = {'radius': 0.7, 'DR': 1.}
+
+    def sweep(self, **kwargs):
+        return QENSmodels.sequential_fit(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q, self.data,
+            resolution=self.resolution, initial=self.initial, center=0.,
+            **kwargs)
+
+    def test_sweep(self):
+        """ Test that warm starts recover the parameters with fewer
+        evaluations than independent fits """
+        sweep = self.sweep()
+        numpy.testing.assert_allclose(sweep.params['radius'], self.radius,
+                                      rtol=1e-5)
+        numpy.testing.assert_allclose(sweep.params['DR'], self.DR,
+                                      rtol=1e-5)
+        numpy.testing.assert_allclose(sweep.params['scale'], 1. + self.q,
+                                      rtol=1e-5)
+        self.assertEqual(sweep.nfev.shape, self.q.shape)
+
+        independent = 0
+        for i in range(self.q.size):
+            model = QENSmodels.SeparableModel(
+                'sqwIsotropicRotationalDiffusion', self.w, self.q[i:i + 1],
+                self.resolution, center=0.)
+            independent += model.fit(self.data[i:i + 1],
+                                     **self.initial).nfev
+        self.assertLess(sweep.nfev.sum(), independent)
+        self.assertLessEqual(self.sweep(extrapolate=True).nfev.sum(),
+                             self.sweep(extrapolate=False).nfev.sum())
+
+    def test_passes(self):
+        """ Test that further passes do not degrade the fits """
+        single = self.sweep()
+        several = self.sweep(passes=3)
+        self.assertTrue(numpy.all(several.chi2 <= single.chi2))
+        self.assertTrue(numpy.all(several.nfev >= single.nfev))
+        self.assertRaises(ValueError, self.sweep, passes=0)
+
+    def test_seeds(self):
+        """ Test chains started from several seeds, in parallel or not """
+        serial = self.sweep(seeds=[1, 8])
+        parallel = self.sweep(seeds=[1, 8], n_workers=3)
+        numpy.testing.assert_allclose(serial.params['radius'], self.radius,
+                                      rtol=1e-5)
+        numpy.testing.assert_array_equal(serial.params['radius'],
+                                         parallel.params['radius'])
+        numpy.testing.assert_array_equal(serial.nfev, parallel.nfev)
+        self.assertRaises(ValueError, self.sweep, seeds=[1, 1])
+
+    def test_records(self):
+        """ Test the records of a sweep with backgrounds """
+        sweep = QENSmodels.sequential_fit(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q,
+            self.data + 0.1, resolution=self.resolution, background=0,
+            initial=self.initial, center=0.)
+        numpy.testing.assert_allclose(sweep.background, 0.1, rtol=1e-5)
+        records = sweep.to_records()
+        self.assertEqual([record['q'] for record in records], list(self.q))
+
+    def test_repeated_q(self):
+        """ Test that spectra measured at the same q start from their
+        neighbour instead of an extrapolation """
+        q = numpy.array([0.5, 1., 1., 1.5])
+        D = 0.1
+        data = QENSmodels.BoundModel(
+            'sqwBrownianTranslationalDiffusion', self.w, q,
+            self.resolution)(scale=2., D=D)
+        sweep = QENSmodels.sequential_fit(
+            'sqwBrownianTranslationalDiffusion', self.w, q, data,
+            resolution=self.resolution, initial={'D': 0.5}, center=0.)
+        numpy.testing.assert_allclose(sweep.params['D'], D, rtol=1e-5)
+
+
+class TestMultiStartFit(unittest.TestCase):
+    """ Tests QENSmodels.fitting.multistart_fit """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 301)
+        self.q = numpy.linspace(0.3, 2., 8)
+        self.resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        self.data = QENSmodels.BoundModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q,
+            self.resolution)(scale=2., radius=1.3, DR=0.4)
+
+    def fit(self, **kwargs):
+        return QENSmodels.multistart_fit(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q, self.data,
+            resolution=self.resolution, center=0., **kwargs)
+
+    def test_global(self):
+        """ Test that the global minimum is found where a local fit fails """
+        model = QENSmodels.SeparableModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q,
+            self.resolution, center=0.)
+        local = model.fit(self.data, radius=2.5, DR=3.)
+        self.assertGreater(local.chi2, 1e-3)
+
+        result = self.fit(n_seeds=32, n_best=4)
+        numpy.testing.assert_allclose(result.best.x, [1.3, 0.4], rtol=1e-5)
+        self.assertEqual(result.screening.shape, (32,))
+        self.assertEqual(result.seeds['radius'].shape, (32,))
+        # minima are distinct and sorted
+        chi2 = [minimum.chi2 for minimum in result.minima]
+        self.assertEqual(chi2, sorted(chi2))
+        for i, first in enumerate(result.minima):
+            for second in result.minima[i + 1:]:
+                self.assertFalse(numpy.allclose(first.x, second.x,
+                                                rtol=1e-3))
+
+    def test_chi2(self):
+        """ Test the screening statistic against the fitted one """
+        model = QENSmodels.SeparableModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q,
+            self.resolution, center=0.)
+        result = model.fit(self.data + 0.01 * numpy.cos(self.w), radius=1.,
+                           DR=0.5)
+        x = numpy.array([result.x, [1., 0.5]])
+        chi2 = model.chi2(self.data + 0.01 * numpy.cos(self.w), x)
+        self.assertEqual(chi2.shape, (2,))
+        self.assertAlmostEqual(chi2[0], result.chi2, 12)
+        self.assertGreater(chi2[1], chi2[0])
+
+    def test_sites(self):
+        """ Test that the number of sites can be sampled """
+        data = QENSmodels.BoundModel(
+            'sqwEquivalentSitesCircle', self.w, self.q, self.resolution,
+            Nsites=4)(scale=2., radius=1.3, resTime=2.)
+        result = QENSmodels.multistart_fit(
+            'sqwEquivalentSitesCircle', self.w, self.q, data,
+            resolution=self.resolution, ranges={'Nsites': (2, 6)},
+            n_seeds=32, n_best=6, center=0.)
+        self.assertEqual(result.best.params['Nsites'], 4)
+        numpy.testing.assert_allclose(result.best.x, [1.3, 2.], rtol=1e-5)
+
+    def test_parallel(self):
+        """ Test that the refinements give the same minima in parallel """
+        serial = self.fit(n_seeds=16, n_best=3)
+        parallel = self.fit(n_seeds=16, n_best=3, n_workers=3)
+        self.assertEqual(len(serial.minima), len(parallel.minima))
+        for first, second in zip(serial.minima, parallel.minima):
+            numpy.testing.assert_array_equal(first.x, second.x)
+        self.assertEqual(serial.nfev, parallel.nfev)
+
+    def test_errors(self):
+        """ Test the errors raised for invalid inputs """
+        self.assertRaises(ValueError, self.fit, ranges={'scale': (1., 2.)})
+        self.assertRaises(ValueError, self.fit, ranges={'DR': (1., 2.)},
+                          DR=1.)
+        self.assertRaises(ValueError, self.fit, n_best=0)
+
+
+class TestPoissonDeviance(unittest.TestCase):
+    """ Tests fits of counts minimising the Poisson deviance """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 201)
+        self.q = numpy.array([0.5, 1., 1.5])
+        self.resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        bound = QENSmodels.BoundModel('sqwDeltaLorentz', self.w, self.q,
+                                      self.resolution, center=0.)
+        self.ideal = bound(scale=numpy.array([20., 30., 40.]), A0=0.4,
+                           hwhm=0.3) + 0.5
+        self.model = QENSmodels.SeparableModel(
+            'sqwDeltaLorentz', self.w, self.q, self.resolution,
+            background=0, center=0.)
+
+    def test_deviance(self):
+        """ Test the deviance against the Poisson log-likelihood """
+        rng = numpy.random.default_rng(1)
+        data = rng.poisson(self.ideal).astype(float)
+        deviance = QENSmodels.poisson_deviance(data, self.ideal)
+        saturated = poisson.logpmf(data, numpy.maximum(data, 1e-300))
+        self.assertAlmostEqual(
+            deviance, 2. * numpy.sum(saturated -
+                                     poisson.logpmf(data, self.ideal)), 8)
+        self.assertEqual(QENSmodels.poisson_deviance(data, data), 0.)
+
+    def test_fit(self):
+        """ Test that fits of counts minimise the deviance """
+        result = self.model.fit(self.ideal, statistic='cash', hwhm=0.1)
+        self.assertTrue(result.success)
+        self.assertEqual(result.statistic, 'cash')
+        numpy.testing.assert_allclose(result.params['hwhm'], 0.3, rtol=1e-4)
+        numpy.testing.assert_allclose(result.params['A0'], 0.4, rtol=1e-4)
+        numpy.testing.assert_allclose(result.background[:, 0], 0.5,
+                                      rtol=1e-3)
+        self.assertLess(result.chi2, 1e-8)
+
+        rng = numpy.random.default_rng(2)
+        data = rng.poisson(self.ideal).astype(float)
+        result = self.model.fit(data, statistic='cash', hwhm=0.1)
+        deviance = QENSmodels.poisson_deviance(data, result.best_fit)
+        dof = data.size - self.model.size - 3 * self.model.ncolumns
+        self.assertAlmostEqual(result.chi2 * dof, deviance, 6)
+        # lower deviance than least squares with errors sqrt(counts)
+        squares = self.model.fit(data, numpy.sqrt(numpy.maximum(data, 1.)),
+                                 hwhm=0.1)
+        self.assertLess(deviance,
+                        QENSmodels.poisson_deviance(data, squares.best_fit))
+        # errors from the Fisher information, not scaled by the deviance
+        self.assertTrue(numpy.all(result.stderr['hwhm'] > 0.))
+        numpy.testing.assert_allclose(result.stderr['hwhm'],
+                                      squares.stderr['hwhm'], rtol=0.3)
+        # and than nearby parameters
+        for hwhm in [0.99, 1.01]:
+            x = result.x * hwhm
+            coefficients, model = self.model.poisson_solve(
+                self.model.basis(x), data)
+            self.assertLess(deviance,
+                            QENSmodels.poisson_deviance(data, model))
+
+    def test_linear(self):
+        """ Test the linear coefficients against a generic minimiser """
+        rng = numpy.random.default_rng(3)
+        data = rng.poisson(self.ideal).astype(float)
+        basis = self.model.basis(self.model.x0(hwhm=0.3))
+        coefficients, model = self.model.poisson_solve(basis, data)
+        numpy.testing.assert_allclose(
+            model, numpy.einsum('qk,qkw->qw', coefficients, basis))
+        for i in range(self.q.size):
+            solution = minimize(
+                lambda c: QENSmodels.poisson_deviance(data[i], c @ basis[i]),
+                coefficients[i] * 1.1, method='Nelder-Mead',
+                options={'xatol': 1e-8, 'fatol': 1e-10, 'maxiter': 10000})
+            numpy.testing.assert_allclose(coefficients[i], solution.x,
+                                          rtol=1e-4)
+
+    def test_errors(self):
+        """ Test the errors raised for invalid inputs """
+        self.assertRaises(ValueError, self.model.fit, self.ideal,
+                          numpy.sqrt(self.ideal), statistic='cash')
+        self.assertRaises(ValueError, self.model.fit, self.ideal - 1.,
+                          statistic='cash')
+        self.assertRaises(ValueError, self.model.fit, self.ideal,
+                          statistic='likelihood')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import numpy
+
+import QENSmodels
+from QENSmodels import iqt, registry
+
+
+class TestIqt(unittest.TestCase):
+    """ Tests QENSmodels.iqt """
+
+    def setUp(self):
+        self.t = numpy.linspace(-5., 50., 56)
+        self.q = numpy.array([0.3, 0.9, 1.5])
+
+    def test_wrappers(self):
+        """ Test that each model of lines has a named counterpart with the
+        same default values """
+        for name in registry.names():
+            spec = registry.get(name)
+            if 'analytic_convolution' not in spec.supports:
+                continue
+            function = getattr(QENSmodels, 'iqt' + name[3:])
+            numpy.testing.assert_array_equal(
+                function(self.t, self.q), iqt.iqt(name, self.t, self.q),
+                err_msg=name)
+
+    def test_hwhm_functions(self):
+        """ Test against the exponentials built from the hwhm functions """
+        hwhm, eisf, qisf = QENSmodels.hwhmJumpTranslationalDiffusion(
+            self.q, 0.2, 0.5)
+        decay = numpy.exp(-hwhm[:, None] * numpy.abs(self.t))
+        expected = 2. * (numpy.reshape(eisf, (-1, 1)) + qisf[:, None] * decay)
+        numpy.testing.assert_allclose(
+            QENSmodels.iqtJumpTranslationalDiffusion(self.t, self.q, 2., 0.2,
+                                                     0.5),
+            expected, rtol=1e-12)
+
+        hwhm, eisf, qisf = QENSmodels.hwhmIsotropicRotationalDiffusion(
+            self.q, 1.5, 0.3)
+        expected = eisf[:, None] + numpy.einsum(
+            'ql,qlt->qt', qisf[:, 1:],
+            numpy.exp(-hwhm[:, 1:, None] * numpy.abs(self.t)))
+        numpy.testing.assert_allclose(
+            QENSmodels.iqtIsotropicRotationalDiffusion(self.t, self.q,
+                                                       radius=1.5, DR=0.3),
+            expected, rtol=1e-6)
+
+    def test_shapes(self):
+        """ Test the shapes of the outputs """
+        result = QENSmodels.iqtBrownianTranslationalDiffusion(self.t, 1.)
+        self.assertEqual(result.shape, (self.t.size,))
+        result = QENSmodels.iqtBrownianTranslationalDiffusion(self.t, self.q)
+        self.assertEqual(result.shape, (self.q.size, self.t.size))
+
+    def test_normalized(self):
+        """ Test normalisation by the value at t = 0 """
+        params = {'scale': 3., 'Nsites': 5, 'radius': 1.5, 'resTime': 0.5,
+                  'sigma': 0.5}
+        result = iqt.iqt('sqwJumpSitesLogNormDist', self.t, self.q, **params)
+        normalized = iqt.iqt('sqwJumpSitesLogNormDist', self.t, self.q,
+                             normalized=True, **params)
+        initial = iqt.iqt('sqwJumpSitesLogNormDist', 0., self.q, **params)
+        numpy.testing.assert_allclose(normalized, result / initial,
+                                      rtol=1e-12)
+        numpy.testing.assert_allclose(normalized[:, self.t == 0.], 1.,
+                                      rtol=1e-12)
+
+    def test_jacobian(self):
+        """ Test analytic derivatives against finite differences """
+        models = {
+            'sqwBrownianTranslationalDiffusion': {'D': 0.3},
+            'sqwChudleyElliottDiffusion': {'D': 0.2, 'L': 1.5},
+            'sqwDeltaTwoLorentz': {'A0': 0.1, 'A1': [0.2, 0.3, 0.4],
+                                   'hwhm1': 0.05, 'hwhm2': 0.5},
+            'sqwGaussianModel3D': {'D': 0.2, 'variance_ux': 0.5},
+            'sqwJumpSitesLogNormDist': {'radius': 2., 'resTime': 0.5,
+                                        'sigma': 0.5},
+            'sqwWaterTeixeira': {'D': 0.2, 'resTime': 1., 'radius': 1.,
+                                 'DR': 0.5},
+        }
+        for model, params in models.items():
+            params = {name: numpy.asarray(value, dtype=float)
+                      for name, value in params.items()}
+            params['scale'] = numpy.array([1., 2., 3.])
+            for normalized in (False, True):
+                bound = iqt.BoundIqt(model, self.t, self.q, normalized)
+                jacobian = bound.jacobian(**params)
+                self.assertEqual(sorted(jacobian),
+                                 sorted(list(params) + ['center']))
+                for name, value in params.items():
+                    # the hwhm functions work in single precision
+                    step = 1e-2 * value
+                    plus = bound(**dict(params, **{name: value + step}))
+                    minus = bound(**dict(params, **{name: value - step}))
+                    expected = (plus - minus) / (2. * step.max())
+                    if value.ndim:
+                        # one value per momentum transfer: one row each
+                        expected = (plus - minus) / (2. * step[:, None])
+                    numpy.testing.assert_allclose(
+                        jacobian[name], expected, rtol=0,
+                        atol=1e-3 * max(numpy.abs(expected).max(), 1e-3),
+                        err_msg='{} {} {}'.format(model, name, normalized))
+                numpy.testing.assert_array_equal(jacobian['center'], 0.)
+
+    def test_jacobian_function(self):
+        """ Test the Jacobian of one model, without bound model """
+        jacobian = iqt.iqt_jacobian('sqwIsotropicRotationalDiffusion',
+                                    self.t, self.q, radius=1.5, DR=0.3)
+        self.assertEqual(sorted(jacobian), ['DR', 'radius', 'scale'])
+        numpy.testing.assert_allclose(
+            jacobian['scale'],
+            QENSmodels.iqtIsotropicRotationalDiffusion(self.t, self.q,
+                                                       radius=1.5, DR=0.3),
+            rtol=1e-12)
+
+    def test_raised_errors(self):
+        """ Test invalid parameters """
+        self.assertRaises(ValueError,
+                          QENSmodels.iqtBrownianTranslationalDiffusion,
+                          self.t, self.q, D=-1.)
+        self.assertRaises(TypeError, iqt.iqt,
+                          'sqwBrownianTranslationalDiffusion', self.t,
+                          self.q, Dt=1.)
+        self.assertRaises(TypeError, iqt.BoundIqt,
+                          'sqwBrownianTranslationalDiffusion', self.t,
+                          self.q, Dt=1.)
+        self.assertRaises(ValueError, iqt.iqt_jacobian,
+                          'sqwBrownianTranslationalDiffusion', self.t,
+                          self.q, names=['Dt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+import numpy
+
+import QENSmodels
+
+
+class TestScan(unittest.TestCase):
+    """ Tests QENSmodels.landscape.scan """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 201)
+        self.q = numpy.linspace(0.3, 2., 6)
+        self.resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        ideal = QENSmodels.BoundModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q,
+            self.resolution)(scale=2., radius=1.3, DR=0.4)
+        rng = numpy.random.default_rng(7)
+        self.errors = numpy.full(ideal.shape, 0.01 * ideal.max())
+        self.data = ideal + self.errors * rng.standard_normal(ideal.shape)
+        self.grid = {'radius': numpy.linspace(1.2, 1.4, 21),
+                     'DR': numpy.linspace(0.32, 0.48, 17)}
+
+    def scan(self, **kwargs):
+        return QENSmodels.scan('sqwIsotropicRotationalDiffusion', self.w,
+                               self.q, self.data, self.grid,
+                               errors=self.errors,
+                               resolution=self.resolution, center=0.,
+                               **kwargs)
+
+    def test_scan(self):
+        """ Test the landscape against the fitted minimum """
+        result = self.scan()
+        self.assertEqual(result.names, ['radius', 'DR'])
+        self.assertEqual(result.chi2.shape, (21, 17))
+        fit = QENSmodels.SeparableModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q,
+            self.resolution, center=0.).fit(self.data, self.errors,
+                                            radius=1.3, DR=0.4)
+        self.assertGreaterEqual(result.chi2.min(), fit.chi2)
+        minimum = result.minimum
+        self.assertAlmostEqual(minimum['radius'], fit.x[0], delta=0.01)
+        self.assertAlmostEqual(minimum['DR'], fit.x[1], delta=0.005)
+        # value at one grid point
+        model = QENSmodels.SeparableModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q,
+            self.resolution, center=0.)
+        self.assertAlmostEqual(
+            result.chi2[3, 5],
+            model.chi2(self.data, numpy.array([self.grid['radius'][3],
+                                               self.grid['DR'][5]]),
+                       self.errors), 12)
+
+    def test_profile(self):
+        """ Test the profiles and the profile-likelihood intervals """
+        result = self.scan()
+        profile = result.profile('DR')
+        self.assertEqual(profile.shape, (17,))
+        numpy.testing.assert_array_equal(profile, result.chi2.min(axis=0))
+
+        fit = QENSmodels.SeparableModel(
+            'sqwIsotropicRotationalDiffusion', self.w, self.q,
+            self.resolution, center=0.).fit(self.data, self.errors,
+                                            radius=1.3, DR=0.4)
+        for i, name in enumerate(result.names):
+            lower, upper = result.interval(name)
+            self.assertLess(lower, fit.x[i])
+            self.assertGreater(upper, fit.x[i])
+            wider = result.interval(name, delta=3.84)
+            self.assertLess(wider[0], lower)
+            self.assertGreater(wider[1], upper)
+        # intervals wider than the grid are open
+        self.assertTrue(numpy.isnan(result.interval('DR', delta=1e9)[0]))
+
+    def test_chunks(self):
+        """ Test that chunks and processes do not change the landscape """
+        serial = self.scan()
+        chunked = self.scan(chunk_size=50, n_workers=2)
+        numpy.testing.assert_array_equal(serial.chi2, chunked.chi2)
+
+    def test_tolerance(self):
+        """ Test that spawned workers truncate the lines as the parent
+        process """
+        spawn = functools.partial(
+            ProcessPoolExecutor,
+            mp_context=multiprocessing.get_context('spawn'))
+        full = self.scan()
+        with QENSmodels.lines.tolerance(rtol=0.05):
+            serial = self.scan()
+            with mock.patch('concurrent.futures.ProcessPoolExecutor',
+                            spawn):
+                parallel = self.scan(chunk_size=200, n_workers=2)
+        self.assertFalse(numpy.array_equal(full.chi2, serial.chi2))
+        numpy.testing.assert_array_equal(serial.chi2, parallel.chi2)
+
+    def test_errors(self):
+        """ Test the errors raised for invalid grids """
+        self.assertRaises(ValueError, QENSmodels.scan,
+                          'sqwIsotropicRotationalDiffusion', self.w, self.q,
+                          self.data, {'radius': [1., 2.]}, center=0.)
+        self.assertRaises(ValueError, QENSmodels.scan,
+                          'sqwIsotropicRotationalDiffusion', self.w, self.q,
+                          self.data, dict(self.grid, scale=[1., 2.]),
+                          center=0.)
+        self.assertRaises(ValueError, QENSmodels.scan,
+                          'sqwIsotropicRotationalDiffusion', self.w, self.q,
+                          self.data, self.grid, center=0., DR=0.4)
+        self.assertRaises(ValueError, QENSmodels.scan,
+                          'sqwIsotropicRotationalDiffusion', self.w, self.q,
+                          self.data, {'radius': [1., 2.], 'DR': [-1., 1.]},
+                          center=0.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import QENSmodels
+
+# root folder of the repository, added to the path of the subprocesses
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code):
+    """ Runs `code` in a fresh interpreter and returns its standard output
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root_dir] + [item for item in [env.get('PYTHONPATH')] if item])
+    return subprocess.check_output([sys.executable, '-c', code],
+                                   env=env, universal_newlines=True)
+
+
+class TestLazyImport(unittest.TestCase):
+    """ Tests lazy loading of the submodules of QENSmodels """
+
+    def test_import_does_not_load_submodules(self):
+        """ Test that importing the package loads no model nor scipy """
+        output = run_python(
+            'import sys\n'
+            'import QENSmodels\n'
+            'print(sorted(name for name in sys.modules\n'
+            '             if name.startswith(("QENSmodels.", "scipy", '
+            '"numpy", "h5py"))))\n'
+            'print(QENSmodels.__file__)')
+        loaded, filename = output.splitlines()
+        self.assertEqual(loaded, '[]')
+        self.assertTrue(filename.startswith(root_dir))
+
+    def test_first_access_loads_only_needed_modules(self):
+        """ Test that a model only loads the modules it depends on """
+        output = run_python(
+            'import sys\n'
+            'import QENSmodels\n'
+            'QENSmodels.sqwBrownianTranslationalDiffusion(1., 1.)\n'
+            'print("scipy.special" in sys.modules)\n'
+            'QENSmodels.sqwIsotropicRotationalDiffusion(1., 1.)\n'
+            'print("scipy.special" in sys.modules)')
+        self.assertEqual(output.split(), ['False', 'True'])
+
+    def test_public_names(self):
+        """ Test that all public names are listed and resolved """
+        for name in QENSmodels.__all__:
+            self.assertIn(name, dir(QENSmodels))
+            self.assertTrue(callable(getattr(QENSmodels, name)))
+
+        self.assertRaises(AttributeError, getattr, QENSmodels, 'sqwUnknown')
+
+    def test_submodule_named_as_function(self):
+        """ Test that importing a submodule named after its function does
+        not hide the function
+        """
+        output = run_python(
+            'import QENSmodels.lorentzian\n'
+            'import QENSmodels.delta\n'
+            'print(callable(QENSmodels.lorentzian), '
+            'callable(QENSmodels.delta))\n'
+            'print(QENSmodels.water_teixeira.__name__)')
+        self.assertEqual(output.split(),
+                         ['True', 'True', 'QENSmodels.water_teixeira'])
+
+
+if __name__ == '__main__':
+    unittest.main()
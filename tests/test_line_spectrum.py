@@ -0,0 +1,114 @@
+import unittest
+import numpy
+
+import QENSmodels
+
+# series models and their parameters
+SERIES = {
+    'hwhmEquivalentSitesCircle': {'Nsites': 5, 'radius': 1.2,
+                                  'resTime': 0.8},
+    'hwhmGaussianModel3D': {'D': 0.3, 'variance_ux': 0.8},
+    'hwhmIsotropicRotationalDiffusion': {'radius': 1.1, 'DR': 0.4},
+    'hwhmJumpSitesLogNormDist': {'Nsites': 4, 'radius': 1.2, 'resTime': 0.8,
+                                 'sigma': 0.5},
+}
+
+
+class TestLineSpectrum(unittest.TestCase):
+    """ Tests QENSmodels.line_spectrum """
+
+    def setUp(self):
+        self.q = numpy.array([0., 0.4, 1.1, 1.9])
+
+    def test_compact(self):
+        """ Test that widths are stored once and broadcast to one row per
+        momentum transfer when unpacked """
+        for name, params in SERIES.items():
+            spectrum = getattr(QENSmodels, name)(self.q, **params)
+            self.assertIsInstance(spectrum, QENSmodels.LineSpectrum)
+            self.assertTrue(spectrum.q_independent_widths, name)
+            self.assertEqual(spectrum.hwhm.shape[0], 1, name)
+            hwhm, eisf, qisf = spectrum
+            self.assertEqual(hwhm.shape,
+                             (self.q.size,) + spectrum.hwhm.shape[1:])
+            for row in hwhm:
+                numpy.testing.assert_array_equal(row, spectrum.hwhm[0],
+                                                 err_msg=name)
+            numpy.testing.assert_array_equal(eisf, spectrum.eisf)
+            numpy.testing.assert_array_equal(qisf, spectrum.qisf)
+
+    def test_materialize(self):
+        """ Test that materialized arrays are full, writable copies """
+        spectrum = QENSmodels.hwhmEquivalentSitesCircle(self.q, 3, 1., 1.)
+        hwhm, eisf, qisf = spectrum.materialize()
+        for value in (hwhm, eisf, qisf):
+            self.assertEqual(value.shape[0], self.q.size)
+            self.assertTrue(value.flags.writeable)
+        hwhm[...] = -1.
+        self.assertTrue(numpy.all(spectrum.hwhm >= 0.))
+        self.assertEqual(len(spectrum), 3)
+        numpy.testing.assert_array_equal(spectrum[2], qisf)
+
+    def test_indexing(self):
+        """ Test that indexing only materializes the requested arrays """
+        spectrum = QENSmodels.hwhmEquivalentSitesCircle(self.q, 3, 1., 1.)
+        full = spectrum._full
+        materialized = []
+
+        def counted(value):
+            materialized.append(value)
+            return full(value)
+
+        spectrum._full = counted
+        numpy.testing.assert_array_equal(spectrum[1], spectrum.eisf)
+        self.assertEqual(len(materialized), 1)
+        hwhm, eisf = spectrum[:2]
+        self.assertEqual(hwhm.shape, (self.q.size, 3))
+        self.assertEqual(len(materialized), 3)
+        self.assertEqual(spectrum[-1].shape, spectrum.qisf.shape)
+
+    def test_log_norm_distribution(self):
+        """ Test the distribution of widths against the jumps between sites
+        it is built from """
+        params = SERIES['hwhmJumpSitesLogNormDist']
+        spectrum = QENSmodels.hwhmJumpSitesLogNormDist(self.q, **params)
+        equiv = QENSmodels.hwhmEquivalentSitesCircle(
+            self.q, params['Nsites'], params['radius'], params['resTime'])
+        ratio = spectrum.hwhm[0, 1] / equiv.hwhm[0, 1]
+        numpy.testing.assert_allclose(
+            spectrum.hwhm[0], numpy.outer(equiv.hwhm[0], ratio))
+        numpy.testing.assert_allclose(spectrum.qisf.sum(axis=2), equiv.qisf)
+
+    def test_errors(self):
+        """ Test that arrays of incompatible shapes are rejected """
+        self.assertRaises(ValueError, QENSmodels.LineSpectrum,
+                          numpy.zeros((2, 3)), numpy.zeros(4),
+                          numpy.zeros((4, 3)))
+        self.assertRaises(ValueError, QENSmodels.LineSpectrum,
+                          numpy.zeros((1, 3)), numpy.zeros(4),
+                          numpy.zeros((3, 3)))
+
+    def test_shared_widths(self):
+        """ Test that lines of q-independent widths are evaluated as when
+        they are given one row per momentum transfer """
+        w = numpy.linspace(-3., 3., 301)
+        elastic, weights, widths = QENSmodels.lines.model_lines(
+            'sqwJumpSitesLogNormDist', self.q, Nsites=4, radius=1.2,
+            resTime=0.8, sigma=0.5)
+        self.assertEqual(widths.strides[0], 0)
+        sqw = QENSmodels.lines.evaluate_lines(w, 0.1, elastic, weights,
+                                              widths)
+        # the same widths, without the fast path for shared widths
+        per_q = widths * numpy.linspace(1., 1. + 1e-12, self.q.size)[:, None]
+        numpy.testing.assert_allclose(
+            sqw, QENSmodels.lines.evaluate_lines(w, 0.1, elastic, weights,
+                                                 per_q),
+            rtol=1e-9, atol=1e-12)
+        numpy.testing.assert_allclose(
+            sqw, QENSmodels.sqwJumpSitesLogNormDist(
+                w, self.q, 1., 0.1, 4, 1.2, 0.8, 0.5),
+            rtol=1e-9, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
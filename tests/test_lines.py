@@ -0,0 +1,266 @@
+import unittest
+import numpy
+
+import QENSmodels
+from QENSmodels import lines
+
+
+PARAMETERS = {
+    'sqwBrownianTranslationalDiffusion': {'D': 0.3},
+    'sqwChudleyElliottDiffusion': {'D': 0.2, 'L': 1.5},
+    'sqwDeltaLorentz': {'A0': 0.3, 'hwhm': [0.01, 0.1, 1.]},
+    'sqwDeltaTwoLorentz': {'A0': 0.1, 'A1': [0.2, 0.3, 0.4],
+                           'hwhm1': 0.01, 'hwhm2': 0.5},
+    'sqwEquivalentSitesCircle': {'Nsites': 5, 'radius': 2.,
+                                 'resTime': 0.5},
+    'sqwGaussianModel3D': {'D': 0.1, 'variance_ux': 0.5},
+    'sqwIsotropicRotationalDiffusion': {'radius': 1.5, 'DR': 0.2},
+    'sqwJumpSitesLogNormDist': {'Nsites': 4, 'radius': 2., 'resTime': 0.5,
+                                'sigma': 0.5},
+    'sqwJumpTranslationalDiffusion': {'D': 0.1, 'resTime': 0.5},
+    'sqwWaterTeixeira': {'D': 0.2, 'resTime': 1., 'radius': 1., 'DR': 0.5},
+}
+
+
+class TestLines(unittest.TestCase):
+    """ Tests line decomposition and vectorised evaluation of the models """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 401)
+        self.q = numpy.array([0.2, 1., 1.8])
+
+    def test_models_match(self):
+        """ Test that evaluated lines match the models term by term """
+        for model, params in PARAMETERS.items():
+            elastic, weights, widths = lines.model_lines(model, self.q,
+                                                         **params)
+            self.assertEqual(weights.shape, widths.shape, model)
+            result = lines.evaluate_lines(self.w, 0.1, elastic, weights,
+                                          widths, scale=2.)
+            expected = getattr(QENSmodels, model)(self.w, self.q, 2., 0.1,
+                                                  **params)
+            numpy.testing.assert_allclose(result, expected, rtol=1e-6,
+                                          atol=1e-12, err_msg=model)
+
+    def test_center_per_q(self):
+        """ Test lines centred at a different energy for each q """
+        centers = [-0.1, 0., 0.15]
+        elastic = numpy.full(3, 0.4)
+        weights = numpy.full((3, 1), 0.6)
+        widths = numpy.full((3, 1), 0.1)
+        result = lines.evaluate_lines(self.w, centers, elastic, weights,
+                                      widths, scale=[1., 2., 3.])
+        for i, center in enumerate(centers):
+            numpy.testing.assert_allclose(
+                result[i],
+                QENSmodels.sqwDeltaLorentz(self.w, 1., i + 1., center,
+                                           0.4, 0.1),
+                rtol=1e-12)
+
+    def test_zero_width_is_elastic(self):
+        """ Test that Lorentzians of zero width are delta functions """
+        result = lines.evaluate_lines(self.w, 0., numpy.zeros(1),
+                                      numpy.ones((1, 1)),
+                                      numpy.zeros((1, 1)))
+        numpy.testing.assert_allclose(result[0], QENSmodels.delta(self.w))
+
+    def test_center_outside_range(self):
+        """ Test that no elastic line is added outside the energy range """
+        result = lines.evaluate_lines(self.w, 5., numpy.ones(1),
+                                      numpy.zeros((1, 0)),
+                                      numpy.zeros((1, 0)))
+        self.assertFalse(numpy.any(result))
+
+    def test_out(self):
+        """ Test writing the result in a given array """
+        out = numpy.ones((3, self.w.size))
+        elastic, weights, widths = lines.model_lines(
+            'sqwBrownianTranslationalDiffusion', self.q, D=0.1)
+        result = lines.evaluate_lines(self.w, 0., elastic, weights, widths,
+                                      out=out)
+        self.assertIs(result, out)
+        numpy.testing.assert_allclose(
+            out, QENSmodels.sqwBrownianTranslationalDiffusion(self.w, self.q,
+                                                              D=0.1),
+            rtol=1e-6)
+
+    def test_derivatives(self):
+        """ Test derivatives of the lines against finite differences """
+        for model, params in PARAMETERS.items():
+            spec = QENSmodels.registry.get(model)
+            derivatives = lines.model_lines_derivatives(model, self.q,
+                                                        **params)
+            fitting = [item.name for item in spec.parameters
+                       if item.fitting and item.name in params]
+            self.assertEqual(sorted(derivatives), sorted(fitting), model)
+            for name in fitting:
+                value = numpy.asarray(params[name], dtype=float)
+                step = 1e-3 * value
+                plus = lines.model_lines(
+                    model, self.q, **dict(params, **{name: value + step}))
+                minus = lines.model_lines(
+                    model, self.q, **dict(params, **{name: value - step}))
+                for k, derivative in enumerate(derivatives[name]):
+                    # per-q parameters: row i only depends on value i
+                    expected = (plus[k] - minus[k]) / numpy.reshape(
+                        2. * step, (-1,) + (1,) * (plus[k].ndim - 1))
+                    if derivative is None:
+                        derivative = 0.
+                    numpy.testing.assert_allclose(
+                        numpy.broadcast_to(derivative, expected.shape),
+                        expected, rtol=1e-2,
+                        atol=1e-3 * max(numpy.abs(expected).max(), 1.),
+                        err_msg='{} {}'.format(model, name))
+
+    def test_line_list(self):
+        """ Test evaluation of lines of different centers """
+        line_list = lines.LineList([[1., 0.5, 0.2], [2., 0., 0.3]],
+                                   [[0.1, 0.2, 0.], [0.3, 0.2, 0.]],
+                                   [[0., 0.3, 0.1], [0.2, 0.3, -0.1]])
+        expected = [
+            QENSmodels.lorentzian(self.w, 1., 0., 0.1) +
+            QENSmodels.lorentzian(self.w, 0.5, 0.3, 0.2) +
+            QENSmodels.delta(self.w, 0.2, 0.1),
+            QENSmodels.lorentzian(self.w, 2., 0.2, 0.3) +
+            QENSmodels.delta(self.w, 0.3, -0.1)]
+        numpy.testing.assert_allclose(line_list.evaluate(self.w), expected,
+                                      rtol=1e-12)
+
+    def test_line_list_merged(self):
+        """ Test merging of lines with the same width and center """
+        line_list = lines.LineList([[1., 0.5, 0.2, 0.], [2., 1., 0.3, 0.]],
+                                   [[0.1, 0.1, 0., 1.], [0.3, 0.3, 0., 1.]],
+                                   0.)
+        merged = line_list.merged()
+        self.assertEqual(merged.nlines, 2)
+        numpy.testing.assert_allclose(merged.weights, [[0.2, 1.5],
+                                                       [0.3, 3.]])
+        numpy.testing.assert_allclose(merged.evaluate(self.w),
+                                      line_list.evaluate(self.w),
+                                      rtol=1e-12)
+
+    def test_line_list_convolve(self):
+        """ Test analytic convolution of lines """
+        first = lines.LineList([[0.5, 0.5]], [[0., 0.1]], [[0., 0.]])
+        second = lines.LineList([[1.]], [[0.2]], [[0.1]])
+        result = first.convolve(second)
+        numpy.testing.assert_allclose(result.weights, [[0.5, 0.5]])
+        numpy.testing.assert_allclose(result.widths, [[0.2, 0.3]])
+        numpy.testing.assert_allclose(result.centers, [[0.1, 0.1]])
+        self.assertEqual(first.convolve(
+            lines.LineList(numpy.ones((3, 1)), 0.1, 0.)).nq, 3)
+        self.assertRaises(ValueError, lines.LineList.convolve,
+                          lines.LineList(numpy.ones((2, 1)), 0.1, 0.),
+                          lines.LineList(numpy.ones((3, 1)), 0.1, 0.))
+
+    def test_hwhm_lines(self):
+        """ Test that lines of the hwhm functions give the models """
+        for model, params in PARAMETERS.items():
+            hwhm = getattr(QENSmodels, model.replace('sqw', 'hwhm'), None)
+            if hwhm is None:
+                continue
+            line_list = lines.hwhm_lines(*hwhm(self.q, **params))
+            expected = getattr(QENSmodels, model)(self.w, self.q, **params)
+            numpy.testing.assert_allclose(
+                line_list.evaluate(self.w), expected, rtol=1e-5,
+                atol=1e-6 * expected.max(), err_msg=model)
+
+    def test_analytic_convolve(self):
+        """ Test convolutions of the outputs of hwhm functions """
+        params = PARAMETERS['sqwWaterTeixeira']
+        line_list = lines.analytic_convolve(
+            QENSmodels.hwhmJumpTranslationalDiffusion(
+                self.q, params['D'], params['resTime']),
+            QENSmodels.hwhmIsotropicRotationalDiffusion(
+                self.q, params['radius'], params['DR']))
+        expected = QENSmodels.sqwWaterTeixeira(self.w, self.q, 2., 0.1,
+                                               **params)
+        numpy.testing.assert_allclose(
+            (2. * line_list).shifted(0.1).evaluate(self.w), expected,
+            rtol=1e-5, atol=1e-6 * expected.max())
+
+        # weights of the convolution of normalised models sum to one
+        first = QENSmodels.hwhmChudleyElliottDiffusion(self.q, 0.2, 1.5)
+        second = QENSmodels.hwhmGaussianModel3D(self.q, 0.1, 0.5)
+        line_list = lines.analytic_convolve(first, second)
+        numpy.testing.assert_allclose(line_list.weights.sum(axis=1), 1.,
+                                      rtol=1e-6)
+        numpy.testing.assert_allclose(
+            numpy.sort(line_list.widths[0]),
+            numpy.sort(first[0][0] + numpy.unique(second[0][0])),
+            rtol=1e-6)
+
+    def test_ragged_rows(self):
+        """ Test rows with few lines, evaluated separately """
+        q = numpy.linspace(0.1, 2., 8)
+        weights = numpy.ones((8, 40))
+        weights[:4, 3:] = 0.
+        weights[4, 9:] = 0.
+        widths = numpy.linspace(0.01, 1., 40) * numpy.ones((8, 1))
+        elastic = numpy.full(q.size, 0.5)
+        expected = lines.LineList.from_model_lines(
+            elastic, weights, widths, 0.1).evaluate(self.w)
+        numpy.testing.assert_allclose(
+            lines.evaluate_lines(self.w, 0.1, elastic, weights, widths),
+            expected, rtol=1e-12)
+
+    def test_tolerance(self):
+        """ Test truncation of the series of lines and its error bound """
+        self.assertEqual(lines.get_tolerance(), {'rtol': 0., 'atol': 0.})
+        self.assertRaises(ValueError, lines.set_tolerance, rtol=-1.)
+        q = numpy.linspace(0.1, 3., 12)
+        w = numpy.linspace(-20, 20, 4001)
+        for model in ('sqwGaussianModel3D', 'sqwIsotropicRotationalDiffusion',
+                      'sqwJumpSitesLogNormDist', 'sqwWaterTeixeira'):
+            params = PARAMETERS[model]
+            elastic, weights, widths = lines.model_lines(model, q, **params)
+            full = lines.evaluate_lines(w, 0., elastic, weights, widths)
+            with lines.tolerance(rtol=1e-4, atol=1e-6):
+                self.assertEqual(lines.get_tolerance(),
+                                 {'rtol': 1e-4, 'atol': 1e-6})
+                truncated = lines.model_lines(model, q, **params)
+                result = lines.evaluate_lines(w, 0., *truncated)
+                sqw = getattr(QENSmodels, model)(w, q, **params)
+            self.assertEqual(lines.get_tolerance(), {'rtol': 0., 'atol': 0.})
+            # fewer lines at low q
+            self.assertLess(numpy.count_nonzero(truncated[1][0]),
+                            numpy.count_nonzero(weights[0]), model)
+
+            # integrated error below the documented bound
+            bound = numpy.maximum(1e-6, 1e-4 * (
+                numpy.abs(elastic) + numpy.abs(weights).sum(axis=1)))
+            dropped = numpy.abs(weights).sum(axis=1) - \
+                numpy.abs(truncated[1]).sum(axis=1)
+            self.assertTrue(numpy.all(dropped <= bound), model)
+            error = numpy.abs(result - full) @ lines.trapz_weights(w)
+            self.assertTrue(numpy.all(error <= bound * (1. + 1e-6)), model)
+            if model != 'sqwWaterTeixeira':
+                numpy.testing.assert_allclose(sqw, result, rtol=1e-6,
+                                              atol=1e-12, err_msg=model)
+
+    def test_tolerance_derivatives(self):
+        """ Test that derivatives are truncated as the lines """
+        q = numpy.linspace(0.1, 3., 12)
+        params = PARAMETERS['sqwGaussianModel3D']
+        full = lines.model_lines_derivatives('sqwGaussianModel3D', q,
+                                             **params)
+        with lines.tolerance(rtol=1e-6):
+            truncated = lines.model_lines('sqwGaussianModel3D', q, **params)
+            derivatives = lines.model_lines_derivatives(
+                'sqwGaussianModel3D', q, **params)
+        for name, (d_elastic, d_weights, d_widths) in derivatives.items():
+            self.assertEqual(d_weights.shape, truncated[1].shape)
+            numpy.testing.assert_array_equal(d_elastic, full[name][0])
+            # same sum of derivatives, up to the dropped lines
+            numpy.testing.assert_allclose(
+                d_weights.sum(axis=1), full[name][1].sum(axis=1),
+                rtol=0, atol=1e-4)
+
+    def test_unknown_model(self):
+        """ Test that an error is raised for models without lines """
+        self.assertRaises(ValueError, lines.model_lines, 'lorentzian',
+                          self.q)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+import numpy
+
+import QENSmodels
+
+
+class TestParameterSamples(unittest.TestCase):
+    """ Tests QENSmodels.lookup.parameter_samples """
+
+    def test_samples(self):
+        """ Test the ranges, the logarithmic and integer samples """
+        ranges = {'Nsites': (2, 6), 'radius': (1., 2.), 'resTime': (0.1, 10.)}
+        for method in ['sobol', 'latin', 'random']:
+            samples = QENSmodels.parameter_samples(
+                'sqwJumpSitesLogNormDist', ranges, 200, method=method,
+                seed=3)
+            for name, (lower, upper) in ranges.items():
+                self.assertEqual(samples[name].shape, (200,))
+                self.assertTrue(numpy.all(samples[name] >= lower))
+                self.assertTrue(numpy.all(samples[name] <= upper))
+            self.assertEqual(set(samples['Nsites']), {2, 3, 4, 5, 6})
+            # as many samples in each decade
+            below = numpy.mean(samples['resTime'] < 1.)
+            self.assertAlmostEqual(below, 0.5, delta=0.1)
+
+        first, second = (QENSmodels.parameter_samples(
+            'sqwJumpSitesLogNormDist', ranges, 200, seed=3)
+            for _ in range(2))
+        numpy.testing.assert_array_equal(first['radius'], second['radius'])
+
+    def test_errors(self):
+        """ Test the errors raised for invalid ranges """
+        self.assertRaises(ValueError, QENSmodels.parameter_samples,
+                          'sqwBrownianTranslationalDiffusion',
+                          {'D': (-1., 1.)}, 10)
+        self.assertRaises(ValueError, QENSmodels.parameter_samples,
+                          'sqwBrownianTranslationalDiffusion',
+                          {'D': (1., 0.1)}, 10)
+        self.assertRaises(ValueError, QENSmodels.parameter_samples,
+                          'sqwBrownianTranslationalDiffusion',
+                          {'D': (0.1, 1.)}, 10, method='grid')
+
+
+class TestSpectralIndex(unittest.TestCase):
+    """ Tests QENSmodels.lookup.SpectralIndex """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.w = numpy.linspace(-2, 2, 201)
+        cls.q = numpy.linspace(0.3, 2., 8)
+        cls.resolution = numpy.exp(-0.5 * (cls.w / 0.03) ** 2)
+        cls.ranges = {'D': (0.05, 1.), 'resTime': (0.1, 5.),
+                      'radius': (0.5, 2.), 'DR': (0.05, 2.)}
+        cls.index = QENSmodels.SpectralIndex(
+            'sqwWaterTeixeira', cls.w, cls.q, cls.ranges, cls.resolution,
+            size=1024, components=12, center=0.)
+        cls.params = {'D': 0.2, 'resTime': 1., 'radius': 1., 'DR': 0.3}
+        cls.data = QENSmodels.BoundModel(
+            'sqwWaterTeixeira', cls.w, cls.q, cls.resolution)(
+            scale=numpy.linspace(1., 3., 8), **cls.params)
+
+    def test_query(self):
+        """ Test that fits started from the nearest spectrum converge """
+        params = self.index.query(self.data)
+        self.assertEqual(sorted(params), ['D', 'DR', 'center', 'radius',
+                                          'resTime'])
+        self.assertAlmostEqual(params['D'], 0.2, delta=0.05)
+        model = QENSmodels.SeparableModel('sqwWaterTeixeira', self.w,
+                                          self.q, self.resolution, center=0.)
+        result = model.fit(self.data, **{name: params[name]
+                                         for name in model.nonlinear})
+        for name, value in self.params.items():
+            numpy.testing.assert_allclose(result.params[name], value,
+                                          rtol=1e-5, err_msg=name)
+
+    def test_batch(self):
+        """ Test queries of several datasets and neighbours """
+        batch = numpy.stack([self.data, 2. * self.data, self.data[::-1]])
+        params = self.index.query(batch, k=3)
+        self.assertEqual(params['D'].shape, (3, 3))
+        numpy.testing.assert_array_equal(params['D'][0], params['D'][1])
+        self.assertEqual(params['D'][0, 0], self.index.query(self.data)['D'])
+        self.assertRaises(ValueError, self.index.query, self.data[:, 1:])
+
+    def test_save(self):
+        """ Test that a saved library gives the same answers """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'water.npz')
+            self.index.save(filename)
+            loaded = QENSmodels.SpectralIndex.load(filename)
+        self.assertEqual(len(loaded), 1024)
+        self.assertEqual(loaded.shape, self.index.shape)
+        self.assertEqual(loaded.query(self.data), self.index.query(self.data))
+
+    def test_errors(self):
+        """ Test the errors raised for invalid inputs """
+        self.assertRaises(ValueError, QENSmodels.SpectralIndex,
+                          'sqwWaterTeixeira', self.w, self.q,
+                          {'D': (0.1, 1.)}, D=0.5)
+        self.assertRaises(ValueError, QENSmodels.SpectralIndex,
+                          'sqwWaterTeixeira', self.w, self.q,
+                          {'scale': (0.1, 1.)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+import unittest
+import numpy
+from os.path import join as pjn
+
+import QENSmodels
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+def write_processed_workspace(filename, values, errors, axis1, axis2):
+    """ Writes arrays using the layout of Mantid SaveNexusProcessed """
+    with h5py.File(filename, 'w') as handle:
+        entry = handle.create_group('mantid_workspace_1')
+        entry.create_dataset('title', data=numpy.bytes_('water 293K'))
+        workspace = entry.create_group('workspace')
+        workspace.create_dataset('values', data=values)
+        workspace.create_dataset('errors', data=errors)
+        workspace.create_dataset('axis1', data=axis1)
+        workspace['axis1'].attrs['units'] = numpy.bytes_('DeltaE')
+        workspace.create_dataset('axis2', data=axis2)
+        workspace['axis2'].attrs['units'] = numpy.bytes_('MomentumTransfer')
+
+
+@unittest.skipIf(h5py is None, 'h5py is not installed')
+class TestMantidNexus(unittest.TestCase):
+    """ Tests reading of Mantid processed NeXus files """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = pjn(self.tmp_dir, 'reduced.nxs')
+
+        self.nspec, self.nbins = 7, 20
+        # histogram data: bin boundaries along the energy axis
+        self.edges = numpy.linspace(-1., 1., self.nbins + 1)
+        self.q = numpy.linspace(0.2, 1.4, self.nspec)
+        self.values = numpy.random.default_rng(1).random((self.nspec,
+                                                          self.nbins))
+        self.errors = 0.1 * self.values
+        write_processed_workspace(self.filename, self.values, self.errors,
+                                  self.edges, self.q)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read(self):
+        """ Test content of dataset read from a processed workspace """
+        dataset = QENSmodels.read_mantid_nexus(self.filename)
+        self.assertIsInstance(dataset, QENSmodels.QENSDataset)
+        numpy.testing.assert_array_almost_equal(
+            dataset.w, 0.5 * (self.edges[1:] + self.edges[:-1]))
+        numpy.testing.assert_array_equal(dataset.q, self.q)
+        numpy.testing.assert_array_equal(dataset.data, self.values)
+        numpy.testing.assert_array_equal(dataset.error, self.errors)
+        self.assertEqual(dataset.metadata['w_units'], 'DeltaE')
+        self.assertEqual(dataset.metadata['q_units'], 'MomentumTransfer')
+        self.assertEqual(dataset.metadata['title'], 'water 293K')
+
+    def test_read_selected_spectra(self):
+        """ Test reading a subset of spectra """
+        dataset = QENSmodels.read_mantid_nexus(self.filename,
+                                               spectra=[5, 1, 3])
+        # in the requested order
+        numpy.testing.assert_array_equal(dataset.q, self.q[[5, 1, 3]])
+        numpy.testing.assert_array_equal(dataset.data,
+                                         self.values[[5, 1, 3]])
+        numpy.testing.assert_array_equal(dataset.error,
+                                         self.errors[[5, 1, 3]])
+        self.assertRaises(ValueError, QENSmodels.read_mantid_nexus,
+                          self.filename, spectra=[5, 1, 5])
+
+    def test_iter_blocks(self):
+        """ Test that streamed blocks cover all spectra in order """
+        blocks = list(QENSmodels.iter_mantid_nexus(self.filename,
+                                                   block_size=3))
+        self.assertEqual([block.nq for block in blocks], [3, 3, 1])
+        numpy.testing.assert_array_equal(
+            numpy.concatenate([block.data for block in blocks]),
+            self.values)
+        numpy.testing.assert_array_equal(
+            numpy.concatenate([block.q for block in blocks]), self.q)
+
+    def test_raised_error_ragged_axis(self):
+        """ Test that spectra with different energy axes are rejected """
+        axis1 = numpy.tile(self.edges, (self.nspec, 1))
+        axis1[2] += 0.1
+        write_processed_workspace(self.filename, self.values, self.errors,
+                                  axis1, self.q)
+        self.assertRaises(ValueError,
+                          QENSmodels.read_mantid_nexus,
+                          self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
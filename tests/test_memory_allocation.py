@@ -0,0 +1,123 @@
+import tracemalloc
+import unittest
+import warnings
+import numpy
+
+import QENSmodels
+
+# representative sizes of the grids
+nq, nw = 100, 1000
+q = numpy.linspace(0.2, 2., nq)
+w = numpy.linspace(-2., 2., nw)
+# the outputs of the hwhm* functions are small: more momentum transfers
+# keep SLACK below the cost of broadcasting their widths to one row per q
+q_hwhm = numpy.linspace(0.2, 2., 1000)
+
+# fixed allowance (in bytes) for Python objects created during a call,
+# which does not scale with the size of the output
+SLACK = 8192
+
+# (parameters, budget): the memory allocated by a call on top of its output
+# should not exceed budget * size of the output (+ SLACK). The output of a
+# LineSpectrum is its compact arrays (see output_size), so that broadcasting
+# the widths to one row per momentum transfer (np.tile, np.repeat) is not
+# absorbed by the budgets.
+HWHM_BUDGETS = {
+    'hwhmBrownianTranslationalDiffusion': ({'D': 0.1}, 0.5),
+    'hwhmChudleyElliottDiffusion': ({'D': 0.23, 'L': 1.}, 0.95),
+    'hwhmEquivalentSitesCircle': ({'Nsites': 3, 'radius': 1.,
+                                   'resTime': 1.}, 4.75),
+    'hwhmGaussianModel3D': ({'D': 0.5, 'variance_ux': 1.}, 1.1),
+    'hwhmIsotropicRotationalDiffusion': ({'radius': 1., 'DR': 1.}, 1.4),
+    'hwhmJumpSitesLogNormDist': ({'Nsites': 3, 'radius': 1., 'resTime': 1.,
+                                  'sigma': 1.}, 0.5),
+    'hwhmJumpTranslationalDiffusion': ({'D': 0.23, 'resTime': 1.25}, 0.75),
+}
+
+SQW_BUDGETS = {
+    'sqwBrownianTranslationalDiffusion': ({'D': 0.1}, 0.1),
+    'sqwChudleyElliottDiffusion': ({'D': 0.23, 'L': 1.}, 0.1),
+    'sqwDeltaLorentz': ({'A0': 0.3, 'hwhm': 0.1}, 0.1),
+    'sqwDeltaTwoLorentz': ({'A0': 0.3, 'A1': 0.3, 'hwhm1': 0.1,
+                            'hwhm2': 0.5}, 0.1),
+    'sqwEquivalentSitesCircle': ({'Nsites': 3, 'radius': 1.,
+                                  'resTime': 1.}, 0.1),
+    'sqwGaussianModel3D': ({'D': 0.5, 'variance_ux': 1.}, 0.5),
+    'sqwIsotropicRotationalDiffusion': ({'radius': 1., 'DR': 1.}, 0.1),
+    'sqwJumpSitesLogNormDist': ({'Nsites': 3, 'radius': 1., 'resTime': 1.,
+                                 'sigma': 1.}, 0.25),
+    'sqwJumpTranslationalDiffusion': ({'D': 0.23, 'resTime': 1.25}, 0.1),
+    'sqwWaterTeixeira': ({'D': 0.23, 'resTime': 1.25, 'radius': 1.,
+                          'DR': 1.}, 0.1),
+}
+
+
+def output_size(output):
+    """ Number of bytes of the array(s) returned by a model. The widths of
+    a LineSpectrum count for one momentum transfer, and its arrays are not
+    materialized. """
+    if isinstance(output, numpy.ndarray):
+        return output.nbytes
+    if isinstance(output, QENSmodels.LineSpectrum):
+        output = output.hwhm[:1], output.eisf, output.qisf
+    return sum(numpy.asarray(item).nbytes for item in output)
+
+
+def extra_memory(function, *args, **kwargs):
+    """ Returns the peak memory allocated by a call in addition to its
+    output, and the size of the output (in bytes)
+    """
+    with warnings.catch_warnings():
+        # warnings recorded by the test runner would be counted otherwise
+        warnings.simplefilter('ignore')
+
+        # warm-up call: caches and lazy imports are not counted
+        function(*args, **kwargs)
+
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            output = function(*args, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    size = output_size(output)
+    return peak - baseline - size, size
+
+
+@unittest.skipIf(tracemalloc.is_tracing(),
+                 'tracemalloc is already used by another tool')
+class TestMemoryAllocation(unittest.TestCase):
+    """ Tests that the memory allocated by the models stays within budget
+    """
+
+    def check_budgets(self, budgets, *args):
+        for name, (kwargs, budget) in sorted(budgets.items()):
+            with self.subTest(function=name):
+                extra, size = extra_memory(getattr(QENSmodels, name),
+                                           *args, **kwargs)
+                self.assertLessEqual(
+                    extra, budget * size + SLACK,
+                    '{} allocates {:.2f} times its output ({} bytes) '
+                    'instead of {}'.format(name, extra / size, size,
+                                           budget))
+
+    def test_hwhm_budgets(self):
+        """ Test memory allocated by the hwhm* functions """
+        self.check_budgets(HWHM_BUDGETS, q_hwhm)
+
+    def test_sqw_budgets(self):
+        """ Test memory allocated by the sqw* functions """
+        self.check_budgets(SQW_BUDGETS, w, q)
+
+    def test_all_models_have_budget(self):
+        """ Test that every public hwhm* and sqw* function is covered """
+        public = [name for name in dir(QENSmodels)
+                  if name.startswith(('hwhm', 'sqw'))]
+        self.assertEqual(sorted(public),
+                         sorted(list(HWHM_BUDGETS) + list(SQW_BUDGETS)))
+
+
+if __name__ == '__main__':
+    unittest.main()
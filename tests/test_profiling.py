@@ -0,0 +1,178 @@
+import cProfile
+import json
+import pstats
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy
+from os.path import join as pjn
+
+import QENSmodels
+
+
+def _fibonacci(n):
+    return n if n < 2 else _fibonacci(n - 1) + _fibonacci(n - 2)
+
+
+class TestProfiling(unittest.TestCase):
+    """ Tests QENSmodels.profile instrumentation """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2., 2., 201)
+        self.q = numpy.array([0.3, 0.6, 0.9])
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_call_counts(self):
+        """ Test counts of public models and of the functions they call """
+        with QENSmodels.profile() as prof:
+            QENSmodels.sqwEquivalentSitesCircle(self.w, self.q, Nsites=4)
+        stats = prof.as_dict()
+
+        sqw = stats['equivalent_sites_circle.sqwEquivalentSitesCircle']
+        self.assertEqual(sqw['ncalls'], 1)
+        self.assertEqual(sqw['output_size'], self.q.size * self.w.size)
+        self.assertEqual(
+            stats['equivalent_sites_circle.hwhmEquivalentSitesCircle']
+            ['ncalls'], 1)
+        # one elastic line and Nsites - 1 Lorentzians per q
+        self.assertEqual(stats['delta.delta']['ncalls'], 3)
+        self.assertEqual(stats['lorentzian.lorentzian']['ncalls'], 9)
+        self.assertEqual(
+            stats['lorentzian.lorentzian']['callers'],
+            {'equivalent_sites_circle.sqwEquivalentSitesCircle': 9})
+
+        # the time spent in the callees is included in the cumulative time
+        self.assertGreaterEqual(sqw['cumtime'], sqw['tottime'])
+        self.assertGreaterEqual(
+            sqw['cumtime'],
+            sqw['tottime'] + stats['lorentzian.lorentzian']['cumtime'])
+        self.assertLessEqual(stats['lorentzian.lorentzian']['p50'],
+                             stats['lorentzian.lorentzian']['max'])
+
+    def test_functions_restored(self):
+        """ Test that the original functions are restored on exit """
+        original = QENSmodels.lorentzian
+        module = sys.modules['QENSmodels.isotropic_rotational_diffusion']
+        original_hwhm = module.hwhmIsotropicRotationalDiffusion
+        with QENSmodels.profile():
+            self.assertIsNot(QENSmodels.lorentzian, original)
+            self.assertEqual(QENSmodels.lorentzian.__name__, 'lorentzian')
+        self.assertIs(QENSmodels.lorentzian, original)
+        self.assertIs(module.hwhmIsotropicRotationalDiffusion,
+                      original_hwhm)
+
+    def test_methods(self):
+        """ Test that convolutions, model kernels and optimisers are
+        separated """
+        resolution = numpy.exp(-0.5 * (self.w / 0.05) ** 2)
+        data = QENSmodels.BoundModel(
+            'sqwBrownianTranslationalDiffusion', self.w, self.q,
+            resolution)(D=0.2)
+        model = QENSmodels.SeparableModel(
+            'sqwBrownianTranslationalDiffusion', self.w, self.q, resolution,
+            center=0.)
+        with QENSmodels.profile() as prof:
+            model.fit(data, D=0.1)
+        stats = prof.as_dict()
+
+        fit = stats['fitting.SeparableModel.fit']
+        self.assertEqual(fit['ncalls'], 1)
+        optimiser = stats['scipy.optimize.least_squares']
+        self.assertEqual(optimiser['callers'],
+                         {'fitting.SeparableModel.fit': 1})
+        convolution = stats['convolution.ResolutionOperator.__call__']
+        self.assertGreater(convolution['ncalls'], 0)
+        self.assertIn('bound_model.BoundModel.__call__',
+                      convolution['callers'])
+        # model decomposed into lines through a dispatch table
+        self.assertGreater(stats['lines._brownian']['ncalls'], 0)
+        self.assertGreaterEqual(optimiser['cumtime'],
+                                convolution['cumtime'])
+
+        # methods are restored
+        self.assertIs(QENSmodels.SeparableModel.fit,
+                      QENSmodels.fitting.SeparableModel.fit)
+        self.assertEqual(QENSmodels.SeparableModel.fit.__qualname__,
+                         'SeparableModel.fit')
+        self.assertFalse(hasattr(QENSmodels.SeparableModel.fit,
+                                 '__wrapped__'))
+        self.assertFalse(hasattr(
+            QENSmodels.lines._DECOMPOSITIONS[
+                'sqwBrownianTranslationalDiffusion'], '__wrapped__'))
+
+    def test_raised_error_nested(self):
+        """ Test that profiling contexts cannot be nested """
+        with QENSmodels.profile():
+            with self.assertRaises(RuntimeError):
+                with QENSmodels.profile():
+                    pass
+
+    def test_extra_functions(self):
+        """ Test instrumentation of functions outside QENSmodels """
+        with QENSmodels.profile(extra=['numpy.convolve']) as prof:
+            numpy.convolve(self.w, self.w[:5])
+        self.assertEqual(prof.as_dict()['numpy.convolve']['ncalls'], 1)
+
+    @unittest.skipIf(sys.version_info < (3, 9),
+                     'tracemalloc.reset_peak requires Python >= 3.9')
+    def test_memory(self):
+        """ Test recording of allocated memory """
+        with QENSmodels.profile(track_memory=True) as prof:
+            QENSmodels.sqwBrownianTranslationalDiffusion(self.w, self.q)
+        stats = prof.as_dict()
+        self.assertGreaterEqual(
+            stats['brownian_translational_diffusion.'
+                  'sqwBrownianTranslationalDiffusion']['alloc_peak'],
+            self.q.size * self.w.size * 8)
+
+    def test_exports(self):
+        """ Test pstats and JSON lines exports """
+        with QENSmodels.profile() as prof:
+            QENSmodels.sqwIsotropicRotationalDiffusion(self.w, self.q)
+
+        prof.dump_stats(pjn(self.tmp_dir, 'models.prof'))
+        stats = pstats.Stats(pjn(self.tmp_dir, 'models.prof'))
+        counts = {key[2]: value[1] for key, value in stats.stats.items()}
+        self.assertEqual(counts['lorentzian'], 15)
+        self.assertEqual(counts['sqwIsotropicRotationalDiffusion'], 1)
+
+        prof.write_jsonl(pjn(self.tmp_dir, 'models.jsonl'))
+        with open(pjn(self.tmp_dir, 'models.jsonl')) as handle:
+            lines = [json.loads(line) for line in handle]
+        self.assertEqual(
+            {line['function']: line['ncalls'] for line in lines},
+            {name: values['ncalls']
+             for name, values in prof.as_dict().items()})
+
+        self.assertIn('lorentzian.lorentzian', prof.summary())
+
+    def test_exports_recursive(self):
+        """ Test that the counts of recursive calls are exported as by
+        cProfile """
+        with QENSmodels.profile(extra=[__name__ + '._fibonacci']) as prof:
+            _fibonacci(6)
+        prof.dump_stats(pjn(self.tmp_dir, 'recursive.prof'))
+        (primitive, ncalls, _, _, callers), = \
+            pstats.Stats(pjn(self.tmp_dir, 'recursive.prof')).stats.values()
+        self.assertEqual((primitive, ncalls), (1, 25))
+        self.assertEqual(prof.as_dict()[__name__ + '._fibonacci']['ncalls'],
+                         25)
+
+        reference = cProfile.Profile()
+        reference.runcall(_fibonacci, 6)
+        reference.create_stats()
+        expected = [value for key, value in reference.stats.items()
+                    if key[2] == '_fibonacci'][0]
+        self.assertEqual(expected[:2], (primitive, ncalls))
+        # only the recursive calls come from an instrumented caller
+        (key, values), = callers.items()
+        self.assertEqual(values[:2], (24, 2))
+        self.assertEqual(expected[4][key][:2], values[:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import inspect
+import unittest
+import numpy
+
+import QENSmodels
+from QENSmodels import registry
+
+
+class TestRegistry(unittest.TestCase):
+    """ Tests QENSmodels.registry model specifications """
+
+    def test_all_models_registered(self):
+        """ Test that every sqw model of the package has a specification """
+        models = [name for name in QENSmodels.__all__
+                  if name.startswith('sqw')]
+        self.assertEqual(sorted(models), sorted(registry.names()))
+
+    def test_specs_match_signatures(self):
+        """ Test that parameter names, order and defaults of the specs match
+        the signatures of the model functions """
+        for name in registry.names():
+            spec = registry.get(name)
+            signature = inspect.signature(spec.function)
+            arguments = list(signature.parameters)[2:]
+            self.assertEqual(arguments, spec.parameter_names, name)
+            for item in spec.parameters:
+                self.assertEqual(
+                    signature.parameters[item.name].default, item.default,
+                    '{}.{}'.format(name, item.name))
+
+    def test_hwhm_functions(self):
+        """ Test that the hwhm functions exist and take the parameters of
+        the model after scale and center """
+        for name in registry.names():
+            spec = registry.get(name)
+            if spec.hwhm is None:
+                continue
+            arguments = list(inspect.signature(
+                spec.hwhm_function).parameters)[1:]
+            self.assertEqual(arguments, spec.parameter_names[2:], name)
+
+    def test_unknown_model(self):
+        """ Test that an error is raised for an unregistered model """
+        self.assertRaises(KeyError, registry.get, 'sqwUnknown')
+
+    def test_register_twice(self):
+        """ Test that a model cannot be registered twice """
+        spec = registry.get('sqwDeltaLorentz')
+        self.assertRaises(ValueError, registry.register, spec)
+
+    def test_validate_defaults(self):
+        """ Test that missing parameters are set to their defaults """
+        spec = registry.get('sqwEquivalentSitesCircle')
+        values = spec.validate(radius=2.)
+        self.assertEqual(values, {'scale': 1., 'center': 0., 'Nsites': 3,
+                                  'radius': 2., 'resTime': 1.})
+        self.assertIsInstance(values['Nsites'], int)
+
+    def test_validate_q_vector(self):
+        """ Test that q-dependent parameters are broadcast to the size of q
+        """
+        spec = registry.get('sqwDeltaTwoLorentz')
+        values = spec.validate([0.1, 0.2, 0.3], A0=0.2, A1=[0.1, 0.2, 0.3])
+        numpy.testing.assert_array_equal(values['A0'], [0.2, 0.2, 0.2])
+        numpy.testing.assert_array_equal(values['A1'], [0.1, 0.2, 0.3])
+        self.assertRaises(ValueError, spec.validate, [0.1, 0.2], A1=[0.1] * 3)
+
+    def test_raised_errors(self):
+        """ Test that invalid values are rejected """
+        spec = registry.get('sqwEquivalentSitesCircle')
+        self.assertRaises(ValueError, spec.validate, Nsites=1)
+        self.assertRaises(ValueError, spec.validate, Nsites=3.5)
+        self.assertRaises(ValueError, spec.validate, radius=0.)
+        self.assertRaises(ValueError, spec.validate, radius=[1., 2.])
+        self.assertRaises(TypeError, spec.validate, Radius=1.)
+        spec = registry.get('sqwDeltaLorentz')
+        self.assertRaises(ValueError, spec.validate, A0=[0.5, 1.5])
+        spec = registry.get('sqwJumpTranslationalDiffusion')
+        self.assertEqual(spec.validate(resTime=0.)['resTime'], 0.)
+        self.assertRaises(ValueError, spec.validate, D=0.)
+
+    def test_bounds(self):
+        """ Test the bounds of the fitting parameters """
+        spec = registry.get('sqwJumpSitesLogNormDist')
+        self.assertNotIn('Nsites', spec.fitting_parameters)
+        lower, upper = spec.bounds()
+        self.assertEqual(lower.size, len(spec.fitting_parameters))
+        numpy.testing.assert_array_equal(upper, numpy.inf)
+
+    def test_call(self):
+        """ Test that calling a spec evaluates the model """
+        spec = registry.get('sqwBrownianTranslationalDiffusion')
+        w = numpy.linspace(-2, 2, 11)
+        numpy.testing.assert_array_equal(
+            spec(w, [0.3, 0.5], D=0.5),
+            QENSmodels.sqwBrownianTranslationalDiffusion(w, [0.3, 0.5],
+                                                         D=0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import multiprocessing
+import shutil
+import tempfile
+import unittest
+import numpy
+from os.path import join as pjn
+
+import QENSmodels
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+def fit_record(index):
+    """ Returns a fake fit record """
+    return {'model': 'sqwBrownianTranslationalDiffusion',
+            'q': 0.1 * index,
+            'chi2': 1. + index,
+            'params': {'scale': 2., 'D': 0.01 * index},
+            'errors': {'scale': 0.1, 'D': 0.001},
+            'timings': {'fit': 0.5}}
+
+
+def worker(queue, first, number):
+    """ Sends records from a separate process """
+    queue.put([fit_record(index) for index in range(first, first + number)])
+
+
+@unittest.skipIf(h5py is None, 'h5py is not installed')
+class TestResultsStore(unittest.TestCase):
+    """ Tests QENSmodels.FitResultsWriter and related functions """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = pjn(self.tmp_dir, 'fits.h5')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_columns(self):
+        """ Test that nested records are stored as separate columns """
+        with QENSmodels.FitResultsWriter(self.filename,
+                                         chunk_size=4) as writer:
+            writer.extend(fit_record(index) for index in range(10))
+            self.assertEqual(writer.nrows, 10)
+
+        results = QENSmodels.read_fit_results(self.filename)
+        self.assertEqual(
+            sorted(results),
+            ['chi2', 'errors/D', 'errors/scale', 'model', 'params/D',
+             'params/scale', 'q', 'timings/fit'])
+        numpy.testing.assert_array_almost_equal(results['params/D'],
+                                                0.01 * numpy.arange(10))
+        self.assertEqual(results['model'][3],
+                         'sqwBrownianTranslationalDiffusion')
+
+        with h5py.File(self.filename, 'r') as handle:
+            column = handle['fits/params/D']
+            self.assertEqual(column.chunks, (4,))
+            self.assertEqual(column.compression, 'gzip')
+
+    def test_append_and_missing_values(self):
+        """ Test appending to an existing store with different fields """
+        with QENSmodels.FitResultsWriter(self.filename) as writer:
+            writer.append(fit_record(0))
+
+        with QENSmodels.FitResultsWriter(self.filename) as writer:
+            self.assertEqual(writer.nrows, 1)
+            writer.append({'model': 'sqwWaterTeixeira', 'q': 0.3,
+                           'params': {'DR': 1.5}, 'run': 'H2O_293K'})
+
+        results = QENSmodels.read_fit_results(
+            self.filename, ['params/D', 'params/DR', 'run', 'model'])
+        numpy.testing.assert_array_equal(results['params/D'],
+                                         [0., numpy.nan])
+        numpy.testing.assert_array_equal(results['params/DR'],
+                                         [numpy.nan, 1.5])
+        self.assertEqual(list(results['run']), ['', 'H2O_293K'])
+        self.assertEqual(results['model'][1], 'sqwWaterTeixeira')
+
+    def test_raised_error_non_scalar(self):
+        """ Test that an error is raised for array values """
+        with QENSmodels.FitResultsWriter(self.filename) as writer:
+            self.assertRaises(TypeError, writer.append,
+                              {'q': numpy.arange(3)})
+            writer.append({'q': 0.5})
+            self.assertRaises(TypeError, writer.append, {'q': 'high'})
+            self.assertEqual(writer.nrows, 1)
+            # columns of rejected records are not created
+            self.assertRaises(TypeError, writer.append,
+                              {'run': 0.1, 'q': 'high'})
+            writer.append({'q': 0.7, 'run': 'H2O_293K'})
+
+        results = QENSmodels.read_fit_results(self.filename)
+        self.assertEqual(list(results['run']), ['', 'H2O_293K'])
+
+    def test_queued_writer(self):
+        """ Test writing records sent by several processes """
+        with QENSmodels.QueuedFitResultsWriter(self.filename) as writer:
+            processes = [multiprocessing.Process(target=worker,
+                                                 args=(writer.queue,
+                                                       10 * i, 10))
+                         for i in range(3)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+        results = QENSmodels.read_fit_results(self.filename, ['chi2'])
+        numpy.testing.assert_array_equal(numpy.sort(results['chi2']),
+                                         1. + numpy.arange(30))
+
+    def test_queued_writer_error(self):
+        """ Test that errors of the writer thread are raised by close """
+        writer = QENSmodels.QueuedFitResultsWriter(self.filename)
+        writer.put({'q': 0.5})
+        writer.put([{'q': 'high'}, {'q': 0.7}])
+        self.assertRaises(TypeError, writer.close)
+        self.assertEqual(writer.rejected, [{'q': 'high'}, {'q': 0.7}])
+        self.assertRaises(TypeError, writer.put, {'q': 0.9})
+        numpy.testing.assert_array_equal(
+            QENSmodels.read_fit_results(self.filename)['q'], [0.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import numpy
+
+import QENSmodels
+
+
+class TestBootstrap(unittest.TestCase):
+    """ Tests QENSmodels.uncertainty.bootstrap """
+
+    def setUp(self):
+        self.w = numpy.linspace(-2, 2, 201)
+        self.q = numpy.array([0.5, 1., 1.5])
+        self.ideal = QENSmodels.BoundModel(
+            'sqwBrownianTranslationalDiffusion', self.w, self.q)(D=0.2)
+        self.model = QENSmodels.SeparableModel(
+            'sqwBrownianTranslationalDiffusion', self.w, self.q, center=0.)
+        self.rng = numpy.random.default_rng(11)
+        self.sigma = 0.01
+
+    def noisy(self):
+        return self.ideal + self.sigma * self.rng.standard_normal(
+            self.ideal.shape)
+
+    def test_spread(self):
+        """ Test the spread of the bootstrap against repeated experiments """
+        fit = self.model.fit(self.noisy(), D=0.2)
+        result = QENSmodels.bootstrap(fit, n=200, seed=0)
+        self.assertTrue(numpy.all(result.success))
+        self.assertEqual(result.samples['D'].shape, (200,))
+        self.assertEqual(result.samples['scale'].shape, (200, 3))
+        repeated = [self.model.fit(self.noisy(), D=0.2).x[0]
+                    for _ in range(200)]
+        ratio = numpy.std(result.samples['D']) / numpy.std(repeated)
+        self.assertGreater(ratio, 0.7)
+        self.assertLess(ratio, 1.4)
+
+        lower, upper = result.interval('D')
+        self.assertLess(lower, result.best['D'])
+        self.assertGreater(upper, result.best['D'])
+        wider = result.interval('D', level=0.95)
+        self.assertLess(wider[0], lower)
+        self.assertGreater(wider[1], upper)
+        self.assertEqual(sorted(result.intervals()),
+                         ['D', 'eisf', 'hwhm', 'scale'])
+
+    def test_derived(self):
+        """ Test the EISF and half-widths derived from the parameters """
+        data = QENSmodels.BoundModel('sqwDeltaLorentz', self.w, self.q)(
+            scale=100., A0=0.3, hwhm=0.2)
+        data = self.rng.poisson(data).astype(float)
+        model = QENSmodels.SeparableModel('sqwDeltaLorentz', self.w, self.q,
+                                          center=0.)
+        fit = model.fit(data, numpy.sqrt(numpy.maximum(data, 1.)), hwhm=0.1)
+        result = QENSmodels.bootstrap(fit, n=20, method='poisson', seed=2)
+        numpy.testing.assert_allclose(result.samples['eisf'],
+                                      result.samples['A0'], rtol=1e-12)
+        numpy.testing.assert_allclose(result.best['eisf'], fit.params['A0'])
+        self.assertEqual(result.samples['eisf'].shape, (20, 3))
+
+    def test_statistic(self):
+        """ Test that the copies are refitted with the same statistic """
+        data = QENSmodels.BoundModel('sqwDeltaLorentz', self.w, self.q)(
+            scale=100., A0=0.3, hwhm=0.2)
+        data = self.rng.poisson(data).astype(float)
+        model = QENSmodels.SeparableModel('sqwDeltaLorentz', self.w, self.q,
+                                          center=0.)
+        fit = model.fit(data, statistic='cash', hwhm=0.1)
+        result = QENSmodels.bootstrap(fit, n=20, method='poisson', seed=3)
+        self.assertTrue(numpy.all(result.success))
+        lower, upper = result.interval('hwhm')
+        self.assertTrue(numpy.all(lower < fit.params['hwhm']))
+        self.assertTrue(numpy.all(upper > fit.params['hwhm']))
+
+    def test_reproducible(self):
+        """ Test that the results only depend on the seed """
+        fit = self.model.fit(self.noisy(), D=0.2)
+        serial = QENSmodels.bootstrap(fit, n=12, seed=5)
+        parallel = QENSmodels.bootstrap(fit, n=12, seed=5, n_workers=3)
+        numpy.testing.assert_array_equal(serial.samples['D'],
+                                         parallel.samples['D'])
+        other = QENSmodels.bootstrap(fit, n=12, seed=6)
+        self.assertFalse(numpy.array_equal(serial.samples['D'],
+                                           other.samples['D']))
+
+    def test_errors(self):
+        """ Test the errors raised for invalid inputs """
+        fit = self.model.fit(self.noisy(), D=0.2)
+        self.assertRaises(ValueError, QENSmodels.bootstrap, fit,
+                          method='jackknife')
+        self.assertRaises(ValueError, QENSmodels.bootstrap, fit,
+                          method='poisson')
+        self.assertRaises(ValueError, QENSmodels.bootstrap, fit, n=0)
+        fit.separable = None
+        self.assertRaises(ValueError, QENSmodels.bootstrap, fit)
+
+
+if __name__ == '__main__':
+    unittest.main()
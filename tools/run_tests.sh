@@ -7,19 +7,40 @@ cd $SCRIPT_DIR
 cd $TESTS_DIR
 
 ## TO RUN UNITTEST
+python -m unittest -v test_adapters_bumps
+python -m unittest -v test_adapters_lmfit
+python -m unittest -v test_adapters_mantid
 python -m unittest -v test_background_polynomials
+python -m unittest -v test_bound_model
 python -m unittest -v test_brownian_translational_diffusion
 python -m unittest -v test_chudley_elliott_diffusion
+python -m unittest -v test_composite
+python -m unittest -v test_convolution
+python -m unittest -v test_dataset
 python -m unittest -v test_delta
 python -m unittest -v test_delta_lorentz
 python -m unittest -v test_delta_two_lorentz
 python -m unittest -v test_equivalent_sites_circle
+python -m unittest -v test_estimation
+python -m unittest -v test_fitting
 python -m unittest -v test_gaussian
 python -m unittest -v test_gaussian_model_3d
+python -m unittest -v test_iqt
 python -m unittest -v test_isotropic_rotational_diffusion
 python -m unittest -v test_jump_sites_log_norm_dist
 python -m unittest -v test_jump_translational_diffusion
+python -m unittest -v test_landscape
+python -m unittest -v test_lazy_import
+python -m unittest -v test_line_spectrum
+python -m unittest -v test_lines
+python -m unittest -v test_lookup
 python -m unittest -v test_lorentzian
+python -m unittest -v test_mantid_nexus
+python -m unittest -v test_memory_allocation
+python -m unittest -v test_profiling
+python -m unittest -v test_registry
+python -m unittest -v test_results_store
+python -m unittest -v test_uncertainty
 python -m unittest -v test_water_teixeira
 
 ## TO RUN DOCTEST